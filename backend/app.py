@@ -1,12 +1,37 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+import argparse
+import contextvars
 import json
 import os
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
-import re
-import random
+
+from context_budget import ContextBudget, TokenCounter
+from dialogue_sessions import DialogueSessionStore, payload_prompt
+from generation_cache import GenerationCache
+from npc_memory import NPCMemoryStore
+from npc_registry import NPCRegistry
+from player_sessions import PlayerSessionStore
+from ollama_client import OllamaError, OllamaUnavailable
+from ollama_router import OllamaRouter, UpstreamPool, parse_upstreams
+from quest_cascade import QuestCascade, TIER_RULES, TIER_SMALL
+from quest_catalogue import catalogue_cache_stats, validate_quest_data
+from quest_output import QuestOutput
+from quest_pool import QuestPool
+from quest_speculation import DEFAULT_INTENT_KEYWORDS, QuestSpeculator
+from quest_templates import QuestRequest, QuestTemplates
+from request_metrics import RequestMetrics
+from response_cleaner import DialogueStreamCleaner, clean_dialogue_response
+from save_store import DEFAULT_ENCODING, DEFAULT_PAGE_SIZE, PatchError, UnknownBaseSave, create_save_store
+from scheduler import GenerationScheduler, PRIORITY_BACKGROUND, PRIORITY_DIALOGUE, PRIORITY_GENERATE_QUEST, PRIORITY_QUEST
+from singleflight import SingleFlight
+from log_reader import CursorExpired, follow as follow_log, tail as tail_log
+from structured_logging import (
+    BodySampler, clear_log_files, log_files, new_request_id, request_id, rotate_log_files, setup_logging
+)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -14,59 +39,309 @@ CORS(app)  # Enable CORS for all routes
 # Configuration
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama2-uncensored')
+OLLAMA_QUEST_MODEL = os.getenv('OLLAMA_QUEST_MODEL', '') or OLLAMA_MODEL  # e.g. a smaller, cheaper model for quests
 USE_LLM_QUESTS = os.getenv('USE_LLM_QUESTS', 'true').lower() == 'true'  # Enable LLM quest generation
 
+# Ollama connection pool / resilience settings
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv('OLLAMA_CONNECT_TIMEOUT', '3.05'))
+OLLAMA_READ_TIMEOUT = float(os.getenv('OLLAMA_READ_TIMEOUT', '60'))
+OLLAMA_MAX_RETRIES = int(os.getenv('OLLAMA_MAX_RETRIES', '2'))
+OLLAMA_RETRY_BACKOFF = float(os.getenv('OLLAMA_RETRY_BACKOFF', '0.5'))
+OLLAMA_POOL_SIZE = int(os.getenv('OLLAMA_POOL_SIZE', '10'))
+OLLAMA_ASYNC_POOL_SIZE = int(os.getenv('OLLAMA_ASYNC_POOL_SIZE', '200'))  # Async mode holds many more in-flight calls
+OLLAMA_BREAKER_THRESHOLD = int(os.getenv('OLLAMA_BREAKER_THRESHOLD', '5'))
+OLLAMA_BREAKER_RESET = float(os.getenv('OLLAMA_BREAKER_RESET', '30'))
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')  # How long Ollama keeps the model, and its prompt cache, loaded
+
+# Ollama servers to balance across: comma-separated URLs, each optionally "=model;model"
+# to limit it to those models. Empty = OLLAMA_URL alone.
+OLLAMA_UPSTREAMS = parse_upstreams(os.getenv('OLLAMA_UPSTREAMS', ''), OLLAMA_URL)
+OLLAMA_PROBE_INTERVAL = float(os.getenv('OLLAMA_PROBE_INTERVAL', '10'))  # seconds between upstream health probes
+OLLAMA_AFFINITY_SLACK = int(os.getenv('OLLAMA_AFFINITY_SLACK', '2'))  # Extra in-flight requests tolerated to keep a conversation on its upstream
+
+# Generation cache settings
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1000'))
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', '3600'))  # seconds
+LLM_CACHE_MAX_MB = float(os.getenv('LLM_CACHE_MAX_MB', '32'))
+LLM_CACHE_VARIANTS = int(os.getenv('LLM_CACHE_VARIANTS', '3'))  # Distinct replies kept per prompt
+LLM_CACHE_DISK_PATH = os.getenv('LLM_CACHE_DISK_PATH', '')  # e.g. logs/generation_cache.db; empty = memory only
+
+# Generation queue / admission control settings
+OLLAMA_MAX_CONCURRENT = int(os.getenv('OLLAMA_MAX_CONCURRENT', '0')) or len(OLLAMA_UPSTREAMS)  # An Ollama server runs ~one generation at a time; default one per upstream
+GENERATION_QUEUE_MAX = int(os.getenv('GENERATION_QUEUE_MAX', '64'))
+QUEUE_TIMEOUT_DIALOGUE = float(os.getenv('QUEUE_TIMEOUT_DIALOGUE', '10'))  # seconds waiting before falling back
+QUEUE_TIMEOUT_GENERATE_QUEST = float(os.getenv('QUEUE_TIMEOUT_GENERATE_QUEST', '20'))
+QUEUE_TIMEOUT_QUEST = float(os.getenv('QUEUE_TIMEOUT_QUEST', '30'))
+
 # MythoMax-13B context window: ~8,192 tokens (similar to Llama 3)
 MAX_CONTEXT_TOKENS = 8192
 # Reserve some tokens for response
 RESERVED_TOKENS = 1000
 MAX_INPUT_TOKENS = MAX_CONTEXT_TOKENS - RESERVED_TOKENS
 
+# Optional real tokenizer: a HuggingFace tokenizer.json or SentencePiece .model for
+# the served model, or a tiktoken encoding name. Falls back to a cached heuristic.
+TOKENIZER_PATH = os.getenv('TOKENIZER_PATH', '')
+TIKTOKEN_ENCODING = os.getenv('TIKTOKEN_ENCODING', '')
+
+# Every NPC's data, shared with the frontend through /api/npcs; edits are picked up without a restart
+NPC_DATA_PATH = os.getenv('NPC_DATA_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'npcs.json'))
+NPC_RELOAD_INTERVAL = float(os.getenv('NPC_RELOAD_INTERVAL', '2'))  # seconds between checks for an edited file; 0 = never
+
+# Server-side NPC memory: only the most relevant memories go into each prompt
+NPC_MEMORY_TOP_K = int(os.getenv('NPC_MEMORY_TOP_K', '6'))
+NPC_MEMORY_MAX_PER_NPC = int(os.getenv('NPC_MEMORY_MAX_PER_NPC', '200'))
+NPC_MEMORY_MAX_CONVERSATIONS = int(os.getenv('NPC_MEMORY_MAX_CONVERSATIONS', '10000'))  # player/NPC pairs kept
+
+# Dialogue prompts are a fixed per-NPC prefix plus the current turn, sent as
+# 'chat' (/api/chat with the session's earlier turns), 'context' (/api/generate
+# continuing the returned context) or 'generate' (one prompt, no session state)
+DIALOGUE_API = os.getenv('DIALOGUE_API', 'chat')
+DIALOGUE_SESSION_MAX = int(os.getenv('DIALOGUE_SESSION_MAX', '1000'))  # player/NPC sessions kept
+DIALOGUE_SESSION_TTL = float(os.getenv('DIALOGUE_SESSION_TTL', '1800'))  # seconds idle before a session is dropped
+DIALOGUE_SESSION_TURNS = int(os.getenv('DIALOGUE_SESSION_TURNS', '6'))  # exchanges kept per session in chat mode
+
+# Player state held between requests, so clients send a session id and small events instead of player_context
+PLAYER_SESSION_MAX = int(os.getenv('PLAYER_SESSION_MAX', '10000'))  # sessions kept
+PLAYER_SESSION_TTL = float(os.getenv('PLAYER_SESSION_TTL', '3600'))  # seconds idle before a session is dropped
+
+# Where saves and logs go unless SAVE_PATH / LOG_DIR say otherwise; never the working
+# directory, so running from a checkout doesn't write into the source tree
+DATA_DIR = os.getenv('DATA_DIR') or os.path.join(
+    os.getenv('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share'), 'llm-scifi-game')
+
+# Save-game persistence: 'sqlite' (one WAL database) or 'file' (a JSON file per save)
+SAVE_BACKEND = os.getenv('SAVE_BACKEND', 'sqlite')
+SAVE_PATH = os.getenv('SAVE_PATH', os.path.join(DATA_DIR, 'saves', 'game_saves.db') if SAVE_BACKEND == 'sqlite' else os.path.join(DATA_DIR, 'saves'))
+SAVE_COMPRESSION = os.getenv('SAVE_COMPRESSION', DEFAULT_ENCODING)  # zstd (needs zstandard), gzip or json
+SAVE_COMPACT_EVERY = int(os.getenv('SAVE_COMPACT_EVERY', '20'))  # Deltas in a chain before writing a full snapshot
+
+# Quest JSON: 'schema' (Ollama JSON-schema format), 'json' (any JSON object) or
+# 'stream' (free-form); every mode stops generating once the object closes
+QUEST_OUTPUT_MODE = os.getenv('QUEST_OUTPUT_MODE', 'schema')
+QUEST_MAX_TOKENS = int(os.getenv('QUEST_MAX_TOKENS', '300'))
+DIALOGUE_MAX_TOKENS = int(os.getenv('DIALOGUE_MAX_TOKENS', '150'))  # num_predict for dialogue replies
+
+# Quest cascade: /api/generate-quest tries the quest templates, then OLLAMA_QUEST_MODEL, then OLLAMA_MODEL
+QUEST_CASCADE_ENABLED = os.getenv('QUEST_CASCADE_ENABLED', 'true').lower() == 'true'
+QUEST_CASCADE_MAX_UNKNOWN_WORDS = int(os.getenv('QUEST_CASCADE_MAX_UNKNOWN_WORDS', '2'))  # Unrecognised suggestion words the templates may ignore
+
+# /api/quests/batch: quests per request, and threads generating batch entries
+# (they spend their time queued in the scheduler, which sets the real limit)
+QUEST_BATCH_MAX = int(os.getenv('QUEST_BATCH_MAX', '20'))
+QUEST_BATCH_WORKERS = int(os.getenv('QUEST_BATCH_WORKERS', '16'))
+
+# Quest pool: quests pre-generated per NPC while Ollama is idle and handed out instantly
+QUEST_POOL_ENABLED = os.getenv('QUEST_POOL_ENABLED', 'true').lower() == 'true'
+QUEST_POOL_SIZE = int(os.getenv('QUEST_POOL_SIZE', '3'))  # Quests kept per NPC
+QUEST_POOL_REFILL_INTERVAL = float(os.getenv('QUEST_POOL_REFILL_INTERVAL', '2'))  # seconds between refill generations
+QUEST_POOL_MAX_AGE = float(os.getenv('QUEST_POOL_MAX_AGE', '1800'))  # seconds before a pooled quest is discarded
+QUEST_POOL_MAX_NPCS = int(os.getenv('QUEST_POOL_MAX_NPCS', '32'))  # NPC/catalogue pools kept
+
+# Quest speculation: start generating a quest when a dialogue message suggests the player is about to ask for one
+QUEST_SPECULATION_ENABLED = os.getenv('QUEST_SPECULATION_ENABLED', 'true').lower() == 'true'
+QUEST_SPECULATION_TTL = float(os.getenv('QUEST_SPECULATION_TTL', '300'))  # seconds an unused speculative quest is kept
+QUEST_SPECULATION_MAX_PENDING = int(os.getenv('QUEST_SPECULATION_MAX_PENDING', '4'))  # speculative generations queued or running at once
+QUEST_SPECULATION_KEYWORDS = [keyword.strip() for keyword in os.getenv('QUEST_SPECULATION_KEYWORDS', '').split(',') if keyword.strip()] or DEFAULT_INTENT_KEYWORDS
+
+# Logging: JSON lines written by a background thread, rotated by size
+LOG_DIR = os.getenv('LOG_DIR', os.path.join(DATA_DIR, 'logs'))
+LOG_FILE = os.getenv('LOG_FILE', 'ollama_interactions.log')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_MAX_MB = float(os.getenv('LOG_MAX_MB', '50'))
+LOG_BACKUPS = int(os.getenv('LOG_BACKUPS', '5'))
+LOG_PROMPT_SAMPLE_RATE = float(os.getenv('LOG_PROMPT_SAMPLE_RATE', '1.0'))  # e.g. 0.01 in production
+
+token_counter = TokenCounter(TOKENIZER_PATH or None, TIKTOKEN_ENCODING or None)
+context_budget = ContextBudget(token_counter, MAX_INPUT_TOKENS)
+
 def estimate_tokens(text):
-    """Rough estimation of token count (1 token ≈ 4 characters for English)"""
+    """Count tokens with the configured tokenizer (cached heuristic if none is available)"""
     if not text:
         return 0
-    # Rough estimation: 1 token ≈ 4 characters for English text
-    return len(text) // 4
+    return token_counter.count(text)
 
 def log_token_usage(prompt, response_tokens=0, context_name="Unknown"):
     """Log token usage for monitoring"""
     input_tokens = estimate_tokens(prompt)
     total_tokens = input_tokens + response_tokens
     
-    logger.info(f"=== TOKEN USAGE: {context_name} ===")
-    logger.info(f"Input tokens: ~{input_tokens}")
-    logger.info(f"Response tokens: {response_tokens}")
-    logger.info(f"Total tokens: ~{total_tokens}")
-    logger.info(f"Context window: {MAX_CONTEXT_TOKENS} tokens")
-    logger.info(f"Usage: {total_tokens}/{MAX_CONTEXT_TOKENS} ({total_tokens/MAX_CONTEXT_TOKENS*100:.1f}%)")
+    logger.info(f"Token usage: {context_name}", extra={
+        'input_tokens': input_tokens,
+        'response_tokens': response_tokens,
+        'total_tokens': total_tokens,
+        'context_window': MAX_CONTEXT_TOKENS,
+        'usage_pct': round(total_tokens / MAX_CONTEXT_TOKENS * 100, 1)
+    })
     
     if total_tokens > MAX_INPUT_TOKENS:
         logger.warning(f"⚠️  WARNING: Approaching context limit! Consider reducing prompt size.")
-    
-    logger.info(f"================================")
+
+# Player the current request is on behalf of, used for fair scheduling, memory and logs
+current_player_id = contextvars.ContextVar('current_player_id', default='anonymous')
+# The request's player session, if it named a live one
+current_player_session = contextvars.ContextVar('current_player_session', default=None)
+# Set when the request named a session the backend no longer has, so the client starts a new one
+session_expired = contextvars.ContextVar('session_expired', default=False)
 
 # Setup logging
-def setup_logging():
-    # Create logs directory if it doesn't exist
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-    
-    # Configure logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('logs/ollama_interactions.log'),
-            logging.StreamHandler()  # Also print to console
-        ]
-    )
-    return logging.getLogger(__name__)
+log_listener = setup_logging(
+    log_dir=LOG_DIR,
+    filename=LOG_FILE,
+    level=LOG_LEVEL,
+    max_bytes=int(LOG_MAX_MB * 1024 * 1024),
+    backup_count=LOG_BACKUPS,
+    context_vars={'player_id': current_player_id}
+)
+logger = logging.getLogger(__name__)
+
+# Full prompts and responses are only logged for this fraction of requests
+prompt_log_sampler = BodySampler(LOG_PROMPT_SAMPLE_RATE)
+
+# Latency by route and generation stage, Ollama token rates and fallbacks, served on /api/metrics
+request_metrics = RequestMetrics()
+
+def upstream_affinity(payload):
+    """Keep a player's conversation with an NPC on the upstream that has its prompt prefix cached"""
+    if payload.get('messages'):
+        prefix = payload['messages'][0]['content']
+    elif payload.get('system'):
+        prefix = payload['system']
+    else:
+        return None
+    return f"{current_player_id.get()}|{prefix}"
+
+# Every Ollama call goes through the router: a keep-alive client per upstream,
+# least-outstanding balancing, conversation affinity and failover
+upstream_pool = UpstreamPool(
+    OLLAMA_UPSTREAMS,
+    probe_interval=OLLAMA_PROBE_INTERVAL,
+    affinity_slack=OLLAMA_AFFINITY_SLACK
+)
+ollama_client = OllamaRouter(
+    upstream_pool,
+    affinity=upstream_affinity,
+    connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+    read_timeout=OLLAMA_READ_TIMEOUT,
+    max_retries=OLLAMA_MAX_RETRIES,
+    backoff_factor=OLLAMA_RETRY_BACKOFF,
+    pool_size=OLLAMA_POOL_SIZE,
+    failure_threshold=OLLAMA_BREAKER_THRESHOLD,
+    reset_timeout=OLLAMA_BREAKER_RESET
+)
+
+# Cache of raw generations keyed on the normalized prompt, model and options
+generation_cache = GenerationCache(
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    ttl_seconds=LLM_CACHE_TTL,
+    max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024),
+    variants_per_key=LLM_CACHE_VARIANTS,
+    disk_path=LLM_CACHE_DISK_PATH or None
+) if LLM_CACHE_ENABLED else None
+
+# Identical generations already in flight are shared instead of re-sent
+inflight_generations = SingleFlight()
+
+# Priority queue in front of Ollama: dialogue, then player-requested quests, then NPC quests
+generation_scheduler = GenerationScheduler(
+    max_concurrent=OLLAMA_MAX_CONCURRENT,
+    max_queue=GENERATION_QUEUE_MAX,
+    queue_timeouts={
+        PRIORITY_DIALOGUE: QUEUE_TIMEOUT_DIALOGUE,
+        PRIORITY_GENERATE_QUEST: QUEUE_TIMEOUT_GENERATE_QUEST,
+        PRIORITY_QUEST: QUEUE_TIMEOUT_QUEST
+    }
+)
+
+# Loaded on first use, once create_dialogue_system_prompt (below) exists to precompile each NPC's prompt
+npc_registry = NPCRegistry(
+    NPC_DATA_PATH,
+    system_prompt=lambda npc: create_dialogue_system_prompt(
+        npc['name'], npc['personality'], npc['role'], npc['background'], npc['dialogue_style']
+    ),
+    reload_interval=NPC_RELOAD_INTERVAL
+)
+
+# What each NPC remembers about each player
+npc_memory = NPCMemoryStore(
+    max_memories_per_npc=NPC_MEMORY_MAX_PER_NPC,
+    max_conversations=NPC_MEMORY_MAX_CONVERSATIONS,
+    top_k=NPC_MEMORY_TOP_K
+)
+
+# Conversation state per player and NPC, so Ollama can reuse the prompt prefix it already evaluated
+dialogue_sessions = DialogueSessionStore(
+    DIALOGUE_API,
+    max_sessions=DIALOGUE_SESSION_MAX,
+    ttl_seconds=DIALOGUE_SESSION_TTL,
+    max_turns=DIALOGUE_SESSION_TURNS,
+    max_input_tokens=MAX_INPUT_TOKENS,
+    count_tokens=estimate_tokens
+)
+
+player_sessions = PlayerSessionStore(max_sessions=PLAYER_SESSION_MAX, ttl_seconds=PLAYER_SESSION_TTL)
+
+# Saves live outside the process so they survive restarts and are shared by workers
+save_store = create_save_store(SAVE_BACKEND, SAVE_PATH, encoding=SAVE_COMPRESSION, compact_every=SAVE_COMPACT_EVERY)
+
+quest_output = QuestOutput(QUEST_OUTPUT_MODE, QUEST_MAX_TOKENS)
 
-logger = setup_logging()
+quest_templates = QuestTemplates()
 
-# Game state storage (in production, use a proper database)
-game_state = {}
+quest_cascade = QuestCascade(
+    OLLAMA_QUEST_MODEL,
+    OLLAMA_MODEL,
+    max_unknown_words=QUEST_CASCADE_MAX_UNKNOWN_WORDS
+) if QUEST_CASCADE_ENABLED else None
+
+# Refills go through generate_background_quest (below), only while the scheduler is idle
+quest_pool = QuestPool(
+    lambda spec: generate_background_quest(spec),
+    generation_scheduler,
+    size=QUEST_POOL_SIZE,
+    refill_interval=QUEST_POOL_REFILL_INTERVAL,
+    max_age=QUEST_POOL_MAX_AGE,
+    max_targets=QUEST_POOL_MAX_NPCS
+) if QUEST_POOL_ENABLED else None
+
+# Speculative quests also go through generate_background_quest, queued behind every player's request
+quest_speculator = QuestSpeculator(
+    lambda spec: generate_background_quest(spec),
+    generation_scheduler,
+    ttl_seconds=QUEST_SPECULATION_TTL,
+    max_pending=QUEST_SPECULATION_MAX_PENDING,
+    keywords=QUEST_SPECULATION_KEYWORDS
+) if QUEST_SPECULATION_ENABLED and USE_LLM_QUESTS else None
+
+quest_batch_executor = ThreadPoolExecutor(max_workers=QUEST_BATCH_WORKERS, thread_name_prefix='quest-batch')
+
+@app.before_request
+def identify_player():
+    """Remember which player the request is for, and give it a request id for the logs"""
+    request_id.set(request.headers.get('X-Request-Id', '')[:64] or new_request_id())
+    data = request.get_json(silent=True) if request.is_json else None
+    session = resume_player_session(request.headers.get('X-Session-Id') or (data or {}).get('session_id') or request.args.get('session_id'))
+    player_id = request.headers.get('X-Player-Id') or (data or {}).get('player_id') or request.remote_addr
+    # A session keeps the player it was started for, so scheduling and memory see the same player throughout
+    current_player_id.set(session.player_id if session else player_id or 'anonymous')
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def add_request_id(response):
+    response.headers['X-Request-Id'] = request_id.get()
+    return response
+
+@app.after_request
+def record_request_latency(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_metrics.observe_request(route, request.method, response.status_code, time.perf_counter() - g.request_started)
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics"""
+    return Response(request_metrics.render(), content_type=request_metrics.registry.CONTENT_TYPE)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -75,9 +350,59 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'ollama_url': OLLAMA_URL,
-        'ollama_model': OLLAMA_MODEL
+        'ollama_model': OLLAMA_MODEL,
+        'ollama_quest_model': OLLAMA_QUEST_MODEL,
+        'ollama_client': ollama_client.stats(),
+        'generation_cache': generation_cache.stats() if generation_cache else None,
+        'coalescing': inflight_generations.stats(),
+        'scheduler': generation_scheduler.stats(),
+        'context_budget': context_budget.stats(),
+        'npc_registry': npc_registry.stats(),
+        'player_sessions': player_sessions.stats(),
+        'npc_memory': npc_memory.stats(),
+        'dialogue_sessions': dialogue_sessions.stats(),
+        'saves': save_store.stats(),
+        'quest_output': quest_output.stats(),
+        'quest_pool': quest_pool.stats() if quest_pool else None,
+        'quest_speculation': quest_speculator.stats() if quest_speculator else None,
+        'quest_cascade': quest_cascade.stats() if quest_cascade else None,
+        'quest_catalogues': catalogue_cache_stats()
     })
 
+@app.route('/api/session', methods=['GET', 'POST', 'DELETE'])
+def handle_session():
+    """Start, update, inspect or end the current player's session"""
+    try:
+        session = current_player_session.get()
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            session, created = update_player_session(session, data)
+            return jsonify({'success': True, 'session_id': session.id, 'created': created, 'state': session.state()})
+        
+        if session is None:
+            return jsonify({'success': False, 'error': 'Unknown or expired session', 'session_expired': True}), 404
+        if request.method == 'DELETE':
+            player_sessions.delete(session.id)
+            return jsonify({'success': True, 'message': 'Session ended'})
+        return jsonify({'success': True, 'session_id': session.id, 'player_id': session.player_id, 'state': session.state()})
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/npcs', methods=['GET'])
+def list_npcs():
+    """The NPC registry for the frontend; answers 304 while the client's copy (If-None-Match) is current"""
+    version, npcs = npc_registry.public()
+    etag = f'"{version}"'
+    if version in request.if_none_match:
+        return Response(status=304, headers={'ETag': etag})
+    response = jsonify({'success': True, 'version': version, 'npcs': npcs})
+    response.headers['ETag'] = etag
+    return response
+
 @app.route('/api/dialogue', methods=['POST'])
 def handle_dialogue():
     """Handle NPC dialogue requests and generate LLM responses"""
@@ -92,20 +417,25 @@ def handle_dialogue():
         npc_background = data.get('npc_background')
         npc_dialogue_style = data.get('npc_dialogue_style')
         player_message = data.get('player_message', '')
-        player_context = data.get('player_context', {})
+        player_context = request_player_context(data)
         memory_context = data.get('memory_context', '')
+        apply_memory_updates(npc_name, data.get('memory_updates'))
+        npc_id = canonical_npc_id(npc_id, npc_name)
         
         # Generate LLM response with memory context
         llm_response = generate_llm_dialogue_response(
             npc_name, npc_personality, npc_role, npc_background, 
             npc_dialogue_style, player_message, player_context, memory_context
         )
+        npc_memory.record_exchange(current_player_id.get(), npc_name, player_message, llm_response)
+        speculate_quest(current_player_id.get(), npc_name, player_message)
         
         return jsonify({
             'success': True,
             'message': llm_response,
             'npc_id': npc_id,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now().isoformat(),
+            **session_status()
         })
         
     except Exception as e:
@@ -115,6 +445,72 @@ def handle_dialogue():
             'message': get_fallback_dialogue_response(npc_name)
         }), 500
 
+@app.route('/api/dialogue/stream', methods=['POST'])
+def handle_dialogue_stream():
+    """Stream NPC dialogue as newline-delimited JSON while Ollama generates it"""
+    data = request.get_json()
+    
+    npc_id = data.get('npc_id')
+    npc_name = data.get('npc_name')
+    npc_personality = data.get('npc_personality')
+    npc_role = data.get('npc_role')
+    npc_background = data.get('npc_background')
+    npc_dialogue_style = data.get('npc_dialogue_style')
+    player_message = data.get('player_message', '')
+    player_context = request_player_context(data)
+    memory_context = data.get('memory_context', '')
+    apply_memory_updates(npc_name, data.get('memory_updates'))
+    player_id = current_player_id.get()
+    status = session_status()
+    
+    events = stream_llm_dialogue_response(
+        npc_name, npc_personality, npc_role, npc_background,
+        npc_dialogue_style, player_message, player_context, memory_context
+    )
+    
+    def generate():
+        for event in events:
+            event['npc_id'] = npc_id
+            if event['type'] == 'done':
+                event.update(status)
+                npc_memory.record_exchange(player_id, npc_name, player_message, event['message'])
+                speculate_quest(player_id, npc_name, player_message)
+            yield json.dumps(event) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/memory', methods=['GET', 'POST', 'DELETE'])
+def handle_memory():
+    """Inspect, add to or clear what an NPC remembers about the current player"""
+    try:
+        player_id = current_player_id.get()
+        if request.method == 'POST':
+            data = request.get_json()
+            npc_name = data.get('npc_name')
+            stored = apply_memory_updates(npc_name, data)
+            return jsonify({'success': True, 'stored': stored})
+        
+        npc_name = request.args.get('npc_name')
+        if request.method == 'DELETE':
+            npc_memory.clear(player_id, npc_name)
+            dialogue_sessions.clear(player_id, npc_name)
+            return jsonify({'success': True, 'message': 'Memories cleared'})
+        
+        if not npc_name:
+            return jsonify({'success': False, 'error': 'npc_name is required'}), 400
+        return jsonify({
+            'success': True,
+            'player_id': player_id,
+            'npc_name': npc_name,
+            **npc_memory.snapshot(player_id, npc_name)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/quest', methods=['POST'])
 def handle_quest():
     """Handle quest generation requests"""
@@ -125,8 +521,8 @@ def handle_quest():
         npc_name = data.get('npc_name')
         npc_personality = data.get('npc_personality')
         npc_role = data.get('npc_role')
-        player_context = data.get('player_context', {})
-        existing_quests = data.get('existing_quests', [])
+        player_context = request_player_context(data)
+        existing_quests = data.get('existing_quests') or session_quest_ids()
         
         # Generate dynamic quest
         quest = generate_dynamic_quest(npc_id, npc_name, npc_personality, npc_role, player_context, existing_quests)
@@ -134,7 +530,8 @@ def handle_quest():
         return jsonify({
             'success': True,
             'quest': quest,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now().isoformat(),
+            **session_status()
         })
         
     except Exception as e:
@@ -144,24 +541,38 @@ def handle_quest():
             'quest': get_fallback_quest(npc_id)
         }), 500
 
+def store_save(player_id, data):
+    """Store a full snapshot, or a {'base_save_id', 'patch'} delta against an earlier save"""
+    if isinstance(data, dict) and 'base_save_id' in data and 'patch' in data:
+        return save_store.save_delta(player_id, data['base_save_id'], data['patch'])
+    return save_store.save(player_id, data)
+
 @app.route('/api/save', methods=['POST'])
 def save_game():
-    """Save game state"""
+    """Save game state, either in full or as a JSON patch against an earlier save"""
     try:
         data = request.get_json()
-        save_id = f"save_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        
-        game_state[save_id] = {
-            'data': data,
-            'timestamp': datetime.now().isoformat()
-        }
+        saved = store_save(current_player_id.get(), data)
         
         return jsonify({
             'success': True,
-            'save_id': save_id,
+            'save_id': saved['save_id'],
+            'timestamp': saved['timestamp'],
+            'kind': saved['kind'],
             'message': 'Game saved successfully'
         })
         
+    except UnknownBaseSave as e:
+        # The client should resend a full snapshot
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 409
+    except PatchError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -170,23 +581,41 @@ def save_game():
 
 @app.route('/api/load', methods=['GET'])
 def load_game():
-    """Load latest game state"""
+    """Load the latest game state, or a specific one with ?save_id="""
     try:
-        if not game_state:
+        save = save_store.load(current_player_id.get(), request.args.get('save_id'))
+        if save is None:
             return jsonify({
                 'success': False,
                 'message': 'No saved game found'
             }), 404
         
-        # Get the most recent save
-        latest_save_id = max(game_state.keys())
-        latest_save = game_state[latest_save_id]
+        return jsonify({
+            'success': True,
+            'save_id': save['save_id'],
+            'data': save['data'],
+            'timestamp': save['timestamp']
+        })
         
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/saves', methods=['GET'])
+def list_saves():
+    """List the current player's saves, newest first; pass ?cursor= to get the next page"""
+    try:
+        saves, next_cursor = save_store.list(
+            current_player_id.get(),
+            limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            before=request.args.get('cursor')
+        )
         return jsonify({
             'success': True,
-            'save_id': latest_save_id,
-            'data': latest_save['data'],
-            'timestamp': latest_save['timestamp']
+            'saves': saves,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -197,25 +626,48 @@ def load_game():
 
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
-    """Get recent logs for debugging"""
+    """Get recent logs for debugging.
+    
+    ?n= lines (default 50), ?level= minimum level, ?since= ISO timestamp,
+    ?cursor= to page further back, ?follow=true to stream new lines as NDJSON.
+    """
     try:
-        log_file = 'logs/ollama_interactions.log'
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as f:
-                # Get last 50 lines
-                lines = f.readlines()
-                recent_logs = lines[-50:] if len(lines) > 50 else lines
-                return jsonify({
-                    'success': True,
-                    'logs': recent_logs,
-                    'total_lines': len(lines)
-                })
-        else:
+        log_file = os.path.join(LOG_DIR, LOG_FILE)
+        if not os.path.exists(log_file):
             return jsonify({
                 'success': False,
                 'message': 'No log file found'
             }), 404
-            
+        
+        level = request.args.get('level')
+        if request.args.get('follow', 'false').lower() == 'true':
+            lines = follow_log(log_file, level=level, timeout=request.args.get('timeout', 300, type=float))
+            return Response(stream_with_context(line + '\n' for line in lines), mimetype='application/x-ndjson')
+        
+        recent_logs, next_cursor = tail_log(
+            log_file,
+            n=request.args.get('n', 50, type=int),
+            level=level,
+            since=request.args.get('since'),
+            cursor=request.args.get('cursor')
+        )
+        return jsonify({
+            'success': True,
+            'logs': recent_logs,
+            'next_cursor': next_cursor,
+            'file_size': os.path.getsize(log_file)
+        })
+        
+    except CursorExpired as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 410
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -224,14 +676,22 @@ def get_logs():
 
 @app.route('/api/logs/clear', methods=['POST'])
 def clear_logs():
-    """Clear the log file"""
+    """Empty the log file being written and delete its rotated backups"""
     try:
-        with open('logs/game_logs.txt', 'w') as f:
-            f.write('')
+        clear_log_files(log_listener)
         return jsonify({'success': True, 'message': 'Logs cleared'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/logs/rotate', methods=['POST'])
+def rotate_logs():
+    """Start a fresh log file, keeping the current one as a backup"""
+    try:
+        rotate_log_files(log_listener)
+        return jsonify({'success': True, 'files': log_files(log_listener)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
 @app.route('/api/generate-quest', methods=['POST'])
 def generate_quest():
     """Generate quests based on conversation context and player suggestions"""
@@ -242,284 +702,424 @@ def generate_quest():
         player_suggestion = data.get('player_suggestion', '')
         available_items = data.get('available_items', [])
         available_npcs = data.get('available_npcs', [])
+        apply_session_events(data)
         
-        logger.info(f"=== GENERATE QUEST REQUEST ===")
-        logger.info(f"NPC: {npc_name}")
-        logger.info(f"Player Suggestion: {player_suggestion}")
-        logger.info(f"Available Items: {available_items}")
-        logger.info(f"Available NPCs: {available_npcs}")
-        logger.info(f"LLM Quests Enabled: {USE_LLM_QUESTS}")
+        logger.info("Generate quest request", extra={
+            'npc': npc_name,
+            'player_suggestion': player_suggestion,
+            'available_items': available_items,
+            'available_npcs': available_npcs,
+            'llm_quests': USE_LLM_QUESTS
+        })
         
         if USE_LLM_QUESTS:
             # Use LLM-powered quest generation
-            logger.info("Using LLM-powered quest generation")
-            logger.info(f"Available Items Count: {len(available_items)}")
-            logger.info(f"Available NPCs Count: {len(available_npcs)}")
-            
             # Get NPC data from NPCData
             npc_data = get_npc_data_by_name(npc_name)
-            if npc_data:
-                quest = generate_dynamic_quest(
-                    npc_data['id'], 
-                    npc_name, 
-                    npc_data['personality'], 
-                    npc_data['role'], 
-                    {},  # player_context
-                    [],  # existing_quests
-                    available_items,
-                    available_npcs,
-                    player_suggestion
-                )
+            if quest_cascade is not None and npc_data:
+                quest = cascade_quest(npc_data, npc_name, available_items, available_npcs, player_suggestion)
+            elif npc_data:
+                # Started during the conversation if the player's messages gave the request away
+                quest = speculative_quest(npc_name, available_items, available_npcs, player_suggestion)
+                if quest is None:
+                    quest = generate_dynamic_quest(
+                        npc_data['id'], 
+                        npc_name, 
+                        npc_data['personality'], 
+                        npc_data['role'], 
+                        {},  # player_context
+                        [],  # existing_quests
+                        available_items,
+                        available_npcs,
+                        player_suggestion,
+                        priority=PRIORITY_GENERATE_QUEST
+                    )
             else:
                 # Fallback to simple quest generation
-                quest = generate_simple_quest(player_suggestion, available_items, available_npcs)
+                quest = generate_simple_quest(player_suggestion, available_items, available_npcs, npc_name)
         else:
             # Use simple rule-based quest generation
             logger.info("Using simple rule-based quest generation")
-            quest = generate_simple_quest(player_suggestion, available_items, available_npcs)
+            quest = generate_simple_quest(player_suggestion, available_items, available_npcs, npc_name)
         
-        logger.info(f"=== GENERATE QUEST RESPONSE ===")
-        logger.info(f"Generated Quest: {quest}")
+        logger.info("Generate quest response", extra={'npc': npc_name, 'quest': quest})
         
-        return jsonify({'success': True, 'quest': quest})
+        return jsonify({'success': True, 'quest': quest, **session_status()})
             
     except Exception as e:
         logger.error(f"Error generating quest: {str(e)}")
         return jsonify({'success': False, 'message': str(e)})
 
-def generate_simple_quest(player_suggestion, available_items, available_npcs):
-    """Generate a simple rule-based quest"""
+@app.route('/api/quests/batch', methods=['POST'])
+def handle_quest_batch():
+    """Generate several quests concurrently, returned in the order they were asked for"""
+    try:
+        data = request.get_json()
+        specs = quest_batch_specs(data)
+        apply_session_events(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        started = time.perf_counter()
+        # Each entry runs with a copy of this request's context (player and request id)
+        futures = [
+            quest_batch_executor.submit(contextvars.copy_context().run, generate_batch_quest, spec)
+            for spec in specs
+        ]
+        results = [future.result() for future in futures]
+        return jsonify(quest_batch_response(results, started))
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def generate_simple_quest(player_suggestion, available_items, available_npcs, npc_name=None):
+    """Generate a rule-based quest from the quest templates"""
     # Log token usage for simple quest generation (no LLM used)
     log_token_usage(f"Simple quest generation: {player_suggestion}", 0, "Simple Quest Generation")
     
-    # Simple quest generation without LLM for now
-    if 'collect' in player_suggestion.lower() or 'crystal' in player_suggestion.lower():
-        if available_items:
-            quest = {
-                "quest_type": "collect_item",
-                "title": f"Collect {available_items[0]}",
-                "description": f"Please collect {available_items[0]} for me.",
-                "target_item": available_items[0],
-                "quantity": 1,
-                "reward_crypto": 15,
-                "response": f"That's a great idea! I could really use some {available_items[0]}. Can you collect it for me?"
-            }
-        else:
-            quest = {
-                "quest_type": "collect_item",
-                "title": "Collect an item",
-                "description": "Please collect an item for me.",
-                "target_item": "crystal_red",
-                "quantity": 1,
-                "reward_crypto": 15,
-                "response": "That's a great idea! I could really use some help collecting items."
-            }
-    elif 'talk' in player_suggestion.lower() or 'message' in player_suggestion.lower():
-        if available_npcs:
-            quest = {
-                "quest_type": "talk_to_npc",
-                "title": f"Talk to {available_npcs[0]}",
-                "description": f"Please deliver a message to {available_npcs[0]}.",
-                "target_npc": available_npcs[0],
-                "reward_crypto": 10,
-                "response": f"That's perfect! I need to get a message to {available_npcs[0]}. Can you help me?"
-            }
-        else:
-            quest = {
-                "quest_type": "talk_to_npc",
-                "title": "Talk to someone",
-                "description": "Please deliver a message to another NPC.",
-                "target_npc": "Commander Sarah Chen",
-                "reward_crypto": 10,
-                "response": "That's perfect! I need to get a message to someone. Can you help me?"
-            }
-    else:
-        # Default quest
-        quest = {
-            "quest_type": "collect_item",
-            "title": f"Collect {available_items[0] if available_items else 'an item'}",
-            "description": f"Please collect {available_items[0] if available_items else 'an item'} for me.",
-            "target_item": available_items[0] if available_items else "crystal_red",
-            "quantity": 1,
-            "reward_crypto": 15,
-            "response": "I'd be happy to give you a task! Here's something you can help me with."
-        }
-    
-    return quest
+    # Templates mention the quest giver and their line of work, if it's an NPC we know
+    npc_data = get_npc_data_by_name(npc_name) if npc_name else None
+    giver, role = (npc_name, npc_data['role']) if npc_data else (None, None)
+    return quest_templates.build(QuestRequest(player_suggestion, available_items, available_npcs), giver, role)
 
 def get_npc_data_by_name(npc_name):
-    """Get NPC data by name (simplified version)"""
-    npc_data = {
-        'Commander Sarah Chen': {
-            'id': 'commander_sarah',
-            'personality': 'authoritative, strategic, concerned about colony security',
-            'role': 'Outpost Commander'
-        },
-        'Engineer Marcus Rodriguez': {
-            'id': 'engineer_marcus',
-            'personality': 'brilliant but eccentric, obsessed with technology',
-            'role': 'Chief Engineer'
-        },
-        'Trader Eliza Thompson': {
-            'id': 'trader_eliza',
-            'personality': 'charismatic, opportunistic, well-connected',
-            'role': 'Merchant'
-        },
-        'Scout Jake Williams': {
-            'id': 'scout_jake',
-            'personality': 'cautious, observant, has seen things in the wilderness',
-            'role': 'Frontier Scout'
-        },
-        'Dr. Kim Park': {
-            'id': 'medic_dr_kim',
-            'personality': 'compassionate, professional, slightly overwhelmed',
-            'role': 'Medical Officer'
-        },
-        'Rick "The Unfiltered"': {
-            'id': 'rick_unfiltered',
-            'personality': 'completely unfiltered, crude, says whatever comes to mind, no social boundaries',
-            'role': 'Unfiltered Resident'
-        }
+    """Get an NPC's registry entry (id, personality, role, ...) by display name"""
+    return npc_registry.by_name(npc_name)
+
+def canonical_npc_id(npc_id, npc_name):
+    """The registry id for an NPC given by (possibly old) id or by name; unknown NPCs keep the id they came with"""
+    npc = npc_registry.by_id(npc_id) if npc_id else None
+    npc = npc or npc_registry.by_name(npc_name)
+    return npc['id'] if npc else npc_id
+
+def resume_player_session(session_id):
+    """Look up the session a request named and make it the current one; returns it, or None"""
+    session = player_sessions.get(session_id) if session_id else None
+    current_player_session.set(session)
+    session_expired.set(bool(session_id) and session is None)
+    return session
+
+def update_player_session(session, data):
+    """POST /api/session: start a session from player_context, or reset/advance the current one.
+    
+    Returns (session, created).
+    """
+    created = session is None
+    if created:
+        session = player_sessions.create(current_player_id.get(), data.get('player_context'))
+        current_player_session.set(session)
+        session_expired.set(False)
+    elif data.get('player_context'):
+        player_sessions.reset(session, data['player_context'])
+    apply_session_events(data)
+    return session, created
+
+def apply_session_events(data):
+    """Apply the events a request carried to its player session"""
+    session = current_player_session.get()
+    if session is not None and data:
+        player_sessions.apply(session, data.get('session_events'))
+
+def request_player_context(data):
+    """The player_context a request sent, or else its session's state with the events it carried applied"""
+    apply_session_events(data)
+    if data.get('player_context'):
+        return data['player_context']
+    session = current_player_session.get()
+    return session.summary() if session is not None else {}
+
+def session_quest_ids():
+    session = current_player_session.get()
+    return list(session.active_quests) if session is not None else []
+
+def session_status():
+    """Response fields telling the client its session is gone and it should start a new one"""
+    return {'session_expired': True} if session_expired.get() else {}
+
+def apply_memory_updates(npc_name, updates):
+    """Store new memories and relationship scores sent by the client; returns how many memories were stored"""
+    if not updates or not npc_name:
+        return 0
+    player_id = current_player_id.get()
+    stored = 0
+    for memory in updates.get('memories', []):
+        if memory.get('content'):
+            npc_memory.add_memory(
+                player_id, npc_name, memory.get('category'), memory['content'],
+                memory.get('emotional_context'), memory.get('importance')
+            )
+            stored += 1
+    if updates.get('relationship'):
+        npc_memory.set_relationship(player_id, npc_name, updates['relationship'])
+    return stored
+
+def lookup_generation(payload):
+    """Return (generation_key, cached_result) for an Ollama payload; cached_result is None on a miss"""
+    key = GenerationCache.make_key(payload_prompt(payload), payload['model'], payload.get('options'))
+    if generation_cache is None:
+        return key, None
+    return key, generation_cache.get(key)
+
+def store_generation(key, result):
+    """Remember a successful generation under the key from lookup_generation"""
+    if generation_cache is not None:
+        generation_cache.put(key, {'response': result.get('response', '')})
+
+def generate_completion(payload, priority=PRIORITY_DIALOGUE, upstream=None):
+    """Run an Ollama generation, serving repeated prompts from the generation cache
+    and sharing one upstream call between identical in-flight requests.
+    
+    `upstream(payload)` makes the call; by default ollama_client.chat for chat
+    payloads and ollama_client.generate otherwise.
+    """
+    key, cached = lookup_generation(payload)
+    if cached is not None:
+        logger.info("Serving generation from cache")
+        return cached
+    
+    upstream = upstream or (ollama_client.chat if 'messages' in payload else ollama_client.generate)
+    
+    def call_upstream():
+        queued = time.perf_counter()
+        with generation_scheduler.slot(priority, current_player_id.get()):
+            started = time.perf_counter()
+            result = upstream(payload)
+        observe_generation(priority, payload, result, started - queued, time.perf_counter() - started)
+        store_generation(key, result)
+        return result
+    
+    return inflight_generations.do(key, call_upstream)
+
+def generation_kind(priority):
+    return 'dialogue' if priority == PRIORITY_DIALOGUE else 'quest'
+
+def observe_generation(priority, payload, result, queue_seconds, generation_seconds):
+    """Record an Ollama call's queue wait (None if it didn't queue), duration and reported token timings"""
+    kind = generation_kind(priority)
+    if queue_seconds is not None:
+        request_metrics.observe_stage(kind, 'queue', queue_seconds)
+    request_metrics.observe_stage(kind, 'generation', generation_seconds)
+    request_metrics.observe_generation(kind, payload['model'], result)
+
+def build_dialogue_payload(npc_name, personality, role, background, dialogue_style, player_message, player_context, memory_context):
+    """Build (and log) the Ollama request for an NPC dialogue line.
+    
+    Returns (payload, turn); hand the turn to finish_dialogue_response so the
+    exchange is kept in the player's session with this NPC.
+    """
+    with request_metrics.stage('dialogue', 'prompt_build'):
+        # Fixed per-NPC prefix, then this turn
+        system = dialogue_system_prompt(npc_name, personality, role, background, dialogue_style)
+        turn_text = create_dialogue_turn(npc_name, system, player_message, player_context, memory_context)
+        payload, turn = dialogue_sessions.build(
+            (current_player_id.get(), npc_name),
+            OLLAMA_MODEL,
+            system,
+            turn_text,
+            {
+                'temperature': 0.8,
+                'num_predict': DIALOGUE_MAX_TOKENS
+            },
+            OLLAMA_KEEP_ALIVE
+        )
+    
+    # Log token usage before sending
+    log_token_usage(f"{system}\n\n{turn_text}", DIALOGUE_MAX_TOKENS, f"Dialogue - {npc_name}")
+    
+    # Log the prompt being sent (the full text only for sampled requests)
+    fields = {'npc': npc_name, 'player_message': player_message, 'dialogue_api': DIALOGUE_API, 'warm_session': turn.warm}
+    if prompt_log_sampler.sampled():
+        fields['prompt'] = payload_prompt(payload)
+    logger.info("Dialogue request", extra=fields)
+    
+    return payload, turn
+
+def finish_dialogue_response(result, npc_name, turn=None):
+    """Clean (and log) a completed Ollama dialogue generation"""
+    llm_response = result.get('response', '').strip()
+    
+    # Clean the response to remove any instruction text
+    with request_metrics.stage('dialogue', 'clean'):
+        cleaned_response = clean_dialogue_response(llm_response)
+    if turn is not None:
+        dialogue_sessions.record(turn, result, cleaned_response)
+    
+    # Log the response received
+    fields = {
+        'npc': npc_name,
+        'response_chars': len(cleaned_response),
+        'prompt_eval_count': result.get('prompt_eval_count'),
+        'prefill_ms': round(result['prompt_eval_duration'] / 1e6, 1) if result.get('prompt_eval_duration') else None
     }
-    return npc_data.get(npc_name)
+    if prompt_log_sampler.sampled():
+        fields['response'] = cleaned_response
+    logger.info("Dialogue response", extra=fields)
+    
+    return cleaned_response
 
 def generate_llm_dialogue_response(npc_name, personality, role, background, dialogue_style, player_message, player_context, memory_context):
     """Generate LLM response for dialogue"""
     try:
-        # Create prompt for the LLM
-        prompt = create_dialogue_prompt(npc_name, personality, role, background, dialogue_style, player_message, player_context, memory_context)
-        
-        # Log token usage before sending
-        log_token_usage(prompt, 150, f"Dialogue - {npc_name}")
-        
-        # Log the prompt being sent
-        logger.info(f"=== DIALOGUE REQUEST ===")
-        logger.info(f"NPC: {npc_name}")
-        logger.info(f"Player Message: {player_message}")
-        logger.info(f"Prompt Sent:")
-        logger.info(prompt)
-        logger.info(f"========================")
-        
-        # Send request to Ollama
-        response = requests.post(f"{OLLAMA_URL}/api/generate", json={
-            'model': OLLAMA_MODEL,
-            'prompt': prompt,
-            'stream': False,
-            'options': {
-                'temperature': 0.8,
-                'max_tokens': 150
-            }
-        })
+        payload, turn = build_dialogue_payload(npc_name, personality, role, background, dialogue_style, player_message, player_context, memory_context)
         
-        if response.status_code == 200:
-            result = response.json()
-            llm_response = result.get('response', '').strip()
-            
-            # Clean the response to remove any instruction text
-            cleaned_response = clean_dialogue_response(llm_response)
-            
-            # Log the response received
-            logger.info(f"=== DIALOGUE RESPONSE ===")
-            logger.info(f"NPC: {npc_name}")
-            logger.info(f"Response Received:")
-            logger.info(cleaned_response)
-            logger.info(f"========================")
-            
-            return cleaned_response
-        else:
-            # Log error
-            logger.error(f"Ollama API error: {response.status_code} - {response.text}")
-            # Fallback response
-            return get_fallback_dialogue_response(npc_name)
+        # Send request to Ollama (or reuse a cached generation)
+        result = generate_completion(payload, PRIORITY_DIALOGUE)
+        
+        response = finish_dialogue_response(result, npc_name, turn)
+        request_metrics.record_outcome('dialogue', npc_name, 'llm')
+        return response
             
+    except OllamaUnavailable as e:
+        logger.warning(f"Ollama unavailable ({e}), using fallback dialogue for {npc_name}")
+    except OllamaError as e:
+        # Log error
+        logger.error(f"Ollama API error: {e}")
     except Exception as e:
         logger.error(f"Error generating LLM response: {e}")
-        return get_fallback_dialogue_response(npc_name)
-
-def clean_dialogue_response(response_text):
-    """Clean LLM response to remove instruction text and memory context"""
-    if not response_text:
-        return "I'm not sure how to respond to that."
-    
-    # Remove common instruction patterns
-    patterns_to_remove = [
-        r"If the player asks about.*?\.",  # Remove instruction text
-        r"Respond as.*?\.",  # Remove instruction text
-        r"Keep responses under.*?\.",  # Remove instruction text
-        r"Be true to.*?\.",  # Remove instruction text
-        r"If there are relevant memories.*?\.",  # Remove instruction text
-        r"Response:",  # Remove response labels
-        r"Answer:",  # Remove answer labels
-        r"Dialogue:",  # Remove dialogue labels
-        r"=== NPC MEMORY CONTEXT ===",  # Remove memory context headers
-        r"=== END MEMORY CONTEXT ===",  # Remove memory context footers
-        r"RELATIONSHIP STATUS:.*?RECENT CONVERSATION CONTEXT:.*?=== END MEMORY CONTEXT ===",  # Remove full memory context
-        r"IMPORTANT INSTRUCTIONS:.*?DO NOT include instruction text in your response",  # Remove instruction block
-        r"PERSONALITY:.*?DIALOGUE STYLE:.*?PLAYER CONTEXT:.*?The player says:",  # Remove full prompt
-    ]
-    
-    cleaned = response_text.strip()
-    
-    # Apply pattern removals
-    for pattern in patterns_to_remove:
-        cleaned = re.sub(pattern, "", cleaned, flags=re.DOTALL | re.IGNORECASE)
-    
-    # Remove lines that look like memory context
-    lines = cleaned.split('\n')
-    filtered_lines = []
-    in_memory_context = False
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Skip memory context lines
-        if any(keyword in line.lower() for keyword in [
-            'relationship status:', 'trust:', 'friendship:', 'respect:', 'attraction:',
-            'personal_info:', 'relationship:', 'promises:', 'emotional:', 'gossip:', 'trade:', 'quests:',
-            'recent conversation context:', 'player:', 'npc:', 'emotion:',
-            '===', 'memory context', 'end memory context'
-        ]):
-            continue
-            
-        # Skip instruction lines
-        if any(keyword in line.lower() for keyword in [
-            'important instructions:', 'respond naturally', 'keep responses', 'be true to',
-            'use the memory context', 'do not include', 'personality:', 'background:', 'dialogue style:'
-        ]):
-            continue
-            
-        filtered_lines.append(line)
     
-    cleaned = ' '.join(filtered_lines).strip()
+    # Fallback response
+    request_metrics.record_outcome('dialogue', npc_name, 'fallback')
+    return get_fallback_dialogue_response(npc_name)
+
+def stream_llm_dialogue_response(npc_name, personality, role, background, dialogue_style, player_message, player_context, memory_context):
+    """Generate LLM dialogue as a sequence of stream events.
     
-    # If we have a meaningful response, return it
-    if cleaned and len(cleaned) > 5:
-        return cleaned
+    Yields {'type': 'chunk', 'text': ...} for each cleaned sentence followed by a
+    final {'type': 'done', 'message': ...} carrying the full response. If Ollama is
+    unavailable the fallback line is sent as a single chunk.
+    """
+    payload, turn = build_dialogue_payload(npc_name, personality, role, background, dialogue_style, player_message, player_context, memory_context)
+    payload['stream'] = True
+    stream = ollama_client.chat_stream if 'messages' in payload else ollama_client.generate_stream
     
-    # Fallback responses if cleaning removed everything
-    fallback_responses = [
-        "I'm not sure how to respond to that.",
-        "That's an interesting question.",
-        "I need to think about that for a moment.",
-        "Let me consider what you're asking."
-    ]
+    start = datetime.now()
+    first_chunk_ms = None
+    sentences = []
+    fallback = False
+    final = {}  # The last chunk: prefill timings and, from /api/generate, the context
     
-    return random.choice(fallback_responses)
+    def tokens():
+        cache_key, cached = lookup_generation(payload)
+        if cached is not None:
+            yield cached['response']
+            return
+        
+        raw = []
+        queued = time.perf_counter()
+        with generation_scheduler.slot(PRIORITY_DIALOGUE, current_player_id.get()):
+            started = time.perf_counter()
+            for chunk in stream(payload):
+                raw.append(chunk.get('response', ''))
+                yield raw[-1]
+                if chunk.get('done'):
+                    final.update(chunk)
+                    # Includes time spent cleaning and sending earlier sentences
+                    observe_generation(PRIORITY_DIALOGUE, payload, final, started - queued, time.perf_counter() - started)
+                    store_generation(cache_key, {'response': ''.join(raw)})
+                    break
+    
+    cleaner = DialogueStreamCleaner()
+    
+    def cleaned_sentences():
+        for piece in tokens():
+            yield from cleaner.feed(piece)
+        yield from cleaner.flush()
+    
+    try:
+        for sentence in cleaned_sentences():
+            if first_chunk_ms is None:
+                first_chunk_ms = (datetime.now() - start).total_seconds() * 1000
+            sentences.append(sentence)
+            yield {'type': 'chunk', 'text': sentence}
+    except OllamaUnavailable as e:
+        logger.warning(f"Ollama unavailable ({e}), using fallback dialogue for {npc_name}")
+        fallback = True
+    except OllamaError as e:
+        logger.error(f"Ollama streaming error: {e}")
+        fallback = True
+    
+    yield from finish_dialogue_stream(npc_name, turn, sentences, fallback, final, first_chunk_ms, cleaner.message())
 
-def create_dialogue_prompt(npc_name, personality, role, background, dialogue_style, player_message, player_context, memory_context):
-    """Create a prompt for dialogue generation"""
+def finish_dialogue_stream(npc_name, turn, sentences, fallback, final, first_chunk_ms, cleaned):
+    """The events that end a dialogue stream once the sentences have been sent.
     
-    # Simplify context for dialogue
-    simplified_context = {
+    `cleaned` is the whole reply as the blocking path cleans it; the 'done'
+    event carries it as the message, so it also corrects the rare line the
+    sentence-by-sentence cleaning let through. A stream that sent nothing gets
+    the fallback line (or, if cleaning left too little, `cleaned`, which is
+    then what the blocking path would say) as its only chunk. After an upstream
+    error the message is what was sent.
+    """
+    events = []
+    if fallback and not sentences:
+        sentences = [get_fallback_dialogue_response(npc_name)]
+        events.append({'type': 'chunk', 'text': sentences[0]})
+    elif not sentences:
+        sentences = [cleaned]
+        events.append({'type': 'chunk', 'text': cleaned})
+    
+    message = ' '.join(sentences) if fallback else cleaned
+    if not fallback:
+        dialogue_sessions.record(turn, final, message)
+    request_metrics.record_outcome('dialogue', npc_name, 'fallback' if fallback else 'llm')
+    fields = {'npc': npc_name, 'first_chunk_ms': first_chunk_ms, 'response_chars': len(message), 'prompt_eval_count': final.get('prompt_eval_count')}
+    if prompt_log_sampler.sampled():
+        fields['response'] = message
+    logger.info("Streaming dialogue response", extra=fields)
+    
+    events.append({
+        'type': 'done',
+        'message': message,
+        'fallback': fallback,
+        'first_chunk_ms': round(first_chunk_ms, 1) if first_chunk_ms is not None else None,
+        'timestamp': datetime.now().isoformat()
+    })
+    return events
+
+def create_dialogue_system_prompt(npc_name, personality, role, background, dialogue_style):
+    """The part of a dialogue prompt that is the same on every turn with this NPC"""
+    return f"""You are {npc_name}, a {role} in a sci-fi frontier outpost.
+
+PERSONALITY: {personality}
+BACKGROUND: {background}
+DIALOGUE STYLE: {dialogue_style}
+
+IMPORTANT INSTRUCTIONS:
+- Respond naturally as {npc_name} in character
+- Keep responses under 2-3 sentences
+- Use the memory context to inform your response, but don't repeat it
+- Be true to your personality and role
+- If you remember something relevant from the memory context, reference it naturally
+- DO NOT include the memory context text in your response
+- DO NOT include instruction text in your response"""
+
+def dialogue_system_prompt(npc_name, personality, role, background, dialogue_style):
+    """The registry's precompiled system prompt, unless the request describes the NPC differently"""
+    npc, system = npc_registry.dialogue_prompt(npc_name)
+    given = {'personality': personality, 'role': role, 'background': background, 'dialogue_style': dialogue_style}
+    if npc is None or any(value and value != npc[field] for field, value in given.items()):
+        return create_dialogue_system_prompt(npc_name, personality, role, background, dialogue_style)
+    return system
+
+def simplify_player_context(player_context):
+    """The three numbers prompts use from a player_context"""
+    if 'active_quests_count' in player_context:
+        # Already summarized by the player's session
+        return player_context
+    return {
         'crypto': player_context.get('crypto', 0),
         'active_quests_count': len(player_context.get('active_quests', [])),
         'inventory_count': len(player_context.get('inventory', []))
     }
+
+def create_dialogue_turn(npc_name, system_prompt, player_message, player_context, memory_context):
+    """The part of a dialogue prompt that changes every turn: player context, relevant memories and the message"""
+    
+    # Simplify context for dialogue
+    simplified_context = simplify_player_context(player_context)
     
     # Format memory context - handle both old and new formats
-    memory_text = ""
     if memory_context:
         if "=== NPC MEMORY CONTEXT ===" in memory_context:
             # New enhanced format - use as is
@@ -527,89 +1127,320 @@ def create_dialogue_prompt(npc_name, personality, role, background, dialogue_sty
         else:
             # Old format - convert to new format
             memory_text = f"\n\n=== NPC MEMORY CONTEXT ===\n{memory_context}\n=== END MEMORY CONTEXT ===\n\n"
+    else:
+        # Current clients keep memories on the server; pull only the ones relevant to this message.
+        # A session with history already has the last exchanges, so they're left out of the memory block.
+        player_id = current_player_id.get()
+        memory_text = npc_memory.build_context(
+            player_id, npc_name, player_message,
+            include_recent=not dialogue_sessions.has_history((player_id, npc_name))
+        )
     
-    prompt = f"""You are {npc_name}, a {role} in a sci-fi frontier outpost.
-
-PERSONALITY: {personality}
-BACKGROUND: {background}
-DIALOGUE STYLE: {dialogue_style}
-
-PLAYER CONTEXT: {simplified_context}
+    def render(memory_text):
+        turn = f"""PLAYER CONTEXT: {simplified_context}
 
 {memory_text}
 
 The player says: "{player_message}"
+"""
+        # In chat mode the reply comes back in the assistant role; as plain text it follows the NPC's name
+        return turn if DIALOGUE_API == 'chat' else f"{turn}\n{npc_name}:\n"
+    
+    turn = render(memory_text)
+    
+    # Trim the lowest-value memories if the prompt would overflow the context window
+    prefix_tokens = estimate_tokens(system_prompt)
+    if memory_text and prefix_tokens + estimate_tokens(turn) > MAX_INPUT_TOKENS:
+        available_tokens = MAX_INPUT_TOKENS - prefix_tokens - estimate_tokens(render(""))
+        memory_text, tokens_cut = context_budget.fit_memory(memory_text, max(available_tokens, 0))
+        turn = render(memory_text)
+        logger.warning(f"Prompt for {npc_name} exceeded {MAX_INPUT_TOKENS} tokens, cut {tokens_cut} tokens of memory context")
+    
+    return turn
 
-IMPORTANT INSTRUCTIONS:
-- Respond naturally as {npc_name} in character
-- Keep responses under 2-3 sentences
-- Use the memory context to inform your response, but don't repeat it
-- Be true to your personality and role
-- If you remember something relevant from the memory context, reference it naturally
-- DO NOT include the memory context text in your response
-- DO NOT include instruction text in your response
+def build_quest_payload(npc_id, npc_name, personality, role, player_context, existing_quests, available_items=None, available_npcs=None, player_suggestion=None, model=None):
+    """Build (and log) the Ollama request for a quest, for OLLAMA_QUEST_MODEL unless another model is given"""
+    with request_metrics.stage('quest', 'prompt_build'):
+        prompt = create_quest_prompt(npc_id, npc_name, personality, role, player_context, existing_quests, available_items, available_npcs, player_suggestion)
+    
+    # Log token usage before sending
+    log_token_usage(prompt, QUEST_MAX_TOKENS, f"Quest Generation - {npc_name}")
+    
+    # Log the quest prompt being sent (the full text only for sampled requests)
+    fields = {'npc': npc_name, 'npc_id': npc_id, 'player_suggestion': player_suggestion, 'model': model or OLLAMA_QUEST_MODEL}
+    if prompt_log_sampler.sampled():
+        fields['prompt'] = prompt
+    logger.info("Quest request", extra=fields)
+    
+    # Streamed, JSON-constrained and capped at QUEST_MAX_TOKENS
+    return quest_output.apply({
+        'model': model or OLLAMA_QUEST_MODEL,
+        'prompt': prompt,
+        'keep_alive': OLLAMA_KEEP_ALIVE,
+        'options': {
+            'temperature': 0.8
+        }
+    })
 
-{npc_name}:
-"""
+def finish_quest_response(result, npc_id, npc_name, available_items=None, available_npcs=None, player_suggestion=None):
+    """Parse (and log) a completed Ollama quest generation"""
+    quest_text = result.get('response', '').strip()
     
-    return prompt
+    # Log the quest response received
+    fields = {'npc': npc_name, 'npc_id': npc_id, 'response_chars': len(quest_text), 'stopped_early': result.get('stopped_early')}
+    if prompt_log_sampler.sampled():
+        fields['response'] = quest_text
+    logger.info("Quest response", extra=fields)
+    
+    # Parse the response into a quest structure
+    return parse_quest_response(quest_text, npc_id, available_items, available_npcs, player_suggestion)
 
-def generate_dynamic_quest(npc_id, npc_name, personality, role, player_context, existing_quests, available_items=None, available_npcs=None, player_suggestion=None):
-    """Generate a dynamic quest based on NPC personality and context"""
+def stream_quest(payload):
+    """Upstream call for quests: read the stream only until the JSON object closes"""
+    return quest_output.read(ollama_client.generate_stream(payload))
+
+def generate_quest_completion(payload, priority):
+    """generate_completion for a quest payload, retrying without `format` if Ollama rejects it"""
     try:
-        prompt = create_quest_prompt(npc_id, npc_name, personality, role, player_context, existing_quests, available_items, available_npcs, player_suggestion)
+        return generate_completion(payload, priority, stream_quest)
+    except OllamaError as e:
+        retry = quest_output.downgrade(payload, e)
+        if retry is None:
+            raise
+        return generate_completion(retry, priority, stream_quest)
+
+def pooled_quest(npc_id, npc_name, personality, role, available_items=None, available_npcs=None, player_suggestion=None):
+    """A pre-generated quest for this NPC, or None if its pool is empty or the player asked for something specific"""
+    if quest_pool is None:
+        return None
+    if player_suggestion:
+        quest_pool.bypass()
+        return None
+    quest = quest_pool.take({
+        'npc_id': npc_id,
+        'npc_name': npc_name,
+        'npc_personality': personality,
+        'npc_role': role,
+        'available_items': available_items,
+        'available_npcs': available_npcs
+    })
+    if quest is not None:
+        logger.info("Quest served from pool", extra={'npc': npc_name, 'npc_id': npc_id})
+        request_metrics.record_outcome('quest', npc_name, 'pool')
+    return quest
+
+def rules_quest(plan, npc_id, npc_name, role):
+    """Quest from the templates for a plan the cascade routed to rules"""
+    quest = quest_templates.build(plan.request, npc_name, role)
+    quest['id'] = f"{npc_id}_quest_{datetime.now().timestamp()}"
+    quest['status'] = 'available'
+    request_metrics.record_outcome('quest', npc_name, 'rules')
+    return quest
+
+def cascade_quest(npc_data, npc_name, available_items, available_npcs, player_suggestion):
+    """/api/generate-quest through the quest cascade: templates, then the small model, then the large one"""
+    started = time.perf_counter()
+    plan = quest_cascade.plan(player_suggestion, available_items, available_npcs)
+    quest = None
+    if plan.tier == TIER_SMALL:
+        # Speculative quests come from the small model
+        quest = speculative_quest(npc_name, available_items, available_npcs, player_suggestion)
+    else:
+        discard_speculation(npc_name, available_items, available_npcs)
+    if plan.tier == TIER_RULES:
+        quest = rules_quest(plan, npc_data['id'], npc_name, npc_data['role'])
+    elif quest is None:
+        quest = generate_dynamic_quest(
+            npc_data['id'], npc_name, npc_data['personality'], npc_data['role'], {}, [],
+            available_items, available_npcs, player_suggestion,
+            priority=PRIORITY_GENERATE_QUEST,
+            model=quest_cascade.model_for(plan),
+            escalate=lambda quest: quest_cascade.escalation(plan, quest, is_fallback_quest(quest))
+        )
+    quest_cascade.record(plan, npc_name, time.perf_counter() - started)
+    return quest
+
+def speculate_quest(player_id, npc_name, player_message):
+    """Start generating this player's next quest from the NPC if the message suggests they'll ask for one"""
+    if quest_speculator is None:
+        return
+    # Same NPC data /api/generate-quest will use, so the speculative prompt matches the real one
+    npc_data = get_npc_data_by_name(npc_name)
+    if npc_data:
+        quest_speculator.observe(player_id, {
+            'npc_id': npc_data['id'],
+            'npc_name': npc_name,
+            'npc_personality': npc_data['personality'],
+            'npc_role': npc_data['role']
+        }, player_message)
+
+def speculative_quest(npc_name, available_items, available_npcs, player_suggestion):
+    """The quest speculated for this player and NPC, or None if there's none or it isn't what they asked for"""
+    if quest_speculator is None:
+        return None
+    quest = quest_speculator.take(
+        current_player_id.get(), npc_name, available_items, available_npcs, player_suggestion,
+        timeout=QUEUE_TIMEOUT_GENERATE_QUEST
+    )
+    if quest is not None:
+        logger.info("Quest served from speculation", extra={'npc': npc_name, 'npc_id': quest.get('id')})
+        request_metrics.record_outcome('quest', npc_name, 'speculative')
+    return quest
+
+def discard_speculation(npc_name, available_items, available_npcs):
+    """Forget the quest speculated for this player and NPC; the request is being answered another way"""
+    if quest_speculator is not None:
+        quest_speculator.discard(current_player_id.get(), npc_name, available_items, available_npcs)
+
+def generate_background_quest(spec):
+    """One quest straight from Ollama for the quest pool or speculation (uncached, so they differ), or None"""
+    npc_id, npc_name = spec['npc_id'], spec['npc_name']
+    available_items, available_npcs = spec['available_items'], spec['available_npcs']
+    player_suggestion = spec.get('player_suggestion')
+    # Pooled quests are shared by every player, so they're made without player context
+    payload = build_quest_payload(npc_id, npc_name, spec['npc_personality'], spec['npc_role'], {}, [], available_items, available_npcs, player_suggestion)
+    started = time.perf_counter()
+    try:
+        result = stream_quest(payload)
+    except OllamaError as e:
+        retry = quest_output.downgrade(payload, e)
+        if retry is None:
+            raise
+        result = stream_quest(retry)
+    observe_generation(PRIORITY_BACKGROUND, payload, result, None, time.perf_counter() - started)
+    quest = finish_quest_response(result, npc_id, npc_name, available_items, available_npcs, player_suggestion)
+    return None if is_fallback_quest(quest) else quest
+
+def generate_dynamic_quest(npc_id, npc_name, personality, role, player_context, existing_quests, available_items=None, available_npcs=None, player_suggestion=None, priority=PRIORITY_QUEST, model=None, escalate=None):
+    """Generate a dynamic quest based on NPC personality and context.
+    
+    `escalate(quest)` may return a bigger model to generate the quest again
+    with when the first one isn't good enough.
+    """
+    try:
+        quest = pooled_quest(npc_id, npc_name, personality, role, available_items, available_npcs, player_suggestion)
+        if quest is not None:
+            return quest
         
-        # Log token usage before sending
-        log_token_usage(prompt, 300, f"Quest Generation - {npc_name}")
-        
-        # Log the quest prompt being sent
-        logger.info(f"=== QUEST REQUEST ===")
-        logger.info(f"NPC: {npc_name} ({npc_id})")
-        logger.info(f"Player Suggestion: {player_suggestion}")
-        logger.info(f"Prompt Sent:")
-        logger.info(prompt)
-        logger.info(f"=====================")
-        
-        response = requests.post(f"{OLLAMA_URL}/api/generate", json={
-            'model': OLLAMA_MODEL,
-            'prompt': prompt,
-            'stream': False,
-            'options': {
-                'temperature': 0.8,
-                'max_tokens': 300
-            }
-        })
+        payload = build_quest_payload(npc_id, npc_name, personality, role, player_context, existing_quests, available_items, available_npcs, player_suggestion, model)
         
-        if response.status_code == 200:
-            result = response.json()
-            quest_text = result.get('response', '').strip()
-            
-            # Log the quest response received
-            logger.info(f"=== QUEST RESPONSE ===")
-            logger.info(f"NPC: {npc_name} ({npc_id})")
-            logger.info(f"Response Received:")
-            logger.info(quest_text)
-            logger.info(f"=====================")
-            
-            # Parse the response into a quest structure
-            return parse_quest_response(quest_text, npc_id, available_items, available_npcs, player_suggestion)
-        else:
-            logger.error(f"Ollama API error for quest: {response.status_code} - {response.text}")
-            return get_fallback_quest(npc_id)
+        result = generate_quest_completion(payload, priority)
+        
+        quest = finish_quest_response(result, npc_id, npc_name, available_items, available_npcs, player_suggestion)
+        
+        retry_model = escalate(quest) if escalate else None
+        if retry_model:
+            logger.info(f"Quest for {npc_id} missed the suggestion, escalating to {retry_model}")
+            payload = build_quest_payload(npc_id, npc_name, personality, role, player_context, existing_quests, available_items, available_npcs, player_suggestion, retry_model)
+            result = generate_quest_completion(payload, priority)
+            quest = finish_quest_response(result, npc_id, npc_name, available_items, available_npcs, player_suggestion)
             
+    except OllamaUnavailable as e:
+        logger.warning(f"Ollama unavailable ({e}), using fallback quest for {npc_id}")
+        quest = get_fallback_quest(npc_id)
+    except OllamaError as e:
+        logger.error(f"Ollama API error for quest: {e}")
+        quest = get_fallback_quest(npc_id)
     except Exception as e:
         logger.error(f"Error generating quest: {e}")
-        return get_fallback_quest(npc_id)
+        quest = get_fallback_quest(npc_id)
+    
+    record_quest_outcome(npc_name, quest)
+    return quest
+
+def quest_batch_specs(data):
+    """The entries of an /api/quests/batch body, with the batch-wide fields filled in.
+    
+    The body is {"quests": [spec, ...]} plus optional player_context,
+    existing_quests, available_items and available_npcs shared by every entry;
+    an entry's own fields win. Raises ValueError for a malformed batch.
+    """
+    specs = data.get('quests') if isinstance(data, dict) else None
+    if not isinstance(specs, list) or not specs:
+        raise ValueError('quests must be a non-empty list of quest specs')
+    if len(specs) > QUEST_BATCH_MAX:
+        raise ValueError(f"At most {QUEST_BATCH_MAX} quests per batch (got {len(specs)})")
+    shared = {field: data[field] for field in ('player_context', 'existing_quests', 'available_items', 'available_npcs') if field in data}
+    return [{**shared, **spec} if isinstance(spec, dict) else spec for spec in specs]
+
+def resolve_quest_spec(spec):
+    """build_quest_payload arguments for one batch entry.
+    
+    An entry looks like an /api/quest body (npc_id, npc_name, npc_personality,
+    npc_role) or an /api/generate-quest one, where only npc_name is given and
+    the NPC is looked up.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError('Each quest spec must be an object')
+    npc_id = spec.get('npc_id')
+    npc_name = spec.get('npc_name')
+    personality = spec.get('npc_personality')
+    role = spec.get('npc_role')
+    if not (personality and role):
+        npc_data = get_npc_data_by_name(npc_name)
+        if npc_data is None:
+            raise ValueError(f"Unknown NPC '{npc_name or npc_id}'")
+        npc_id = npc_id or npc_data['id']
+        personality = personality or npc_data['personality']
+        role = role or npc_data['role']
+    return (
+        npc_id, npc_name, personality, role,
+        spec.get('player_context') or request_player_context({}), spec.get('existing_quests') or session_quest_ids(),
+        spec.get('available_items'), spec.get('available_npcs'), spec.get('player_suggestion')
+    )
+
+def is_fallback_quest(quest):
+    # Unparseable output is replaced by the fallback quest rather than raising
+    return str(quest.get('id', '')).startswith('fallback_')
+
+def record_quest_outcome(npc_name, quest):
+    request_metrics.record_outcome('quest', npc_name, 'fallback' if is_fallback_quest(quest) else 'llm')
+
+def batch_quest_result(quest):
+    return {'success': True, 'quest': quest, 'fallback': is_fallback_quest(quest)}
+
+def batch_quest_error(spec, error):
+    npc_id = spec.get('npc_id') if isinstance(spec, dict) else None
+    npc_name = spec.get('npc_name') if isinstance(spec, dict) else None
+    logger.warning(f"Batch quest for {npc_id} failed ({error}), using fallback quest")
+    request_metrics.record_outcome('quest', npc_name or npc_id, 'fallback')
+    return {'success': False, 'error': str(error), 'quest': get_fallback_quest(npc_id), 'fallback': True}
+
+def generate_batch_quest(spec):
+    """One /api/quests/batch entry; a failure becomes that NPC's fallback quest and an error"""
+    try:
+        args = resolve_quest_spec(spec)
+        quest = pooled_quest(*args[:4], *args[6:])
+        if quest is None:
+            payload = build_quest_payload(*args)
+            result = generate_quest_completion(payload, PRIORITY_QUEST)
+            npc_id, npc_name = args[0], args[1]
+            quest = finish_quest_response(result, npc_id, npc_name, *args[6:])
+            record_quest_outcome(npc_name, quest)
+        return batch_quest_result(quest)
+    except Exception as e:
+        return batch_quest_error(spec, e)
+
+def quest_batch_response(results, started):
+    """Response body for a finished batch"""
+    elapsed = time.perf_counter() - started
+    generated = sum(1 for result in results if result['success'] and not result['fallback'])
+    logger.info("Quest batch", extra={'quests': len(results), 'generated': generated, 'elapsed_ms': round(elapsed * 1000, 1)})
+    return {
+        'success': True,
+        'quests': results,
+        'generated': generated,
+        'failed': sum(1 for result in results if not result['success']),
+        'elapsed_ms': round(elapsed * 1000, 1),
+        'timestamp': datetime.now().isoformat(),
+        **session_status()
+    }
 
 def create_quest_prompt(npc_id, npc_name, personality, role, player_context, existing_quests, available_items=None, available_npcs=None, player_suggestion=None):
     """Create a prompt for quest generation"""
     
     # Simplify context for quest generation
-    simplified_context = {
-        'crypto': player_context.get('crypto', 0),
-        'active_quests_count': len(player_context.get('active_quests', [])),
-        'inventory_count': len(player_context.get('inventory', []))
-    }
+    simplified_context = simplify_player_context(player_context)
     available_items = available_items or []
     available_npcs = available_npcs or []
     player_suggestion = player_suggestion or ""
@@ -658,298 +1489,62 @@ Respond with ONLY the JSON:"""
 def parse_quest_response(quest_text, npc_id, available_items=None, available_npcs=None, player_suggestion=None):
     """Parse LLM response into quest structure"""
     try:
-        # Clean the response text
-        quest_text = quest_text.strip()
-        
-        # Strategy 1: Try to find JSON between curly braces
-        if '{' in quest_text and '}' in quest_text:
-            start = quest_text.find('{')
-            end = quest_text.rfind('}') + 1
-            json_str = quest_text[start:end]
-            
-            # Try to parse the JSON
-            try:
-                quest = json.loads(json_str)
-                logger.info(f"Successfully parsed JSON from LLM response")
-                
-                # Validate and fix quest data
-                quest = validate_quest_data(quest, available_items, available_npcs, player_suggestion)
-                
-                # Ensure required fields
-                quest['id'] = quest.get('id', f"{npc_id}_quest_{datetime.now().timestamp()}")
-                quest['status'] = 'available'
-                
-                return quest
-            except json.JSONDecodeError as e:
-                logger.warning(f"JSON parsing failed: {e}")
-        
-        # Strategy 2: Try to extract JSON from lines that look like JSON
-        lines = quest_text.split('\n')
-        for line in lines:
-            line = line.strip()
-            if line.startswith('{') and line.endswith('}'):
-                try:
-                    quest = json.loads(line)
-                    logger.info(f"Successfully parsed JSON from line: {line}")
-                    
-                    # Validate and fix quest data
-                    quest = validate_quest_data(quest, available_items, available_npcs, player_suggestion)
-                    
-                    # Ensure required fields
-                    quest['id'] = quest.get('id', f"{npc_id}_quest_{datetime.now().timestamp()}")
-                    quest['status'] = 'available'
-                    
-                    return quest
-                except json.JSONDecodeError:
-                    continue
-        
-        # Strategy 3: Try to fix common JSON issues
-        # Remove quotes around the entire response if present
-        if quest_text.startswith('"') and quest_text.endswith('"'):
-            quest_text = quest_text[1:-1]
-        
-        # Try to find the first valid JSON object
-        import re
-        json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
-        matches = re.findall(json_pattern, quest_text)
-        
-        for match in matches:
-            try:
-                quest = json.loads(match)
-                logger.info(f"Successfully parsed JSON using regex: {match}")
-                
-                # Validate and fix quest data
-                quest = validate_quest_data(quest, available_items, available_npcs, player_suggestion)
-                
-                # Ensure required fields
-                quest['id'] = quest.get('id', f"{npc_id}_quest_{datetime.now().timestamp()}")
-                quest['status'] = 'available'
-                
-                return quest
-            except json.JSONDecodeError:
-                continue
-        
-        # If all strategies fail, log the problematic response and fallback
-        logger.error(f"Failed to parse quest response. Raw response: {quest_text}")
-        return get_fallback_quest(npc_id)
+        with request_metrics.stage('quest', 'parse'):
+            quest = quest_output.parse(quest_text)
+        if quest is None:
+            # Nothing parsed: log the problematic response and fall back
+            logger.error(f"Failed to parse quest response. Raw response: {quest_text}")
+            return get_fallback_quest(npc_id)
+        
+        # Validate and fix quest data
+        with request_metrics.stage('quest', 'validate'):
+            quest = validate_quest_data(quest, available_items, available_npcs, player_suggestion)
+        
+        # Ensure required fields
+        quest['id'] = quest.get('id', f"{npc_id}_quest_{datetime.now().timestamp()}")
+        quest['status'] = 'available'
+        
+        return quest
             
     except Exception as e:
         logger.error(f"Error parsing quest response: {e}")
         logger.error(f"Raw response was: {quest_text}")
         return get_fallback_quest(npc_id)
 
-def validate_quest_data(quest, available_items=None, available_npcs=None, player_suggestion=None):
-    """Validate and fix quest data to ensure it uses only available items/NPCs"""
-    available_items = available_items or []
-    available_npcs = available_npcs or []
-    
-    # Extract reward amount from player suggestion if mentioned
-    if player_suggestion:
-        import re
-        # Look for numbers followed by "crypto" or just numbers that might be crypto amounts
-        crypto_matches = re.findall(r'(\d+)\s*crypto', player_suggestion.lower())
-        if crypto_matches:
-            suggested_reward = int(crypto_matches[0])
-            # Use the suggested reward, but cap it at a reasonable amount (1000 instead of 200)
-            quest['reward_crypto'] = min(suggested_reward, 1000)
-            logger.info(f"Using player-suggested reward: {suggested_reward} crypto (capped at {quest['reward_crypto']})")
-    
-    # Validate collect_item quests
-    if quest.get('quest_type') == 'collect_item':
-        target_item = quest.get('target_item')
-        
-        # If target item is not in available items, try to find a close match
-        if target_item and target_item not in available_items:
-            logger.warning(f"Target item '{target_item}' not in available items, looking for close match")
-            
-            # Try to find a close match based on player suggestion
-            if player_suggestion:
-                suggestion_lower = player_suggestion.lower()
-                
-                # Look for item mentions in the suggestion
-                for item in available_items:
-                    item_lower = item.lower()
-                    # Check if the item name or parts of it appear in the suggestion
-                    if (item_lower in suggestion_lower or 
-                        any(word in suggestion_lower for word in item_lower.split('_'))):
-                        quest['target_item'] = item
-                        logger.info(f"Found close match: '{target_item}' -> '{item}'")
-                        break
-                
-                # If no close match found, try some common mappings
-                if quest['target_item'] not in available_items:
-                    common_mappings = {
-                        'alien': 'alien_relic',
-                        'crystal': 'crystal_red',
-                        'rock': 'space_rock',
-                        'ore': 'iron_ore',
-                        'plant': 'plant_fiber',
-                        'artifact': 'enigmatic_artifact',
-                        'dust': 'cosmic_dust',
-                        'shard': 'impact_shard',
-                        'spire': 'crystal_spires',
-                        'rubble': 'ancient_rubble',
-                        'stalk': 'glow_stalk',
-                        'fragment': 'meteorite_fragment',
-                        'azure': 'azure_crystal'
-                    }
-                    
-                    for keyword, item_id in common_mappings.items():
-                        if keyword in suggestion_lower and item_id in available_items:
-                            quest['target_item'] = item_id
-                            logger.info(f"Using keyword mapping: '{keyword}' -> '{item_id}'")
-                            break
-            
-            # If still no match, use first available item
-            if quest['target_item'] not in available_items:
-                if available_items:
-                    quest['target_item'] = available_items[0]
-                    logger.warning(f"No match found, using first available item: {available_items[0]}")
-                else:
-                    quest['target_item'] = 'crystal_red'
-        
-        # Extract quantity from player suggestion if mentioned
-        if player_suggestion:
-            import re
-            # Look for numbers followed by quantity words
-            quantity_matches = re.findall(r'(\d+)\s*(?:pieces?|items?|units?|of)', player_suggestion.lower())
-            if quantity_matches:
-                suggested_quantity = int(quantity_matches[0])
-                quest['quantity'] = min(suggested_quantity, 10)  # Cap at 10
-                logger.info(f"Using player-suggested quantity: {suggested_quantity}")
-            # Also check for words like "some", "a few", "several"
-            elif any(word in player_suggestion.lower() for word in ['some', 'a few', 'several']):
-                quest['quantity'] = 3
-                logger.info("Using 'some' quantity: 3")
-            elif 'a ' in player_suggestion.lower() or 'an ' in player_suggestion.lower():
-                quest['quantity'] = 1
-                logger.info("Using single item quantity: 1")
-    
-    # Validate talk_to_npc quests
-    elif quest.get('quest_type') == 'talk_to_npc':
-        target_npc = quest.get('target_npc')
-        if target_npc and target_npc not in available_npcs:
-            logger.warning(f"Target NPC '{target_npc}' not in available NPCs, using first available")
-            if available_npcs:
-                quest['target_npc'] = available_npcs[0]
-            else:
-                quest['target_npc'] = 'Commander Sarah Chen'
-    
-    return quest
-
 def get_fallback_dialogue_response(npc_name):
     """Get fallback dialogue responses when LLM is unavailable"""
-    fallback_responses = {
-        'Commander Sarah Chen': "At ease, soldier. The outpost is running smoothly, but we always need to stay vigilant. Is there something specific you need assistance with?",
-        'Engineer Marcus Rodriguez': "Oh! Hello there! I was just working on some fascinating modifications to the power grid. The quantum flux capacitors are behaving most unusually today!",
-        'Trader Eliza Thompson': "Well hello, handsome! I've got some excellent deals today. Just got a shipment of rare materials from the outer colonies. Interested?",
-        'Scout Jake Williams': "*whispers* You should be careful out there. I've seen things in the wilderness that would make your blood run cold. The outpost walls are all that keep us safe.",
-        'Dr. Kim Park': "Hello! I hope you're feeling well. The medical bay is fully stocked, but I'm always concerned about the health of our outpost residents. How are you holding up?"
-    }
-    
-    return fallback_responses.get(npc_name, "Hello there! I'd be happy to help you with whatever you need around the outpost.")
+    return npc_registry.fallback_dialogue(npc_name)
 
 def get_fallback_quest(npc_id):
     """Get fallback quest when LLM is unavailable"""
-    fallback_quests = {
-        'commander_sarah': {
-            'id': f'fallback_commander_{datetime.now().timestamp()}',
-            'title': 'Security Assessment',
-            'description': 'Conduct a security assessment of the outpost perimeter and report any vulnerabilities',
-            'reward': 'Military commendation and access to restricted areas',
-            'status': 'available',
-            'objectives': [
-                {
-                    'id': 'assess_perimeter',
-                    'description': 'Check all security checkpoints around the outpost',
-                    'target': 4,
-                    'progress': 0
-                }
-            ]
-        },
-        'engineer_marcus': {
-            'id': f'fallback_engineer_{datetime.now().timestamp()}',
-            'title': 'Power Grid Maintenance',
-            'description': 'Help maintain the outpost power grid by checking and repairing critical systems',
-            'reward': 'Technical schematics and engineering tools',
-            'status': 'available',
-            'objectives': [
-                {
-                    'id': 'repair_systems',
-                    'description': 'Repair 3 critical power systems',
-                    'target': 3,
-                    'progress': 0
-                }
-            ]
-        },
-        'trader_eliza': {
-            'id': f'fallback_trader_{datetime.now().timestamp()}',
-            'title': 'Supply Chain Management',
-            'description': 'Help manage the supply chain by delivering goods to various outpost locations',
-            'reward': 'Credits and rare trade goods',
-            'status': 'available',
-            'objectives': [
-                {
-                    'id': 'deliver_goods',
-                    'description': 'Deliver supplies to 5 different locations',
-                    'target': 5,
-                    'progress': 0
-                }
-            ]
-        },
-        'scout_jake': {
-            'id': f'fallback_scout_{datetime.now().timestamp()}',
-            'title': 'Wilderness Reconnaissance',
-            'description': 'Scout the dangerous areas beyond the outpost and report any threats',
-            'reward': 'Survival gear and wilderness knowledge',
-            'status': 'available',
-            'objectives': [
-                {
-                    'id': 'scout_areas',
-                    'description': 'Explore 3 dangerous areas and report findings',
-                    'target': 3,
-                    'progress': 0
-                }
-            ]
-        },
-        'medic_dr_kim': {
-            'id': f'fallback_medic_{datetime.now().timestamp()}',
-            'title': 'Medical Supply Run',
-            'description': 'Help gather medical supplies and check on the health of outpost residents',
-            'reward': 'Medical supplies and first aid training',
-            'status': 'available',
-            'objectives': [
-                {
-                    'id': 'gather_supplies',
-                    'description': 'Collect medical supplies from 4 locations',
-                    'target': 4,
-                    'progress': 0
-                }
-            ]
-        },
-        'unfiltered_rick': {
-            'id': f'fallback_rick_{datetime.now().timestamp()}',
-            'title': 'Shady Business',
-            'description': 'Help me with some... let\'s say "unofficial" business around the outpost. Nothing illegal, just... creative.',
-            'reward': 'Some crypto and maybe some interesting stories',
-            'status': 'available',
-            'objectives': [
-                {
-                    'id': 'shady_tasks',
-                    'description': 'Complete some questionable but profitable tasks',
-                    'target': 3,
-                    'progress': 0
-                }
-            ]
-        }
-    }
-    
-    return fallback_quests.get(npc_id, fallback_quests['commander_sarah'])
+    return npc_registry.fallback_quest(npc_id)
 
-if __name__ == '__main__':
+def serve():
+    """Run the backend with Flask's threaded server, or under uvicorn with --async"""
+    parser = argparse.ArgumentParser(description='LLM Sci-Fi Game Backend')
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '5000')))
+    parser.add_argument('--async', dest='async_mode', action='store_true',
+                        default=os.getenv('SERVER_MODE', 'sync').lower() == 'async',
+                        help='Serve the asyncio (ASGI) app with uvicorn instead of Flask')
+    parser.add_argument('--no-debug', dest='debug', action='store_false',
+                        default=os.getenv('FLASK_DEBUG', 'true').lower() == 'true',
+                        help='Disable the Flask debugger and reloader')
+    args = parser.parse_args()
+    
     print("Starting LLM Sci-Fi Game Backend...")
     print(f"Ollama URL: {OLLAMA_URL}")
     print(f"Ollama Model: {OLLAMA_MODEL}")
-    print("Server running on http://localhost:5000")
+    if len(OLLAMA_UPSTREAMS) > 1:
+        print(f"Ollama Upstreams: {', '.join(url for url, models in OLLAMA_UPSTREAMS)}")
+    print(f"Mode: {'async (uvicorn)' if args.async_mode else 'sync (Flask)'}")
+    print(f"Server running on http://localhost:{args.port}")
     
-    app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=True, reloader_type='watchdog') 
\ No newline at end of file
+    if args.async_mode:
+        import uvicorn
+        uvicorn.run('asgi:asgi_app', host=args.host, port=args.port, log_level='info')
+    else:
+        app.run(debug=args.debug, host=args.host, port=args.port, threaded=True, use_reloader=args.debug)
+
+if __name__ == '__main__':
+    serve()
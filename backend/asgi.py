@@ -0,0 +1,667 @@
+"""Asyncio (ASGI) serving mode for the game backend.
+
+Serves the same JSON routes as the Flask app in app.py, but every handler awaits
+an httpx-based Ollama client instead of blocking a worker thread, so a single
+process can hold hundreds of in-flight generations.
+
+Run with `python backend/app.py --async` or `uvicorn asgi:asgi_app` from backend/.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import time
+from datetime import datetime
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import app as game
+from log_reader import CursorExpired, follow as follow_log, tail as tail_log
+from ollama_client import OllamaError, OllamaUnavailable
+from ollama_router import AsyncOllamaRouter
+from quest_cascade import TIER_RULES, TIER_SMALL
+from response_cleaner import DialogueStreamCleaner
+from save_store import PatchError, UnknownBaseSave
+from scheduler import PRIORITY_DIALOGUE, PRIORITY_GENERATE_QUEST, PRIORITY_QUEST
+from structured_logging import clear_log_files, log_files, new_request_id, request_id, rotate_log_files
+
+logger = game.logger
+
+# Created on startup so the httpx client binds to the server's event loop
+ollama_client = None
+
+def identify_player(request, data):
+    """Async version of app.identify_player"""
+    request_id.set(request.headers.get('X-Request-Id', '')[:64] or new_request_id())
+    session = game.resume_player_session(
+        request.headers.get('X-Session-Id') or (data or {}).get('session_id') or request.query_params.get('session_id'))
+    player_id = request.headers.get('X-Player-Id') or (data or {}).get('player_id') or (request.client.host if request.client else None)
+    game.current_player_id.set(session.player_id if session else player_id or 'anonymous')
+
+def query_param(request, name, default, type=str):
+    """A query parameter converted with `type`, or the default if it's missing or doesn't convert (as Flask's args.get)"""
+    try:
+        return type(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+async def generate_completion(payload, priority=PRIORITY_DIALOGUE, upstream=None):
+    """Async version of app.generate_completion"""
+    key, cached = game.lookup_generation(payload)
+    if cached is not None:
+        return cached
+
+    upstream = upstream or (ollama_client.chat if 'messages' in payload else ollama_client.generate)
+
+    async def call_upstream():
+        queued = time.perf_counter()
+        async with game.generation_scheduler.slot_async(priority, game.current_player_id.get()):
+            started = time.perf_counter()
+            result = await upstream(payload)
+        game.observe_generation(priority, payload, result, started - queued, time.perf_counter() - started)
+        game.store_generation(key, result)
+        return result
+
+    return await game.inflight_generations.do_async(key, call_upstream)
+
+async def generate_llm_dialogue_response(npc_name, personality, role, background, dialogue_style, player_message, player_context, memory_context):
+    """Async version of app.generate_llm_dialogue_response"""
+    try:
+        payload, turn = game.build_dialogue_payload(npc_name, personality, role, background, dialogue_style, player_message, player_context, memory_context)
+        result = await generate_completion(payload, PRIORITY_DIALOGUE)
+        response = game.finish_dialogue_response(result, npc_name, turn)
+        game.request_metrics.record_outcome('dialogue', npc_name, 'llm')
+        return response
+    except OllamaUnavailable as e:
+        logger.warning(f"Ollama unavailable ({e}), using fallback dialogue for {npc_name}")
+    except OllamaError as e:
+        logger.error(f"Ollama API error: {e}")
+    except Exception as e:
+        logger.error(f"Error generating LLM response: {e}")
+    game.request_metrics.record_outcome('dialogue', npc_name, 'fallback')
+    return game.get_fallback_dialogue_response(npc_name)
+
+async def stream_llm_dialogue_response(npc_name, personality, role, background, dialogue_style, player_message, player_context, memory_context):
+    """Async version of app.stream_llm_dialogue_response"""
+    payload, turn = game.build_dialogue_payload(npc_name, personality, role, background, dialogue_style, player_message, player_context, memory_context)
+    payload['stream'] = True
+    stream = ollama_client.chat_stream if 'messages' in payload else ollama_client.generate_stream
+
+    start = datetime.now()
+    first_chunk_ms = None
+    sentences = []
+    fallback = False
+    final = {}
+
+    async def tokens():
+        cache_key, cached = game.lookup_generation(payload)
+        if cached is not None:
+            yield cached['response']
+            return
+
+        raw = []
+        queued = time.perf_counter()
+        async with game.generation_scheduler.slot_async(PRIORITY_DIALOGUE, game.current_player_id.get()):
+            started = time.perf_counter()
+            async with contextlib.aclosing(stream(payload)) as chunks:
+                async for chunk in chunks:
+                    raw.append(chunk.get('response', ''))
+                    yield raw[-1]
+                    if chunk.get('done'):
+                        final.update(chunk)
+                        game.observe_generation(PRIORITY_DIALOGUE, payload, final, started - queued, time.perf_counter() - started)
+                        game.store_generation(cache_key, {'response': ''.join(raw)})
+                        break
+
+    cleaner = DialogueStreamCleaner()
+
+    def sent(cleaned):
+        nonlocal first_chunk_ms
+        if cleaned and first_chunk_ms is None:
+            first_chunk_ms = (datetime.now() - start).total_seconds() * 1000
+        sentences.extend(cleaned)
+        return [{'type': 'chunk', 'text': sentence} for sentence in cleaned]
+
+    try:
+        async with contextlib.aclosing(tokens()) as pieces:
+            async for piece in pieces:
+                for event in sent(cleaner.feed(piece)):
+                    yield event
+        for event in sent(cleaner.flush()):
+            yield event
+    except OllamaUnavailable as e:
+        logger.warning(f"Ollama unavailable ({e}), using fallback dialogue for {npc_name}")
+        fallback = True
+    except OllamaError as e:
+        logger.error(f"Ollama streaming error: {e}")
+        fallback = True
+
+    for event in game.finish_dialogue_stream(npc_name, turn, sentences, fallback, final, first_chunk_ms, cleaner.message()):
+        yield event
+
+async def stream_quest(payload):
+    """Async version of app.stream_quest"""
+    return await game.quest_output.read_async(ollama_client.generate_stream(payload))
+
+async def generate_quest_completion(payload, priority):
+    """Async version of app.generate_quest_completion"""
+    try:
+        return await generate_completion(payload, priority, stream_quest)
+    except OllamaError as e:
+        retry = game.quest_output.downgrade(payload, e)
+        if retry is None:
+            raise
+        return await generate_completion(retry, priority, stream_quest)
+
+async def generate_dynamic_quest(npc_id, npc_name, personality, role, player_context, existing_quests, available_items=None, available_npcs=None, player_suggestion=None, priority=PRIORITY_QUEST, model=None, escalate=None):
+    """Async version of app.generate_dynamic_quest"""
+    try:
+        quest = game.pooled_quest(npc_id, npc_name, personality, role, available_items, available_npcs, player_suggestion)
+        if quest is not None:
+            return quest
+        payload = game.build_quest_payload(npc_id, npc_name, personality, role, player_context, existing_quests, available_items, available_npcs, player_suggestion, model)
+        result = await generate_quest_completion(payload, priority)
+        quest = game.finish_quest_response(result, npc_id, npc_name, available_items, available_npcs, player_suggestion)
+        retry_model = escalate(quest) if escalate else None
+        if retry_model:
+            logger.info(f"Quest for {npc_id} missed the suggestion, escalating to {retry_model}")
+            payload = game.build_quest_payload(npc_id, npc_name, personality, role, player_context, existing_quests, available_items, available_npcs, player_suggestion, retry_model)
+            result = await generate_quest_completion(payload, priority)
+            quest = game.finish_quest_response(result, npc_id, npc_name, available_items, available_npcs, player_suggestion)
+    except OllamaUnavailable as e:
+        logger.warning(f"Ollama unavailable ({e}), using fallback quest for {npc_id}")
+        quest = game.get_fallback_quest(npc_id)
+    except OllamaError as e:
+        logger.error(f"Ollama API error for quest: {e}")
+        quest = game.get_fallback_quest(npc_id)
+    except Exception as e:
+        logger.error(f"Error generating quest: {e}")
+        quest = game.get_fallback_quest(npc_id)
+    game.record_quest_outcome(npc_name, quest)
+    return quest
+
+async def speculative_quest(npc_name, available_items, available_npcs, player_suggestion):
+    """Async version of app.speculative_quest"""
+    if game.quest_speculator is None:
+        return None
+    quest = await game.quest_speculator.take_async(
+        game.current_player_id.get(), npc_name, available_items, available_npcs, player_suggestion,
+        timeout=game.QUEUE_TIMEOUT_GENERATE_QUEST
+    )
+    if quest is not None:
+        logger.info("Quest served from speculation", extra={'npc': npc_name, 'npc_id': quest.get('id')})
+        game.request_metrics.record_outcome('quest', npc_name, 'speculative')
+    return quest
+
+async def cascade_quest(npc_data, npc_name, available_items, available_npcs, player_suggestion):
+    """Async version of app.cascade_quest"""
+    started = time.perf_counter()
+    plan = game.quest_cascade.plan(player_suggestion, available_items, available_npcs)
+    quest = None
+    if plan.tier == TIER_SMALL:
+        quest = await speculative_quest(npc_name, available_items, available_npcs, player_suggestion)
+    else:
+        game.discard_speculation(npc_name, available_items, available_npcs)
+    if plan.tier == TIER_RULES:
+        quest = game.rules_quest(plan, npc_data['id'], npc_name, npc_data['role'])
+    elif quest is None:
+        quest = await generate_dynamic_quest(
+            npc_data['id'], npc_name, npc_data['personality'], npc_data['role'], {}, [],
+            available_items, available_npcs, player_suggestion,
+            priority=PRIORITY_GENERATE_QUEST,
+            model=game.quest_cascade.model_for(plan),
+            escalate=lambda quest: game.quest_cascade.escalation(plan, quest, game.is_fallback_quest(quest))
+        )
+    game.quest_cascade.record(plan, npc_name, time.perf_counter() - started)
+    return quest
+
+async def generate_batch_quest(spec):
+    """Async version of app.generate_batch_quest"""
+    try:
+        args = game.resolve_quest_spec(spec)
+        quest = game.pooled_quest(*args[:4], *args[6:])
+        if quest is None:
+            payload = game.build_quest_payload(*args)
+            result = await generate_quest_completion(payload, PRIORITY_QUEST)
+            npc_id, npc_name = args[0], args[1]
+            quest = game.finish_quest_response(result, npc_id, npc_name, *args[6:])
+            game.record_quest_outcome(npc_name, quest)
+        return game.batch_quest_result(quest)
+    except Exception as e:
+        return game.batch_quest_error(spec, e)
+
+class RequestLatencyMiddleware:
+    """Async version of app.record_request_latency"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router fills in the matched route on this same scope
+            route = scope['route'].path if 'route' in scope else 'unmatched'
+            game.request_metrics.observe_request(route, scope['method'], status, time.perf_counter() - started)
+
+async def metrics(request):
+    """Prometheus metrics"""
+    return Response(game.request_metrics.render(), headers={'Content-Type': game.request_metrics.registry.CONTENT_TYPE})
+
+async def health_check(request):
+    """Health check endpoint"""
+    return JSONResponse({
+        'status': 'healthy',
+        'mode': 'async',
+        'timestamp': datetime.now().isoformat(),
+        'ollama_url': game.OLLAMA_URL,
+        'ollama_model': game.OLLAMA_MODEL,
+        'ollama_quest_model': game.OLLAMA_QUEST_MODEL,
+        'ollama_client': ollama_client.stats(),
+        'generation_cache': game.generation_cache.stats() if game.generation_cache else None,
+        'coalescing': game.inflight_generations.stats(),
+        'scheduler': game.generation_scheduler.stats(),
+        'context_budget': game.context_budget.stats(),
+        'npc_registry': game.npc_registry.stats(),
+        'player_sessions': game.player_sessions.stats(),
+        'npc_memory': game.npc_memory.stats(),
+        'dialogue_sessions': game.dialogue_sessions.stats(),
+        'saves': game.save_store.stats(),
+        'quest_output': game.quest_output.stats(),
+        'quest_pool': game.quest_pool.stats() if game.quest_pool else None,
+        'quest_speculation': game.quest_speculator.stats() if game.quest_speculator else None,
+        'quest_cascade': game.quest_cascade.stats() if game.quest_cascade else None,
+        'quest_catalogues': game.catalogue_cache_stats()
+    })
+
+async def handle_session(request):
+    """Start, update, inspect or end the current player's session"""
+    try:
+        data = await request.json() if request.method == 'POST' else None
+        identify_player(request, data)
+        session = game.current_player_session.get()
+
+        if request.method == 'POST':
+            session, created = game.update_player_session(session, data or {})
+            return JSONResponse({'success': True, 'session_id': session.id, 'created': created, 'state': session.state()})
+
+        if session is None:
+            return JSONResponse({'success': False, 'error': 'Unknown or expired session', 'session_expired': True}, status_code=404)
+        if request.method == 'DELETE':
+            game.player_sessions.delete(session.id)
+            return JSONResponse({'success': True, 'message': 'Session ended'})
+        return JSONResponse({'success': True, 'session_id': session.id, 'player_id': session.player_id, 'state': session.state()})
+
+    except Exception as e:
+        return JSONResponse({
+            'success': False,
+            'error': str(e)
+        }, status_code=500)
+
+async def list_npcs(request):
+    """Async version of app.list_npcs"""
+    version, npcs = game.npc_registry.public()
+    etag = f'"{version}"'
+    client_etags = [tag.strip().removeprefix('W/') for tag in request.headers.get('if-none-match', '').split(',')]
+    if etag in client_etags or '*' in client_etags:
+        return Response(status_code=304, headers={'ETag': etag})
+    return JSONResponse({'success': True, 'version': version, 'npcs': npcs}, headers={'ETag': etag})
+
+async def handle_dialogue(request):
+    """Handle NPC dialogue requests and generate LLM responses"""
+    npc_name = None
+    try:
+        data = await request.json()
+        identify_player(request, data)
+
+        npc_id = data.get('npc_id')
+        npc_name = data.get('npc_name')
+        player_message = data.get('player_message', '')
+        player_context = game.request_player_context(data)
+        game.apply_memory_updates(npc_name, data.get('memory_updates'))
+        npc_id = game.canonical_npc_id(npc_id, npc_name)
+
+        llm_response = await generate_llm_dialogue_response(
+            npc_name, data.get('npc_personality'), data.get('npc_role'), data.get('npc_background'),
+            data.get('npc_dialogue_style'), player_message,
+            player_context, data.get('memory_context', '')
+        )
+        game.npc_memory.record_exchange(game.current_player_id.get(), npc_name, player_message, llm_response)
+        game.speculate_quest(game.current_player_id.get(), npc_name, player_message)
+
+        return JSONResponse({
+            'success': True,
+            'message': llm_response,
+            'npc_id': npc_id,
+            'timestamp': datetime.now().isoformat(),
+            **game.session_status()
+        })
+
+    except Exception as e:
+        return JSONResponse({
+            'success': False,
+            'error': str(e),
+            'message': game.get_fallback_dialogue_response(npc_name)
+        }, status_code=500)
+
+async def handle_dialogue_stream(request):
+    """Stream NPC dialogue as newline-delimited JSON while Ollama generates it"""
+    data = await request.json()
+    identify_player(request, data)
+
+    npc_id = data.get('npc_id')
+    npc_name = data.get('npc_name')
+    player_message = data.get('player_message', '')
+    player_context = game.request_player_context(data)
+    game.apply_memory_updates(npc_name, data.get('memory_updates'))
+    player_id = game.current_player_id.get()
+    status = game.session_status()
+
+    async def generate():
+        events = stream_llm_dialogue_response(
+            npc_name, data.get('npc_personality'), data.get('npc_role'), data.get('npc_background'),
+            data.get('npc_dialogue_style'), player_message,
+            player_context, data.get('memory_context', '')
+        )
+        async for event in events:
+            event['npc_id'] = npc_id
+            if event['type'] == 'done':
+                event.update(status)
+                game.npc_memory.record_exchange(player_id, npc_name, player_message, event['message'])
+                game.speculate_quest(player_id, npc_name, player_message)
+            yield json.dumps(event) + '\n'
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+async def handle_memory(request):
+    """Inspect, add to or clear what an NPC remembers about the current player"""
+    try:
+        data = await request.json() if request.method == 'POST' else None
+        identify_player(request, data)
+        player_id = game.current_player_id.get()
+
+        if request.method == 'POST':
+            stored = game.apply_memory_updates(data.get('npc_name'), data)
+            return JSONResponse({'success': True, 'stored': stored})
+
+        npc_name = request.query_params.get('npc_name')
+        if request.method == 'DELETE':
+            game.npc_memory.clear(player_id, npc_name)
+            game.dialogue_sessions.clear(player_id, npc_name)
+            return JSONResponse({'success': True, 'message': 'Memories cleared'})
+
+        if not npc_name:
+            return JSONResponse({'success': False, 'error': 'npc_name is required'}, status_code=400)
+        return JSONResponse({
+            'success': True,
+            'player_id': player_id,
+            'npc_name': npc_name,
+            **game.npc_memory.snapshot(player_id, npc_name)
+        })
+
+    except Exception as e:
+        return JSONResponse({
+            'success': False,
+            'error': str(e)
+        }, status_code=500)
+
+async def handle_quest(request):
+    """Handle quest generation requests"""
+    npc_id = None
+    try:
+        data = await request.json()
+        identify_player(request, data)
+
+        npc_id = data.get('npc_id')
+        quest = await generate_dynamic_quest(
+            npc_id, data.get('npc_name'), data.get('npc_personality'), data.get('npc_role'),
+            game.request_player_context(data), data.get('existing_quests') or game.session_quest_ids()
+        )
+
+        return JSONResponse({
+            'success': True,
+            'quest': quest,
+            'timestamp': datetime.now().isoformat(),
+            **game.session_status()
+        })
+
+    except Exception as e:
+        return JSONResponse({
+            'success': False,
+            'error': str(e),
+            'quest': game.get_fallback_quest(npc_id)
+        }, status_code=500)
+
+async def generate_quest(request):
+    """Generate quests based on conversation context and player suggestions"""
+    try:
+        data = await request.json()
+        identify_player(request, data)
+        npc_name = data.get('npc_name', 'Unknown NPC')
+        player_suggestion = data.get('player_suggestion', '')
+        available_items = data.get('available_items', [])
+        available_npcs = data.get('available_npcs', [])
+        game.apply_session_events(data)
+
+        logger.info("Generate quest request", extra={
+            'npc': npc_name,
+            'player_suggestion': player_suggestion,
+            'available_items': available_items,
+            'available_npcs': available_npcs,
+            'llm_quests': game.USE_LLM_QUESTS
+        })
+
+        npc_data = game.get_npc_data_by_name(npc_name) if game.USE_LLM_QUESTS else None
+        if game.quest_cascade is not None and npc_data:
+            quest = await cascade_quest(npc_data, npc_name, available_items, available_npcs, player_suggestion)
+        elif npc_data:
+            quest = await speculative_quest(npc_name, available_items, available_npcs, player_suggestion)
+            if quest is None:
+                quest = await generate_dynamic_quest(
+                    npc_data['id'],
+                    npc_name,
+                    npc_data['personality'],
+                    npc_data['role'],
+                    {},  # player_context
+                    [],  # existing_quests
+                    available_items,
+                    available_npcs,
+                    player_suggestion,
+                    priority=PRIORITY_GENERATE_QUEST
+                )
+        else:
+            quest = game.generate_simple_quest(player_suggestion, available_items, available_npcs, npc_name)
+
+        logger.info("Generate quest response", extra={'npc': npc_name, 'quest': quest})
+
+        return JSONResponse({'success': True, 'quest': quest, **game.session_status()})
+
+    except Exception as e:
+        logger.error(f"Error generating quest: {str(e)}")
+        return JSONResponse({'success': False, 'message': str(e)})
+
+async def handle_quest_batch(request):
+    """Generate several quests concurrently, returned in the order they were asked for"""
+    try:
+        data = await request.json()
+        identify_player(request, data)
+        specs = game.quest_batch_specs(data)
+        game.apply_session_events(data)
+    except ValueError as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=400)
+
+    try:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(generate_batch_quest(spec) for spec in specs))
+        return JSONResponse(game.quest_batch_response(results, started))
+
+    except Exception as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+async def save_game(request):
+    """Save game state, either in full or as a JSON patch against an earlier save"""
+    try:
+        data = await request.json()
+        identify_player(request, data)
+        # The save store blocks on disk, so keep it off the event loop
+        saved = await run_in_threadpool(game.store_save, game.current_player_id.get(), data)
+
+        return JSONResponse({
+            'success': True,
+            'save_id': saved['save_id'],
+            'timestamp': saved['timestamp'],
+            'kind': saved['kind'],
+            'message': 'Game saved successfully'
+        })
+
+    except UnknownBaseSave as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=409)
+    except PatchError as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+async def load_game(request):
+    """Load the latest game state, or a specific one with ?save_id="""
+    try:
+        identify_player(request, None)
+        save = await run_in_threadpool(game.save_store.load, game.current_player_id.get(), request.query_params.get('save_id'))
+        if save is None:
+            return JSONResponse({'success': False, 'message': 'No saved game found'}, status_code=404)
+
+        return JSONResponse({
+            'success': True,
+            'save_id': save['save_id'],
+            'data': save['data'],
+            'timestamp': save['timestamp']
+        })
+
+    except Exception as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+async def list_saves(request):
+    """List the current player's saves, newest first; pass ?cursor= to get the next page"""
+    try:
+        identify_player(request, None)
+        saves, next_cursor = await run_in_threadpool(
+            game.save_store.list,
+            game.current_player_id.get(),
+            query_param(request, 'limit', game.DEFAULT_PAGE_SIZE, int),
+            request.query_params.get('cursor')
+        )
+        return JSONResponse({'success': True, 'saves': saves, 'next_cursor': next_cursor})
+
+    except Exception as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+async def get_logs(request):
+    """Get recent logs for debugging (same parameters as app.get_logs)"""
+    try:
+        log_file = os.path.join(game.LOG_DIR, game.LOG_FILE)
+        if not os.path.exists(log_file):
+            return JSONResponse({'success': False, 'message': 'No log file found'}, status_code=404)
+
+        level = request.query_params.get('level')
+        if request.query_params.get('follow', 'false').lower() == 'true':
+            # A blocking generator; Starlette iterates it on a worker thread
+            lines = follow_log(log_file, level=level, timeout=query_param(request, 'timeout', 300, float))
+            return StreamingResponse((line + '\n' for line in lines), media_type='application/x-ndjson')
+
+        recent_logs, next_cursor = await run_in_threadpool(
+            tail_log,
+            log_file,
+            n=query_param(request, 'n', 50, int),
+            level=level,
+            since=request.query_params.get('since'),
+            cursor=request.query_params.get('cursor')
+        )
+        return JSONResponse({
+            'success': True,
+            'logs': recent_logs,
+            'next_cursor': next_cursor,
+            'file_size': os.path.getsize(log_file)
+        })
+
+    except CursorExpired as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=410)
+    except ValueError as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+async def clear_logs(request):
+    """Empty the log file being written and delete its rotated backups"""
+    try:
+        await run_in_threadpool(clear_log_files, game.log_listener)
+        return JSONResponse({'success': True, 'message': 'Logs cleared'})
+    except Exception as e:
+        return JSONResponse({'success': False, 'message': str(e)})
+
+async def rotate_logs(request):
+    """Start a fresh log file, keeping the current one as a backup"""
+    try:
+        await run_in_threadpool(rotate_log_files, game.log_listener)
+        return JSONResponse({'success': True, 'files': log_files(game.log_listener)})
+    except Exception as e:
+        return JSONResponse({'success': False, 'message': str(e)})
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global ollama_client
+    ollama_client = AsyncOllamaRouter(
+        game.upstream_pool,
+        affinity=game.upstream_affinity,
+        connect_timeout=game.OLLAMA_CONNECT_TIMEOUT,
+        read_timeout=game.OLLAMA_READ_TIMEOUT,
+        max_retries=game.OLLAMA_MAX_RETRIES,
+        backoff_factor=game.OLLAMA_RETRY_BACKOFF,
+        pool_size=game.OLLAMA_ASYNC_POOL_SIZE,
+        failure_threshold=game.OLLAMA_BREAKER_THRESHOLD,
+        reset_timeout=game.OLLAMA_BREAKER_RESET
+    )
+    logger.info(f"Async backend started (Ollama pool size {game.OLLAMA_ASYNC_POOL_SIZE})")
+    yield
+    await ollama_client.close()
+
+asgi_app = Starlette(
+    routes=[
+        Route('/api/health', health_check, methods=['GET']),
+        Route('/api/npcs', list_npcs, methods=['GET']),
+        Route('/api/session', handle_session, methods=['GET', 'POST', 'DELETE']),
+        Route('/api/metrics', metrics, methods=['GET']),
+        Route('/api/dialogue', handle_dialogue, methods=['POST']),
+        Route('/api/dialogue/stream', handle_dialogue_stream, methods=['POST']),
+        Route('/api/memory', handle_memory, methods=['GET', 'POST', 'DELETE']),
+        Route('/api/quest', handle_quest, methods=['POST']),
+        Route('/api/generate-quest', generate_quest, methods=['POST']),
+        Route('/api/quests/batch', handle_quest_batch, methods=['POST']),
+        Route('/api/save', save_game, methods=['POST']),
+        Route('/api/load', load_game, methods=['GET']),
+        Route('/api/saves', list_saves, methods=['GET']),
+        Route('/api/logs', get_logs, methods=['GET']),
+        Route('/api/logs/clear', clear_logs, methods=['POST']),
+        Route('/api/logs/rotate', rotate_logs, methods=['POST']),
+    ],
+    middleware=[
+        Middleware(RequestLatencyMiddleware),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    lifespan=lifespan
+)
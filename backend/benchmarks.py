@@ -0,0 +1,660 @@
+"""Microbenchmarks for backend hot paths.
+
+    python backend/benchmarks.py                  # run everything
+    python backend/benchmarks.py token_counting   # run selected benchmarks
+    python backend/benchmarks.py app_hot_paths --output after.json --baseline before.json
+
+Each benchmark prints the mean and best time per call. --output writes every
+timing as JSON; --baseline compares this run's means with such a file.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCHMARKS = {}
+RESULTS = {}  # benchmark name -> its timed() results, for --output
+current_benchmark = None
+
+def benchmark(fn):
+    """Register a benchmark under its function name"""
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+def timed(label, fn, repeat=5, number=1):
+    """Time fn() and print mean/best milliseconds per call"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+    result = {'label': label, 'mean_ms': sum(samples) / len(samples), 'best_ms': min(samples)}
+    print(f"  {label:<48} mean {result['mean_ms']:>10.4f}ms   best {result['best_ms']:>10.4f}ms")
+    RESULTS.setdefault(current_benchmark, []).append(result)
+    return result
+
+def run_metadata():
+    """Where and on what code a run happened, stored with --output results"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'timestamp': datetime.now().isoformat(), 'git_commit': commit,
+            'python': platform.python_version(), 'platform': platform.platform()}
+
+def sample_memory_context(memory_lines):
+    """A frontend-style memory context block with the given number of memory lines"""
+    categories = ['PERSONAL_INFO', 'RELATIONSHIP', 'QUESTS', 'PROMISES', 'EMOTIONAL', 'GOSSIP', 'TRADE', 'EVENTS']
+    snippets = [
+        'Player mentioned their family back home on Mars',
+        'Player promised to bring back a crystal_red by tomorrow',
+        'Player asked about the secret reactor project',
+        'Player offered a deal for 50 crypto',
+        'Player seemed angry about the missing shipment',
+        'Heard gossip about the scout seeing lights in the wilderness',
+    ]
+    rng = random.Random(42)
+    lines = ['', '=== NPC MEMORY CONTEXT ===', 'RELATIONSHIP STATUS:', '- Trust: 55/100', '- Friendship: 40/100', '']
+    per_category = max(1, memory_lines // len(categories))
+    for category in categories:
+        lines.append(f'{category}:')
+        for _ in range(per_category):
+            lines.append(f"- {rng.choice(snippets)} (turn {rng.randint(1, 500)})")
+        lines.append('')
+    lines += ['RECENT CONVERSATION CONTEXT:', 'Player: "hello"', 'NPC: "At ease."', '', '=== END MEMORY CONTEXT ===', '']
+    return '\n'.join(lines)
+
+@benchmark
+def token_counting():
+    from context_budget import TokenCounter, heuristic_token_count
+
+    counter = TokenCounter()
+    for size in (5_000, 50_000, 500_000):
+        text = sample_memory_context(size // 60)[:size]
+        timed(f"len//4 on {size:,} chars", lambda: len(text) // 4, number=100)
+        timed(f"heuristic (cold) on {size:,} chars", lambda: heuristic_token_count.__wrapped__(text))
+        timed(f"heuristic (cached) on {size:,} chars", lambda: counter.count(text), number=100)
+
+@benchmark
+def context_fitting():
+    from context_budget import ContextBudget, TokenCounter
+
+    budget = ContextBudget(TokenCounter(), 7192)
+    for memory_lines in (500, 5_000):
+        memory = sample_memory_context(memory_lines)
+        tokens = budget.count(memory)
+        timed(f"fit {memory_lines:,} memory lines ({tokens:,} tok) into 6000", lambda: budget.fit_memory(memory, 6000))
+
+@benchmark
+def memory_retrieval():
+    from context_budget import TokenCounter
+    from npc_memory import NPCMemoryStore
+
+    counter = TokenCounter()
+    memory = sample_memory_context(1_000)
+    contents = [line[2:] for line in memory.split('\n') if line.startswith('- Player') or line.startswith('- Heard')]
+    for stored in (10, 100, 200):
+        store = NPCMemoryStore(max_memories_per_npc=stored)
+        for index in range(stored):
+            store.add_memory('player', 'Rick', 'events', contents[index % len(contents)])
+        context = store.build_context('player', 'Rick', 'any news on the reactor secret?')
+        timed(f"top-6 of {stored} memories ({counter.count(context)} tok in prompt)",
+              lambda: store.build_context('player', 'Rick', 'any news on the reactor secret?'), number=20)
+
+def sample_game_state(turn):
+    """Roughly the shape of what the frontend posts to /api/save"""
+    return {
+        'player': {'x': 400 + turn % 50, 'y': 300, 'crypto': turn * 5},
+        'inventory': [{'id': f'item_{i}', 'quantity': 1} for i in range(12)],
+        'quests': [{'id': f'quest_{i}', 'status': 'active', 'progress': turn % 4} for i in range(5)],
+        'turn': turn
+    }
+
+def sample_player_context(items=16, quests=5):
+    """Roughly what the frontend's Player.getPlayerContext() sends with each request"""
+    return {
+        'position': {'x': 412.5, 'y': 288.0},
+        'active_quests': [{'id': f'quest_{i}', 'title': f'Supply Run {i}', 'type': 'collect_item'} for i in range(quests)],
+        'inventory': [{'itemId': f'item_{i}', 'itemName': f'Item {i}', 'quantity': 3} for i in range(items)],
+        'crypto': 120,
+        'game_time': 1760000000000
+    }
+
+@benchmark
+def save_store(total_saves=100_000, players=1_000):
+    from save_store import FileSaveStore, SQLiteSaveStore
+
+    # What /api/load used to do: max() over an in-process dict of every save
+    game_state = {f"save_{turn:08d}": {'data': None} for turn in range(total_saves)}
+    timed(f"dict max() over {total_saves:,} saves (old /api/load)", lambda: max(game_state.keys()), number=20)
+
+    directory = tempfile.mkdtemp(prefix='save_bench_')
+    try:
+        for name, store in (('sqlite', SQLiteSaveStore(os.path.join(directory, 'saves.db'))),
+                            ('file', FileSaveStore(os.path.join(directory, 'files')))):
+            start = time.perf_counter()
+            for turn in range(total_saves):
+                store.save(f'player_{turn % players}', sample_game_state(turn))
+            elapsed = time.perf_counter() - start
+            print(f"  {name}: wrote {total_saves:,} saves for {players:,} players in {elapsed:.1f}s")
+
+            turn = iter(range(total_saves, total_saves * 2))
+            timed(f"{name} save with {total_saves:,} stored", lambda: store.save('player_1', sample_game_state(next(turn))), number=200)
+            timed(f"{name} load latest with {total_saves:,} stored", lambda: store.load('player_1'), number=200)
+            saves, cursor = store.list('player_1', limit=20)
+            timed(f"{name} list second page of 20", lambda: store.list('player_1', limit=20, before=cursor), number=200)
+            store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+@benchmark
+def delta_saves(saves_per_run=200):
+    from save_store import SQLiteSaveStore, make_patch
+
+    directory = tempfile.mkdtemp(prefix='delta_bench_')
+    try:
+        # Bytes stored per save for the same sequence of slowly changing states
+        states = []
+        state = sample_game_state(0)
+        state['map'] = {'explored': [[(x * y) % 3 for x in range(40)] for y in range(40)]}
+        for turn in range(saves_per_run):
+            state = json.loads(json.dumps(state))
+            state['player'].update({'x': 400 + turn % 50, 'crypto': turn * 5})
+            state['quests'][turn % 5]['progress'] = turn
+            state['map']['explored'][turn % 40][turn % 37] = 9
+            states.append(state)
+
+        for label, encoding, compact_every in (('full snapshots, uncompressed', 'json', 1),
+                                               ('full snapshots, gzip', 'gzip', 1),
+                                               ('deltas, gzip, compact every 20', 'gzip', 20)):
+            store = SQLiteSaveStore(os.path.join(directory, f'{encoding}_{compact_every}.db'),
+                                    encoding=encoding, compact_every=compact_every)
+            previous = None
+            for state in states:
+                if previous is None or compact_every == 1:
+                    previous = (store.save('player', state)['save_id'], state)
+                else:
+                    previous = (store.save_delta('player', previous[0], make_patch(previous[1], state))['save_id'], state)
+            stats = store.stats()
+            print(f"  {label:<48} {stats['bytes_per_save']:>8,} bytes/save   ({stats['compression_ratio']}x vs raw JSON)")
+            store.close()
+
+        # Load latency as the delta chain grows (cold cache: replay from the snapshot)
+        for chain_length in (1, 10, 50, 150):
+            store = SQLiteSaveStore(os.path.join(directory, f'chain_{chain_length}.db'),
+                                    encoding='gzip', compact_every=chain_length + 1, cache_size=1)
+            save_id = store.save('player', states[0])['save_id']
+            for previous, state in zip(states, states[1:chain_length + 1]):
+                save_id = store.save_delta('player', save_id, make_patch(previous, state))['save_id']
+
+            def cold_load():
+                store._cache.clear()
+                return store.load('player')
+            assert cold_load()['data'] == states[chain_length]
+            timed(f"load at delta chain length {chain_length} (cold)", cold_load, number=20)
+            store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+@benchmark
+def logging_overhead():
+    import logging
+    from structured_logging import BodySampler, setup_logging, stop_listener
+
+    directory = tempfile.mkdtemp(prefix='log_bench_')
+    prompt = sample_memory_context(40)
+    response = "Well hello there, traveler. The reactor is humming today, and so am I."
+    try:
+        # Before: a FileHandler written to on the request thread, with the old banner-per-line logging
+        old_logger = logging.getLogger('bench.before')
+        old_logger.propagate = False
+        handler = logging.FileHandler(os.path.join(directory, 'before.log'))
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        old_logger.addHandler(handler)
+        old_logger.setLevel(logging.INFO)
+
+        def before():
+            for line in ("=== TOKEN USAGE: Dialogue - Rick ===", "Input tokens: ~900", "Response tokens: 150",
+                         "Total tokens: ~1050", "Context window: 8192 tokens", "Usage: 1050/8192 (12.8%)",
+                         "================================", "=== DIALOGUE REQUEST ===", "NPC: Rick",
+                         "Player Message: hello", "Prompt Sent:", prompt, "========================",
+                         "=== DIALOGUE RESPONSE ===", "NPC: Rick", "Response Received:", response,
+                         "========================"):
+                old_logger.info(line)
+        timed("before: 18 FileHandler records", before, number=500)
+        handler.close()
+
+        # After: three structured records put on a queue, bodies sampled
+        new_logger = logging.getLogger('bench.after')
+        new_logger.propagate = False
+        listener = setup_logging(log_dir=directory, filename='after.log', console=False, logger_name='bench.after')
+        for rate in (1.0, 0.01):
+            sampler = BodySampler(rate)
+
+            def after():
+                new_logger.info("Token usage: Dialogue - Rick", extra={'input_tokens': 900, 'response_tokens': 150})
+                fields = {'npc': 'Rick', 'player_message': 'hello'}
+                if sampler.sampled():
+                    fields['prompt'] = prompt
+                new_logger.info("Dialogue request", extra=fields)
+                fields = {'npc': 'Rick', 'response_chars': len(response)}
+                if sampler.sampled():
+                    fields['response'] = response
+                new_logger.info("Dialogue response", extra=fields)
+            timed(f"after: 3 queued JSON records, bodies at {rate:.0%}", after, number=500)
+        stop_listener(listener)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def legacy_clean_dialogue_response(response_text):
+    """The cleaner as it was before response_cleaner.py, kept as the reference output"""
+    import re
+    from response_cleaner import DIALOGUE_CLEANUP_PATTERNS, FALLBACK_RESPONSES, INSTRUCTION_LINE_KEYWORDS, MEMORY_LINE_KEYWORDS
+
+    if not response_text:
+        return "I'm not sure how to respond to that."
+    cleaned = response_text.strip()
+    for pattern in DIALOGUE_CLEANUP_PATTERNS:
+        cleaned = re.sub(pattern, "", cleaned, flags=re.DOTALL | re.IGNORECASE)
+    filtered_lines = []
+    for line in cleaned.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if any(keyword in line.lower() for keyword in MEMORY_LINE_KEYWORDS):
+            continue
+        if any(keyword in line.lower() for keyword in INSTRUCTION_LINE_KEYWORDS):
+            continue
+        filtered_lines.append(line)
+    cleaned = ' '.join(filtered_lines).strip()
+    if cleaned and len(cleaned) > 5:
+        return cleaned
+    return random.choice(FALLBACK_RESPONSES)
+
+def dialogue_corpus(size=400):
+    """Golden corpus of model replies: mostly clean, some with echoed labels, instructions or prompt"""
+    rng = random.Random(7)
+    replies = [
+        "*adjusts goggles* The reactor's been humming all week. Don't touch the blue wires.",
+        "Listen, kid - you want crystals, you bring me 50 crypto first. That's the deal.",
+        "Ha! You again? Fine.\nI'll tell you about the scout, but this stays between us.",
+        "We don't get many travelers out here. Most of them don't come back from the wilderness!",
+        "Trust is earned, not given.   Come back when you've proven yourself.",
+        "Mmm.",
+        "",
+    ]
+    memory = sample_memory_context(16)
+    prompt = ("PERSONALITY: Gruff but fair\nBACKGROUND: Ex-military engineer\nDIALOGUE STYLE: Short sentences\n\n"
+              "PLAYER CONTEXT: {'crypto': 120}\n" + memory + '\nThe player says: "any work?"\n\n'
+              "IMPORTANT INSTRUCTIONS:\n- Respond naturally as Rick in character\n- Keep responses under 2-3 sentences\n"
+              "- Use the memory context to inform your response, but don't repeat it\n"
+              "- Be true to your personality and role\n- DO NOT include the memory context text in your response\n"
+              "- DO NOT include instruction text in your response\n")
+    contaminations = [
+        lambda reply: reply,
+        lambda reply: reply,
+        lambda reply: reply,
+        lambda reply: "Response: " + reply,
+        lambda reply: "Dialogue:\n" + reply + "\nAnswer: yes",
+        lambda reply: reply + "\nRespond as Rick would. Keep responses under three sentences.",
+        lambda reply: memory + reply,
+        lambda reply: reply + "\n\nRelationship: friendly\nNPC: " + reply,
+        lambda reply: prompt + "\nRick: " + reply,
+    ]
+    return [rng.choice(contaminations)(rng.choice(replies)) for _ in range(size)]
+
+@benchmark
+def response_cleaning():
+    from response_cleaner import clean_dialogue_response, clean_dialogue_stream
+
+    corpus = dialogue_corpus()
+    mismatches = 0
+    for text in corpus:
+        random.seed(text)
+        expected = legacy_clean_dialogue_response(text)
+        random.seed(text)
+        mismatches += clean_dialogue_response(text) != expected
+    print(f"  golden corpus: {len(corpus)} replies, {mismatches} differ from the previous cleaner")
+
+    clean = [text for text in corpus if '\n' not in text and ':' not in text]
+    for label, texts in (("clean replies", clean), ("full corpus", corpus)):
+        timed(f"before: {label} x{len(texts)}", lambda: [legacy_clean_dialogue_response(t) for t in texts], number=5)
+        timed(f"after: {label} x{len(texts)}", lambda: [clean_dialogue_response(t) for t in texts], number=5)
+
+    def stream_all():
+        for text in corpus:
+            # Roughly token-sized chunks, as Ollama streams them
+            list(clean_dialogue_stream(text[i:i + 4] for i in range(0, len(text), 4)))
+    timed(f"stream cleaner, 4-char chunks x{len(corpus)}", stream_all)
+
+def legacy_extract_quest_json(text):
+    """The three strategies parse_quest_response used before quest_output.py"""
+    import re
+
+    text = text.strip()
+    if '{' in text and '}' in text:
+        try:
+            return json.loads(text[text.find('{'):text.rfind('}') + 1])
+        except ValueError:
+            pass
+    for line in text.split('\n'):
+        line = line.strip()
+        if line.startswith('{') and line.endswith('}'):
+            try:
+                return json.loads(line)
+            except ValueError:
+                continue
+    for match in re.findall(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', text):
+        try:
+            return json.loads(match)
+        except ValueError:
+            continue
+    return None
+
+def quest_outputs(max_tokens=300, chars_per_token=4):
+    """Full quest generations as a model would stream them, capped at max_tokens"""
+    quest = json.dumps({
+        'quest_type': 'collect_item', 'title': 'Crystal Run', 'description': 'Bring back red crystals from the ridge',
+        'target_item': 'crystal_red', 'quantity': 3, 'reward_crypto': 40,
+        'response': "Those crystals won't collect themselves. Watch the {ridge} at night."
+    }, indent=2)
+    chatter = "\n\nThis quest fits Rick's role as an engineer. Let me know if you want a {harder} version! " * 8
+    outputs = {
+        'schema mode': quest,
+        'json mode, trailing whitespace': quest + '\n' * 2000,
+        'free-form, trailing chatter': quest + chatter,
+        'free-form, preamble and chatter': "Sure! Here's a quest for {you}:\n" + quest + chatter,
+        'free-form, cut off by max_tokens': "Here you go:\n" + quest[:len(quest) - 30],
+        'no JSON at all': "I can't think of a quest right now. " * 40,
+    }
+    cap = max_tokens * chars_per_token
+    return {label: text[:cap] for label, text in outputs.items()}
+
+@benchmark
+def quest_parsing(chars_per_token=4):
+    from quest_output import QuestOutput
+
+    output = QuestOutput(max_tokens=300)
+
+    def stream(text):
+        for i in range(0, len(text), chars_per_token):
+            yield {'response': text[i:i + chars_per_token], 'done': False}
+        yield {'response': '', 'done': True}
+
+    for label, text in quest_outputs(chars_per_token=chars_per_token).items():
+        streamed = output.stats()['tokens_streamed']
+        result = output.read(stream(text))
+        before = 'ok' if legacy_extract_quest_json(text) is not None else 'FAILED'
+        after = 'ok' if output.parse(result['response']) is not None else 'FAILED'
+        tokens_before = -(-len(text) // chars_per_token)
+        tokens_after = min(output.stats()['tokens_streamed'] - streamed, tokens_before)
+        print(f"  {label:<34} parse {before:>6} -> {after:<6}  tokens generated {tokens_before:>4} -> {tokens_after:>4}")
+    stats = output.stats()
+    print(f"  parse success rate {stats['parse_success_rate']:.0%}, parsed by {stats['parsed_by']}")
+
+    text = quest_outputs()['free-form, preamble and chatter']
+    timed("scan a streamed quest to its closing brace", lambda: output.read(stream(text)), number=200)
+    timed("before: three-strategy parse of the full text", lambda: legacy_extract_quest_json(text), number=200)
+    timed("after: extract_quest_json of the full text", lambda: output.parse(text), number=200)
+
+def legacy_validate_quest_data(quest, available_items, available_npcs, player_suggestion):
+    """validate_quest_data before quest_catalogue.py (logging left out), kept as the reference output"""
+    import re
+    from quest_catalogue import COMMON_ITEM_MAPPINGS
+
+    if player_suggestion:
+        crypto_matches = re.findall(r'(\d+)\s*crypto', player_suggestion.lower())
+        if crypto_matches:
+            quest['reward_crypto'] = min(int(crypto_matches[0]), 1000)
+    if quest.get('quest_type') == 'collect_item':
+        target_item = quest.get('target_item')
+        if target_item and target_item not in available_items:
+            if player_suggestion:
+                suggestion_lower = player_suggestion.lower()
+                for item in available_items:
+                    item_lower = item.lower()
+                    if (item_lower in suggestion_lower or
+                            any(word in suggestion_lower for word in item_lower.split('_'))):
+                        quest['target_item'] = item
+                        break
+                if quest['target_item'] not in available_items:
+                    for keyword, item_id in COMMON_ITEM_MAPPINGS.items():
+                        if keyword in suggestion_lower and item_id in available_items:
+                            quest['target_item'] = item_id
+                            break
+            if quest['target_item'] not in available_items:
+                quest['target_item'] = available_items[0] if available_items else 'crystal_red'
+        if player_suggestion:
+            quantity_matches = re.findall(r'(\d+)\s*(?:pieces?|items?|units?|of)', player_suggestion.lower())
+            if quantity_matches:
+                quest['quantity'] = min(int(quantity_matches[0]), 10)
+            elif any(word in player_suggestion.lower() for word in ['some', 'a few', 'several']):
+                quest['quantity'] = 3
+            elif 'a ' in player_suggestion.lower() or 'an ' in player_suggestion.lower():
+                quest['quantity'] = 1
+    elif quest.get('quest_type') == 'talk_to_npc':
+        target_npc = quest.get('target_npc')
+        if target_npc and target_npc not in available_npcs:
+            quest['target_npc'] = available_npcs[0] if available_npcs else 'Commander Sarah Chen'
+    return quest
+
+def sample_catalogue(size):
+    """size item ids like the frontend's (word_word), including the COMMON_ITEM_MAPPINGS targets"""
+    from quest_catalogue import COMMON_ITEM_MAPPINGS
+
+    rng = random.Random(size)
+    prefixes = ['iron', 'void', 'plasma', 'ancient', 'glow', 'quantum', 'frozen', 'solar', 'toxic', 'hollow',
+                'rusted', 'bio', 'nano', 'deep', 'star', 'ion', 'dark', 'gilded', 'lunar', 'feral']
+    nouns = ['core', 'shard', 'coil', 'lichen', 'gear', 'lens', 'vial', 'cell', 'husk', 'beacon',
+             'chip', 'spore', 'plate', 'rod', 'seed', 'tooth', 'ingot', 'scrap', 'fang', 'resin']
+    items = []
+    seen = set()
+    while len(items) < size - len(COMMON_ITEM_MAPPINGS):
+        item = f"{rng.choice(prefixes)}_{rng.choice(nouns)}_{rng.randint(1, size)}"
+        if item not in seen:
+            seen.add(item)
+            items.append(item)
+    # Mapping targets at the end, where the linear scan finds them last
+    return items + list(COMMON_ITEM_MAPPINGS.values())
+
+QUEST_SUGGESTIONS = [
+    "find me 3 pieces of that alien stuff for 50 crypto",
+    "I want to explore the wasteland",
+    "something with crystals maybe",
+    "bring an azure crystal",
+    "a few plant samples",
+    "talk to someone",
+    "I'll do anything for 2000 crypto",
+    "xyzzy",
+    "",
+]
+
+@benchmark
+def quest_validation():
+    import copy
+    import logging
+    from quest_catalogue import QuestCatalogue, quest_catalogue, validate_quest_data
+
+    logging.disable(logging.CRITICAL)
+    npcs = ['Commander Sarah Chen', 'Dr. Marcus Webb', 'Scout Jake Williams']
+    quests = [
+        {'quest_type': 'collect_item', 'target_item': 'unobtainium', 'quantity': 1, 'reward_crypto': 15},
+        {'quest_type': 'collect_item', 'target_item': 'crystal_red', 'quantity': 1, 'reward_crypto': 15},
+        {'quest_type': 'talk_to_npc', 'target_npc': 'Rick', 'reward_crypto': 15},
+    ]
+    try:
+        for size in (100, 1_000, 10_000):
+            items = sample_catalogue(size)
+            cases = [(quest, suggestion) for quest in quests for suggestion in QUEST_SUGGESTIONS]
+            mismatches = sum(
+                legacy_validate_quest_data(copy.deepcopy(quest), items, npcs, suggestion) !=
+                validate_quest_data(copy.deepcopy(quest), items, npcs, suggestion)
+                for quest, suggestion in cases
+            )
+            print(f"  {size:,} items: {len(cases)} quest/suggestion cases, {mismatches} differ from the previous logic")
+
+            quest = quests[0]
+            timed(f"before: validate, {size:,} items", lambda: [
+                legacy_validate_quest_data(dict(quest), items, npcs, suggestion) for suggestion in QUEST_SUGGESTIONS
+            ], number=5)
+            timed(f"after: validate, {size:,} items (index cached)", lambda: [
+                validate_quest_data(dict(quest), items, npcs, suggestion) for suggestion in QUEST_SUGGESTIONS
+            ], number=5)
+            timed(f"after: index build (cache miss), {size:,} items", lambda: QuestCatalogue(items, npcs))
+            timed(f"after: index lookup (cache hit), {size:,} items", lambda: quest_catalogue(items, npcs), number=100)
+    finally:
+        logging.disable(logging.NOTSET)
+
+@benchmark
+def app_hot_paths():
+    """The per-request functions in app.py, as the routes call them"""
+    import logging
+
+    directory = tempfile.mkdtemp(prefix='app_bench_')
+    # Keep the app's logs, saves and background work out of the way
+    os.environ.setdefault('DATA_DIR', directory)
+    os.environ.setdefault('QUEST_POOL_ENABLED', 'false')
+    import app
+
+    logging.disable(logging.CRITICAL)
+    try:
+        npc = ('Engineer Marcus Rodriguez', 'brilliant but eccentric, obsessed with technology', 'Chief Engineer',
+               'Built half the outpost from salvage', 'Rapid-fire technical jargon')
+        system = app.create_dialogue_system_prompt(*npc)
+        for memory_lines in (16, 500):
+            memory = sample_memory_context(memory_lines)
+            timed(f"dialogue prompt, {memory_lines} memory lines", lambda: app.create_dialogue_turn(
+                npc[0], app.create_dialogue_system_prompt(*npc), 'any work for me?', {'crypto': 50}, memory), number=20)
+        prompt = f"{system}\n\n{app.create_dialogue_turn(npc[0], system, 'hello', {'crypto': 50}, sample_memory_context(16))}"
+        timed(f"estimate_tokens, cached ({len(prompt):,} chars)", lambda: app.estimate_tokens(prompt), number=1000)
+        suffix = itertools.count()
+        timed(f"estimate_tokens, new text ({len(prompt):,} chars)", lambda: app.estimate_tokens(f"{prompt}{next(suffix)}"), number=50)
+
+        corpus = dialogue_corpus()
+        timed(f"clean_dialogue_response x{len(corpus)}", lambda: [app.clean_dialogue_response(t) for t in corpus], number=5)
+
+        items = sample_catalogue(100)
+        npcs = ['Commander Sarah Chen', 'Scout Jake Williams', 'Trader Eliza Thompson']
+        outputs = quest_outputs()
+        for label, output in (('schema', 'schema mode'), ('free-form', 'free-form, preamble and chatter'), ('no JSON', 'no JSON at all')):
+            text = outputs[output]
+            timed(f"parse_quest_response, {label}", lambda: app.parse_quest_response(
+                text, 'engineer_marcus', items, npcs, QUEST_SUGGESTIONS[0]), number=50)
+        quest = json.loads(outputs['schema mode'])
+        timed("validate_quest_data, 100 items", lambda: [
+            app.validate_quest_data(dict(quest), items, npcs, suggestion) for suggestion in QUEST_SUGGESTIONS
+        ], number=20)
+
+        # NPC lookups, fallbacks and system prompts come precompiled from the registry
+        names = [entry['name'] for entry in app.npc_registry.public()[1]]
+        timed(f"npc registry, lookup by name x{len(names)}", lambda: [app.get_npc_data_by_name(name) for name in names], number=1000)
+        timed("npc registry, fallback quest", lambda: app.get_fallback_quest('unfiltered_rick'), number=1000)
+        timed("npc registry, dialogue system prompt", lambda: app.dialogue_system_prompt(npc[0], None, None, None, None), number=1000)
+
+        # A dialogue body with the full player_context against one with a player session id and an event
+        body = {'npc_name': npc[0], 'player_message': 'any work for me?', 'memory_context': ''}
+        legacy_body = json.dumps({**body, 'player_context': sample_player_context()})
+        session = app.player_sessions.create('benchmark', sample_player_context())
+        session_body = json.dumps({**body, 'session_id': session.id, 'session_events': [{'seq': 1, 'type': 'crypto', 'amount': 15}]})
+        print(f"  dialogue body: {len(legacy_body):,} bytes with player_context, {len(session_body):,} with a session")
+        timed("parse dialogue body, player_context", lambda: app.simplify_player_context(json.loads(legacy_body)['player_context']), number=1000)
+        timed("parse dialogue body, session + event", lambda: (
+            app.player_sessions.apply(session, [dict(event, seq=None) for event in json.loads(session_body)['session_events']]),
+            session.summary()
+        ), number=1000)
+
+        # The cascade's rules tier answers /api/generate-quest without a model
+        npc_data = app.get_npc_data_by_name(npc[0])
+        timed(f"quest cascade, route x{len(QUEST_SUGGESTIONS)}", lambda: [
+            app.quest_cascade.plan(suggestion, items, npcs) for suggestion in QUEST_SUGGESTIONS
+        ], number=50)
+        timed(f"quest cascade, rules quest x{len(QUEST_SUGGESTIONS)}", lambda: [
+            app.rules_quest(app.quest_cascade.plan(suggestion, items, npcs), npc_data['id'], npc[0], npc_data['role'])
+            for suggestion in QUEST_SUGGESTIONS
+        ], number=50)
+    finally:
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(directory, ignore_errors=True)
+
+@benchmark
+def log_tail(target_mb=200):
+    from log_reader import tail
+
+    directory = tempfile.mkdtemp(prefix='log_tail_bench_')
+    path = os.path.join(directory, 'ollama_interactions.log')
+    levels = ['INFO'] * 8 + ['WARNING', 'ERROR']
+    try:
+        # Grow the file in steps and time the old readlines() against a tail at each size
+        size = 0
+        for step_mb in (2, 20, target_mb):
+            with open(path, 'a', encoding='utf-8') as f:
+                while size < step_mb * 1024 * 1024:
+                    line = json.dumps({
+                        'ts': f"2026-01-01T00:00:{size % 60:02d}.000", 'level': random.choice(levels),
+                        'logger': 'app', 'msg': 'Dialogue request', 'request_id': f"{size:012x}",
+                        'npc': 'Rick', 'player_message': 'hello there ' * 8
+                    }) + '\n'
+                    f.write(line)
+                    size += len(line)
+            print(f"  {step_mb}MB log file")
+
+            def readlines():
+                with open(path, 'r') as f:
+                    return f.readlines()[-50:]
+            timed("before: readlines()[-50:]", readlines, repeat=3)
+            timed("after: tail n=50", lambda: tail(path, n=50), number=100)
+            timed("after: tail n=50 level=ERROR", lambda: tail(path, n=50, level='ERROR'), number=100)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def compare(baseline_path):
+    """Print how this run's mean times moved against an earlier --output file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('git_commit')}, {baseline['meta']['timestamp']}):")
+    for name, results in RESULTS.items():
+        before = {result['label']: result for result in baseline['results'].get(name, [])}
+        for result in results:
+            if result['label'] not in before:
+                continue
+            old, new = before[result['label']]['mean_ms'], result['mean_ms']
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"  {name}: {result['label']:<48} {old:>10.4f}ms -> {new:>10.4f}ms  {change:+6.1f}%")
+
+def main():
+    global current_benchmark
+    parser = argparse.ArgumentParser(description='Microbenchmarks for backend hot paths')
+    parser.add_argument('names', nargs='*', help=f"Benchmarks to run (default all): {', '.join(BENCHMARKS)}")
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare with the JSON results of an earlier run')
+    args = parser.parse_args()
+
+    selected = args.names or list(BENCHMARKS)
+    for name in selected:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark '{name}'. Available: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+    for name in selected:
+        print(f"{name}:")
+        current_benchmark = name
+        BENCHMARKS[name]()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': run_metadata(), 'results': RESULTS}, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        compare(args.baseline)
+
+if __name__ == '__main__':
+    main()
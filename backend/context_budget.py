@@ -0,0 +1,240 @@
+import functools
+import logging
+import math
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Letter runs, single digits and individual punctuation marks
+_PIECE_PATTERN = re.compile(r"[A-Za-z]+|\d|[^\sA-Za-z\d]")
+
+
+@functools.lru_cache(maxsize=8192)
+def heuristic_token_count(text):
+    """Approximate a Llama-style tokenizer without loading a vocabulary.
+
+    Short words are usually one token, longer words split every ~4 characters,
+    digits are tokenized one at a time and punctuation is a token of its own.
+    Much closer than len(text)//4 for prompts full of JSON and punctuation.
+    """
+    count = 0
+    for piece in _PIECE_PATTERN.findall(text):
+        length = len(piece)
+        count += 1 if length <= 6 else math.ceil(length / 4)
+    return count
+
+
+class TokenCounter:
+    """Counts tokens with a real tokenizer when one is available.
+
+    Tries, in order: a HuggingFace tokenizer.json (tokenizers package), a
+    SentencePiece .model file (sentencepiece package), tiktoken, and finally the
+    cached heuristic above. Results are cached per text either way.
+    """
+
+    def __init__(self, tokenizer_path=None, tiktoken_encoding=None, cache_size=4096):
+        self.name = 'heuristic'
+        self._encode = None
+
+        if tokenizer_path and tokenizer_path.endswith('.json'):
+            try:
+                from tokenizers import Tokenizer
+                tokenizer = Tokenizer.from_file(tokenizer_path)
+                self._encode = lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+                self.name = f"tokenizers:{tokenizer_path}"
+            except Exception as e:
+                logger.warning(f"Could not load tokenizer {tokenizer_path}: {e}")
+        elif tokenizer_path and tokenizer_path.endswith('.model'):
+            try:
+                import sentencepiece
+                processor = sentencepiece.SentencePieceProcessor(model_file=tokenizer_path)
+                self._encode = lambda text: len(processor.encode(text))
+                self.name = f"sentencepiece:{tokenizer_path}"
+            except Exception as e:
+                logger.warning(f"Could not load SentencePiece model {tokenizer_path}: {e}")
+
+        if self._encode is None and tiktoken_encoding:
+            try:
+                import tiktoken
+                encoding = tiktoken.get_encoding(tiktoken_encoding)
+                self._encode = lambda text: len(encoding.encode(text))
+                self.name = f"tiktoken:{tiktoken_encoding}"
+            except Exception as e:
+                logger.warning(f"Could not load tiktoken encoding {tiktoken_encoding}: {e}")
+
+        if self._encode is not None:
+            self._cached = functools.lru_cache(maxsize=cache_size)(self._encode)
+        else:
+            self._cached = heuristic_token_count
+
+    def count(self, text):
+        if not text:
+            return 0
+        return self._cached(text)
+
+    def cache_info(self):
+        info = self._cached.cache_info()
+        return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize}
+
+
+# How much each memory section is worth keeping when the prompt is over budget
+SECTION_WEIGHTS = {
+    'RELATIONSHIP STATUS': 6,
+    'PROMISES': 5,
+    'RELATIONSHIP': 5,
+    'QUESTS': 4,
+    'PERSONAL_INFO': 4,
+    'EMOTIONAL': 3,
+    'RECENT CONVERSATION CONTEXT': 3,
+    'EVENTS': 2,
+    'TRADE': 2,
+    'GOSSIP': 1
+}
+
+# Same signals the frontend uses in calculateMemoryImportance
+IMPORTANCE_KEYWORDS = {
+    'promise': 3, 'deal': 3, 'agreement': 3, 'secret': 3, 'confidential': 3,
+    'romantic': 3, 'intimate': 3, 'betrayal': 4, 'trust': 4, 'angry': 3, 'furious': 3,
+    'quest': 2, 'mission': 2, 'crypto': 2, 'money': 2, 'payment': 2,
+    'family': 2, 'home': 2, 'background': 2, 'happy': 2, 'excited': 2, 'sad': 2, 'hurt': 2
+}
+
+# Lines longer than this are shortened before anything is dropped
+MAX_MEMORY_LINE_CHARS = 240
+
+_SECTION_HEADER = re.compile(r'^([A-Z][A-Z_ ]+):$')
+
+
+def score_memory_line(line, section, position, section_length):
+    """Value of keeping one memory line: section weight + keyword importance + recency"""
+    score = SECTION_WEIGHTS.get(section, 2)
+    lowered = line.lower()
+    score += sum(weight for keyword, weight in IMPORTANCE_KEYWORDS.items() if keyword in lowered)
+    # Later lines in a section are more recent
+    score += position / max(section_length, 1)
+    return score
+
+
+class ContextBudget:
+    """Fits prompts into the model's context window by trimming memory context"""
+
+    def __init__(self, counter, max_input_tokens):
+        self.counter = counter
+        self.max_input_tokens = max_input_tokens
+        self._lock = threading.Lock()
+        self._stats = {
+            'prompts_checked': 0,
+            'prompts_trimmed': 0,
+            'lines_compressed': 0,
+            'lines_dropped': 0,
+            'tokens_cut': 0,
+            'over_budget_after_trim': 0
+        }
+
+    def count(self, text):
+        return self.counter.count(text)
+
+    def fit_memory(self, memory_text, available_tokens):
+        """Trim memory_text to at most available_tokens.
+
+        Structural lines (=== headers ===, section headers) are kept while any of
+        their section survives. Over-long lines are compressed first, then the
+        lowest-value lines are dropped until the text fits. Returns the trimmed
+        text and the number of tokens cut.
+        """
+        with self._lock:
+            self._stats['prompts_checked'] += 1
+
+        original_tokens = self.count(memory_text)
+        if original_tokens <= available_tokens:
+            return memory_text, 0
+
+        lines = memory_text.split('\n')
+        kept = [True] * len(lines)
+        sections = {}  # line index -> section name for content lines
+        headers = {}  # section name -> header line index
+        section = None
+        for index, line in enumerate(lines):
+            stripped = line.strip()
+            header = _SECTION_HEADER.match(stripped)
+            if stripped.startswith('===') or not stripped:
+                section = None if stripped.startswith('===') else section
+                continue
+            if header:
+                section = header.group(1).strip()
+                headers[section] = index
+                continue
+            sections[index] = section
+
+        # Step 1: compress over-long lines
+        compressed = 0
+        for index in sections:
+            if len(lines[index]) > MAX_MEMORY_LINE_CHARS:
+                lines[index] = lines[index][:MAX_MEMORY_LINE_CHARS].rstrip() + '...'
+                compressed += 1
+
+        def current_tokens():
+            return self.count('\n'.join(line for line, keep in zip(lines, kept) if keep))
+
+        # Step 2: drop lowest-value lines until we fit
+        by_section = {}
+        position = {}
+        for index, name in sections.items():
+            members = by_section.setdefault(name, [])
+            position[index] = len(members)
+            members.append(index)
+        ranked = sorted(
+            sections,
+            key=lambda i: score_memory_line(lines[i], sections[i], position[i], len(by_section[sections[i]]))
+        )
+
+        dropped = 0
+        remaining = iter(ranked)
+
+        def drop(index):
+            kept[index] = False
+            # Drop a section header once all of its lines are gone
+            name = sections[index]
+            if name in headers and not any(kept[i] for i in by_section[name]):
+                kept[headers[name]] = False
+
+        # Subtracting per-line counts is cheap but only approximate for real
+        # tokenizers, so re-count once it looks like we fit and keep going if not
+        tokens = current_tokens()
+        while tokens > available_tokens:
+            for index in remaining:
+                drop(index)
+                dropped += 1
+                tokens -= self.count(lines[index])
+                if tokens <= available_tokens:
+                    break
+            else:
+                break
+            tokens = current_tokens()
+
+        trimmed = '\n'.join(line for line, keep in zip(lines, kept) if keep)
+        if not any(kept[i] for i in sections):
+            # Nothing worth remembering fit - leave the frame out entirely
+            trimmed = ''
+        final_tokens = self.count(trimmed)
+        tokens_cut = original_tokens - final_tokens
+
+        with self._lock:
+            self._stats['prompts_trimmed'] += 1
+            self._stats['lines_compressed'] += compressed
+            self._stats['lines_dropped'] += dropped
+            self._stats['tokens_cut'] += tokens_cut
+            if final_tokens > available_tokens:
+                self._stats['over_budget_after_trim'] += 1
+
+        logger.info(f"Trimmed memory context by {tokens_cut} tokens ({compressed} lines compressed, {dropped} dropped)")
+        return trimmed, tokens_cut
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['tokenizer'] = self.counter.name
+        stats['max_input_tokens'] = self.max_input_tokens
+        stats['count_cache'] = self.counter.cache_info()
+        return stats
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import Histogram
+
+# How dialogue is sent to Ollama. Every mode puts the NPC's persona and
+# instructions first, unchanged from turn to turn, so Ollama can reuse the KV
+# state it already computed for them instead of re-running prefill:
+#   chat     - /api/chat: the system prefix, the session's earlier turns, then this turn
+#   context  - /api/generate with `system` and the `context` tokens Ollama returned last turn
+#   generate - /api/generate with prefix and turn as one prompt; no session state
+DIALOGUE_API_MODES = ('chat', 'context', 'generate')
+
+
+def payload_prompt(payload):
+    """Everything a dialogue payload conditions on, as text, for cache and coalescing keys"""
+    if 'messages' in payload:
+        return '\n'.join(f"{message['role']}: {message['content']}" for message in payload['messages'])
+    prompt = payload['prompt']
+    if payload.get('system'):
+        prompt = f"{payload['system']}\n{prompt}"
+    if payload.get('context'):
+        digest = hashlib.blake2b(json.dumps(payload['context']).encode(), digest_size=8).hexdigest()
+        prompt = f"[context {digest}]\n{prompt}"
+    return prompt
+
+
+class DialogueTurn:
+    """One dialogue request: its session, what was sent and how much of it was already in the session"""
+
+    __slots__ = ('key', 'user', 'warm', 'prompt_tokens')
+
+    def __init__(self, key, user, warm, prompt_tokens):
+        self.key = key
+        self.user = user
+        self.warm = warm
+        self.prompt_tokens = prompt_tokens
+
+
+class DialogueSessionStore:
+    """Per-session (player + NPC) conversation state for prefix reuse, with eviction.
+
+    In chat mode a session holds its last `max_turns` exchanges, in context mode
+    the token context Ollama returned for the previous turn. Sessions idle for
+    `ttl_seconds` expire and the least recently used go once there are more than
+    `max_sessions`. State that would push a prompt past `max_input_tokens` is
+    dropped (oldest exchanges first in chat mode).
+
+    Ollama's prompt_eval_count / prompt_eval_duration are recorded per turn, so
+    stats() reports prefill time for cold (first) and warm turns and an estimate
+    of the prefill time saved by not re-evaluating reused tokens.
+    """
+
+    def __init__(self, mode='chat', max_sessions=1000, ttl_seconds=1800, max_turns=6,
+                 max_input_tokens=7192, count_tokens=None):
+        if mode not in DIALOGUE_API_MODES:
+            raise ValueError(f"Unknown dialogue API mode '{mode}' (expected one of {', '.join(DIALOGUE_API_MODES)})")
+        self.mode = mode
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self.max_input_tokens = max_input_tokens
+        self.count_tokens = count_tokens or (lambda text: len(text) // 4)
+
+        # key -> {'messages': [...], 'context': [...] or None, 'used_at': float}
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._prefill = {'cold': Histogram(), 'warm': Histogram()}
+        self._stats = {
+            'turns': 0,
+            'warm_turns': 0,
+            'unmeasured_turns': 0,
+            'prompt_tokens_est': 0,
+            'prompt_tokens_evaluated': 0,
+            'prefill_seconds': 0.0,
+            'history_trimmed': 0,
+            'context_dropped': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+
+    def _session(self, key, now):
+        """Live session for key, or None; caller must hold the lock"""
+        session = self._sessions.get(key)
+        if session is not None and now - session['used_at'] > self.ttl_seconds:
+            del self._sessions[key]
+            self._stats['expirations'] += 1
+            session = None
+        return session
+
+    def build(self, key, model, system, turn, options, keep_alive=None):
+        """Ollama payload for this turn and the DialogueTurn to pass back to record()"""
+        fixed_tokens = self.count_tokens(system) + self.count_tokens(turn)
+        with self._lock:
+            session = self._session(key, time.monotonic())
+            messages = list(session['messages']) if session else []
+            context = session['context'] if session else None
+
+        payload = {'model': model, 'stream': False, 'options': options}
+        if keep_alive:
+            payload['keep_alive'] = keep_alive
+
+        if self.mode == 'chat':
+            history_tokens = [self.count_tokens(message['content']) for message in messages]
+            while messages and fixed_tokens + sum(history_tokens) > self.max_input_tokens:
+                # Drop the oldest exchange; the prefix after the system message no longer matches
+                del messages[:2], history_tokens[:2]
+                with self._lock:
+                    self._stats['history_trimmed'] += 1
+            payload['messages'] = [{'role': 'system', 'content': system}, *messages, {'role': 'user', 'content': turn}]
+            return payload, DialogueTurn(key, turn, bool(messages), fixed_tokens + sum(history_tokens))
+
+        if self.mode == 'context' and context and fixed_tokens + len(context) > self.max_input_tokens:
+            context = None
+            with self._lock:
+                self._stats['context_dropped'] += 1
+        if self.mode == 'context':
+            payload['system'] = system
+            payload['prompt'] = turn
+            if context:
+                payload['context'] = context
+            return payload, DialogueTurn(key, turn, bool(context), fixed_tokens + len(context or ()))
+
+        payload['prompt'] = f"{system}\n\n{turn}"
+        return payload, DialogueTurn(key, turn, False, fixed_tokens)
+
+    def has_history(self, key):
+        """Whether the next turn for key carries earlier exchanges (chat history or a returned context)"""
+        with self._lock:
+            session = self._session(key, time.monotonic())
+            return bool(session and (session['messages'] or session['context']))
+
+    def record(self, turn, result, reply):
+        """Store a finished turn in its session and account for its prefill time"""
+        evaluated = result.get('prompt_eval_count')
+        duration_ns = result.get('prompt_eval_duration')
+        now = time.monotonic()
+        with self._lock:
+            self._stats['turns'] += 1
+            if turn.warm:
+                self._stats['warm_turns'] += 1
+            if evaluated is None or duration_ns is None:
+                # Served from the generation cache, or an Ollama that doesn't report timings
+                self._stats['unmeasured_turns'] += 1
+            else:
+                self._stats['prompt_tokens_est'] += turn.prompt_tokens
+                self._stats['prompt_tokens_evaluated'] += evaluated
+                self._stats['prefill_seconds'] += duration_ns / 1e9
+                self._prefill['warm' if turn.warm else 'cold'].observe(duration_ns / 1e9)
+
+            if self.mode == 'generate':
+                return
+            session = self._session(turn.key, now)
+            if session is None:
+                session = self._sessions[turn.key] = {'messages': [], 'context': None}
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self._stats['evictions'] += 1
+            else:
+                self._sessions.move_to_end(turn.key)
+            session['used_at'] = now
+            if self.mode == 'chat':
+                session['messages'].extend([{'role': 'user', 'content': turn.user}, {'role': 'assistant', 'content': reply}])
+                del session['messages'][:-2 * self.max_turns]
+            else:
+                # A cached reply carries no context; the next turn starts a fresh one
+                session['context'] = result.get('context')
+
+    def clear(self, player_id, npc_name=None):
+        """Forget a player's sessions, or just the one with npc_name"""
+        with self._lock:
+            for key in [key for key in self._sessions if key[0] == player_id and npc_name in (None, key[1])]:
+                del self._sessions[key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['sessions'] = len(self._sessions)
+        evaluated = stats['prompt_tokens_evaluated']
+        reused = max(stats['prompt_tokens_est'] - evaluated, 0)
+        ms_per_token = stats['prefill_seconds'] * 1000 / evaluated if evaluated else None
+        stats['prefill_seconds'] = round(stats['prefill_seconds'], 3)
+        stats['prompt_tokens_reused_est'] = reused
+        stats['prefill_ms_per_token'] = round(ms_per_token, 3) if ms_per_token is not None else None
+        measured = stats['turns'] - stats['unmeasured_turns']
+        saved_ms = reused * ms_per_token if ms_per_token is not None else 0.0
+        stats['prefill_ms_saved_est'] = round(saved_ms, 1)
+        stats['prefill_ms_saved_per_turn_est'] = round(saved_ms / measured, 1) if measured else None
+        stats['prefill_seconds_cold'] = self._prefill['cold'].snapshot()
+        stats['prefill_seconds_warm'] = self._prefill['warm'].snapshot()
+        stats['mode'] = self.mode
+        stats['max_turns'] = self.max_turns
+        return stats
@@ -0,0 +1,251 @@
+"""Fake Ollama server for benchmarks and load tests.
+
+Speaks enough of the Ollama API (/api/generate, /api/chat, /api/tags) for the
+backend, with a fixed time to first token, a fixed generation speed,
+streaming and injected failures (before a reply or partway through a stream),
+so load test runs and tests are repeatable and don't need a GPU:
+
+    python backend/fake_ollama.py --port 11435 --first-token-ms 150 --tokens-per-sec 40 --fail-rate 0.02
+    OLLAMA_URL=http://localhost:11435 python backend/app.py --no-debug
+    python backend/loadtest.py --route mix --concurrency 1 10 50 --output run.json
+
+Replies are picked by a seeded hash of the prompt, so the same prompt always
+gets the same reply. Quest prompts get a valid quest JSON built from the
+prompt's AVAILABLE_ITEMS / AVAILABLE_NPCS, followed by chatter the backend
+should cut off.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIALOGUE_REPLIES = [
+    "The reactor's been running hot all week, so keep your distance from the lower decks.",
+    "Supplies came in short again. If you find any iron ore out there, I'll make it worth your while.",
+    "Stay sharp past the ridge. The scouts keep reporting lights nobody can explain.",
+    "Credits talk, friend. Bring me something rare and we'll see about a discount.",
+    "You look like you've walked a long way. Sit down, the medbay can spare a minute.",
+]
+
+QUEST_CHATTER = "\n\nThis quest fits the NPC's role and the player's suggestion. Let me know if you want a harder version!"
+
+
+class FakeOllama:
+    """Reply generator and counters behind the fake server"""
+
+    def __init__(self, first_token_ms=150.0, tokens_per_sec=40.0, fail_rate=0.0, fail_status=503,
+                 models=('llama2-uncensored',), seed=0, fail_first=0, stream_error_after=None):
+        self.first_token_ms = first_token_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.fail_first = fail_first  # The first N requests fail whatever fail_rate says
+        self.stream_error_after = stream_error_after  # Streams break off with an error line after this many tokens
+        self.models = list(models)
+        self.seed = seed
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'failed': 0, 'streams': 0, 'streams_closed_early': 0, 'stream_errors': 0, 'tokens': 0}
+
+    def should_fail(self):
+        with self._lock:
+            self._stats['requests'] += 1
+            failed = self._rng.random() < self.fail_rate or self._stats['requests'] <= self.fail_first
+            if failed:
+                self._stats['failed'] += 1
+            return failed
+
+    def reply(self, prompt, structured):
+        """Reply text for a prompt: a dialogue line, or a quest for quest prompts"""
+        rng = random.Random(hashlib.blake2b(f"{self.seed}|{prompt}".encode(), digest_size=8).digest())
+        if not (structured or 'quest_type' in prompt):
+            return rng.choice(DIALOGUE_REPLIES)
+        items = _prompt_list(prompt, 'AVAILABLE_ITEMS') or ['iron_ore']
+        npcs = _prompt_list(prompt, 'AVAILABLE_NPCS')
+        if npcs and rng.random() < 0.3:
+            quest = {'quest_type': 'talk_to_npc', 'title': 'Pass the Word', 'description': 'Deliver a message',
+                     'target_npc': rng.choice(npcs), 'reward_crypto': rng.choice([10, 15, 20])}
+        else:
+            quest = {'quest_type': 'collect_item', 'title': 'Supply Run', 'description': 'Gather supplies for the outpost',
+                     'target_item': rng.choice(items), 'quantity': rng.randint(1, 3), 'reward_crypto': rng.choice([15, 20, 30])}
+        quest['response'] = "Think you can handle it?"
+        text = json.dumps(quest)
+        # JSON mode ends at the object; free-form models keep talking
+        return text if structured else text + QUEST_CHATTER
+
+    def tokens(self, text, limit=None):
+        # Ollama streams roughly one token (~4 characters) per chunk
+        pieces = re.findall(r'\S{1,4}\s*|\s+', text)
+        return pieces[:limit] if limit else pieces
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(first_token_ms=self.first_token_ms, tokens_per_sec=self.tokens_per_sec, fail_rate=self.fail_rate)
+        return stats
+
+
+def _prompt_list(prompt, label):
+    match = re.search(rf'^{label}: (\[.*\])$', prompt, re.MULTILINE)
+    try:
+        return json.loads(match.group(1)) if match else []
+    except ValueError:
+        return []
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def handle(self):
+            try:
+                super().handle()
+            except (BrokenPipeError, ConnectionResetError):
+                # The backend hung up, e.g. once a quest's JSON was complete
+                pass
+
+        def send_json(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/api/tags':
+                self.send_json(200, {'models': [{'name': f"{model}:latest"} for model in fake.models]})
+            elif self.path == '/fake/stats':
+                self.send_json(200, fake.stats())
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if self.path not in ('/api/generate', '/api/chat'):
+                self.send_json(404, {'error': 'not found'})
+                return
+            if fake.should_fail():
+                self.send_json(fake.fail_status, {'error': 'injected failure'})
+                return
+
+            chat = self.path == '/api/chat'
+            if chat:
+                prompt = '\n'.join(message.get('content', '') for message in body.get('messages', []))
+            else:
+                prompt = f"{body.get('system', '')}\n{body.get('prompt', '')}"
+            text = fake.reply(prompt, bool(body.get('format')))
+            tokens = fake.tokens(text, (body.get('options') or {}).get('num_predict'))
+            prompt_tokens = len(prompt) // 4
+            per_token = 1.0 / fake.tokens_per_sec if fake.tokens_per_sec > 0 else 0.0
+
+            def piece(content):
+                return {'message': {'role': 'assistant', 'content': content}} if chat else {'response': content}
+
+            def done():
+                final = {
+                    'done': True,
+                    'prompt_eval_count': prompt_tokens,
+                    'prompt_eval_duration': int(fake.first_token_ms * 1e6),
+                    'eval_count': len(tokens),
+                    'eval_duration': int(len(tokens) * per_token * 1e9)
+                }
+                if not chat:
+                    final['context'] = list(range(prompt_tokens + len(tokens)))
+                return final
+
+            time.sleep(fake.first_token_ms / 1000)
+            if not body.get('stream', True):
+                time.sleep(len(tokens) * per_token)
+                fake.count('tokens', len(tokens))
+                self.send_json(200, {**piece(''.join(tokens)), **done(), 'model': body.get('model')})
+                return
+
+            fake.count('streams')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                for index, token in enumerate(tokens):
+                    if fake.stream_error_after is not None and index >= fake.stream_error_after:
+                        # What Ollama sends when generation fails after the 200 went out
+                        fake.count('stream_errors')
+                        self.write_chunk({'error': 'injected stream failure'})
+                        break
+                    self.write_chunk({**piece(token), 'done': False})
+                    fake.count('tokens')
+                    time.sleep(per_token)
+                else:
+                    self.write_chunk({**piece(''), **done()})
+                self.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                fake.count('streams_closed_early')
+                self.close_connection = True
+
+        def write_chunk(self, body):
+            line = (json.dumps(body) + '\n').encode()
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b'\r\n')
+            self.wfile.flush()
+
+    return Handler
+
+
+def create_server(fake, host='127.0.0.1', port=0):
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    return server
+
+
+def start(port=0, host='127.0.0.1', **options):
+    """Serve a FakeOllama on a background thread; returns (server, fake). port=0 picks a free port."""
+    fake = FakeOllama(**options)
+    server = create_server(fake, host, port)
+    threading.Thread(target=server.serve_forever, name='fake-ollama', daemon=True).start()
+    return server, fake
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Ollama server for benchmarks and load tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--first-token-ms', type=float, default=150.0, help='Prefill time before the first token')
+    parser.add_argument('--tokens-per-sec', type=float, default=40.0, help='Generation speed (0 = instant)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of requests answered with --fail-status')
+    parser.add_argument('--fail-status', type=int, default=503)
+    parser.add_argument('--fail-first', type=int, default=0, help='Fail the first N requests (e.g. to watch retries)')
+    parser.add_argument('--stream-error-after', type=int, help='Break every stream off with an error after N tokens')
+    parser.add_argument('--model', action='append', dest='models', help='Model to list in /api/tags (repeatable)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeOllama(args.first_token_ms, args.tokens_per_sec, args.fail_rate, args.fail_status,
+                      args.models or ['llama2-uncensored'], args.seed, args.fail_first,
+                      args.stream_error_after)
+    server = create_server(fake, args.host, args.port)
+    print(f"Fake Ollama on http://{args.host}:{args.port} ({args.first_token_ms:g}ms to first token, "
+          f"{args.tokens_per_sec:g} tok/s, {args.fail_rate:.0%} failures)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
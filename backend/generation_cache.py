@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace and case so trivially different prompts share a key"""
+    return ' '.join(prompt.split()).casefold()
+
+
+class GenerationCache:
+    """LRU + TTL cache of LLM generations with an optional on-disk tier.
+
+    Each key holds up to `variants_per_key` different generations. Lookups miss
+    until that many variants have been collected, then return one at random, so
+    the same opening question doesn't always get the identical reply.
+    """
+
+    def __init__(self, max_entries=1000, ttl_seconds=3600, max_bytes=32 * 1024 * 1024,
+                 variants_per_key=1, disk_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.variants_per_key = max(1, variants_per_key)
+        self.disk_path = disk_path
+
+        # key -> {'variants': [...], 'created_at': float, 'size': int}
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'disk_hits': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS generations '
+                '(key TEXT PRIMARY KEY, variants TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(prompt, model, options=None):
+        """Hash of the normalized prompt, model and sampling options"""
+        material = json.dumps({
+            'prompt': normalize_prompt(prompt),
+            'model': model,
+            'options': options or {}
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return a cached generation for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry['created_at'] > self.ttl_seconds:
+                self._remove(key)
+                self._stats['expirations'] += 1
+                entry = None
+
+            if entry is None:
+                entry = self._load_from_disk(key, now)
+
+            if entry is None or len(entry['variants']) < self.variants_per_key:
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return random.choice(entry['variants'])
+
+    def put(self, key, value):
+        """Store a generation, adding it as another variant if the key exists"""
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {'variants': [], 'created_at': now, 'size': 0}
+                self._entries[key] = entry
+            elif len(entry['variants']) >= self.variants_per_key:
+                # Already full - refresh the oldest variant instead of growing
+                self._bytes -= len(json.dumps(entry['variants'].pop(0)))
+                entry['size'] = sum(len(json.dumps(v)) for v in entry['variants'])
+
+            entry['variants'].append(value)
+            entry['size'] += size
+            self._bytes += size
+            self._entries.move_to_end(key)
+            self._evict()
+            self._save_to_disk(key, entry)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self._stats['evictions'] += 1
+
+    def _load_from_disk(self, key, now):
+        if self._db is None:
+            return None
+        row = self._db.execute('SELECT variants, created_at FROM generations WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.ttl_seconds:
+            self._db.execute('DELETE FROM generations WHERE key = ?', (key,))
+            self._db.commit()
+            self._stats['expirations'] += 1
+            return None
+
+        variants = json.loads(row[0])
+        entry = {'variants': variants, 'created_at': row[1], 'size': sum(len(json.dumps(v)) for v in variants)}
+        self._entries[key] = entry
+        self._bytes += entry['size']
+        self._evict()
+        self._stats['disk_hits'] += 1
+        return entry
+
+    def _save_to_disk(self, key, entry):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                'INSERT OR REPLACE INTO generations (key, variants, created_at) VALUES (?, ?, ?)',
+                (key, json.dumps(entry['variants']), entry['created_at'])
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not persist generation cache entry: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute('DELETE FROM generations')
+                self._db.commit()
+
+    def stats(self):
+        """Hit/miss/eviction counters plus current size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['max_bytes'] = self.max_bytes
+        stats['variants_per_key'] = self.variants_per_key
+        stats['disk_tier'] = self.disk_path is not None
+        return stats
@@ -0,0 +1,278 @@
+"""Load test for the game backend.
+
+Fires requests at a running backend from N concurrent clients and reports
+requests/sec and latency percentiles at each concurrency level, e.g.
+
+    python backend/loadtest.py --concurrency 1 10 50 --requests 200 --route dialogue
+
+Works against both serving modes (python backend/app.py [--async]). Routes
+that carry several items per request (quest-batch) also report items/sec, so
+
+    python backend/loadtest.py --concurrency 1 --requests 20 --route quest
+    python backend/loadtest.py --concurrency 1 --requests 4 --route quest-batch
+
+compares serial quest calls with batches of QUEST_BATCH_SIZE.
+
+With --fake-ollama the run is self-contained and repeatable: it starts
+fake_ollama.py with the given latency, speed and failure rate, launches a
+backend pointed at it, and tears both down afterwards. --output writes the
+results as JSON and --baseline compares them with an earlier file:
+
+    python backend/loadtest.py --fake-ollama --route mix --concurrency 1 10 50 --output before.json
+    python backend/loadtest.py --fake-ollama --route mix --concurrency 1 10 50 --baseline before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+NPCS = [
+    ('commander_sarah', 'Commander Sarah Chen', 'authoritative, strategic, concerned about colony security', 'Outpost Commander'),
+    ('engineer_marcus', 'Engineer Marcus Rodriguez', 'brilliant but eccentric, obsessed with technology', 'Chief Engineer'),
+    ('trader_eliza', 'Trader Eliza Thompson', 'charismatic, opportunistic, well-connected', 'Merchant'),
+    ('scout_jake', 'Scout Jake Williams', 'cautious, observant, has seen things in the wilderness', 'Frontier Scout'),
+    ('medic_dr_kim', 'Dr. Kim Park', 'compassionate, professional, slightly overwhelmed', 'Medical Officer'),
+]
+
+PLAYER_MESSAGES = ['hello', 'what do you do here?', 'any work for me?', 'seen anything strange lately?', 'how is the outpost holding up?']
+ITEMS = ['crystal_red', 'iron_ore', 'space_rock', 'plant_fiber', 'alien_relic', 'cosmic_dust']
+
+def dialogue_request():
+    npc_id, name, personality, role = random.choice(NPCS)
+    return 'POST', '/api/dialogue', {
+        'npc_id': npc_id,
+        'npc_name': name,
+        'npc_personality': personality,
+        'npc_role': role,
+        'player_message': random.choice(PLAYER_MESSAGES),
+        'player_context': {'crypto': 50, 'active_quests': [], 'inventory': []},
+        'memory_context': ''
+    }
+
+def quest_request():
+    npc_id, name, personality, role = random.choice(NPCS)
+    return 'POST', '/api/quest', {
+        'npc_id': npc_id,
+        'npc_name': name,
+        'npc_personality': personality,
+        'npc_role': role,
+        'player_context': {'crypto': 50, 'active_quests': [], 'inventory': []},
+        'existing_quests': []
+    }
+
+def generate_quest_request():
+    _, name, _, _ = random.choice(NPCS)
+    return 'POST', '/api/generate-quest', {
+        'npc_name': name,
+        'conversation_context': '',
+        'player_suggestion': f"can I collect some {random.choice(ITEMS).split('_')[-1]} for 20 crypto?",
+        'available_items': ITEMS,
+        'available_npcs': [npc[1] for npc in NPCS]
+    }
+
+QUEST_BATCH_SIZE = 5
+
+def quest_batch_request():
+    return 'POST', '/api/quests/batch', {
+        'quests': [
+            {'npc_id': npc_id, 'npc_name': name, 'npc_personality': personality, 'npc_role': role}
+            for npc_id, name, personality, role in random.sample(NPCS, QUEST_BATCH_SIZE)
+        ],
+        'player_context': {'crypto': 50, 'active_quests': [], 'inventory': []},
+        'existing_quests': []
+    }
+
+def save_request():
+    return 'POST', '/api/save', {'player': {'x': random.randint(0, 1000), 'y': random.randint(0, 1000)}, 'crypto': 50}
+
+def health_request():
+    return 'GET', '/api/health', None
+
+ROUTES = {
+    'dialogue': dialogue_request,
+    'quest': quest_request,
+    'generate-quest': generate_quest_request,
+    'quest-batch': quest_batch_request,
+    'save': save_request,
+    'health': health_request,
+}
+
+def mixed_request():
+    # Roughly what a play session looks like: mostly talking, some quests and saves
+    return random.choices(
+        [dialogue_request, generate_quest_request, quest_request, save_request],
+        weights=[70, 15, 5, 10]
+    )[0]()
+
+ROUTES['mix'] = mixed_request
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def run_level(base_url, make_request, concurrency, total_requests, timeout):
+    """Run total_requests spread across `concurrency` clients and summarise the results"""
+    latencies = []
+    errors = 0
+    items = 0
+    remaining = total_requests
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+
+        async def worker():
+            nonlocal remaining, errors, items
+            while remaining > 0:
+                remaining -= 1
+                method, path, body = make_request()
+                items += len(body['quests']) if body and 'quests' in body else 1
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_sec': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'items_per_sec': round(items / elapsed, 2) if elapsed else 0.0,
+        'latency_p50_ms': round(percentile(latencies, 50), 1),
+        'latency_p95_ms': round(percentile(latencies, 95), 1),
+        'latency_max_ms': round(latencies[-1], 1) if latencies else 0.0
+    }
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@contextlib.contextmanager
+def local_backend(args):
+    """A fake Ollama and a backend using it, for --fake-ollama; yields (backend url, fake)"""
+    import fake_ollama
+
+    server, fake = fake_ollama.start(first_token_ms=args.first_token_ms, tokens_per_sec=args.tokens_per_sec,
+                                     fail_rate=args.fail_rate, seed=args.seed)
+    directory = tempfile.mkdtemp(prefix='loadtest_')
+    port = free_port()
+    env = dict(
+        os.environ,
+        OLLAMA_URL=f"http://127.0.0.1:{server.server_port}",
+        LOG_DIR=directory,
+        SAVE_PATH=os.path.join(directory, 'saves.db'),
+        LOG_PROMPT_SAMPLE_RATE='0'
+    )
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py'),
+               '--no-debug', '--host', '127.0.0.1', '--port', str(port)]
+    if args.server_mode == 'async':
+        command.append('--async')
+    backend = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if httpx.get(f"{url}/api/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if backend.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"Backend didn't start (exit code {backend.poll()})")
+            time.sleep(0.2)
+        yield url, fake
+    finally:
+        backend.terminate()
+        backend.wait(timeout=10)
+        server.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+
+def compare(results, baseline_path):
+    """Print throughput and p95 changes against an earlier --output file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {(result['route'], result['concurrency']): result for result in baseline['results']}
+    print(f"\nCompared with {baseline_path} ({baseline['meta']['timestamp']}):")
+    for result in results:
+        old = before.get((result['route'], result['concurrency']))
+        if old is None:
+            continue
+        throughput = (result['requests_per_sec'] - old['requests_per_sec']) / old['requests_per_sec'] * 100 if old['requests_per_sec'] else 0.0
+        print(f"{result['route']} c={result['concurrency']:<4} {old['requests_per_sec']:>8.2f} -> {result['requests_per_sec']:>8.2f} req/s "
+              f"({throughput:+.1f}%)  p95 {old['latency_p95_ms']:>8.1f} -> {result['latency_p95_ms']:>8.1f}ms")
+
+async def run(args, url):
+    results = []
+    for concurrency in args.concurrency:
+        result = await run_level(url, ROUTES[args.route], concurrency, args.requests, args.timeout)
+        result['route'] = args.route
+        results.append(result)
+        if not args.json:
+            per_item = f"{result['items_per_sec']:>8.2f} items/s  " if result['items_per_sec'] != result['requests_per_sec'] else ''
+            print(f"c={concurrency:<4} {result['requests_per_sec']:>8.2f} req/s  {per_item}"
+                  f"p50={result['latency_p50_ms']:>8.1f}ms  p95={result['latency_p95_ms']:>8.1f}ms  "
+                  f"errors={result['errors']}")
+    return results
+
+async def main():
+    parser = argparse.ArgumentParser(description='Load test the LLM Sci-Fi Game backend')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--route', choices=sorted(ROUTES), default='dialogue')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--requests', type=int, default=100, help='Requests per concurrency level')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the request mix')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare with the JSON results of an earlier run')
+    fake = parser.add_argument_group('fake Ollama', 'Start a fake Ollama and a backend using it instead of testing --url')
+    fake.add_argument('--fake-ollama', action='store_true')
+    fake.add_argument('--server-mode', choices=['sync', 'async'], default='sync')
+    fake.add_argument('--first-token-ms', type=float, default=150.0)
+    fake.add_argument('--tokens-per-sec', type=float, default=40.0)
+    fake.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    meta = {'timestamp': datetime.now().isoformat(), 'args': vars(args)}
+    if args.fake_ollama:
+        with local_backend(args) as (url, fake_server):
+            results = await run(args, url)
+            meta['fake_ollama'] = fake_server.stats()
+    else:
+        results = await run(args, args.url)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+if __name__ == '__main__':
+    asyncio.run(main())
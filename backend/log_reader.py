@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import time
+import zlib
+
+BLOCK_SIZE = 64 * 1024
+MAX_LINES = 500
+FINGERPRINT_SIZE = 256
+
+
+class CursorExpired(Exception):
+    """The log file a cursor pointed into has been rotated or cleared"""
+
+
+def reverse_lines(path, end=None, block_size=BLOCK_SIZE):
+    """Yield (offset, line) from the end of the file backwards.
+
+    Reads fixed-size blocks from the end, so the cost depends on how many lines
+    are consumed, not on the size of the file. `end` starts the scan at that
+    byte offset instead of the end of the file; offset is where each line starts.
+    """
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END) if end is None else min(end, os.fstat(f.fileno()).st_size)
+        remainder = b''
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            lines = block.split(b'\n')
+            # The first piece may be the tail of a line that starts in an earlier block
+            remainder = lines.pop(0)
+            offset = position + len(remainder) + 1
+            starts = []
+            for line in lines:
+                starts.append((offset, line))
+                offset += len(line) + 1
+            for start, line in reversed(starts):
+                if line:
+                    yield start, line.decode('utf-8', errors='replace')
+        if remainder:
+            yield 0, remainder.decode('utf-8', errors='replace')
+
+
+def parse_line(line):
+    """Structured entry for a JSON log line; older plain-text lines become {'msg': line}"""
+    try:
+        entry = json.loads(line)
+        if isinstance(entry, dict):
+            return entry
+    except ValueError:
+        pass
+    return {'msg': line}
+
+
+def file_id(path):
+    """Identity of the log file: its inode plus a checksum of its first line.
+
+    Clearing truncates the file in place, keeping the inode, but the first line
+    written afterwards carries a new timestamp, so the checksum changes.
+    """
+    with open(path, 'rb') as f:
+        inode = os.fstat(f.fileno()).st_ino
+        first_line = f.readline(FINGERPRINT_SIZE)
+    return f"{inode:x}-{zlib.crc32(first_line):08x}"
+
+
+def make_cursor(path, offset):
+    return f"{file_id(path)}:{offset}"
+
+
+def _parse_cursor(path, cursor):
+    try:
+        identity, offset = cursor.split(':', 1)
+        offset = int(offset)
+    except ValueError:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    if identity != file_id(path) or offset > os.path.getsize(path):
+        raise CursorExpired("Log file was rotated or cleared since this cursor was issued")
+    return offset
+
+
+def _level_number(name):
+    """Numeric level for a level name, or None if logging doesn't know it"""
+    number = logging.getLevelName(str(name).upper())
+    return number if isinstance(number, int) else None
+
+
+def _min_level(level):
+    if not level:
+        return None
+    number = _level_number(level)
+    if number is None:
+        raise ValueError(f"Unknown log level '{level}'")
+    return number
+
+
+def _matches(entry, min_level):
+    if not min_level:
+        return True
+    # Lines without a level, or with one logging doesn't know, count as INFO
+    number = _level_number(entry.get('level', 'INFO'))
+    return (logging.INFO if number is None else number) >= min_level
+
+
+def tail(path, n=50, level=None, since=None, cursor=None):
+    """Newest n log lines matching the filters, returned oldest first.
+
+    `level` is a minimum level name, `since` an ISO timestamp; since log lines
+    are chronological the scan stops at the first line older than `since`.
+    Pass the returned cursor back to page further into the past; it is None
+    once the start of the file is reached.
+    """
+    n = max(1, min(n, MAX_LINES))
+    min_level = _min_level(level)
+    end = _parse_cursor(path, cursor) if cursor else None
+
+    lines = []
+    next_offset = None
+    for offset, line in reverse_lines(path, end):
+        entry = parse_line(line)
+        if since and 'ts' in entry and entry['ts'] < since:
+            break
+        if not _matches(entry, min_level):
+            continue
+        lines.append(line)
+        if len(lines) == n:
+            next_offset = offset
+            break
+    lines.reverse()
+    next_cursor = make_cursor(path, next_offset) if next_offset else None
+    return lines, next_cursor
+
+
+def follow(path, level=None, poll_interval=0.5, timeout=300):
+    """Yield new log lines as they're written, surviving rotation and truncation"""
+    min_level = _min_level(level)
+    deadline = time.monotonic() + timeout
+
+    f = open(path, 'rb')
+    f.seek(0, os.SEEK_END)
+    identity = os.fstat(f.fileno()).st_ino
+    buffer = b''
+    try:
+        while time.monotonic() < deadline:
+            chunk = f.read()
+            if chunk:
+                buffer += chunk
+                *complete, buffer = buffer.split(b'\n')
+                for raw in complete:
+                    line = raw.decode('utf-8', errors='replace')
+                    if line and _matches(parse_line(line), min_level):
+                        yield line
+                continue
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stat = None
+            if stat and (stat.st_ino != identity or stat.st_size < f.tell()):
+                # Rotated or cleared: start reading the new file from the top
+                f.close()
+                f = open(path, 'rb')
+                identity = os.fstat(f.fileno()).st_ino
+                buffer = b''
+                continue
+            time.sleep(poll_interval)
+    finally:
+        f.close()
@@ -0,0 +1,164 @@
+import bisect
+import threading
+
+# Seconds; covers everything from a cache hit to a slow 13B generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram, cheap enough to observe on every request"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls in"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if not total:
+            return 0.0
+        target = q * total
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            running += count
+            if running >= target:
+                return bound if bound != float('inf') else self.buckets[-1]
+        return self.buckets[-1]
+
+    def cumulative(self):
+        """(cumulative bucket counts by upper bound, count, sum)"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            total_sum = self._sum
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets, counts):
+            running += count
+            cumulative[str(bound)] = running
+        cumulative['+Inf'] = total
+        return cumulative, total, total_sum
+
+    def snapshot(self):
+        """Cumulative bucket counts plus count/sum and rough p50/p95"""
+        cumulative, total, total_sum = self.cumulative()
+        return {
+            'buckets': cumulative,
+            'count': total,
+            'sum': round(total_sum, 4),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95)
+        }
+
+
+class Counter:
+    """Monotonic counter"""
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def value(self):
+        with self._lock:
+            return self._value
+
+
+class MetricFamily:
+    """One named metric with a child Histogram or Counter per set of label values.
+
+    Label values beyond the first `max_series` combinations are folded into a
+    single "other" series so client-supplied labels (NPC names) can't grow it
+    without bound.
+    """
+
+    def __init__(self, name, help_text, kind, labelnames=(), buckets=DEFAULT_BUCKETS, max_series=500):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self.max_series = max_series
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                if key not in self._children and len(self._children) >= self.max_series:
+                    key = ('other',) * len(self.labelnames)
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = Histogram(self.buckets) if self.kind == 'histogram' else Counter()
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+            if self.kind == 'counter':
+                lines.append(f"{self.name}{_label_text(labels)} {_number(child.value())}")
+                continue
+            cumulative, total, total_sum = child.cumulative()
+            for bound, count in cumulative.items():
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_label_text(labels + [le])} {count}")
+            lines.append(f"{self.name}_sum{_label_text(labels)} {_number(total_sum)}")
+            lines.append(f"{self.name}_count{_label_text(labels)} {total}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metric families rendered together in the Prometheus text exposition format"""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._families = []
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(MetricFamily(name, help_text, 'histogram', labelnames, buckets))
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(MetricFamily(name, help_text, 'counter', labelnames))
+
+    def _add(self, family):
+        self._families.append(family)
+        return family
+
+    def render(self):
+        lines = []
+        for family in self._families:
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(labels):
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def _number(value):
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
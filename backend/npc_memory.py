@@ -0,0 +1,259 @@
+import itertools
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'but', 'is', 'are', 'was', 'were', 'be', 'to', 'of', 'in', 'on',
+    'at', 'for', 'with', 'it', 'this', 'that', 'i', 'you', 'me', 'my', 'your', 'we', 'do', 'did',
+    'what', 'how', 'so', 'just', 'about', 'have', 'has', 'any', 'can', 'player', 'npc'
+}
+
+
+def tokenize(text):
+    return [word for word in _WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+
+
+def calculate_importance(content, emotional_context=None):
+    """Server-side port of DialogueManager.calculateMemoryImportance"""
+    importance = 1
+    content = content or ''
+    if emotional_context:
+        if 'angry' in emotional_context or 'furious' in emotional_context:
+            importance += 3
+        if 'happy' in emotional_context or 'excited' in emotional_context:
+            importance += 2
+        if 'sad' in emotional_context or 'hurt' in emotional_context:
+            importance += 2
+        if 'trust' in emotional_context or 'betrayal' in emotional_context:
+            importance += 4
+
+    if 'promise' in content or 'deal' in content or 'agreement' in content:
+        importance += 3
+    if 'secret' in content or 'confidential' in content:
+        importance += 3
+    if 'quest' in content or 'mission' in content:
+        importance += 2
+    if 'crypto' in content or 'money' in content or 'payment' in content:
+        importance += 2
+    if 'relationship' in content or 'romantic' in content or 'intimate' in content:
+        importance += 3
+    if 'family' in content or 'home' in content or 'background' in content:
+        importance += 2
+
+    return min(importance, 10)
+
+
+class _Conversation:
+    """Everything one NPC remembers about one player"""
+
+    def __init__(self, recent_exchanges):
+        self.memories = []
+        self.relationship = None
+        self.recent = deque(maxlen=recent_exchanges)
+
+
+class NPCMemoryStore:
+    """Per-player, per-NPC memories with BM25 + importance retrieval.
+
+    Instead of the client posting every memory on every dialogue request, the
+    backend keeps memories itself and puts only the top-k most relevant to the
+    current player message into the prompt, so prompt size stays flat however
+    long a player has been talking.
+    """
+
+    # Weights for combining relevance, importance and recency into one score
+    RELEVANCE_WEIGHT = 0.6
+    IMPORTANCE_WEIGHT = 0.3
+    RECENCY_WEIGHT = 0.1
+
+    # Standard BM25 parameters
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, max_memories_per_npc=200, max_conversations=10000, recent_exchanges=5, top_k=6):
+        self.max_memories_per_npc = max_memories_per_npc
+        self.max_conversations = max_conversations
+        self.recent_exchanges = recent_exchanges
+        self.top_k = top_k
+        self._conversations = OrderedDict()  # (player_id, npc_key) -> _Conversation
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _conversation(self, player_id, npc_key, create=True):
+        """Caller must hold the lock"""
+        key = (player_id, npc_key)
+        conversation = self._conversations.get(key)
+        if conversation is None and create:
+            conversation = _Conversation(self.recent_exchanges)
+            self._conversations[key] = conversation
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        if conversation is not None:
+            self._conversations.move_to_end(key)
+        return conversation
+
+    def add_memory(self, player_id, npc_key, category, content, emotional_context=None, importance=None):
+        """Store one categorized memory, pruning the least important when full"""
+        memory = {
+            'id': f"memory_{next(self._ids)}",
+            'category': category or 'events',
+            'content': content,
+            'emotional_context': emotional_context,
+            'timestamp': time.time(),
+            'importance': importance if importance is not None else calculate_importance(content, emotional_context),
+            'terms': Counter(tokenize(content))
+        }
+        with self._lock:
+            conversation = self._conversation(player_id, npc_key)
+            conversation.memories.append(memory)
+            if len(conversation.memories) > self.max_memories_per_npc:
+                # Same rule as the frontend: keep the most important, newest first
+                conversation.memories.sort(key=lambda m: (m['importance'], m['timestamp']), reverse=True)
+                del conversation.memories[self.max_memories_per_npc:]
+        return memory
+
+    def record_exchange(self, player_id, npc_key, player_message, npc_response, emotional_context=None):
+        """Remember a dialogue turn for the recent-conversation section"""
+        with self._lock:
+            conversation = self._conversation(player_id, npc_key)
+            conversation.recent.append({
+                'player_message': player_message,
+                'npc_response': npc_response,
+                'emotional_context': emotional_context
+            })
+
+    def set_relationship(self, player_id, npc_key, scores):
+        with self._lock:
+            self._conversation(player_id, npc_key).relationship = dict(scores)
+
+    def clear(self, player_id, npc_key=None):
+        with self._lock:
+            if npc_key is not None:
+                self._conversations.pop((player_id, npc_key), None)
+            else:
+                for key in [key for key in self._conversations if key[0] == player_id]:
+                    del self._conversations[key]
+
+    def has_context(self, player_id, npc_key):
+        with self._lock:
+            conversation = self._conversation(player_id, npc_key, create=False)
+            return bool(conversation and (conversation.memories or conversation.recent or conversation.relationship))
+
+    def _bm25_scores(self, memories, query_terms):
+        if not query_terms or not memories:
+            return [0.0] * len(memories)
+        doc_count = len(memories)
+        lengths = [sum(memory['terms'].values()) for memory in memories]
+        avg_length = sum(lengths) / doc_count or 1.0
+        document_frequency = Counter()
+        for memory in memories:
+            document_frequency.update(term for term in memory['terms'] if term in query_terms)
+
+        scores = []
+        for memory, length in zip(memories, lengths):
+            score = 0.0
+            for term in query_terms:
+                frequency = memory['terms'].get(term)
+                if not frequency:
+                    continue
+                df = document_frequency[term]
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                score += idf * frequency * (self.K1 + 1) / (frequency + self.K1 * (1 - self.B + self.B * length / avg_length))
+            scores.append(score)
+        return scores
+
+    def retrieve(self, player_id, npc_key, query, k=None):
+        """Top-k memories for query, ranked by BM25 relevance, importance and recency"""
+        k = k or self.top_k
+        with self._lock:
+            conversation = self._conversation(player_id, npc_key, create=False)
+            memories = list(conversation.memories) if conversation else []
+        if not memories:
+            return []
+
+        relevance = self._bm25_scores(memories, set(tokenize(query or '')))
+        best = max(relevance) or 1.0
+        by_age = sorted(range(len(memories)), key=lambda i: memories[i]['timestamp'])
+        recency = {index: rank / max(len(memories) - 1, 1) for rank, index in enumerate(by_age)}
+
+        ranked = sorted(
+            range(len(memories)),
+            key=lambda i: (self.RELEVANCE_WEIGHT * relevance[i] / best +
+                           self.IMPORTANCE_WEIGHT * memories[i]['importance'] / 10 +
+                           self.RECENCY_WEIGHT * recency[i]),
+            reverse=True
+        )
+        return [memories[i] for i in ranked[:k]]
+
+    def build_context(self, player_id, npc_key, query, k=None, include_recent=True):
+        """Memory context block for the prompt, in the frontend's format, or '' if nothing is known.
+
+        Pass include_recent=False when the prompt already carries the last
+        exchanges (a dialogue session's history), so they aren't sent twice.
+        """
+        memories = self.retrieve(player_id, npc_key, query, k)
+        with self._lock:
+            conversation = self._conversation(player_id, npc_key, create=False)
+            relationship = dict(conversation.relationship) if conversation and conversation.relationship else None
+            recent = list(conversation.recent)[-2:] if conversation and include_recent else []
+
+        if not memories and not relationship and not recent:
+            return ""
+
+        context = "\n\n=== NPC MEMORY CONTEXT ===\n"
+        if relationship:
+            context += "RELATIONSHIP STATUS:\n"
+            for name in ('trust', 'friendship', 'respect', 'attraction'):
+                if name in relationship:
+                    context += f"- {name.capitalize()}: {relationship[name]}/100\n"
+            context += "\n"
+
+        categorized = OrderedDict()
+        for memory in memories:
+            categorized.setdefault(memory['category'], []).append(memory)
+        for category, category_memories in categorized.items():
+            context += f"{category.upper()}:\n"
+            for memory in category_memories:
+                context += f"- {memory['content']}"
+                if memory['emotional_context']:
+                    context += f" ({memory['emotional_context']})"
+                context += "\n"
+            context += "\n"
+
+        if recent:
+            context += "RECENT CONVERSATION CONTEXT:\n"
+            for exchange in recent:
+                context += f"Player: \"{exchange['player_message']}\"\n"
+                context += f"NPC: \"{exchange['npc_response']}\"\n"
+                if exchange['emotional_context']:
+                    context += f"Emotion: {exchange['emotional_context']}\n"
+                context += "\n"
+
+        context += "=== END MEMORY CONTEXT ===\n\n"
+        return context
+
+    def snapshot(self, player_id, npc_key):
+        """Everything stored for one player/NPC pair, for debugging"""
+        with self._lock:
+            conversation = self._conversation(player_id, npc_key, create=False)
+            if conversation is None:
+                return {'memories': [], 'relationship': None, 'recent': []}
+            return {
+                'memories': [{k: v for k, v in m.items() if k != 'terms'} for m in conversation.memories],
+                'relationship': conversation.relationship,
+                'recent': list(conversation.recent)
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'conversations': len(self._conversations),
+                'memories': sum(len(c.memories) for c in self._conversations.values()),
+                'top_k': self.top_k,
+                'max_memories_per_npc': self.max_memories_per_npc
+            }
@@ -0,0 +1,205 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Fields every NPC entry in the data file must have
+REQUIRED_FIELDS = ('id', 'name', 'personality', 'role', 'background', 'dialogue_style', 'fallback_quest')
+
+
+class NPCRegistryError(ValueError):
+    """The NPC data file is missing, unreadable or malformed"""
+
+
+class NPCSnapshot:
+    """One immutable load of the NPC data file, with its lookups and precompiled tables"""
+
+    def __init__(self, data, version, mtime, system_prompt):
+        self.data = data
+        self.version = version
+        self.mtime = mtime
+        self.npcs = data['npcs']
+        self.by_id = {}
+        self.by_name = {}
+        self.system_prompts = {}
+        self.fallback_dialogue = {}
+        for npc in self.npcs:
+            for npc_id in [npc['id'], *npc.get('aliases', [])]:
+                if npc_id in self.by_id:
+                    raise NPCRegistryError(f"Duplicate NPC id '{npc_id}'")
+                self.by_id[npc_id] = npc
+            if npc['name'] in self.by_name:
+                raise NPCRegistryError(f"Duplicate NPC name '{npc['name']}'")
+            self.by_name[npc['name']] = npc
+            self.system_prompts[npc['id']] = system_prompt(npc) if system_prompt else None
+            self.fallback_dialogue[npc['id']] = npc.get('fallback_dialogue') or data['default_fallback_dialogue']
+        self.default_npc = self.by_id.get(data.get('default_npc')) or self.npcs[0]
+        # What clients get from /api/npcs: everything but the server-side fallbacks
+        self.public_npcs = [
+            {key: value for key, value in npc.items() if key not in ('fallback_dialogue', 'fallback_quest')}
+            for npc in self.npcs
+        ]
+
+
+def parse_npc_data(raw):
+    """Decode and check the NPC data file's contents; raises NPCRegistryError"""
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise NPCRegistryError(f"Invalid JSON: {e}") from e
+    npcs = data.get('npcs') if isinstance(data, dict) else None
+    if not npcs or not isinstance(npcs, list):
+        raise NPCRegistryError("Expected an object with a non-empty 'npcs' list")
+    for index, npc in enumerate(npcs):
+        missing = [field for field in REQUIRED_FIELDS if not (isinstance(npc, dict) and npc.get(field))]
+        if missing:
+            raise NPCRegistryError(f"NPC {index} is missing {', '.join(missing)}")
+        if not npc['fallback_quest'].get('id_prefix'):
+            raise NPCRegistryError(f"NPC '{npc['id']}' fallback_quest is missing id_prefix")
+    data.setdefault('default_fallback_dialogue', "Hello there! I'd be happy to help you with whatever you need around the outpost.")
+    return data
+
+
+class NPCRegistry:
+    """Every NPC's data, loaded once from a JSON file and shared by all request paths.
+
+    Lookups by id (including old ids listed as `aliases`) and by display name are
+    dict hits on the current snapshot. Each NPC's dialogue system prompt is built
+    once per load with `system_prompt(npc)`, and the fallback dialogue and quest
+    tables are precompiled alongside it; fallback quests only get their
+    timestamped id when handed out.
+
+    The file is re-read when its mtime changes, checked at most every
+    `reload_interval` seconds (0 disables the check; reload() forces one). A
+    reload builds a whole new snapshot and swaps it in, so readers never see a
+    half-loaded registry, and an edit that fails to parse keeps the last good one.
+    """
+
+    def __init__(self, path, system_prompt=None, reload_interval=2.0):
+        self.path = path
+        self.system_prompt = system_prompt
+        self.reload_interval = reload_interval
+
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'loads': 0, 'reloads': 0, 'reload_errors': 0, 'lookups': 0, 'misses': 0}
+        self._last_error = None
+        self._failed_mtime = None
+
+    def _load(self):
+        """Read and compile the data file; caller must hold the lock"""
+        with open(self.path, 'rb') as f:
+            mtime = os.fstat(f.fileno()).st_mtime
+            raw = f.read()
+        data = parse_npc_data(raw)
+        snapshot = NPCSnapshot(data, hashlib.sha1(raw).hexdigest()[:12], mtime, self.system_prompt)
+        self._stats['loads'] += 1
+        return snapshot
+
+    def _current(self):
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and (not self.reload_interval or now - self._checked_at < self.reload_interval):
+            return snapshot
+        with self._lock:
+            if self._snapshot is None:
+                # The first load has nothing to fall back on, so its errors propagate
+                self._snapshot = self._load()
+                self._checked_at = now
+                logger.info(f"Loaded {len(self._snapshot.npcs)} NPCs from {self.path}")
+            elif now - self._checked_at >= self.reload_interval:
+                self._checked_at = now
+                self._reload_if_changed()
+            return self._snapshot
+
+    def _reload_if_changed(self, force=False):
+        """Swap in a fresh snapshot if the file changed; caller must hold the lock"""
+        mtime = None
+        try:
+            mtime = os.stat(self.path).st_mtime
+            # A broken edit is reported once, then left alone until the file changes again
+            if not force and mtime in (self._snapshot.mtime, self._failed_mtime):
+                return False
+            snapshot = self._load()
+        except (OSError, NPCRegistryError) as e:
+            self._stats['reload_errors'] += 1
+            self._failed_mtime = mtime
+            self._last_error = str(e)
+            logger.warning(f"Keeping the previous NPC data, reloading {self.path} failed: {e}")
+            return False
+        changed = snapshot.version != self._snapshot.version
+        self._snapshot = snapshot
+        self._last_error = self._failed_mtime = None
+        if changed:
+            self._stats['reloads'] += 1
+            logger.info(f"Reloaded {len(snapshot.npcs)} NPCs from {self.path} (version {snapshot.version})")
+        return changed
+
+    def reload(self):
+        """Re-read the data file now; returns True if its contents changed"""
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._load()
+                return True
+            self._checked_at = time.monotonic()
+            return self._reload_if_changed(force=True)
+
+    def _count(self, npc):
+        # Unlocked: an occasional lost increment is fine for a hit counter
+        self._stats['lookups'] += 1
+        if npc is None:
+            self._stats['misses'] += 1
+        return npc
+
+    def by_id(self, npc_id):
+        """The NPC with this id or alias, or None. The entry is shared; don't modify it."""
+        return self._count(self._current().by_id.get(npc_id))
+
+    def by_name(self, npc_name):
+        """The NPC with this display name, or None. The entry is shared; don't modify it."""
+        return self._count(self._current().by_name.get(npc_name))
+
+    def dialogue_prompt(self, npc_name):
+        """(entry, precompiled dialogue system prompt) for the NPC with this name, or (None, None)"""
+        snapshot = self._current()
+        npc = self._count(snapshot.by_name.get(npc_name))
+        return (npc, snapshot.system_prompts[npc['id']]) if npc else (None, None)
+
+    def fallback_dialogue(self, npc_name):
+        snapshot = self._current()
+        npc = snapshot.by_name.get(npc_name)
+        return snapshot.fallback_dialogue[npc['id']] if npc else snapshot.data['default_fallback_dialogue']
+
+    def fallback_quest(self, npc_id):
+        """A fresh copy of the NPC's fallback quest (the default NPC's for unknown ids)"""
+        snapshot = self._current()
+        npc = snapshot.by_id.get(npc_id) or snapshot.default_npc
+        template = npc['fallback_quest']
+        quest = {'id': f"{template['id_prefix']}_{datetime.now().timestamp()}"}
+        quest.update(copy.deepcopy({key: value for key, value in template.items() if key != 'id_prefix'}))
+        quest['status'] = 'available'
+        return quest
+
+    def public(self):
+        """(version, NPC list) for clients; the version changes whenever the file's contents do"""
+        snapshot = self._current()
+        return snapshot.version, snapshot.public_npcs
+
+    def stats(self):
+        snapshot = self._snapshot
+        stats = dict(self._stats)
+        stats.update(
+            path=self.path,
+            npcs=len(snapshot.npcs) if snapshot else 0,
+            version=snapshot.version if snapshot else None,
+            reload_interval=self.reload_interval,
+            last_error=self._last_error
+        )
+        return stats
@@ -0,0 +1,455 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx  # Only needed for the async serving mode
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying - Ollama returns these while a model is loading
+# or when a proxy in front of it hiccups
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+
+def with_response(body):
+    """Give an /api/chat body the 'response' field /api/generate bodies have, so callers can treat both alike"""
+    if 'response' not in body and isinstance(body.get('message'), dict):
+        body['response'] = body['message'].get('content', '')
+    return body
+
+
+class OllamaError(Exception):
+    """Raised when Ollama could not produce a usable response"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OllamaUnavailable(OllamaError):
+    """Raised without touching the network while the circuit breaker is open"""
+
+
+def stream_chunk(line):
+    """Decode one line of a streamed reply; raises OllamaError for the error line a failed generation ends with"""
+    chunk = json.loads(line)
+    if 'error' in chunk:
+        # Ollama has already sent its 200, so a failure partway through arrives as a line
+        raise OllamaError(f"Ollama stream failed: {chunk['error']}")
+    return with_response(chunk)
+
+
+def response_body(response):
+    """Decoded JSON object of a 200 response; raises OllamaError if the body isn't one"""
+    try:
+        body = response.json()
+    except ValueError as e:
+        # A proxy error page or a truncated body, sent with a 200
+        raise OllamaError(f"Ollama sent an unreadable response: {e}")
+    if not isinstance(body, dict):
+        raise OllamaError(f"Ollama sent an unexpected response: {type(body).__name__}")
+    return body
+
+
+def is_client_error(error):
+    """A 4xx: Ollama is up but rejected this request (e.g. a `format` the model can't do)"""
+    return error.status_code is not None and 400 <= error.status_code < 500
+
+
+class CircuitBreaker:
+    """Trip after repeated failures so callers go straight to fallbacks"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a request may be sent upstream right now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let a single probe through; everyone else keeps failing fast
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def available(self):
+        """Like allow_request, but only looks: True unless the breaker is open and not yet due a probe"""
+        with self._lock:
+            return self.state != self.OPEN or time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    logger.warning(f"Ollama circuit breaker opened after {self.consecutive_failures} consecutive failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'times_opened': self.times_opened
+            }
+
+
+class UpstreamStats:
+    """Thread-safe pool saturation and latency counters for one upstream"""
+
+    def __init__(self, pool_size):
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {
+            'requests': 0,
+            'successes': 0,
+            'failures': 0,
+            'client_errors': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'short_circuited': 0,
+            'pool_waits': 0,
+            'peak_in_flight': 0,
+            'latency_total_ms': 0.0,
+            'latency_max_ms': 0.0,
+            'latency_last_ms': 0.0
+        }
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def enter(self):
+        with self._lock:
+            if self._in_flight >= self.pool_size:
+                self._stats['pool_waits'] += 1
+            self._in_flight += 1
+            self._stats['requests'] += 1
+            self._stats['peak_in_flight'] = max(self._stats['peak_in_flight'], self._in_flight)
+
+    def exit(self, start):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._in_flight -= 1
+            self._stats['latency_total_ms'] += elapsed_ms
+            self._stats['latency_last_ms'] = elapsed_ms
+            self._stats['latency_max_ms'] = max(self._stats['latency_max_ms'], elapsed_ms)
+
+    def bump(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+        stats['pool_size'] = self.pool_size
+        stats['pool_saturation'] = round(stats['in_flight'] / self.pool_size, 3) if self.pool_size else 0.0
+        completed = stats['successes'] + stats['failures'] + stats['client_errors']
+        stats['latency_avg_ms'] = round(stats['latency_total_ms'] / completed, 1) if completed else 0.0
+        for key in ('latency_total_ms', 'latency_max_ms', 'latency_last_ms'):
+            stats[key] = round(stats[key], 1)
+        return stats
+
+
+def record_error(breaker, stats, error):
+    """Count a failed call against the upstream, unless Ollama answered and only rejected the request"""
+    if is_client_error(error):
+        # The upstream is fine and would reject the same request anywhere
+        breaker.record_success()
+        stats.bump('client_errors')
+    else:
+        breaker.record_failure()
+        stats.bump('failures')
+
+
+def backoff_delay(backoff_factor, attempt):
+    """Exponential backoff with jitter for the given (1-based) retry attempt"""
+    return backoff_factor * (2 ** (attempt - 1)) * (0.5 + random.random() / 2)
+
+
+class OllamaClient:
+    """Shared, pooled HTTP client for the Ollama API"""
+
+    def __init__(self, base_url, connect_timeout=3.05, read_timeout=60.0, max_retries=2,
+                 backoff_factor=0.5, pool_size=10, failure_threshold=5, reset_timeout=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        # One keep-alive pool shared by every worker thread. pool_block makes
+        # threads wait for a free connection instead of opening throwaway ones.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.stats_counters = UpstreamStats(pool_size)
+
+    def generate(self, payload):
+        """POST to /api/generate and return the decoded JSON body"""
+        return self.post('/api/generate', payload)
+
+    def generate_stream(self, payload):
+        """POST a streaming request to /api/generate, yielding each decoded chunk"""
+        return self.stream('/api/generate', payload)
+
+    def chat(self, payload):
+        """POST to /api/chat and return the decoded JSON body, with the reply also under 'response'"""
+        return with_response(self.post('/api/chat', payload))
+
+    def chat_stream(self, payload):
+        """POST a streaming request to /api/chat, yielding chunks shaped like generate_stream's"""
+        return self.stream('/api/chat', payload)
+
+    def stream(self, path, payload):
+        """POST a streaming request to an Ollama endpoint, yielding each decoded chunk"""
+        if not self.breaker.allow_request():
+            self.stats_counters.bump('short_circuited')
+            raise OllamaUnavailable('Ollama circuit breaker is open')
+
+        self.stats_counters.enter()
+        start = time.perf_counter()
+        response = None
+        error = None
+        try:
+            response = self._post_with_retries(path, payload, stream=True)
+            for line in response.iter_lines():
+                if line:
+                    yield stream_chunk(line)
+        except GeneratorExit:
+            # The caller stopped reading early; closing the response makes Ollama
+            # cancel the rest of the generation
+            self.breaker.record_success()
+            self.stats_counters.bump('successes')
+            raise
+        except OllamaError as e:
+            error = e
+            raise
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # The connection dropped or Ollama sent garbage mid-stream
+            error = OllamaError(f"Ollama stream interrupted: {e}")
+            raise error
+        finally:
+            if response is not None:
+                response.close()
+            self.stats_counters.exit(start)
+            if error is not None:
+                record_error(self.breaker, self.stats_counters, error)
+
+        self.breaker.record_success()
+        self.stats_counters.bump('successes')
+
+    def post(self, path, payload):
+        """POST JSON to an Ollama endpoint with retries and circuit breaking"""
+        if not self.breaker.allow_request():
+            self.stats_counters.bump('short_circuited')
+            raise OllamaUnavailable('Ollama circuit breaker is open')
+
+        self.stats_counters.enter()
+        start = time.perf_counter()
+        try:
+            response = self._post_with_retries(path, payload)
+            body = response_body(response)
+        except OllamaError as e:
+            record_error(self.breaker, self.stats_counters, e)
+            raise
+        finally:
+            self.stats_counters.exit(start)
+
+        self.breaker.record_success()
+        self.stats_counters.bump('successes')
+        return body
+
+    def _post_with_retries(self, path, payload, stream=False):
+        url = f"{self.base_url}{path}"
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout, stream=stream)
+            except requests.exceptions.Timeout as e:
+                # Nothing was sent if connecting timed out, so that's worth another try;
+                # a generation that timed out would most likely time out again
+                self.stats_counters.bump('timeouts')
+                if not isinstance(e, requests.exceptions.ConnectTimeout) or attempt >= self.max_retries:
+                    raise OllamaError(f"Timed out talking to Ollama: {e}")
+            except requests.exceptions.ConnectionError as e:
+                if attempt >= self.max_retries:
+                    raise OllamaError(f"Could not connect to Ollama: {e}")
+            else:
+                if response.status_code == 200:
+                    return response
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                    raise OllamaError(f"{response.status_code} - {response.text}", response.status_code)
+
+            attempt += 1
+            self.stats_counters.bump('retries')
+            time.sleep(backoff_delay(self.backoff_factor, attempt))
+
+    def stats(self):
+        """Snapshot of pool saturation, latency and breaker counters"""
+        stats = self.stats_counters.snapshot()
+        stats['circuit_breaker'] = self.breaker.snapshot()
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncOllamaClient:
+    """asyncio counterpart of OllamaClient built on httpx, for the ASGI serving mode"""
+
+    def __init__(self, base_url, connect_timeout=3.05, read_timeout=60.0, max_retries=2,
+                 backoff_factor=0.5, pool_size=100, failure_threshold=5, reset_timeout=30.0):
+        if httpx is None:
+            raise RuntimeError('httpx is required for the async serving mode (pip install httpx)')
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.stats_counters = UpstreamStats(pool_size)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def generate(self, payload):
+        """POST to /api/generate and return the decoded JSON body"""
+        return await self.post('/api/generate', payload)
+
+    def generate_stream(self, payload):
+        """POST a streaming request to /api/generate, yielding each decoded chunk"""
+        return self.stream('/api/generate', payload)
+
+    async def chat(self, payload):
+        """POST to /api/chat and return the decoded JSON body, with the reply also under 'response'"""
+        return with_response(await self.post('/api/chat', payload))
+
+    def chat_stream(self, payload):
+        """POST a streaming request to /api/chat, yielding chunks shaped like generate_stream's"""
+        return self.stream('/api/chat', payload)
+
+    async def stream(self, path, payload):
+        """POST a streaming request to an Ollama endpoint, yielding each decoded chunk"""
+        if not self.breaker.allow_request():
+            self.stats_counters.bump('short_circuited')
+            raise OllamaUnavailable('Ollama circuit breaker is open')
+
+        self.stats_counters.enter()
+        start = time.perf_counter()
+        error = None
+        try:
+            async with self.client.stream('POST', f"{self.base_url}{path}", json=payload) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode('utf-8', errors='replace')
+                    raise OllamaError(f"{response.status_code} - {body}", response.status_code)
+                async for line in response.aiter_lines():
+                    if line:
+                        yield stream_chunk(line)
+        except GeneratorExit:
+            self.breaker.record_success()
+            self.stats_counters.bump('successes')
+            raise
+        except OllamaError as e:
+            error = e
+            raise
+        except httpx.TimeoutException as e:
+            self.stats_counters.bump('timeouts')
+            error = OllamaError(f"Timed out talking to Ollama: {e}")
+            raise error
+        except (httpx.HTTPError, ValueError) as e:
+            error = OllamaError(f"Ollama stream interrupted: {e}")
+            raise error
+        finally:
+            self.stats_counters.exit(start)
+            if error is not None:
+                record_error(self.breaker, self.stats_counters, error)
+
+        self.breaker.record_success()
+        self.stats_counters.bump('successes')
+
+    async def post(self, path, payload):
+        """POST JSON to an Ollama endpoint with retries and circuit breaking"""
+        if not self.breaker.allow_request():
+            self.stats_counters.bump('short_circuited')
+            raise OllamaUnavailable('Ollama circuit breaker is open')
+
+        self.stats_counters.enter()
+        start = time.perf_counter()
+        try:
+            response = await self._post_with_retries(path, payload)
+            body = response_body(response)
+        except OllamaError as e:
+            record_error(self.breaker, self.stats_counters, e)
+            raise
+        finally:
+            self.stats_counters.exit(start)
+
+        self.breaker.record_success()
+        self.stats_counters.bump('successes')
+        return body
+
+    async def _post_with_retries(self, path, payload):
+        url = f"{self.base_url}{path}"
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.post(url, json=payload)
+            except httpx.TimeoutException as e:
+                self.stats_counters.bump('timeouts')
+                if not isinstance(e, httpx.ConnectTimeout) or attempt >= self.max_retries:
+                    raise OllamaError(f"Timed out talking to Ollama: {e}")
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise OllamaError(f"Could not connect to Ollama: {e}")
+            else:
+                if response.status_code == 200:
+                    return response
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                    raise OllamaError(f"{response.status_code} - {response.text}", response.status_code)
+
+            attempt += 1
+            self.stats_counters.bump('retries')
+            await asyncio.sleep(backoff_delay(self.backoff_factor, attempt))
+
+    def stats(self):
+        """Snapshot of pool saturation, latency and breaker counters"""
+        stats = self.stats_counters.snapshot()
+        stats['circuit_breaker'] = self.breaker.snapshot()
+        return stats
+
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,364 @@
+import hashlib
+import logging
+import threading
+import time
+
+import requests
+
+from ollama_client import AsyncOllamaClient, OllamaClient, OllamaError, OllamaUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+def parse_upstreams(spec, default_url):
+    """[(url, models or None)] from an OLLAMA_UPSTREAMS value.
+
+    Entries are comma-separated URLs, each optionally followed by
+    `=model;model` to restrict it to those models, e.g.
+    "http://gpu1:11434,http://gpu2:11434,http://cpu1:11434=phi3:mini".
+    An empty spec means default_url alone.
+    """
+    upstreams = []
+    for entry in (spec or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        url, _, models = entry.partition('=')
+        models = [model.strip() for model in models.split(';') if model.strip()]
+        upstreams.append((url.strip().rstrip('/'), models or None))
+    return upstreams or [(default_url.rstrip('/'), None)]
+
+
+def model_name(name):
+    # Ollama lists "llama2" as "llama2:latest"
+    return name[:-len(':latest')] if name.endswith(':latest') else name
+
+
+class Upstream:
+    """One Ollama server: the models it serves and what the router knows about it"""
+
+    def __init__(self, url, models=None):
+        self.url = url
+        self.models = {model_name(model) for model in models} if models else None
+        self.discovered_models = None
+        self.healthy = None  # Unknown until the first probe
+        self.last_probe = None
+        self.probe_latency_ms = None
+        self.probe_failures = 0
+        self.outstanding = 0
+        self.picks = 0
+        self.last_pick = 0
+
+    def serves(self, model):
+        """Whether requests for this model can go here, going by config or, failing that, the last probe"""
+        known = self.models if self.models is not None else self.discovered_models
+        return known is None or model is None or model_name(model) in known
+
+
+class UpstreamPool:
+    """The configured Ollama servers with their health and load, shared by the sync and async routers.
+
+    select() picks, among the upstreams serving the requested model that are
+    neither failing health probes nor behind an open circuit breaker, the one
+    with the fewest outstanding requests. A request with an affinity key (one
+    player's conversation with one NPC) prefers the upstream that key hashes to
+    (rendezvous hashing, so keys only move when their upstream goes away) as
+    long as it has at most `affinity_slack` more outstanding requests than the
+    least loaded one; that upstream holds the conversation's KV cache.
+
+    A background thread probes every upstream's /api/tags each
+    `probe_interval` seconds, which also tells the pool which models it has.
+    """
+
+    def __init__(self, upstreams, probe_interval=10.0, probe_timeout=2.0, affinity_slack=2):
+        self.upstreams = [Upstream(url, models) for url, models in upstreams]
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.affinity_slack = affinity_slack
+
+        self._lock = threading.Lock()
+        self._tick = 0
+        self._session = requests.Session()
+        self._thread = None
+        self._stats = {
+            'affinity_hits': 0,
+            'affinity_spills': 0,
+            'failovers': 0,
+            'no_upstream': 0
+        }
+
+    def _candidates(self, model, exclude, available):
+        serving = [upstream for upstream in self.upstreams if upstream.serves(model)]
+        if not serving:
+            # Nobody lists the model; let upstreams without a configured model list try
+            serving = [upstream for upstream in self.upstreams if upstream.models is None]
+        usable = [upstream for upstream in serving if upstream not in exclude and available(upstream)]
+        # Prefer upstreams whose last probe passed, but a stale probe shouldn't stop everything
+        return [upstream for upstream in usable if upstream.healthy is not False] or usable
+
+    def select(self, model, affinity=None, exclude=(), available=lambda upstream: True):
+        """Pick an upstream and count a request against it; release() it when done.
+
+        Raises OllamaUnavailable if no upstream can take the request.
+        """
+        self.start()
+        with self._lock:
+            candidates = self._candidates(model, exclude, available)
+            if not candidates:
+                self._stats['no_upstream'] += 1
+                raise OllamaUnavailable(f"No available Ollama upstream for model '{model}'")
+
+            # Least outstanding requests, least recently picked on a tie
+            chosen = min(candidates, key=lambda upstream: (upstream.outstanding, upstream.last_pick))
+            if affinity is not None and len(candidates) > 1:
+                preferred = max(candidates, key=lambda upstream: _rendezvous(affinity, upstream.url))
+                if preferred.outstanding <= chosen.outstanding + self.affinity_slack:
+                    chosen = preferred
+                    self._stats['affinity_hits'] += 1
+                else:
+                    self._stats['affinity_spills'] += 1
+
+            self._tick += 1
+            chosen.outstanding += 1
+            chosen.picks += 1
+            chosen.last_pick = self._tick
+            return chosen
+
+    def release(self, upstream):
+        with self._lock:
+            upstream.outstanding -= 1
+
+    def record_failover(self, upstream, error):
+        with self._lock:
+            self._stats['failovers'] += 1
+        logger.warning(f"Ollama upstream {upstream.url} failed ({error}), trying another")
+
+    def probe(self, upstream):
+        """Check one upstream's /api/tags and note the models it has"""
+        start = time.perf_counter()
+        try:
+            response = self._session.get(f"{upstream.url}/api/tags", timeout=self.probe_timeout)
+            response.raise_for_status()
+            models = {model_name(model.get('name', '')) for model in response.json().get('models', [])}
+        except (requests.exceptions.RequestException, ValueError, AttributeError) as e:
+            with self._lock:
+                if upstream.healthy is not False:
+                    logger.warning(f"Ollama upstream {upstream.url} failed its health probe: {e}")
+                upstream.healthy = False
+                upstream.probe_failures += 1
+                upstream.last_probe = time.monotonic()
+            return False
+        with self._lock:
+            if upstream.healthy is False:
+                logger.info(f"Ollama upstream {upstream.url} is healthy again")
+            upstream.healthy = True
+            upstream.discovered_models = models
+            upstream.last_probe = time.monotonic()
+            upstream.probe_latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        return True
+
+    def probe_all(self):
+        for upstream in self.upstreams:
+            self.probe(upstream)
+
+    def start(self):
+        """Start probing in the background, once"""
+        if self._thread is None and self.probe_interval > 0:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='ollama-probe', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self.probe_all()
+            time.sleep(self.probe_interval)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['upstreams'] = [{
+                'url': upstream.url,
+                'healthy': upstream.healthy,
+                'models': sorted(upstream.models) if upstream.models is not None else None,
+                'discovered_models': sorted(upstream.discovered_models) if upstream.discovered_models is not None else None,
+                'outstanding': upstream.outstanding,
+                'picks': upstream.picks,
+                'probe_failures': upstream.probe_failures,
+                'probe_latency_ms': upstream.probe_latency_ms,
+                'last_probe_age_s': round(now - upstream.last_probe, 1) if upstream.last_probe is not None else None
+            } for upstream in self.upstreams]
+        stats['probe_interval'] = self.probe_interval
+        stats['affinity_slack'] = self.affinity_slack
+        return stats
+
+
+def _rendezvous(key, url):
+    return hashlib.blake2b(f"{key}|{url}".encode(), digest_size=8).digest()
+
+
+def _should_fail_over(error):
+    # Connection problems, timeouts and server errors; a 4xx would fail anywhere
+    return error.status_code is None or error.status_code >= 500
+
+
+class OllamaRouter:
+    """OllamaClient interface over an UpstreamPool, with one pooled client per upstream.
+
+    `affinity(payload)` returns the key that should keep a request on the same
+    upstream as earlier ones, or None. A request that fails before any data
+    arrived (connection error, timeout, 5xx or an open breaker) is retried on
+    the next best upstream.
+    """
+
+    def __init__(self, pool, affinity=None, **client_options):
+        self.pool = pool
+        self.affinity = affinity or (lambda payload: None)
+        self.clients = {upstream.url: OllamaClient(upstream.url, **client_options) for upstream in pool.upstreams}
+
+    def _available(self, upstream):
+        return self.clients[upstream.url].breaker.available()
+
+    def _select(self, payload, tried, error):
+        try:
+            return self.pool.select(payload.get('model'), self.affinity(payload), tried, self._available)
+        except OllamaUnavailable:
+            if error is not None:
+                # Report what went wrong on the last upstream, not that none are left
+                raise error
+            raise
+
+    def _call(self, method, payload):
+        tried = []
+        error = None
+        while True:
+            upstream = self._select(payload, tried, error)
+            try:
+                return getattr(self.clients[upstream.url], method)(payload)
+            except OllamaUnavailable as e:
+                error = e
+            except OllamaError as e:
+                if not _should_fail_over(e):
+                    raise
+                error = e
+                self.pool.record_failover(upstream, e)
+            finally:
+                self.pool.release(upstream)
+            tried.append(upstream)
+
+    def _stream(self, method, payload):
+        tried = []
+        error = None
+        while True:
+            upstream = self._select(payload, tried, error)
+            chunks = getattr(self.clients[upstream.url], method)(payload)
+            try:
+                try:
+                    first = next(chunks)
+                except StopIteration:
+                    return
+                except OllamaUnavailable as e:
+                    error = e
+                except OllamaError as e:
+                    if not _should_fail_over(e):
+                        raise
+                    error = e
+                    self.pool.record_failover(upstream, e)
+                else:
+                    # Data is flowing; from here on a failure is the caller's to handle
+                    yield first
+                    yield from chunks
+                    return
+            finally:
+                chunks.close()
+                self.pool.release(upstream)
+            tried.append(upstream)
+
+    def generate(self, payload):
+        return self._call('generate', payload)
+
+    def chat(self, payload):
+        return self._call('chat', payload)
+
+    def generate_stream(self, payload):
+        return self._stream('generate_stream', payload)
+
+    def chat_stream(self, payload):
+        return self._stream('chat_stream', payload)
+
+    def stats(self):
+        """Pool and balancing counters, with each upstream's client stats"""
+        stats = self.pool.stats()
+        for upstream in stats['upstreams']:
+            upstream['client'] = self.clients[upstream['url']].stats()
+        return stats
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+
+
+class AsyncOllamaRouter(OllamaRouter):
+    """asyncio counterpart of OllamaRouter over AsyncOllamaClients, sharing the same UpstreamPool"""
+
+    def __init__(self, pool, affinity=None, **client_options):
+        self.pool = pool
+        self.affinity = affinity or (lambda payload: None)
+        self.clients = {upstream.url: AsyncOllamaClient(upstream.url, **client_options) for upstream in pool.upstreams}
+
+    async def _call(self, method, payload):
+        tried = []
+        error = None
+        while True:
+            upstream = self._select(payload, tried, error)
+            try:
+                return await getattr(self.clients[upstream.url], method)(payload)
+            except OllamaUnavailable as e:
+                error = e
+            except OllamaError as e:
+                if not _should_fail_over(e):
+                    raise
+                error = e
+                self.pool.record_failover(upstream, e)
+            finally:
+                self.pool.release(upstream)
+            tried.append(upstream)
+
+    async def _stream(self, method, payload):
+        tried = []
+        error = None
+        while True:
+            upstream = self._select(payload, tried, error)
+            chunks = getattr(self.clients[upstream.url], method)(payload)
+            try:
+                try:
+                    first = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+                except OllamaUnavailable as e:
+                    error = e
+                except OllamaError as e:
+                    if not _should_fail_over(e):
+                        raise
+                    error = e
+                    self.pool.record_failover(upstream, e)
+                else:
+                    yield first
+                    async for chunk in chunks:
+                        yield chunk
+                    return
+            finally:
+                await chunks.aclose()
+                self.pool.release(upstream)
+            tried.append(upstream)
+
+    async def generate(self, payload):
+        return await self._call('generate', payload)
+
+    async def chat(self, payload):
+        return await self._call('chat', payload)
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.close()
@@ -0,0 +1,215 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Per-session caps, so one client can't grow its session without bound
+MAX_INVENTORY_ITEMS = 256
+MAX_ACTIVE_QUESTS = 128
+
+EVENT_TYPES = ('crypto', 'item', 'quest_started', 'quest_ended')
+
+
+class PlayerSession:
+    """What the backend knows about one player between requests"""
+
+    __slots__ = ('id', 'player_id', 'crypto', 'inventory', 'active_quests', 'last_seq', 'version', 'created_at', 'used_at')
+
+    def __init__(self, session_id, player_id, now):
+        self.id = session_id
+        self.player_id = player_id
+        self.crypto = 0
+        self.inventory = {}  # item id -> quantity
+        self.active_quests = {}  # quest id -> None, in the order they were started
+        self.last_seq = 0
+        self.version = 0
+        self.created_at = now
+        self.used_at = now
+
+    def summary(self):
+        """The player_context prompts use, in the shape create_dialogue_turn and create_quest_prompt expect"""
+        return {
+            'crypto': self.crypto,
+            'active_quests_count': len(self.active_quests),
+            'inventory_count': len(self.inventory)
+        }
+
+    def state(self):
+        return {
+            'crypto': self.crypto,
+            'inventory': dict(self.inventory),
+            'active_quests': list(self.active_quests),
+            'last_seq': self.last_seq,
+            'version': self.version
+        }
+
+
+def _quantity(value, default=1):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return default
+    return int(value)
+
+
+class PlayerSessionStore:
+    """Server-held player state, so requests carry a session id instead of the whole player_context.
+
+    A session starts from one full player_context (crypto, inventory slots,
+    active quests, as the frontend's Player.getPlayerContext() builds it) and
+    is then kept current by small events sent along with later requests:
+
+        {'seq': 7, 'type': 'crypto', 'amount': -15}
+        {'seq': 8, 'type': 'item', 'item_id': 'iron_ore', 'quantity': 2}   (negative to remove)
+        {'seq': 9, 'type': 'quest_started', 'quest_id': 'q1'}
+        {'seq': 10, 'type': 'quest_ended', 'quest_id': 'q1'}
+
+    Events with a `seq` at or below the last one applied are skipped, so a
+    client can resend events whose request failed without counting them twice.
+    Sessions idle for `ttl_seconds` expire, and the least recently used go once
+    there are more than `max_sessions`; a client whose session is gone starts a
+    new one from its full state.
+    """
+
+    def __init__(self, max_sessions=10000, ttl_seconds=3600.0):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'created': 0,
+            'resets': 0,
+            'lookups': 0,
+            'unknown': 0,
+            'events': 0,
+            'duplicate_events': 0,
+            'invalid_events': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+
+    def _expire(self, now):
+        """Drop sessions idle past the TTL (oldest first); caller must hold the lock"""
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.used_at <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            self._stats['expirations'] += 1
+
+    def create(self, player_id, player_context=None):
+        """Start a session for the player, optionally from a full player_context"""
+        now = time.monotonic()
+        session = PlayerSession(secrets.token_urlsafe(16), player_id, now)
+        if player_context:
+            self._load(session, player_context)
+        with self._lock:
+            self._expire(now)
+            self._sessions[session.id] = session
+            self._stats['created'] += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats['evictions'] += 1
+        return session
+
+    def get(self, session_id):
+        """The live session with this id, marked as used, or None"""
+        now = time.monotonic()
+        with self._lock:
+            self._stats['lookups'] += 1
+            session = self._sessions.get(session_id)
+            if session is not None and now - session.used_at > self.ttl_seconds:
+                del self._sessions[session_id]
+                self._stats['expirations'] += 1
+                session = None
+            if session is None:
+                self._stats['unknown'] += 1
+                return None
+            session.used_at = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def reset(self, session, player_context):
+        """Replace the session's state with a full player_context, e.g. after loading a save"""
+        with self._lock:
+            self._load(session, player_context)
+            self._stats['resets'] += 1
+
+    def _load(self, session, player_context):
+        session.crypto = _quantity(player_context.get('crypto'), 0)
+        session.inventory = {}
+        for slot in player_context.get('inventory') or []:
+            if not isinstance(slot, dict):
+                continue
+            item_id = slot.get('itemId') or slot.get('item_id')
+            if item_id and (item_id in session.inventory or len(session.inventory) < MAX_INVENTORY_ITEMS):
+                session.inventory[item_id] = session.inventory.get(item_id, 0) + _quantity(slot.get('quantity'))
+        session.active_quests = {}
+        for quest in (player_context.get('active_quests') or [])[:MAX_ACTIVE_QUESTS]:
+            quest_id = quest.get('id') if isinstance(quest, dict) else quest
+            if quest_id is not None:
+                session.active_quests[str(quest_id)] = None
+        session.version += 1
+
+    def apply(self, session, events):
+        """Apply a request's events to its session; returns how many changed it"""
+        if not events or not isinstance(events, list):
+            return 0
+        applied = 0
+        with self._lock:
+            for event in events:
+                if not isinstance(event, dict) or event.get('type') not in EVENT_TYPES:
+                    self._stats['invalid_events'] += 1
+                    continue
+                seq = event.get('seq')
+                if isinstance(seq, int):
+                    if seq <= session.last_seq:
+                        self._stats['duplicate_events'] += 1
+                        continue
+                    session.last_seq = seq
+                if self._apply(session, event):
+                    applied += 1
+                else:
+                    self._stats['invalid_events'] += 1
+            if applied:
+                session.version += 1
+                self._stats['events'] += applied
+        return applied
+
+    def _apply(self, session, event):
+        """Apply one event; caller must hold the lock. Returns False if it was malformed."""
+        kind = event['type']
+        if kind == 'crypto':
+            session.crypto = max(session.crypto + _quantity(event.get('amount'), 0), 0)
+            return True
+        if kind == 'item':
+            item_id = event.get('item_id')
+            if not item_id or not isinstance(item_id, str):
+                return False
+            quantity = session.inventory.get(item_id, 0) + _quantity(event.get('quantity'))
+            if quantity > 0 and (item_id in session.inventory or len(session.inventory) < MAX_INVENTORY_ITEMS):
+                session.inventory[item_id] = quantity
+            else:
+                session.inventory.pop(item_id, None)
+            return True
+        quest_id = event.get('quest_id')
+        if quest_id is None:
+            return False
+        if kind == 'quest_started':
+            if len(session.active_quests) < MAX_ACTIVE_QUESTS:
+                session.active_quests[str(quest_id)] = None
+        else:
+            session.active_quests.pop(str(quest_id), None)
+        return True
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            stats = dict(self._stats)
+            stats['sessions'] = len(self._sessions)
+        stats['max_sessions'] = self.max_sessions
+        stats['ttl_seconds'] = self.ttl_seconds
+        return stats
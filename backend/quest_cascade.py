@@ -0,0 +1,119 @@
+import logging
+import threading
+
+from metrics import Histogram
+from quest_templates import MAX_TEMPLATE_WORDS, QuestRequest
+
+logger = logging.getLogger(__name__)
+
+TIER_RULES = 'rules'
+TIER_SMALL = 'small'
+TIER_LARGE = 'large'
+TIERS = (TIER_RULES, TIER_SMALL, TIER_LARGE)
+
+# Seconds; templates answer in microseconds, models in seconds
+CASCADE_BUCKETS = (0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.05, 0.25, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class QuestPlan:
+    """One /api/generate-quest request's route through the cascade"""
+
+    def __init__(self, request, tier, reason):
+        self.request = request
+        self.tier = tier
+        self.reason = reason
+        self.served_by = tier
+        self.escalated_from = None
+
+
+class QuestCascade:
+    """Sends each quest request to the cheapest tier that can satisfy its suggestion.
+
+    - rules: the template grammar, when the suggestion asks for nothing the
+      templates can't honour (a kind of quest, an item or NPC in the catalogue,
+      a quantity or reward)
+    - small: `small_model`, when the suggestion names things the catalogue
+      lookups can't resolve, such as an item by another name
+    - large: `large_model`, when the suggestion asks for custom prose (a story,
+      a mystery, a long request), or when the small model's quest doesn't give
+      the player what they asked for
+
+    Tier counts, escalations and the time each tier took per request appear in
+    stats().
+    """
+
+    def __init__(self, small_model, large_model, max_unknown_words=2):
+        self.small_model = small_model
+        self.large_model = large_model
+        self.max_unknown_words = max_unknown_words
+
+        self._lock = threading.Lock()
+        self._latency = {tier: Histogram(CASCADE_BUCKETS) for tier in TIERS}
+        self._stats = {
+            'requests': 0,
+            'routed': {tier: 0 for tier in TIERS},
+            'served': {tier: 0 for tier in TIERS},
+            'escalations': 0
+        }
+
+    def plan(self, player_suggestion, available_items=None, available_npcs=None):
+        """Parse the suggestion and pick the tier to start at"""
+        request = QuestRequest(player_suggestion, available_items, available_npcs)
+        if request.prose_words:
+            tier, reason = TIER_LARGE, f"asks for custom prose ({', '.join(request.prose_words)})"
+        elif len(request.words) > MAX_TEMPLATE_WORDS:
+            tier, reason = TIER_LARGE, f"long suggestion ({len(request.words)} words)"
+        elif not request.target_resolved:
+            tier, reason = TIER_SMALL, f"names something not in the catalogue ({', '.join(request.unknown_words)})"
+        elif len(request.unknown_words) > self.max_unknown_words:
+            tier, reason = TIER_SMALL, f"details the templates would drop ({', '.join(request.unknown_words)})"
+        else:
+            tier, reason = TIER_RULES, 'templates satisfy the suggestion'
+        return QuestPlan(request, tier, reason)
+
+    def model_for(self, plan):
+        return self.large_model if plan.tier == TIER_LARGE else self.small_model
+
+    def escalation(self, plan, quest, fallback=False):
+        """The model to retry with if the small model's quest (or its fallback) misses the suggestion, else None"""
+        if plan.served_by != TIER_SMALL or self.large_model == self.small_model:
+            return None
+        if not fallback and plan.request.satisfied_by(quest):
+            return None
+        plan.escalated_from = TIER_SMALL
+        plan.served_by = TIER_LARGE
+        with self._lock:
+            self._stats['escalations'] += 1
+        return self.large_model
+
+    def record(self, plan, npc_name, seconds):
+        """Count and log where a request was routed and how long it took to answer"""
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['routed'][plan.tier] += 1
+            self._stats['served'][plan.served_by] += 1
+        self._latency[plan.served_by].observe(seconds)
+        logger.info("Quest routed", extra={
+            'npc': npc_name,
+            'tier': plan.tier,
+            'served_by': plan.served_by,
+            'escalated_from': plan.escalated_from,
+            'reason': plan.reason,
+            'elapsed_ms': round(seconds * 1000, 3)
+        })
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'requests': self._stats['requests'],
+                'routed': dict(self._stats['routed']),
+                'served': dict(self._stats['served']),
+                'escalations': self._stats['escalations']
+            }
+        requests = stats['requests']
+        stats['rules_rate'] = round(stats['served'][TIER_RULES] / requests, 3) if requests else None
+        stats['latency_seconds'] = {tier: self._latency[tier].snapshot() for tier in TIERS}
+        stats['small_model'] = self.small_model
+        stats['large_model'] = self.large_model
+        stats['max_unknown_words'] = self.max_unknown_words
+        return stats
@@ -0,0 +1,205 @@
+import functools
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Suggestion keywords for items whose names the player is unlikely to type exactly
+COMMON_ITEM_MAPPINGS = {
+    'alien': 'alien_relic',
+    'crystal': 'crystal_red',
+    'rock': 'space_rock',
+    'ore': 'iron_ore',
+    'plant': 'plant_fiber',
+    'artifact': 'enigmatic_artifact',
+    'dust': 'cosmic_dust',
+    'shard': 'impact_shard',
+    'spire': 'crystal_spires',
+    'rubble': 'ancient_rubble',
+    'stalk': 'glow_stalk',
+    'fragment': 'meteorite_fragment',
+    'azure': 'azure_crystal'
+}
+
+DEFAULT_ITEM = 'crystal_red'
+DEFAULT_NPC = 'Commander Sarah Chen'
+
+MAX_SUGGESTED_REWARD = 1000
+MAX_SUGGESTED_QUANTITY = 10
+
+# Numbers followed by "crypto", and numbers followed by quantity words
+_REWARD_PATTERN = re.compile(r'(\d+)\s*crypto')
+_QUANTITY_PATTERN = re.compile(r'(\d+)\s*(?:pieces?|items?|units?|of)')
+
+
+def suggested_reward(suggestion_lower):
+    """Crypto amount the player asked for, or None"""
+    match = _REWARD_PATTERN.search(suggestion_lower)
+    return int(match.group(1)) if match else None
+
+
+def suggested_quantity(suggestion_lower):
+    """Item count the player asked for, or None"""
+    match = _QUANTITY_PATTERN.search(suggestion_lower)
+    return int(match.group(1)) if match else None
+
+
+class QuestCatalogue:
+    """Lookup structures for one list of available items and NPCs.
+
+    Built once per catalogue: membership sets, an inverted index from each
+    `_`-separated part of an item name to the first item containing it, and the
+    COMMON_ITEM_MAPPINGS whose items are actually available. Matching a
+    suggestion then costs time proportional to the suggestion, not the
+    catalogue.
+    """
+
+    def __init__(self, items, npcs):
+        self.items = list(items)
+        self.npcs = list(npcs)
+        self.item_set = set(self.items)
+        self.npc_set = set(self.npcs)
+
+        # Name part -> catalogue position of the first item with that part
+        self.item_parts = {}
+        for position, item in enumerate(self.items):
+            for part in item.lower().split('_'):
+                self.item_parts.setdefault(part, position)
+        # Every prefix of a name part, so a scan of the suggestion can stop early
+        self._prefixes = {part[:end] for part in self.item_parts for end in range(1, len(part) + 1)}
+
+        self.mappings = [(keyword, item) for keyword, item in COMMON_ITEM_MAPPINGS.items() if item in self.item_set]
+
+    def has_item(self, value):
+        try:
+            return value in self.item_set
+        except TypeError:
+            # The model can return a list or object where a name belongs
+            return value in self.items
+
+    def has_npc(self, value):
+        try:
+            return value in self.npc_set
+        except TypeError:
+            return value in self.npcs
+
+    def match_suggestion(self, suggestion_lower):
+        """First item, in catalogue order, with its name or a name part in the suggestion.
+
+        Name parts match anywhere in the suggestion, not only as whole words,
+        exactly like the original per-item scan. If a whole name is in the
+        suggestion then so is each of its parts, so only parts are looked up.
+        """
+        # An empty part ('a__b') is in every string
+        best = self.item_parts.get('')
+        length = len(suggestion_lower)
+        for start in range(length):
+            end = start + 1
+            while end <= length:
+                piece = suggestion_lower[start:end]
+                if piece not in self._prefixes:
+                    break
+                position = self.item_parts.get(piece)
+                if position is not None and (best is None or position < best):
+                    best = position
+                end += 1
+            if best == 0:
+                break
+        return self.items[best] if best is not None else None
+
+    def match_keyword(self, suggestion_lower):
+        """Item for the first COMMON_ITEM_MAPPINGS keyword in the suggestion, if available"""
+        for keyword, item in self.mappings:
+            if keyword in suggestion_lower:
+                return keyword, item
+        return None, None
+
+    @property
+    def default_item(self):
+        return self.items[0] if self.items else DEFAULT_ITEM
+
+    @property
+    def default_npc(self):
+        return self.npcs[0] if self.npcs else DEFAULT_NPC
+
+
+@functools.lru_cache(maxsize=64)
+def _cached_catalogue(items, npcs):
+    return QuestCatalogue(items, npcs)
+
+
+def quest_catalogue(available_items=None, available_npcs=None):
+    """QuestCatalogue for these lists, cached by their contents.
+
+    The frontend sends the same lists with every request, so the index is
+    normally built once and then found by hashing the tuples.
+    """
+    return _cached_catalogue(tuple(available_items or ()), tuple(available_npcs or ()))
+
+
+def catalogue_cache_stats():
+    info = _cached_catalogue.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize}
+
+
+def validate_quest_data(quest, available_items=None, available_npcs=None, player_suggestion=None):
+    """Validate and fix quest data to ensure it uses only available items/NPCs"""
+    catalogue = quest_catalogue(available_items, available_npcs)
+    suggestion_lower = player_suggestion.lower() if player_suggestion else ''
+
+    # Extract reward amount from player suggestion if mentioned
+    if player_suggestion:
+        reward = suggested_reward(suggestion_lower)
+        if reward is not None:
+            quest['reward_crypto'] = min(reward, MAX_SUGGESTED_REWARD)
+            logger.info(f"Using player-suggested reward: {reward} crypto (capped at {quest['reward_crypto']})")
+
+    # Validate collect_item quests
+    if quest.get('quest_type') == 'collect_item':
+        target_item = quest.get('target_item')
+    
+        # If target item is not in available items, try to find a close match
+        if target_item and not catalogue.has_item(target_item):
+            logger.warning(f"Target item '{target_item}' not in available items, looking for close match")
+        
+            # Try to find a close match based on player suggestion
+            if player_suggestion:
+                item = catalogue.match_suggestion(suggestion_lower)
+                if item is not None:
+                    quest['target_item'] = item
+                    logger.info(f"Found close match: '{target_item}' -> '{item}'")
+                else:
+                    # If no close match found, try some common mappings
+                    keyword, item = catalogue.match_keyword(suggestion_lower)
+                    if item is not None:
+                        quest['target_item'] = item
+                        logger.info(f"Using keyword mapping: '{keyword}' -> '{item}'")
+        
+            # If still no match, use first available item
+            if not catalogue.has_item(quest['target_item']):
+                quest['target_item'] = catalogue.default_item
+                if catalogue.items:
+                    logger.warning(f"No match found, using first available item: {catalogue.default_item}")
+    
+        # Extract quantity from player suggestion if mentioned
+        if player_suggestion:
+            quantity = suggested_quantity(suggestion_lower)
+            if quantity is not None:
+                quest['quantity'] = min(quantity, MAX_SUGGESTED_QUANTITY)
+                logger.info(f"Using player-suggested quantity: {quantity}")
+            # Also check for words like "some", "a few", "several"
+            elif any(word in suggestion_lower for word in ['some', 'a few', 'several']):
+                quest['quantity'] = 3
+                logger.info("Using 'some' quantity: 3")
+            elif 'a ' in suggestion_lower or 'an ' in suggestion_lower:
+                quest['quantity'] = 1
+                logger.info("Using single item quantity: 1")
+
+    # Validate talk_to_npc quests
+    elif quest.get('quest_type') == 'talk_to_npc':
+        target_npc = quest.get('target_npc')
+        if target_npc and not catalogue.has_npc(target_npc):
+            logger.warning(f"Target NPC '{target_npc}' not in available NPCs, using first available")
+            quest['target_npc'] = catalogue.default_npc
+
+    return quest
@@ -0,0 +1,301 @@
+import json
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Declared shape of a generated quest, sent as Ollama's `format` so the model can
+# only produce a matching JSON object
+QUEST_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'quest_type': {'type': 'string', 'enum': ['collect_item', 'talk_to_npc']},
+        'title': {'type': 'string'},
+        'description': {'type': 'string'},
+        'target_item': {'type': 'string'},
+        'target_npc': {'type': 'string'},
+        'quantity': {'type': 'integer'},
+        'reward_crypto': {'type': 'integer'},
+        'response': {'type': 'string'}
+    },
+    'required': ['quest_type', 'title', 'description', 'reward_crypto', 'response']
+}
+
+# How quest generations ask for JSON:
+#   schema - `format` is QUEST_SCHEMA (Ollama 0.5+)
+#   json   - `format: "json"`, any JSON object
+#   stream - free-form output; generation is still cut off when the object closes
+QUEST_OUTPUT_MODES = ('schema', 'json', 'stream')
+
+_STRUCTURAL = re.compile(r'[{}\[\]"\\]')
+_NESTED_OBJECT = re.compile(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}')
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+class JSONObjectScanner:
+    """Finds the first complete JSON object in text fed chunk by chunk.
+
+    Only string/escape state and bracket nesting are tracked, so the text is
+    scanned once and the object is recognised on the chunk that closes it. A
+    balanced candidate that isn't valid JSON (say "{you}" in a preamble) is
+    skipped and the search resumes at the next opening brace.
+    """
+
+    def __init__(self):
+        self._text = ''
+        self._position = 0
+        self._start = None
+        self._end = None
+        self._stack = []
+        self._in_string = False
+
+    @property
+    def complete(self):
+        return self._end is not None
+
+    def feed(self, chunk):
+        """Add a chunk of text; returns True once an object has closed"""
+        if self.complete:
+            return True
+        self._text += chunk or ''
+        text = self._text
+
+        while True:
+            if self._start is None:
+                start = text.find('{', self._position)
+                if start < 0:
+                    self._position = len(text)
+                    return False
+                self._start = start
+                self._position = start
+            match = _STRUCTURAL.search(text, self._position)
+            if not match:
+                self._position = len(text)
+                return False
+            char = match.group()
+            if char == '\\' and self._in_string:
+                if match.end() == len(text):
+                    # Wait for the escaped character
+                    self._position = match.start()
+                    return False
+                self._position = match.end() + 1
+                continue
+            self._position = match.end()
+            if self._in_string:
+                if char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in _CLOSERS:
+                self._stack.append(char)
+            elif char in '}]' and self._stack:
+                self._stack.pop()
+                if not self._stack:
+                    if _load_object(text[self._start:self._position]) is not None:
+                        self._end = self._position
+                        return True
+                    # Balanced but not JSON: try the next brace
+                    self._position = self._start + 1
+                    self._start = None
+                    self._in_string = False
+
+    def text(self):
+        return self._text
+
+    def object_text(self):
+        """The first complete object, or None"""
+        return self._text[self._start:self._end] if self.complete else None
+
+    def repaired_text(self):
+        """A truncated object closed off: the open string and brackets are terminated"""
+        if self._start is None or self.complete:
+            return None
+        text = self._text[self._start:]
+        if text.endswith('\\') and self._in_string:
+            text = text[:-1]
+        if self._in_string:
+            text += '"'
+        return text.rstrip().rstrip(',') + ''.join(_CLOSERS[opener] for opener in reversed(self._stack))
+
+
+def _load_object(text):
+    try:
+        value = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def extract_quest_json(text):
+    """Find the quest object in model output.
+
+    Returns (quest, strategy), or (None, None) if nothing parses. Schema/JSON mode
+    output parses directly; free-form output is searched the ways the parser
+    always has, and an object cut off by the token limit is closed and retried.
+    """
+    text = (text or '').strip()
+
+    quest = _load_object(text)
+    if quest is not None:
+        return quest, 'direct'
+
+    scanner = JSONObjectScanner()
+    scanner.feed(text)
+    if scanner.complete:
+        quest = _load_object(scanner.object_text())
+        if quest is not None:
+            return quest, 'first_object'
+
+    if '{' in text and '}' in text:
+        quest = _load_object(text[text.find('{'):text.rfind('}') + 1])
+        if quest is not None:
+            return quest, 'braces'
+
+    for line in text.split('\n'):
+        line = line.strip()
+        if line.startswith('{') and line.endswith('}'):
+            quest = _load_object(line)
+            if quest is not None:
+                return quest, 'line'
+
+    if text.startswith('"') and text.endswith('"'):
+        text = text[1:-1]
+    for match in _NESTED_OBJECT.findall(text):
+        quest = _load_object(match)
+        if quest is not None:
+            return quest, 'regex'
+
+    if not scanner.complete:
+        quest = _load_object(scanner.repaired_text())
+        if quest is not None:
+            return quest, 'repaired'
+
+    return None, None
+
+
+class QuestOutput:
+    """Structured quest generation: request JSON from Ollama and stop reading at the closing brace.
+
+    In schema/json mode the model is constrained to a JSON object; in every mode
+    the generation is streamed and the connection is dropped as soon as the
+    first object closes, which makes Ollama stop generating instead of spending
+    the rest of the token budget on trailing text or whitespace. If the server
+    rejects `format`, the mode drops to stream for the rest of the process.
+    """
+
+    def __init__(self, mode='schema', max_tokens=300):
+        if mode not in QUEST_OUTPUT_MODES:
+            raise ValueError(f"Unknown quest output mode '{mode}' (expected one of {', '.join(QUEST_OUTPUT_MODES)})")
+        self.mode = mode
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._stats = {
+            'generations': 0,
+            'early_stops': 0,
+            'tokens_streamed': 0,
+            'tokens_saved_max': 0,
+            'parsed': 0,
+            'parse_failures': 0,
+            'format_downgrades': 0
+        }
+        self._strategies = {}
+
+    def apply(self, payload):
+        """Set up an Ollama quest payload for the current mode"""
+        payload['stream'] = True
+        payload['options']['num_predict'] = self.max_tokens
+        if self.mode == 'schema':
+            payload['format'] = QUEST_SCHEMA
+        elif self.mode == 'json':
+            payload['format'] = 'json'
+        return payload
+
+    def downgrade(self, payload, error):
+        """Return payload without `format` if the server rejected it, else None"""
+        if 'format' not in payload or getattr(error, 'status_code', None) != 400:
+            return None
+        with self._lock:
+            if self.mode != 'stream':
+                logger.warning(f"Ollama rejected structured output ({error}); quest generation falls back to streamed free-form JSON")
+                self.mode = 'stream'
+                self._stats['format_downgrades'] += 1
+        return {key: value for key, value in payload.items() if key != 'format'}
+
+    def _start(self):
+        return JSONObjectScanner(), {'tokens': 0, 'done': None, 'first_at': None, 'last_at': None}
+
+    def _observe(self, scanner, progress, chunk):
+        """Feed one stream chunk; returns True when reading should stop"""
+        progress['tokens'] += 1
+        progress['last_at'] = time.perf_counter()
+        if progress['first_at'] is None:
+            progress['first_at'] = progress['last_at']
+        if chunk.get('done'):
+            progress['done'] = chunk
+            scanner.feed(chunk.get('response', ''))
+            return True
+        return scanner.feed(chunk.get('response', ''))
+
+    def _finish(self, scanner, progress):
+        stopped_early = scanner.complete and progress['done'] is None
+        with self._lock:
+            self._stats['generations'] += 1
+            self._stats['tokens_streamed'] += progress['tokens']
+            if stopped_early:
+                self._stats['early_stops'] += 1
+                self._stats['tokens_saved_max'] += max(self.max_tokens - progress['tokens'], 0)
+        result = dict(progress['done'] or {})
+        if stopped_early and progress['tokens'] > 1:
+            # Ollama never sent its final chunk with eval_count/eval_duration; one chunk is
+            # one token, and everything after the first chunk was generation
+            result['eval_count'] = progress['tokens'] - 1
+            result['eval_duration'] = int((progress['last_at'] - progress['first_at']) * 1e9)
+        result['response'] = scanner.object_text() if scanner.complete else scanner.text()
+        result['stopped_early'] = stopped_early
+        return result
+
+    def read(self, chunks):
+        """Collect a streamed quest generation, hanging up once the object is complete"""
+        scanner, progress = self._start()
+        try:
+            for chunk in chunks:
+                if self._observe(scanner, progress, chunk):
+                    break
+        finally:
+            # Closing the stream closes the connection, which cancels the generation
+            chunks.close()
+        return self._finish(scanner, progress)
+
+    async def read_async(self, chunks):
+        """Async version of read"""
+        scanner, progress = self._start()
+        try:
+            async for chunk in chunks:
+                if self._observe(scanner, progress, chunk):
+                    break
+        finally:
+            await chunks.aclose()
+        return self._finish(scanner, progress)
+
+    def parse(self, text):
+        """extract_quest_json, counted towards the parse success rate"""
+        quest, strategy = extract_quest_json(text)
+        with self._lock:
+            if quest is None:
+                self._stats['parse_failures'] += 1
+            else:
+                self._stats['parsed'] += 1
+                self._strategies[strategy] = self._strategies.get(strategy, 0) + 1
+        return quest
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['parsed_by'] = dict(self._strategies)
+        attempts = stats['parsed'] + stats['parse_failures']
+        stats['parse_success_rate'] = round(stats['parsed'] / attempts, 3) if attempts else None
+        stats['mode'] = self.mode
+        stats['max_tokens'] = self.max_tokens
+        return stats
@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from scheduler import PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# Name the scheduler sees refills under, so they never count against a player
+POOL_PLAYER_ID = 'quest-pool'
+
+
+def pool_key(spec):
+    """Everything that goes into a pooled quest's prompt and validation"""
+    return (
+        spec.get('npc_id'),
+        spec.get('npc_name'),
+        spec.get('npc_personality'),
+        spec.get('npc_role'),
+        tuple(spec.get('available_items') or ()),
+        tuple(spec.get('available_npcs') or ())
+    )
+
+
+class QuestPool:
+    """Per-NPC reservoirs of pre-generated quests, refilled while Ollama is idle.
+
+    A pool is kept for each NPC (and item/NPC catalogue) that quests have been
+    asked for, up to `max_targets` of them, least recently asked-for first out.
+    take() hands out a pooled quest instantly or returns None so the caller
+    generates one live. A background thread tops the pools up to `size`, one
+    generation at a time and at most one every `refill_interval` seconds, and
+    only when the scheduler has nothing running or queued. Quests older than
+    `max_age` seconds are discarded, and so are pools nobody has asked for in
+    that long, so an idle server stops generating.
+
+    `generate(spec)` makes one quest for a spec and returns None if the model
+    produced nothing usable.
+    """
+
+    def __init__(self, generate, scheduler, size=3, refill_interval=2.0, max_age=1800.0, max_targets=32):
+        self.generate = generate
+        self.scheduler = scheduler
+        self.size = size
+        self.refill_interval = refill_interval
+        self.max_age = max_age
+        self.max_targets = max_targets
+
+        # key -> {'spec': dict, 'quests': deque of (created_at, quest), 'last_used': float}
+        self._targets = OrderedDict()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'bypassed': 0,
+            'generated': 0,
+            'refill_failures': 0,
+            'unusable': 0,
+            'stale_dropped': 0,
+            'busy_skips': 0
+        }
+
+    def _prune(self, quests, now):
+        """Drop expired quests from the front of a reservoir; caller must hold the lock"""
+        while quests and now - quests[0][0] > self.max_age:
+            quests.popleft()
+            self._stats['stale_dropped'] += 1
+
+    def take(self, spec):
+        """A pooled quest for this spec, or None; either way the spec's pool is kept filled"""
+        key = pool_key(spec)
+        now = time.monotonic()
+        with self._lock:
+            target = self._targets.get(key)
+            if target is None:
+                target = self._targets[key] = {'spec': dict(spec), 'quests': deque()}
+                while len(self._targets) > self.max_targets:
+                    self._targets.popitem(last=False)
+            else:
+                self._targets.move_to_end(key)
+            target['last_used'] = now
+            self._prune(target['quests'], now)
+            quest = target['quests'].popleft()[1] if target['quests'] else None
+            self._stats['hits' if quest is not None else 'misses'] += 1
+        self._start()
+        self._wake.set()
+        return quest
+
+    def bypass(self):
+        """Count a request that needed a custom quest"""
+        with self._lock:
+            self._stats['bypassed'] += 1
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='quest-pool', daemon=True)
+                    self._thread.start()
+
+    def _next_target(self):
+        """Spec of the emptiest pool below `size`, or None if all are full"""
+        now = time.monotonic()
+        with self._lock:
+            # Least recently used first, so unused pools are at the front
+            while self._targets:
+                key, target = next(iter(self._targets.items()))
+                if now - target['last_used'] <= self.max_age:
+                    break
+                self._stats['stale_dropped'] += len(target['quests'])
+                del self._targets[key]
+            best = None
+            for target in self._targets.values():
+                self._prune(target['quests'], now)
+                if len(target['quests']) < self.size and (best is None or len(target['quests']) < len(best['quests'])):
+                    best = target
+            return (pool_key(best['spec']), best['spec']) if best is not None else None
+
+    def refill_once(self):
+        """Generate one quest for the emptiest pool if Ollama is idle; returns True if one was added"""
+        next_target = self._next_target()
+        if next_target is None:
+            return False
+        key, spec = next_target
+
+        waiter = self.scheduler.try_acquire(PRIORITY_BACKGROUND, POOL_PLAYER_ID)
+        if waiter is None:
+            with self._lock:
+                self._stats['busy_skips'] += 1
+            return False
+        try:
+            quest = self.generate(spec)
+        except Exception as e:
+            with self._lock:
+                self._stats['refill_failures'] += 1
+            logger.warning(f"Quest pool refill for {spec.get('npc_id')} failed: {e}")
+            return False
+        finally:
+            self.scheduler.release(waiter)
+
+        with self._lock:
+            if quest is None:
+                self._stats['unusable'] += 1
+                return False
+            self._stats['generated'] += 1
+            target = self._targets.get(key)
+            if target is None:
+                # Evicted while generating
+                return False
+            target['quests'].append((time.monotonic(), quest))
+        return True
+
+    def _run(self):
+        while True:
+            if self._next_target() is None:
+                # Everything is full; sleep until a take() or the oldest quest could expire
+                self._wake.wait(self.max_age)
+                self._wake.clear()
+                continue
+            self.refill_once()
+            time.sleep(self.refill_interval)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            depths = {}
+            oldest = None
+            for target in self._targets.values():
+                quests = target['quests']
+                name = target['spec'].get('npc_id') or target['spec'].get('npc_name')
+                depths[name] = depths.get(name, 0) + len(quests)
+                if quests:
+                    age = now - quests[0][0]
+                    oldest = age if oldest is None else max(oldest, age)
+            stats['targets'] = len(self._targets)
+        served = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / served, 3) if served else None
+        stats['pooled'] = sum(depths.values())
+        stats['pooled_by_npc'] = depths
+        stats['oldest_age_s'] = round(oldest, 1) if oldest is not None else None
+        stats['size'] = self.size
+        stats['refill_interval'] = self.refill_interval
+        stats['max_age'] = self.max_age
+        return stats
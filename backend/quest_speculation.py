@@ -0,0 +1,245 @@
+import asyncio
+import copy
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from quest_catalogue import validate_quest_data
+from quest_templates import QuestRequest
+from scheduler import AdmissionRejected, PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# Name the scheduler sees speculative generations under
+SPECULATION_PLAYER_ID = 'quest-speculation'
+
+# Things players say in conversation shortly before asking for a quest. The
+# frontend already sends messages containing "quest", "job" etc. straight to
+# /api/generate-quest, so these are the lead-ups: money, boredom, offers of help.
+DEFAULT_INTENT_KEYWORDS = (
+    'work', 'job', 'task', 'mission', 'quest', 'help', 'favor', 'favour', 'errand', 'crypto', 'credits',
+    'money', 'pay', 'earn', 'reward', 'broke', 'bored', 'busy', 'need', 'supplies', 'anything i can do',
+    'anything to do', 'anything for me'
+)
+
+
+def intent_pattern(keywords):
+    return re.compile(r'\b(?:' + '|'.join(re.escape(keyword) for keyword in keywords) + r')', re.IGNORECASE)
+
+
+class QuestSpeculator:
+    """Generates a quest in the background when conversation suggests one is about to be asked for.
+
+    observe() is fed each dialogue message. When it matches an intent keyword
+    and nothing is already speculated for that player and NPC, one quest is
+    generated at background priority with the message as the suggestion and the
+    item/NPC catalogue from the player's last quest request. take() hands it to
+    the player's next /api/generate-quest for that NPC, waiting for it if it is
+    already generating, after re-validating it against the actual suggestion.
+    It is served only if it still matches what the player asked for; a
+    speculation that didn't match, expired after `ttl_seconds` unused, or was
+    still queued when the request came is counted as wasted.
+
+    `generate(spec)` makes one quest and returns None if the model produced
+    nothing usable.
+    """
+
+    def __init__(self, generate, scheduler, ttl_seconds=300.0, max_pending=4, keywords=DEFAULT_INTENT_KEYWORDS):
+        self.generate = generate
+        self.scheduler = scheduler
+        self.ttl_seconds = ttl_seconds
+        self.max_pending = max_pending
+        self._intent = intent_pattern(keywords)
+
+        # (player_id, npc_name) -> {'spec', 'state': queued|running|done, 'future', 'quest', 'created_at', 'cancelled'}
+        self._speculations = {}
+        self._catalogues = {}  # player_id -> (items, npcs) from their last quest request
+        self._last_catalogue = (None, None)
+        self._executor = ThreadPoolExecutor(max_workers=max(max_pending, 1), thread_name_prefix='quest-speculation')
+        self._lock = threading.Lock()
+        self._stats = {
+            'predictions': 0,
+            'started': 0,
+            'skipped_pending': 0,
+            'skipped_no_catalogue': 0,
+            'generated': 0,
+            'unusable': 0,
+            'failed': 0,
+            'hits': 0,
+            'hits_waited': 0,
+            'misses': 0,
+            'mismatches': 0,
+            'cancelled': 0,
+            'late': 0,
+            'expired': 0,
+            'unneeded': 0
+        }
+
+    def predicts_quest(self, player_message):
+        return bool(player_message and self._intent.search(player_message))
+
+    def _expire(self, now):
+        """Drop unused speculations older than the TTL; caller must hold the lock"""
+        for key, speculation in list(self._speculations.items()):
+            if speculation['state'] == 'done' and now - speculation['created_at'] > self.ttl_seconds:
+                del self._speculations[key]
+                if speculation.get('quest') is not None:
+                    self._stats['expired'] += 1
+
+    def observe(self, player_id, spec, player_message):
+        """Start speculating for this player and NPC if the message suggests a quest request is coming"""
+        if not self.predicts_quest(player_message):
+            return False
+        key = (player_id, spec['npc_name'])
+        now = time.monotonic()
+        with self._lock:
+            self._stats['predictions'] += 1
+            self._expire(now)
+            if key in self._speculations:
+                return False
+            pending = sum(1 for speculation in self._speculations.values() if speculation['state'] != 'done')
+            if pending >= self.max_pending:
+                self._stats['skipped_pending'] += 1
+                return False
+            items, npcs = self._catalogues.get(player_id, self._last_catalogue)
+            if items is None:
+                # No quest request seen yet, so no idea which items and NPCs the game has
+                self._stats['skipped_no_catalogue'] += 1
+                return False
+            speculation = {
+                'spec': dict(spec, available_items=items, available_npcs=npcs, player_suggestion=player_message),
+                'state': 'queued',
+                'created_at': now,
+                'cancelled': False
+            }
+            self._speculations[key] = speculation
+            self._stats['started'] += 1
+            speculation['future'] = self._executor.submit(self._run, speculation)
+        logger.info("Speculating on a quest request", extra={'npc': spec['npc_name'], 'player_message': player_message})
+        return True
+
+    def _run(self, speculation):
+        spec = speculation['spec']
+        try:
+            # Lowest priority: runs only once no player is waiting on a generation
+            waiter = self.scheduler.acquire(PRIORITY_BACKGROUND, SPECULATION_PLAYER_ID, timeout=self.ttl_seconds)
+        except AdmissionRejected:
+            with self._lock:
+                speculation['state'] = 'done'
+                self._stats['cancelled'] += 1
+            return None
+        try:
+            with self._lock:
+                if speculation['cancelled']:
+                    speculation['state'] = 'done'
+                    return None
+                speculation['state'] = 'running'
+            quest = self.generate(spec)
+        except Exception as e:
+            quest = None
+            with self._lock:
+                self._stats['failed'] += 1
+            logger.warning(f"Speculative quest for {spec['npc_name']} failed: {e}")
+        finally:
+            self.scheduler.release(waiter)
+        with self._lock:
+            speculation['state'] = 'done'
+            speculation['quest'] = quest
+            speculation['created_at'] = time.monotonic()
+            if quest is None:
+                self._stats['unusable'] += 1
+            else:
+                self._stats['generated'] += 1
+        return quest
+
+    def _remember(self, player_id, available_items, available_npcs):
+        """Note the catalogue a player's quest request came with; caller must hold the lock"""
+        catalogue = (list(available_items or []), list(available_npcs or []))
+        self._catalogues[player_id] = self._last_catalogue = catalogue
+
+    def _claim(self, player_id, npc_name, available_items, available_npcs):
+        """Remember the player's catalogue and take their speculation for this NPC, if any; returns it or None"""
+        now = time.monotonic()
+        with self._lock:
+            self._remember(player_id, available_items, available_npcs)
+            self._expire(now)
+            speculation = self._speculations.pop((player_id, npc_name), None)
+            if speculation is None:
+                self._stats['misses'] += 1
+            elif speculation['state'] == 'queued':
+                # Not started yet; the live request will get to Ollama sooner
+                speculation['cancelled'] = True
+                self._stats['cancelled'] += 1
+                speculation = None
+            elif speculation['state'] == 'running':
+                self._stats['hits_waited'] += 1
+            return speculation
+
+    def discard(self, player_id, npc_name, available_items, available_npcs):
+        """Drop this player's speculation for the NPC because their request was answered another way"""
+        with self._lock:
+            self._remember(player_id, available_items, available_npcs)
+            speculation = self._speculations.pop((player_id, npc_name), None)
+            if speculation is None:
+                return
+            if speculation['state'] == 'queued':
+                speculation['cancelled'] = True
+                self._stats['cancelled'] += 1
+            elif speculation['state'] == 'running' or speculation.get('quest') is not None:
+                self._stats['unneeded'] += 1
+
+    def _serve(self, quest, available_items, available_npcs, player_suggestion):
+        if quest is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+        quest = validate_quest_data(copy.deepcopy(quest), available_items, available_npcs, player_suggestion)
+        # Made without seeing the real suggestion: validation applied its reward and quantity,
+        # but can't fix the wrong kind of quest or a different item than the one asked for
+        matched = QuestRequest(player_suggestion, available_items, available_npcs).satisfied_by(quest)
+        with self._lock:
+            self._stats['hits' if matched else 'mismatches'] += 1
+        return quest if matched else None
+
+    def take(self, player_id, npc_name, available_items, available_npcs, player_suggestion, timeout=None):
+        """The speculative quest for this request, or None to generate one live"""
+        speculation = self._claim(player_id, npc_name, available_items, available_npcs)
+        if speculation is None:
+            return None
+        try:
+            quest = speculation['future'].result(timeout)
+        except FutureTimeout:
+            with self._lock:
+                self._stats['late'] += 1
+            return None
+        return self._serve(quest, available_items, available_npcs, player_suggestion)
+
+    async def take_async(self, player_id, npc_name, available_items, available_npcs, player_suggestion, timeout=None):
+        """asyncio version of take()"""
+        speculation = self._claim(player_id, npc_name, available_items, available_npcs)
+        if speculation is None:
+            return None
+        try:
+            quest = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(speculation['future'])), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._stats['late'] += 1
+            return None
+        return self._serve(quest, available_items, available_npcs, player_suggestion)
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            stats = dict(self._stats)
+            stats['pending'] = sum(1 for speculation in self._speculations.values() if speculation['state'] != 'done')
+            stats['ready'] = len(self._speculations) - stats['pending']
+        requests = stats['hits'] + stats['misses'] + stats['mismatches'] + stats['late']
+        stats['hit_rate'] = round(stats['hits'] / requests, 3) if requests else None
+        # Generations that never reached a player
+        stats['wasted'] = stats['mismatches'] + stats['late'] + stats['expired'] + stats['unneeded']
+        stats['precision'] = round(stats['hits'] / stats['generated'], 3) if stats['generated'] else None
+        stats['ttl_seconds'] = self.ttl_seconds
+        stats['max_pending'] = self.max_pending
+        return stats
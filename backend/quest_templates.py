@@ -0,0 +1,289 @@
+import functools
+import random
+import re
+
+from quest_catalogue import DEFAULT_ITEM, DEFAULT_NPC, quest_catalogue, suggested_reward, validate_quest_data
+
+# Verbs that say which kind of quest the player wants
+COLLECT_WORDS = frozenset((
+    'collect', 'bring', 'find', 'gather', 'fetch', 'get', 'grab', 'mine', 'harvest', 'scavenge', 'retrieve',
+    'salvage', 'recover', 'supply', 'supplies', 'item', 'items', 'resources', 'materials'
+))
+TALK_WORDS = frozenset(('talk', 'speak', 'message', 'deliver', 'tell', 'visit', 'chat', 'contact', 'meet', 'courier'))
+
+# Asking for these needs writing the templates can't do
+PROSE_WORDS = frozenset((
+    'story', 'lore', 'history', 'mystery', 'mysterious', 'secret', 'secrets', 'legend', 'backstory', 'epic',
+    'adventure', 'twist', 'interesting', 'creative', 'unique', 'special', 'dramatic', 'exciting', 'why',
+    'explain', 'describe', 'surprise', 'puzzle', 'riddle'
+))
+
+# Words that carry no detail the templates would need to honour
+FILLER_WORDS = frozenset((
+    'the', 'and', 'for', 'you', 'your', 'yours', 'me', 'my', 'mine', 'our', 'can', 'could', 'would', 'should',
+    'will', 'want', 'wanna', 'need', 'needs', 'like', 'please', 'any', 'anything', 'something', 'some', 'few',
+    'several', 'couple', 'have', 'has', 'got', 'give', 'gimme', 'let', 'lets', 'with', 'from', 'about', 'that',
+    'this', 'there', 'here', 'what', 'how', 'who', 'where', 'when', 'maybe', 'just', 'more', 'much', 'many',
+    'lot', 'lots', 'bit', 'quest', 'quests', 'mission', 'missions', 'job', 'jobs', 'task', 'tasks', 'work',
+    'errand', 'errands', 'favor', 'favour', 'help', 'helping', 'quick', 'quickly', 'easy', 'simple', 'small',
+    'big', 'new', 'another', 'other', 'one', 'ones', 'them', 'him', 'her', 'they', 'are', 'was', 'were', 'been',
+    'being', 'not', 'don', 'doesn', 'crypto', 'reward', 'rewards', 'pay', 'paid', 'pays', 'earn', 'credits',
+    'money', 'piece', 'pieces', 'unit', 'units', 'into', 'out', 'off', 'around', 'again', 'too', 'also',
+    'then', 'now', 'today', 'someone', 'somebody', 'anyone', 'people', 'person', 'npc', 'doing', 'thing',
+    'things', 'stuff', 'kind', 'sort', 'type', 'hey', 'okay', 'yes', 'yeah', 'sure', 'ready', 'able', 'time',
+    'which', 'their', 'its', 'but', 'all', 'each', 'every', 'way', 'use', 'useful', 'had'
+))
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Requests longer than this are asking for more than a template
+MAX_TEMPLATE_WORDS = 30
+
+
+def _singular(word):
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+class SuggestionIndex:
+    """Whole-word lookups of item and NPC names for one catalogue.
+
+    Unlike QuestCatalogue.match_suggestion, which matches name parts anywhere
+    (so "more" finds iron_ore), words here must match a name part exactly,
+    and the item matching the most words wins ("red crystal" is crystal_red,
+    not the first crystal).
+    """
+
+    def __init__(self, items, npcs):
+        catalogue = quest_catalogue(items, npcs)
+        self.items = catalogue.items
+        self.npcs = catalogue.npcs
+        self.item_words = {}
+        for item in self.items:
+            for part in item.lower().split('_'):
+                if part:
+                    self.item_words.setdefault(part, []).append(item)
+        self.mappings = dict(catalogue.mappings)
+        self.npc_words = {}
+        for npc in self.npcs:
+            for part in _WORD_PATTERN.findall(npc.lower()):
+                if len(part) > 2:
+                    self.npc_words.setdefault(part, []).append(npc)
+
+    def items_for(self, word):
+        return self.item_words.get(word) or self.item_words.get(_singular(word)) or []
+
+
+@functools.lru_cache(maxsize=64)
+def _suggestion_index(items, npcs):
+    return SuggestionIndex(items, npcs)
+
+
+def _best(scores, order):
+    """Highest scoring name, earliest in the catalogue on a tie"""
+    if not scores:
+        return None
+    return max(scores, key=lambda name: (scores[name], -order.index(name)))
+
+
+class QuestRequest:
+    """What a player's quest suggestion asks for, in terms of one catalogue.
+
+    quest_type is 'collect_item' or 'talk_to_npc' when the suggestion says so
+    and None otherwise; item and npc are the catalogue entries it names.
+    unknown_words are words that are neither filler nor a name in the
+    catalogue (details a template would ignore) and prose_words those asking
+    for custom writing.
+    """
+
+    def __init__(self, suggestion, available_items=None, available_npcs=None):
+        self.suggestion = suggestion or ''
+        self.available_items = list(available_items or [])
+        self.available_npcs = list(available_npcs or [])
+        index = _suggestion_index(tuple(self.available_items), tuple(self.available_npcs))
+
+        self.words = _WORD_PATTERN.findall(self.suggestion.lower())
+        item_scores, npc_scores = {}, {}
+        collect = talk = False
+        self.unknown_words = []
+        self.prose_words = []
+        for word in self.words:
+            word = word.split("'")[0]
+            items = index.items_for(word)
+            mapped = index.mappings.get(word) or index.mappings.get(_singular(word))
+            npcs = index.npc_words.get(word, [])
+            for item in items:
+                item_scores[item] = item_scores.get(item, 0) + 1
+            if mapped and not items:
+                item_scores[mapped] = item_scores.get(mapped, 0) + 1
+            for npc in npcs:
+                npc_scores[npc] = npc_scores.get(npc, 0) + 1
+            collect = collect or word in COLLECT_WORDS
+            talk = talk or word in TALK_WORDS
+            if word in PROSE_WORDS:
+                self.prose_words.append(word)
+            elif not (items or mapped or npcs or word in COLLECT_WORDS or word in TALK_WORDS
+                      or word in FILLER_WORDS or word.isdigit() or len(word) < 3):
+                self.unknown_words.append(word)
+
+        self.item = _best(item_scores, index.items)
+        self.npc = _best(npc_scores, index.npcs)
+        if talk and not (collect and self.item):
+            self.quest_type = 'talk_to_npc'
+        elif collect or self.item:
+            self.quest_type = 'collect_item'
+        elif self.npc:
+            self.quest_type = 'talk_to_npc'
+        else:
+            self.quest_type = None
+
+    @property
+    def target_resolved(self):
+        """Whether the catalogue has what the suggestion is about, or it didn't ask for anything in particular"""
+        if self.quest_type == 'talk_to_npc':
+            return self.npc is not None or not self.unknown_words
+        return self.item is not None or not self.unknown_words
+
+    def satisfied_by(self, quest):
+        """Whether a quest gives the player what they asked for"""
+        if self.quest_type and quest.get('quest_type') != self.quest_type:
+            return False
+        if quest.get('quest_type') == 'collect_item':
+            return self.item is None or quest.get('target_item') == self.item
+        if quest.get('quest_type') == 'talk_to_npc':
+            return self.npc is None or quest.get('target_npc') == self.npc
+        return False
+
+
+# Template grammar. {giver} is the NPC handing out the quest, {item}/{items}
+# an item's display name, {count} the quantity in words and {npc} the NPC to
+# talk to. {purpose} comes from PURPOSES by the giver's role.
+COLLECT_TITLES = (
+    '{Item} Supply Run', 'Collect {Item}', 'Gather {Item}', 'Salvage Run: {Item}', '{Item} Recovery',
+    'Short on {Item}'
+)
+COLLECT_DESCRIPTIONS = (
+    'Collect {count} {items} for {giver}.',
+    'Gather {count} {items} and bring {them} back to {giver} for {purpose}.',
+    '{giver} needs {count} {items} for {purpose}.',
+    'Track down {count} {items} for {purpose} and return to {giver}.'
+)
+COLLECT_RESPONSES = (
+    "I need {count} {items} for {purpose}. Think you can find {them}?",
+    "We're short on {items}. Bring me {count} and I'll make it worth your while.",
+    "{Count} {items}, that's all I'm asking. It's for {purpose}.",
+    "If you can get me {count} {items}, I'll pay you {reward} crypto. Deal?",
+    "Good timing. {Purpose} is held up until I get {count} {items}. Can you handle it?"
+)
+TALK_TITLES = ('A Word with {npc}', 'Message for {npc}', 'Check in with {npc}', "{npc}'s Message")
+TALK_DESCRIPTIONS = (
+    'Deliver a message from {giver} to {npc}.',
+    'Talk to {npc} on behalf of {giver}.',
+    'Find {npc} and pass on word from {giver}.'
+)
+TALK_RESPONSES = (
+    "I need to get a message to {npc}. Can you carry it for me?",
+    "Go talk to {npc} for me. They'll know what it's about.",
+    "{npc} hasn't heard from me in a while. Would you pass on a message?",
+    "Take this to {npc}. There's {reward} crypto in it for you."
+)
+
+# Role keyword -> what the giver needs items for
+PURPOSES = (
+    (('engineer', 'mechanic', 'technician'), 'the reactor repairs'),
+    (('doctor', 'medic', 'medical', 'scientist', 'researcher'), 'my research'),
+    (('commander', 'security', 'captain', 'soldier', 'guard'), "the outpost's defences"),
+    (('trader', 'merchant', 'dealer', 'smuggler', 'broker'), 'a buyer who pays well'),
+    (('farmer', 'botanist', 'cook', 'chef'), 'the hydroponics bay')
+)
+DEFAULT_PURPOSE = 'the outpost'
+
+COUNT_WORDS = ('zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine', 'ten')
+
+
+def item_display_name(item):
+    return item.replace('_', ' ')
+
+
+def purpose_for(role):
+    role = (role or '').lower()
+    for keywords, purpose in PURPOSES:
+        if any(keyword in role for keyword in keywords):
+            return purpose
+    return DEFAULT_PURPOSE
+
+
+class QuestTemplates:
+    """Builds quests from the template grammar, with no model involved.
+
+    The quest is then put through validate_quest_data like a generated one, so
+    rewards, quantities and names follow the same rules either way.
+    """
+
+    def __init__(self, seed=None):
+        self._random = random.Random(seed)
+
+    def build(self, request, giver=None, giver_role=None):
+        """A quest dict (without id or status) for a QuestRequest"""
+        giver = giver or 'me'
+        quest_type = request.quest_type
+        if quest_type is None:
+            # Nothing specific asked for: mostly fetch quests, sometimes a message run
+            quest_type = 'talk_to_npc' if request.available_npcs and self._random.random() < 0.3 else 'collect_item'
+
+        if quest_type == 'talk_to_npc':
+            npcs = [npc for npc in request.available_npcs if npc != giver] or request.available_npcs or [DEFAULT_NPC]
+            npc = request.npc or self._random.choice(npcs)
+            reward = self._random.choice((10, 10, 15, 20))
+            slots = {'giver': giver, 'npc': npc, 'reward': reward}
+            quest = {
+                'quest_type': 'talk_to_npc',
+                'title': self._random.choice(TALK_TITLES).format(**slots),
+                'description': self._random.choice(TALK_DESCRIPTIONS).format(**slots),
+                'target_npc': npc,
+                'reward_crypto': reward,
+                'response': self._random.choice(TALK_RESPONSES).format(**slots)
+            }
+        else:
+            item = request.item or (self._random.choice(request.available_items) if request.available_items else DEFAULT_ITEM)
+            quantity = self._random.choice((1, 2, 3, 3, 5))
+            quest = {
+                'quest_type': 'collect_item',
+                'target_item': item,
+                'quantity': quantity,
+                'reward_crypto': 10 + 5 * quantity
+            }
+
+        # Rewards and quantities the player named win, as they do for generated quests
+        quest = validate_quest_data(quest, request.available_items, request.available_npcs, request.suggestion)
+        if quest['quest_type'] == 'collect_item':
+            if suggested_reward(request.suggestion.lower()) is None:
+                quest['reward_crypto'] = 10 + 5 * quest['quantity']
+            quest.update(self._collect_text(quest, giver, giver_role))
+        return quest
+
+    def _collect_text(self, quest, giver, giver_role):
+        quantity = quest['quantity']
+        name = item_display_name(quest['target_item'])
+        purpose = purpose_for(giver_role)
+        count = COUNT_WORDS[quantity] if 0 <= quantity < len(COUNT_WORDS) else str(quantity)
+        slots = {
+            'giver': giver,
+            'item': name,
+            'Item': name.title(),
+            'items': name,
+            'count': count,
+            'Count': count.capitalize(),
+            'them': 'them' if quantity > 1 else 'it',
+            'purpose': purpose,
+            'Purpose': purpose[0].upper() + purpose[1:],
+            'reward': quest['reward_crypto']
+        }
+        return {
+            'title': self._random.choice(COLLECT_TITLES).format(**slots),
+            'description': self._random.choice(COLLECT_DESCRIPTIONS).format(**slots),
+            'response': self._random.choice(COLLECT_RESPONSES).format(**slots)
+        }
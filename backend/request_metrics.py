@@ -0,0 +1,83 @@
+import time
+from contextlib import contextmanager
+
+from metrics import MetricsRegistry
+
+# Generation throughput in tokens/second, from a CPU-bound 13B model to a small one on a GPU
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 200, 300)
+
+
+class RequestMetrics:
+    """Where request time goes, for /api/metrics.
+
+    - `http_request_duration_seconds`: end-to-end latency per route (time to
+      the response headers for streamed routes)
+    - `llm_stage_duration_seconds`: time per stage of a dialogue or quest
+      generation: prompt_build, queue (waiting for a scheduler slot),
+      generation (the Ollama call), clean, parse and validate
+    - `ollama_*_tokens_total` / `ollama_*_seconds_total`: Ollama's own
+      eval_count/eval_duration and prompt_eval_count/prompt_eval_duration, so
+      rate(tokens) / rate(seconds) is the real generation or prefill speed;
+      `ollama_generation_tokens_per_second` is the per-request distribution
+    - `npc_responses_total`: replies per NPC by outcome, for fallback rates
+    """
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        self._requests = self.registry.histogram(
+            'http_request_duration_seconds', 'End-to-end request latency by route',
+            ('route', 'method', 'status'))
+        self._stages = self.registry.histogram(
+            'llm_stage_duration_seconds', 'Time spent in each stage of a dialogue or quest generation',
+            ('kind', 'stage'))
+        self._eval_tokens = self.registry.counter(
+            'ollama_eval_tokens_total', 'Tokens generated by Ollama (eval_count)', ('kind', 'model'))
+        self._eval_seconds = self.registry.counter(
+            'ollama_eval_seconds_total', 'Time Ollama spent generating them (eval_duration)', ('kind', 'model'))
+        self._prompt_tokens = self.registry.counter(
+            'ollama_prompt_eval_tokens_total', 'Prompt tokens Ollama evaluated (prompt_eval_count)', ('kind', 'model'))
+        self._prompt_seconds = self.registry.counter(
+            'ollama_prompt_eval_seconds_total', 'Time Ollama spent on prefill (prompt_eval_duration)', ('kind', 'model'))
+        self._tokens_per_second = self.registry.histogram(
+            'ollama_generation_tokens_per_second', 'Generation speed per Ollama response',
+            ('kind', 'model'), TOKENS_PER_SECOND_BUCKETS)
+        self._outcomes = self.registry.counter(
+            'npc_responses_total', 'NPC dialogue lines and quests by outcome (llm, rules, pool, speculative or fallback)',
+            ('kind', 'npc', 'outcome'))
+
+    def observe_request(self, route, method, status, seconds):
+        self._requests.labels(route, method, status).observe(seconds)
+
+    def observe_stage(self, kind, stage, seconds):
+        self._stages.labels(kind, stage).observe(seconds)
+
+    @contextmanager
+    def stage(self, kind, stage):
+        """Time the enclosed block as one stage of a `kind` ('dialogue' or 'quest') generation"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(kind, stage, time.perf_counter() - start)
+
+    def observe_generation(self, kind, model, result):
+        """Record the token counts and timings Ollama reported for one response, if it did"""
+        eval_count = result.get('eval_count')
+        eval_duration = result.get('eval_duration')
+        if eval_count and eval_duration:
+            self._eval_tokens.labels(kind, model).inc(eval_count)
+            self._eval_seconds.labels(kind, model).inc(eval_duration / 1e9)
+            self._tokens_per_second.labels(kind, model).observe(eval_count / (eval_duration / 1e9))
+        prompt_eval_count = result.get('prompt_eval_count')
+        prompt_eval_duration = result.get('prompt_eval_duration')
+        if prompt_eval_count and prompt_eval_duration:
+            self._prompt_tokens.labels(kind, model).inc(prompt_eval_count)
+            self._prompt_seconds.labels(kind, model).inc(prompt_eval_duration / 1e9)
+
+    def record_outcome(self, kind, npc, outcome):
+        """Count a reply: 'llm' (generated, or a cached generation), 'rules' (templated quest), 'pool'
+        (pre-generated quest), 'speculative' (quest generated during the conversation) or 'fallback'"""
+        self._outcomes.labels(kind, npc or 'unknown', outcome).inc()
+
+    def render(self):
+        return self.registry.render()
@@ -0,0 +1,259 @@
+import random
+import re
+
+# Instruction/prompt fragments the model sometimes echoes back, removed in this order
+DIALOGUE_CLEANUP_PATTERNS = [
+    r"If the player asks about.*?\.",  # Remove instruction text
+    r"Respond as.*?\.",  # Remove instruction text
+    r"Keep responses under.*?\.",  # Remove instruction text
+    r"Be true to.*?\.",  # Remove instruction text
+    r"If there are relevant memories.*?\.",  # Remove instruction text
+    r"Response:",  # Remove response labels
+    r"Answer:",  # Remove answer labels
+    r"Dialogue:",  # Remove dialogue labels
+    r"=== NPC MEMORY CONTEXT ===",  # Remove memory context headers
+    r"=== END MEMORY CONTEXT ===",  # Remove memory context footers
+    r"RELATIONSHIP STATUS:.*?RECENT CONVERSATION CONTEXT:.*?=== END MEMORY CONTEXT ===",  # Remove full memory context
+    r"IMPORTANT INSTRUCTIONS:.*?DO NOT include instruction text in your response",  # Remove instruction block
+    r"PERSONALITY:.*?DIALOGUE STYLE:.*?PLAYER CONTEXT:.*?The player says:",  # Remove full prompt
+]
+
+# Lines containing any of these look like echoed memory context
+MEMORY_LINE_KEYWORDS = [
+    'relationship status:', 'trust:', 'friendship:', 'respect:', 'attraction:',
+    'personal_info:', 'relationship:', 'promises:', 'emotional:', 'gossip:', 'trade:', 'quests:',
+    'recent conversation context:', 'player:', 'npc:', 'emotion:',
+    '===', 'memory context', 'end memory context'
+]
+
+# Lines containing any of these look like echoed instructions
+INSTRUCTION_LINE_KEYWORDS = [
+    'important instructions:', 'respond naturally', 'keep responses', 'be true to',
+    'use the memory context', 'do not include', 'personality:', 'background:', 'dialogue style:'
+]
+
+FALLBACK_RESPONSES = [
+    "I'm not sure how to respond to that.",
+    "That's an interesting question.",
+    "I need to think about that for a moment.",
+    "Let me consider what you're asking."
+]
+
+# A sentence is complete once terminal punctuation is followed by whitespace,
+# or at the end of a line
+SENTENCE_BOUNDARY = re.compile(r'[.!?]["\')*]*(?=\s)|\n')
+
+# A cleaned reply this short or shorter is replaced by a fallback response
+MIN_RESPONSE_CHARS = 5
+
+
+def _trie_pattern(node):
+    if '' in node:
+        # A shorter keyword already matched; longer ones sharing its prefix add nothing
+        return ''
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items())]
+    return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+
+def keyword_pattern(keywords, flags=0):
+    """Compile keywords into one regex shaped like a trie.
+
+    Keywords sharing a prefix share a branch ('trust:' and 'trade:' become
+    'tr(?:ade:|ust:)'), so a search walks the trie once per position in C,
+    Aho-Corasick style, instead of scanning the text once per keyword. Only
+    answers whether some keyword occurs, not which one.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return re.compile(_trie_pattern(trie), flags)
+
+
+_CLEANUP_FLAGS = re.DOTALL | re.IGNORECASE
+_CLEANUP_REGEXES = [re.compile(pattern, _CLEANUP_FLAGS) for pattern in DIALOGUE_CLEANUP_PATTERNS]
+
+# Every cleanup pattern starts with a plain literal it can't match without
+_CLEANUP_LITERALS = [pattern.split('.*?')[0].lower() for pattern in DIALOGUE_CLEANUP_PATTERNS]
+
+# The only non-ASCII characters IGNORECASE matches against an ASCII letter that
+# lower() doesn't turn into that letter
+_IGNORECASE_FOLD = {0x130: 'i', 0x131: 'i', 0x17f: 's'}
+
+# Keywords are matched against lowercased text, as the line filters always have
+_LINE_KEYWORDS = keyword_pattern(MEMORY_LINE_KEYWORDS + INSTRUCTION_LINE_KEYWORDS)
+
+# Patterns that can run past a sentence end, each with a regex for its leading literal
+_SPANNING = [(re.compile(literal, _CLEANUP_FLAGS), regex)
+             for literal, regex in zip((pattern.split('.*?')[0] for pattern in DIALOGUE_CLEANUP_PATTERNS), _CLEANUP_REGEXES)
+             if '.*?' in regex.pattern]
+
+
+def _candidate_patterns(text):
+    """Indexes of the cleanup patterns whose leading literal occurs in text"""
+    lowered = text.lower() if text.isascii() else text.translate(_IGNORECASE_FOLD).lower()
+    return {index for index, literal in enumerate(_CLEANUP_LITERALS) if literal in lowered}
+
+
+def strip_instructions(text):
+    """Remove every DIALOGUE_CLEANUP_PATTERNS match, in pattern order.
+
+    Removing one match can change what a later pattern matches, so patterns
+    still run in order, but only those whose leading literal is present; a
+    substring check is much cheaper than a case-insensitive regex scan. The
+    candidates are re-checked after anything is actually removed.
+    """
+    candidates = _candidate_patterns(text)
+    for index, regex in enumerate(_CLEANUP_REGEXES):
+        if index in candidates:
+            text, removed = regex.subn("", text)
+            if removed:
+                candidates = _candidate_patterns(text)
+    return text
+
+
+def clean_dialogue_response(response_text):
+    """Clean LLM response to remove instruction text and memory context"""
+    if not response_text:
+        return "I'm not sure how to respond to that."
+
+    cleaned = strip_instructions(response_text.strip())
+
+    # Drop lines that look like memory context or instructions
+    lines = cleaned.split('\n')
+    lowered = cleaned.lower()
+    if _LINE_KEYWORDS.search(lowered) is not None:
+        # lower() never adds or removes newlines, so the lines pair up
+        lines = [line for line, lowered_line in zip(lines, lowered.split('\n'))
+                 if _LINE_KEYWORDS.search(lowered_line) is None]
+    filtered_lines = [line for line in (line.strip() for line in lines) if line]
+
+    cleaned = ' '.join(filtered_lines).strip()
+
+    # If we have a meaningful response, return it
+    if cleaned and len(cleaned) > MIN_RESPONSE_CHARS:
+        return cleaned
+
+    # Fallback responses if cleaning removed everything
+    return random.choice(FALLBACK_RESPONSES)
+
+
+class DialogueStreamCleaner:
+    """Cleans streamed LLM text chunk by chunk, one sentence at a time.
+
+    feed() returns the cleaned sentences completed by a chunk and flush() what
+    is left once the stream ends; joined with single spaces they read as
+    clean_dialogue_response's output. Text is held back while an instruction
+    pattern that spans sentences (an echoed prompt or memory block) is still
+    open, and until the reply is long enough not to be replaced by a fallback.
+
+    The one thing a stream can't know in advance is that a later sentence
+    brings a memory/instruction keyword into a line whose earlier sentences
+    were already sent; the blocking cleaner drops that whole line. message()
+    is the whole reply cleaned exactly as clean_dialogue_response does, and
+    is what the stream should end with.
+    """
+
+    def __init__(self):
+        self._raw = []
+        self._buffer = ''
+        self._position = 0  # Where to look for the next sentence boundary in the buffer
+        self._checked = [0] * len(_SPANNING)  # Per spanning pattern, where its unchecked openers start
+        self._line_open = False  # Part of the current line was already cleaned
+        self._suppress_line = False
+        self._whitespace = ''  # Whitespace kept for the next sentence on this line
+        self._held = []  # Sentences waiting until the reply is long enough
+        self._released = False
+
+    def _can_cut(self, end):
+        """Whether every spanning pattern that starts before end also finishes before it"""
+        for index, (opener, regex) in enumerate(_SPANNING):
+            for match in opener.finditer(self._buffer, self._checked[index], end):
+                if regex.match(self._buffer, match.start(), end) is None:
+                    return False
+                # Finishes before this end, so before any later one too
+                self._checked[index] = match.start() + 1
+        return True
+
+    def _clean_piece(self, piece, line_ended):
+        """Cleaned text of one stretch of the current line, or None"""
+        if self._suppress_line:
+            return None
+        if _LINE_KEYWORDS.search(piece.lower()):
+            self._suppress_line = True
+            return None
+        text = self._whitespace + piece
+        if not self._line_open:
+            text = text.lstrip()
+        body = text.rstrip()
+        # Whitespace only belongs in the reply if more of the line follows
+        self._whitespace = '' if line_ended else text[len(body):]
+        if not body:
+            return None
+        if self._line_open and body.startswith(' '):
+            # Joining sentences with a space puts it back
+            body = body[1:]
+        self._line_open = True
+        return body
+
+    def _clean_segment(self, segment, final=False):
+        lines = strip_instructions(segment).split('\n')
+        cleaned = []
+        for index, piece in enumerate(lines):
+            if index:
+                self._line_open = self._suppress_line = False
+                self._whitespace = ''
+            text = self._clean_piece(piece, final or index < len(lines) - 1)
+            if text:
+                cleaned.append(text)
+        return cleaned
+
+    def _release(self, sentences):
+        if self._released:
+            return sentences
+        self._held.extend(sentences)
+        if len(' '.join(self._held)) <= MIN_RESPONSE_CHARS:
+            return []
+        self._released = True
+        sentences, self._held = self._held, []
+        return sentences
+
+    def feed(self, chunk):
+        self._raw.append(chunk)
+        self._buffer += chunk
+        sentences = []
+        while True:
+            match = SENTENCE_BOUNDARY.search(self._buffer, self._position)
+            if not match:
+                break
+            # Boundaries already found can't move, so later chunks resume after the last one
+            self._position = match.end()
+            if not self._can_cut(match.end()):
+                continue
+            segment, self._buffer = self._buffer[:match.end()], self._buffer[match.end():]
+            self._position = 0
+            self._checked = [0] * len(_SPANNING)
+            sentences.extend(self._clean_segment(segment))
+        return self._release(sentences)
+
+    def flush(self):
+        segment, self._buffer = self._buffer, ''
+        self._position = 0
+        self._checked = [0] * len(_SPANNING)
+        sentences = self._release(self._clean_segment(segment, final=True))
+        # Too short to send: the stream ends with a fallback response instead
+        return sentences if self._released else []
+
+    def message(self):
+        """The whole reply as clean_dialogue_response cleans it"""
+        return clean_dialogue_response(''.join(self._raw))
+
+
+def clean_dialogue_stream(chunks):
+    """Incrementally clean streamed LLM text, yielding cleaned sentences as they complete"""
+    cleaner = DialogueStreamCleaner()
+    for chunk in chunks:
+        yield from cleaner.feed(chunk)
+    yield from cleaner.flush()
@@ -0,0 +1,615 @@
+import copy
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# zstd is smaller and faster when installed; gzip is always available
+DEFAULT_ENCODING = 'zstd' if zstandard else 'gzip'
+
+
+class UnknownBaseSave(Exception):
+    """A delta save referred to a base save this player doesn't have"""
+
+
+class PatchError(ValueError):
+    """A JSON patch couldn't be applied"""
+
+
+def new_save_id(now=None):
+    """Unique save id that sorts in creation order, e.g. save_20250101_120000_000123_a1b2c3"""
+    now = now or datetime.now()
+    return f"save_{now.strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:6]}"
+
+
+def compress(raw, encoding):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(raw)
+    if encoding == 'gzip':
+        return gzip.compress(raw, compresslevel=6)
+    return raw
+
+
+def decompress(blob, encoding):
+    if encoding == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Save was written with zstd but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if encoding == 'gzip':
+        return gzip.decompress(blob)
+    return blob if isinstance(blob, bytes) else blob.encode()
+
+
+def _pointer_parts(pointer):
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise PatchError(f"Invalid JSON pointer '{pointer}'")
+    return [part.replace('~1', '/').replace('~0', '~') for part in pointer[1:].split('/')]
+
+
+def _escape(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _resolve_parent(document, pointer):
+    parts = _pointer_parts(pointer)
+    if not parts:
+        raise PatchError("Operations on the document root are not supported")
+    parent = document
+    for part in parts[:-1]:
+        try:
+            parent = parent[int(part)] if isinstance(parent, list) else parent[part]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise PatchError(f"Path '{pointer}' does not exist")
+    return parent, parts[-1]
+
+
+def _get(document, pointer):
+    parent, key = _resolve_parent(document, pointer)
+    try:
+        return parent[int(key)] if isinstance(parent, list) else parent[key]
+    except (KeyError, IndexError, ValueError, TypeError):
+        raise PatchError(f"Path '{pointer}' does not exist")
+
+
+def _add(document, pointer, value):
+    parent, key = _resolve_parent(document, pointer)
+    try:
+        if isinstance(parent, list):
+            if key == '-':
+                parent.append(value)
+            else:
+                parent.insert(int(key), value)
+        else:
+            parent[key] = value
+    except (ValueError, TypeError):
+        raise PatchError(f"Cannot add at '{pointer}'")
+
+
+def _remove(document, pointer):
+    parent, key = _resolve_parent(document, pointer)
+    try:
+        if isinstance(parent, list):
+            return parent.pop(int(key))
+        return parent.pop(key)
+    except (KeyError, IndexError, ValueError, TypeError, AttributeError):
+        raise PatchError(f"Path '{pointer}' does not exist")
+
+
+# Members each patch operation needs besides 'op' and 'path'
+_OPERATION_MEMBERS = {
+    'add': ('value',),
+    'remove': (),
+    'replace': ('value',),
+    'move': ('from',),
+    'copy': ('from',),
+    'test': ('value',)
+}
+
+
+def validate_patch(patch):
+    """Raise PatchError unless patch is a list of well-formed operations"""
+    if not isinstance(patch, list):
+        raise PatchError("Patch must be a list of operations")
+    for index, operation in enumerate(patch):
+        if not isinstance(operation, dict):
+            raise PatchError(f"Patch operation {index} must be an object")
+        op = operation.get('op')
+        if op not in _OPERATION_MEMBERS:
+            raise PatchError(f"Unknown patch operation '{op}'")
+        for member in ('path', *_OPERATION_MEMBERS[op]):
+            if member not in operation:
+                raise PatchError(f"Patch operation {index} ('{op}') is missing '{member}'")
+        for member in ('path', 'from'):
+            if member in operation and not isinstance(operation[member], str):
+                raise PatchError(f"Patch operation {index} ('{op}') has a non-string '{member}'")
+
+
+def apply_patch(document, patch):
+    """Apply an RFC 6902 JSON patch to document in place and return it.
+
+    The whole patch is validated first, so a malformed one leaves document untouched.
+    """
+    validate_patch(patch)
+    for operation in patch:
+        op = operation['op']
+        path = operation['path']
+        if op == 'add':
+            _add(document, path, operation['value'])
+        elif op == 'remove':
+            _remove(document, path)
+        elif op == 'replace':
+            _remove(document, path)
+            _add(document, path, operation['value'])
+        elif op == 'move':
+            _add(document, path, _remove(document, operation['from']))
+        elif op == 'copy':
+            _add(document, path, copy.deepcopy(_get(document, operation['from'])))
+        elif op == 'test':
+            if _get(document, path) != operation['value']:
+                raise PatchError(f"Test failed at '{path}'")
+    return document
+
+
+def make_patch(old, new, path=''):
+    """Minimal JSON patch turning old into new (objects are diffed key by key, lists by index)"""
+    if type(old) is not type(new):
+        return [{'op': 'replace', 'path': path, 'value': new}]
+    if isinstance(old, dict):
+        patch = []
+        for key in old:
+            if key not in new:
+                patch.append({'op': 'remove', 'path': f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            if key not in old:
+                patch.append({'op': 'add', 'path': f"{path}/{_escape(key)}", 'value': value})
+            else:
+                patch.extend(make_patch(old[key], value, f"{path}/{_escape(key)}"))
+        return patch
+    if isinstance(old, list):
+        patch = []
+        for index in range(min(len(old), len(new))):
+            patch.extend(make_patch(old[index], new[index], f"{path}/{index}"))
+        for index in range(len(old), len(new)):
+            patch.append({'op': 'add', 'path': f"{path}/{index}", 'value': new[index]})
+        # Remove from the end so earlier indexes stay valid
+        for index in range(len(old) - 1, len(new) - 1, -1):
+            patch.append({'op': 'remove', 'path': f"{path}/{index}"})
+        return patch
+    return [] if old == new else [{'op': 'replace', 'path': path, 'value': new}]
+
+
+class SaveStore:
+    """Save-game persistence with compressed snapshot + delta chains.
+
+    Saves belong to a player. A save is either a full snapshot or a JSON patch
+    against an earlier save of the same player; loading walks back to the
+    nearest snapshot and replays the patches. Once a chain is `compact_every`
+    deltas long the next save is written as a full snapshot instead, so a load
+    never replays more than that. Recently rebuilt states are cached, which
+    keeps the usual "delta against the latest save" pattern cheap.
+
+    Backends only store and fetch records. They keep them outside the process
+    so saves survive restarts and are shared by every worker, and must make
+    "latest save for a player" a cheap indexed lookup.
+    """
+
+    name = 'base'
+
+    def __init__(self, encoding=DEFAULT_ENCODING, compact_every=20, cache_size=128):
+        if encoding == 'zstd' and zstandard is None:
+            raise ValueError("zstd save compression needs the zstandard package")
+        self.encoding = encoding
+        self.compact_every = compact_every
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # (player_id, save_id) -> (state JSON, depth)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'full_saves': 0,
+            'delta_saves': 0,
+            'compactions': 0,
+            'stored_bytes': 0,
+            'snapshot_bytes': 0,  # What the same saves would take as uncompressed full JSON
+            'cache_hits': 0,
+            'patches_replayed': 0
+        }
+
+    # Backend primitives
+
+    def _put(self, player_id, record, blob):
+        raise NotImplementedError
+
+    def _get(self, player_id, save_id):
+        """Return (record, blob) or None"""
+        raise NotImplementedError
+
+    def _latest_id(self, player_id):
+        raise NotImplementedError
+
+    def list(self, player_id, limit=DEFAULT_PAGE_SIZE, before=None):
+        """Newest-first page of save metadata older than the `before` save_id.
+
+        Returns (saves, next_cursor); next_cursor is None on the last page.
+        """
+        raise NotImplementedError
+
+    def count(self, player_id=None):
+        raise NotImplementedError
+
+    # Snapshot/delta handling shared by all backends
+
+    def _remember(self, player_id, save_id, state_json, depth):
+        with self._stats_lock:
+            self._cache[(player_id, save_id)] = (state_json, depth)
+            self._cache.move_to_end((player_id, save_id))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cached(self, player_id, save_id):
+        with self._stats_lock:
+            entry = self._cache.get((player_id, save_id))
+            if entry is not None:
+                self._cache.move_to_end((player_id, save_id))
+                self._stats['cache_hits'] += 1
+            return entry
+
+    def _write(self, player_id, kind, payload_json, state_json, base_id=None, depth=0):
+        now = datetime.now()
+        blob = compress(payload_json.encode(), self.encoding)
+        record = {
+            'save_id': new_save_id(now),
+            'timestamp': now.isoformat(),
+            'kind': kind,
+            'base_id': base_id,
+            'depth': depth,
+            'encoding': self.encoding
+        }
+        self._put(player_id, record, blob)
+        self._remember(player_id, record['save_id'], state_json, depth)
+        with self._stats_lock:
+            self._stats[f'{kind}_saves'] += 1
+            self._stats['stored_bytes'] += len(blob)
+            self._stats['snapshot_bytes'] += len(state_json)
+        return {'save_id': record['save_id'], 'timestamp': record['timestamp'], 'kind': kind, 'size': len(blob)}
+
+    def _materialize(self, player_id, save_id):
+        """Rebuild the state of save_id; returns (record, state JSON, depth) or None"""
+        found = self._get(player_id, save_id)
+        if found is None:
+            return None
+        record = found[0]
+        cached = self._cached(player_id, save_id)
+        if cached is not None:
+            return record, cached[0], cached[1]
+
+        # Walk back to a snapshot (or a cached state), then replay the patches forward
+        patches = []
+        current, blob = found
+        while True:
+            cached = self._cached(player_id, current['save_id'])
+            if cached is not None:
+                state = json.loads(cached[0])
+                break
+            raw = decompress(blob, current['encoding'])
+            if current['kind'] == 'full':
+                state = json.loads(raw)
+                break
+            patches.append(json.loads(raw))
+            found = self._get(player_id, current['base_id'])
+            if found is None:
+                raise UnknownBaseSave(f"Save chain for {save_id} is broken at {current['base_id']}")
+            current, blob = found
+
+        for patch in reversed(patches):
+            apply_patch(state, patch)
+        with self._stats_lock:
+            self._stats['patches_replayed'] += len(patches)
+
+        state_json = json.dumps(state)
+        self._remember(player_id, save_id, state_json, record['depth'])
+        return record, state_json, record['depth']
+
+    def save(self, player_id, data):
+        """Store a full snapshot and return {'save_id', 'timestamp', 'kind', 'size'}"""
+        state_json = json.dumps(data)
+        return self._write(player_id, 'full', state_json, state_json)
+
+    def save_delta(self, player_id, base_save_id, patch):
+        """Store a JSON patch against base_save_id, compacting to a snapshot once the chain is long"""
+        base = self._materialize(player_id, base_save_id)
+        if base is None:
+            raise UnknownBaseSave(f"Unknown base save '{base_save_id}'")
+        _, base_json, base_depth = base
+        state_json = json.dumps(apply_patch(json.loads(base_json), patch))
+
+        if base_depth + 1 >= self.compact_every:
+            with self._stats_lock:
+                self._stats['compactions'] += 1
+            return self._write(player_id, 'full', state_json, state_json)
+        return self._write(player_id, 'delta', json.dumps(patch), state_json, base_save_id, base_depth + 1)
+
+    def load(self, player_id, save_id=None):
+        """Return {'save_id', 'timestamp', 'data'} for save_id (default: latest), or None"""
+        save_id = save_id or self._latest_id(player_id)
+        if not save_id:
+            return None
+        materialized = self._materialize(player_id, save_id)
+        if materialized is None:
+            return None
+        record, state_json, _ = materialized
+        return {'save_id': record['save_id'], 'timestamp': record['timestamp'], 'data': json.loads(state_json)}
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['cached_states'] = len(self._cache)
+        written = stats['full_saves'] + stats['delta_saves']
+        stats['bytes_per_save'] = round(stats['stored_bytes'] / written) if written else 0
+        stats['compression_ratio'] = round(stats['snapshot_bytes'] / stats['stored_bytes'], 2) if stats['stored_bytes'] else 0.0
+        stats['backend'] = self.name
+        stats['encoding'] = self.encoding
+        stats['compact_every'] = self.compact_every
+        return stats
+
+    def close(self):
+        pass
+
+
+class SQLiteSaveStore(SaveStore):
+    """Saves in one SQLite database in WAL mode.
+
+    WAL lets readers run alongside the writer, so several workers can share the
+    file. (player_id, save_id) is indexed and save ids sort by time, so latest
+    save and every page of the listing are index range scans.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, count_ttl=30.0, **options):
+        super().__init__(**options)
+        self.path = path
+        self.count_ttl = count_ttl
+        self._total = None  # (save count, monotonic time it was counted) for stats()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+        db = self._connect()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS saves (
+                save_id TEXT PRIMARY KEY,
+                player_id TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                data BLOB NOT NULL,
+                kind TEXT NOT NULL DEFAULT 'full',
+                base_id TEXT,
+                depth INTEGER NOT NULL DEFAULT 0,
+                encoding TEXT NOT NULL DEFAULT 'json'
+            )
+        """)
+        # Databases from before delta saves hold plain JSON snapshots only
+        columns = {row[1] for row in db.execute('PRAGMA table_info(saves)')}
+        for column, definition in (('kind', "TEXT NOT NULL DEFAULT 'full'"), ('base_id', 'TEXT'),
+                                   ('depth', 'INTEGER NOT NULL DEFAULT 0'), ('encoding', "TEXT NOT NULL DEFAULT 'json'")):
+            if column not in columns:
+                db.execute(f'ALTER TABLE saves ADD COLUMN {column} {definition}')
+        db.execute('CREATE INDEX IF NOT EXISTS saves_by_player ON saves (player_id, save_id)')
+        db.commit()
+
+    def _connect(self):
+        """One connection per thread; sqlite3 connections can't be shared safely"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute('PRAGMA synchronous=NORMAL')  # Durable enough with WAL, much faster commits
+            self._local.db = db
+            with self._lock:
+                self._connections.append(db)
+        return db
+
+    def _put(self, player_id, record, blob):
+        db = self._connect()
+        with db:
+            db.execute(
+                'INSERT INTO saves (save_id, player_id, created_at, data, kind, base_id, depth, encoding) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (record['save_id'], player_id, record['timestamp'], blob,
+                 record['kind'], record['base_id'], record['depth'], record['encoding'])
+            )
+        with self._lock:
+            if self._total is not None:
+                self._total = (self._total[0] + 1, self._total[1])
+
+    def _get(self, player_id, save_id):
+        row = self._connect().execute(
+            'SELECT save_id, created_at, kind, base_id, depth, encoding, data FROM saves '
+            'WHERE player_id = ? AND save_id = ?',
+            (player_id, save_id)
+        ).fetchone()
+        if row is None:
+            return None
+        record = {'save_id': row[0], 'timestamp': row[1], 'kind': row[2], 'base_id': row[3], 'depth': row[4], 'encoding': row[5]}
+        return record, row[6]
+
+    def _latest_id(self, player_id):
+        row = self._connect().execute(
+            'SELECT save_id FROM saves WHERE player_id = ? ORDER BY save_id DESC LIMIT 1',
+            (player_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def list(self, player_id, limit=DEFAULT_PAGE_SIZE, before=None):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query = 'SELECT save_id, created_at, kind, length(data) FROM saves WHERE player_id = ?'
+        params = [player_id]
+        if before:
+            query += ' AND save_id < ?'
+            params.append(before)
+        rows = self._connect().execute(query + ' ORDER BY save_id DESC LIMIT ?', params + [limit + 1]).fetchall()
+        saves = [{'save_id': row[0], 'timestamp': row[1], 'kind': row[2], 'size': row[3]} for row in rows[:limit]]
+        next_cursor = saves[-1]['save_id'] if len(rows) > limit else None
+        return saves, next_cursor
+
+    def count(self, player_id=None):
+        db = self._connect()
+        if player_id is None:
+            return db.execute('SELECT COUNT(*) FROM saves').fetchone()[0]
+        return db.execute('SELECT COUNT(*) FROM saves WHERE player_id = ?', (player_id,)).fetchone()[0]
+
+    def _total_count(self):
+        """Save count for stats(), recounted every count_ttl seconds.
+
+        COUNT(*) scans the whole table, too slow for every health check. Saves
+        made by this process are added in between; other workers' saves show up
+        at the next recount.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._total is not None and now - self._total[1] < self.count_ttl:
+                return self._total[0]
+        total = self.count()
+        with self._lock:
+            self._total = (total, now)
+        return total
+
+    def stats(self):
+        stats = super().stats()
+        stats['saves'] = self._total_count()
+        stats['path'] = self.path
+        return stats
+
+    def close(self):
+        with self._lock:
+            for db in self._connections:
+                db.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class FileSaveStore(SaveStore):
+    """One file per save under <directory>/<player>/.
+
+    A save file is a one-line JSON header followed by the compressed payload.
+    Each player directory keeps a LATEST pointer so loading the newest save
+    doesn't scan the directory; listing sorts that player's file names. Writes go
+    to a temp file and are renamed into place, so readers never see half a save.
+    """
+
+    name = 'file'
+
+    _UNSAFE = re.compile(r'[^A-Za-z0-9_.-]')
+    _EXTENSIONS = ('.save', '.json')  # .json: uncompressed snapshots from before delta saves
+
+    def __init__(self, directory, **options):
+        super().__init__(**options)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _player_dir(self, player_id):
+        return os.path.join(self.directory, self._UNSAFE.sub('_', player_id) or '_')
+
+    @staticmethod
+    def _write_atomic(path, content):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _put(self, player_id, record, blob):
+        player_dir = self._player_dir(player_id)
+        os.makedirs(player_dir, exist_ok=True)
+        header = json.dumps({key: value for key, value in record.items() if key != 'save_id'})
+        self._write_atomic(os.path.join(player_dir, f"{record['save_id']}.save"), header.encode() + b'\n' + blob)
+        self._write_atomic(os.path.join(player_dir, 'LATEST'), record['save_id'].encode())
+
+    def _get(self, player_id, save_id):
+        if not save_id or self._UNSAFE.search(save_id):
+            return None
+        player_dir = self._player_dir(player_id)
+        try:
+            with open(os.path.join(player_dir, f"{save_id}.save"), 'rb') as f:
+                header, blob = f.read().split(b'\n', 1)
+            return dict(json.loads(header), save_id=save_id), blob
+        except FileNotFoundError:
+            pass
+        try:
+            with open(os.path.join(player_dir, f"{save_id}.json")) as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return None
+        record = {'save_id': save_id, 'timestamp': stored['timestamp'], 'kind': 'full', 'base_id': None, 'depth': 0, 'encoding': 'json'}
+        return record, json.dumps(stored['data']).encode()
+
+    def _latest_id(self, player_id):
+        try:
+            with open(os.path.join(self._player_dir(player_id), 'LATEST')) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _save_files(self, player_id):
+        try:
+            names = os.listdir(self._player_dir(player_id))
+        except FileNotFoundError:
+            return []
+        return sorted((name for name in names if name.endswith(self._EXTENSIONS)), reverse=True)
+
+    def _kind(self, player_dir, name):
+        if name.endswith('.json'):
+            return 'full'
+        with open(os.path.join(player_dir, name), 'rb') as f:
+            return json.loads(f.readline())['kind']
+
+    def list(self, player_id, limit=DEFAULT_PAGE_SIZE, before=None):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        player_dir = self._player_dir(player_id)
+        names = [name for name in self._save_files(player_id) if not before or name.rsplit('.', 1)[0] < before]
+        saves = []
+        for name in names[:limit]:
+            save_id = name.rsplit('.', 1)[0]
+            saves.append({
+                'save_id': save_id,
+                'timestamp': datetime.strptime(save_id[5:27], '%Y%m%d_%H%M%S_%f').isoformat(),
+                'kind': self._kind(player_dir, name),
+                'size': os.path.getsize(os.path.join(player_dir, name))
+            })
+        next_cursor = saves[-1]['save_id'] if len(names) > limit else None
+        return saves, next_cursor
+
+    def count(self, player_id=None):
+        if player_id is not None:
+            return len(self._save_files(player_id))
+        return sum(len(self._save_files(name)) for name in os.listdir(self.directory))
+
+    def stats(self):
+        stats = super().stats()
+        stats['path'] = self.directory
+        return stats
+
+
+def create_save_store(backend, path, **options):
+    """Build the save store named by SAVE_BACKEND"""
+    if backend == 'sqlite':
+        return SQLiteSaveStore(path, **options)
+    if backend == 'file':
+        return FileSaveStore(path, **options)
+    raise ValueError(f"Unknown save backend '{backend}' (expected 'sqlite' or 'file')")
@@ -0,0 +1,221 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import threading
+import time
+
+from metrics import Histogram
+from ollama_client import OllamaUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Lower value = served first
+PRIORITY_DIALOGUE = 0
+PRIORITY_GENERATE_QUEST = 1
+PRIORITY_QUEST = 2
+PRIORITY_BACKGROUND = 3  # Work nobody is waiting for, e.g. quest pool refills
+
+PRIORITY_NAMES = {
+    PRIORITY_DIALOGUE: 'dialogue',
+    PRIORITY_GENERATE_QUEST: 'generate_quest',
+    PRIORITY_QUEST: 'quest',
+    PRIORITY_BACKGROUND: 'background'
+}
+
+
+class AdmissionRejected(OllamaUnavailable):
+    """Raised when a generation is shed instead of being sent upstream"""
+
+
+class QueueFull(AdmissionRejected):
+    """The generation queue is at capacity"""
+
+
+class QueueTimeout(AdmissionRejected):
+    """The request waited past its queue deadline"""
+
+
+class _Waiter:
+    __slots__ = ('priority', 'player_id', 'seq', 'enqueued_at', 'granted', 'wake')
+
+    def __init__(self, priority, player_id, seq):
+        self.priority = priority
+        self.player_id = player_id
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.wake = None
+
+
+class GenerationScheduler:
+    """Bounded priority queue with admission control in front of one upstream.
+
+    At most `max_concurrent` generations run at once. Waiting requests are
+    served by priority class, and within a class the player who was served
+    least recently goes next, so one chatty player can't starve the rest.
+    Requests still queued when their class deadline passes are shed with
+    QueueTimeout, and new requests are rejected with QueueFull once
+    `max_queue` are waiting; callers fall back instead of timing out.
+    """
+
+    def __init__(self, max_concurrent=1, max_queue=64, queue_timeouts=None):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeouts = queue_timeouts or {}
+
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._active = 0
+        self._seq = itertools.count()
+        self._grant_tick = itertools.count()
+        self._last_grant_by_player = {}
+        self._active_by_player = {}
+
+        self._wait_histograms = {name: Histogram() for name in PRIORITY_NAMES.values()}
+        self._stats = {
+            'admitted': 0,
+            'rejected_queue_full': 0,
+            'shed_deadline': 0,
+            'peak_queue_depth': 0
+        }
+
+    def _timeout_for(self, priority, timeout):
+        return timeout if timeout is not None else self.queue_timeouts.get(priority)
+
+    def _enqueue(self, priority, player_id):
+        """Grant immediately or register a waiter; caller must hold the lock"""
+        if self._active < self.max_concurrent and not self._waiters:
+            waiter = _Waiter(priority, player_id, next(self._seq))
+            self._grant(waiter)
+            return waiter
+
+        if len(self._waiters) >= self.max_queue:
+            self._stats['rejected_queue_full'] += 1
+            raise QueueFull(f"Generation queue full ({self.max_queue} waiting)")
+
+        waiter = _Waiter(priority, player_id, next(self._seq))
+        self._waiters.append(waiter)
+        self._stats['peak_queue_depth'] = max(self._stats['peak_queue_depth'], len(self._waiters))
+        return waiter
+
+    def _grant(self, waiter):
+        waiter.granted = True
+        self._active += 1
+        self._active_by_player[waiter.player_id] = self._active_by_player.get(waiter.player_id, 0) + 1
+        self._last_grant_by_player[waiter.player_id] = next(self._grant_tick)
+        self._stats['admitted'] += 1
+        self._wait_histograms[PRIORITY_NAMES.get(waiter.priority, 'quest')].observe(time.monotonic() - waiter.enqueued_at)
+
+    def _dispatch(self):
+        """Hand free slots to the best waiters; caller must hold the lock"""
+        while self._active < self.max_concurrent and self._waiters:
+            best = min(self._waiters, key=lambda w: (
+                w.priority,
+                self._active_by_player.get(w.player_id, 0),
+                self._last_grant_by_player.get(w.player_id, -1),
+                w.seq
+            ))
+            self._waiters.remove(best)
+            self._grant(best)
+            best.wake()
+
+    def _abandon(self, waiter, priority):
+        """Drop a waiter whose deadline passed; returns True if it was granted meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self._stats['shed_deadline'] += 1
+        logger.warning(f"Shedding {PRIORITY_NAMES.get(priority, priority)} generation after queue deadline")
+        return False
+
+    def release(self, waiter):
+        with self._lock:
+            self._active -= 1
+            remaining = self._active_by_player.get(waiter.player_id, 1) - 1
+            if remaining:
+                self._active_by_player[waiter.player_id] = remaining
+            else:
+                self._active_by_player.pop(waiter.player_id, None)
+            self._dispatch()
+
+    def acquire(self, priority, player_id=None, timeout=None):
+        """Block until a slot is granted; raises AdmissionRejected if shed"""
+        timeout = self._timeout_for(priority, timeout)
+        event = threading.Event()
+        with self._lock:
+            waiter = self._enqueue(priority, player_id)
+            waiter.wake = event.set
+        if waiter.granted:
+            return waiter
+
+        if not event.wait(timeout) and not self._abandon(waiter, priority):
+            raise QueueTimeout(f"Waited more than {timeout}s for a generation slot")
+        return waiter
+
+    def try_acquire(self, priority=PRIORITY_BACKGROUND, player_id=None):
+        """Take a slot only if the upstream is idle (nothing running or queued), else return None"""
+        with self._lock:
+            if self._active or self._waiters:
+                return None
+            waiter = _Waiter(priority, player_id, next(self._seq))
+            self._grant(waiter)
+            return waiter
+
+    async def acquire_async(self, priority, player_id=None, timeout=None):
+        """asyncio version of acquire()"""
+        timeout = self._timeout_for(priority, timeout)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+        with self._lock:
+            waiter = self._enqueue(priority, player_id)
+            waiter.wake = wake
+        if waiter.granted:
+            return waiter
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter, priority):
+                raise QueueTimeout(f"Waited more than {timeout}s for a generation slot")
+        except asyncio.CancelledError:
+            if self._abandon(waiter, priority):
+                self.release(waiter)
+            raise
+        return waiter
+
+    @contextlib.contextmanager
+    def slot(self, priority, player_id=None, timeout=None):
+        waiter = self.acquire(priority, player_id, timeout)
+        try:
+            yield
+        finally:
+            self.release(waiter)
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self, priority, player_id=None, timeout=None):
+        waiter = await self.acquire_async(priority, player_id, timeout)
+        try:
+            yield
+        finally:
+            self.release(waiter)
+
+    def stats(self):
+        """Queue depth, admission counters and wait-time histograms per priority class"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['active'] = self._active
+            stats['queue_depth'] = len(self._waiters)
+            depth_by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+            for waiter in self._waiters:
+                depth_by_priority[PRIORITY_NAMES.get(waiter.priority, 'quest')] += 1
+        stats['queue_depth_by_priority'] = depth_by_priority
+        stats['max_concurrent'] = self.max_concurrent
+        stats['max_queue'] = self.max_queue
+        stats['wait_seconds'] = {name: hist.snapshot() for name, hist in self._wait_histograms.items()}
+        return stats
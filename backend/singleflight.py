@@ -0,0 +1,97 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """One in-flight upstream call that any number of callers can wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent identical calls into a single upstream call.
+
+    The first caller for a key (the leader) runs the function; callers arriving
+    with the same key while it is running wait for, and share, its result or
+    exception. Works across threads via do() and across asyncio tasks via
+    do_async().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self._stats = {
+            'upstream_calls': 0,
+            'coalesced': 0
+        }
+
+    def do(self, key, fn):
+        """Run fn() once for all threads currently asking for key"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['upstream_calls'] += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def do_async(self, key, coro_fn):
+        """Await coro_fn() once for all tasks currently asking for key.
+
+        The shared call runs as its own task and every caller, leader included,
+        awaits it through shield(), so cancelling any one caller (say its client
+        disconnected) leaves the call running for the others.
+        """
+        with self._lock:
+            task = self._async_calls.get(key)
+            if task is not None:
+                self._stats['coalesced'] += 1
+            else:
+                task = asyncio.ensure_future(coro_fn())
+                self._async_calls[key] = task
+                self._stats['upstream_calls'] += 1
+                task.add_done_callback(lambda done: self._finish_async(key, done))
+        return await asyncio.shield(task)
+
+    def _finish_async(self, key, task):
+        with self._lock:
+            if self._async_calls.get(key) is task:
+                del self._async_calls[key]
+        if not task.cancelled():
+            # Every caller may have been cancelled; mark the exception as retrieved
+            task.exception()
+
+    def stats(self):
+        """Upstream calls made vs. calls saved by coalescing"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls) + len(self._async_calls)
+        total = stats['upstream_calls'] + stats['coalesced']
+        stats['saved_ratio'] = round(stats['coalesced'] / total, 3) if total else 0.0
+        return stats
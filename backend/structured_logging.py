@@ -0,0 +1,182 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import uuid
+import zlib
+from datetime import datetime
+
+# Set per request so every record can be tied back to the request that caused it
+request_id = contextvars.ContextVar('request_id', default='-')
+
+# Attributes every LogRecord has; anything else was passed in `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'context'}
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+
+def record_fields(record):
+    """Structured fields passed as logger.info(msg, extra={...})"""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the request id and any other per-request context variables.
+
+    Runs on the QueueHandler, i.e. in the thread that logged, because context
+    variables aren't visible from the listener thread.
+    """
+
+    def __init__(self, context_vars):
+        super().__init__()
+        self.context_vars = context_vars
+
+    def filter(self, record):
+        record.context = {name: var.get() for name, var in self.context_vars.items()}
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, ids and extra fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            **getattr(record, 'context', {})
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """The old human-readable format, with any structured fields appended"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(levelname)s - %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += ' ' + json.dumps(fields, default=str, ensure_ascii=False)
+        return line
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the record intact for the structured formatter.
+
+    The stock prepare() formats the message and drops exc_info, which would
+    lose the traceback and fold the extra fields into a string.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class BodySampler:
+    """Decides whether a request's prompt/response bodies get logged.
+
+    The decision is a hash of the request id, so the prompt and the response of
+    one request are either both logged or both skipped.
+    """
+
+    def __init__(self, rate):
+        self.rate = max(0.0, min(1.0, rate))
+
+    def sampled(self):
+        if self.rate >= 1.0:
+            return True
+        if self.rate <= 0.0:
+            return False
+        return zlib.crc32(request_id.get().encode()) % 10000 < self.rate * 10000
+
+
+def setup_logging(log_dir='logs', filename='ollama_interactions.log', level='INFO',
+                  max_bytes=50 * 1024 * 1024, backup_count=5, console=True, context_vars=None, logger_name=None):
+    """Route all logging through a queue to a background writer thread.
+
+    Callers only pay for putting the record on a queue; formatting and disk I/O
+    happen on the QueueListener's thread. The file gets JSON lines, stamped with
+    the request id and `context_vars`, and is rotated by size. Configures the
+    root logger unless `logger_name` is given. Returns the listener, which is
+    stopped at exit.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, filename), maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(ConsoleFormatter())
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter({'request_id': request_id, **(context_vars or {})}))
+
+    target = logging.getLogger(logger_name)
+    for handler in list(target.handlers):
+        target.removeHandler(handler)
+    target.addHandler(queue_handler)
+    target.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_listener, listener)
+    return listener
+
+
+def _file_handler(listener):
+    return next(h for h in listener.handlers if isinstance(h, logging.handlers.RotatingFileHandler))
+
+
+def log_files(listener):
+    """The active log file followed by its rotated backups that exist"""
+    handler = _file_handler(listener)
+    paths = [handler.baseFilename] + [f"{handler.baseFilename}.{i}" for i in range(1, handler.backupCount + 1)]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def rotate_log_files(listener):
+    """Start a new log file now, keeping the current one as the first backup"""
+    handler = _file_handler(listener)
+    # The handler lock keeps the listener thread from writing mid-rotation
+    with handler.lock:
+        handler.doRollover()
+
+
+def clear_log_files(listener):
+    """Empty the active log file and delete its backups"""
+    handler = _file_handler(listener)
+    with handler.lock:
+        if handler.stream:
+            handler.stream.seek(0)
+            handler.stream.truncate()
+        for path in log_files(listener)[1:]:
+            os.remove(path)
+
+
+def stop_listener(listener):
+    """Flush and stop a listener; safe to call more than once"""
+    if listener._thread is not None:
+        listener.stop()
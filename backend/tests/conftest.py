@@ -0,0 +1,98 @@
+"""Shared fixtures: fake Ollama servers, and the app configured against one.
+
+Backend modules import each other by bare name, so backend/ is put on the path
+the same way running `python backend/app.py` does.
+"""
+import os
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_ollama  # noqa: E402
+
+# What the shared fake goes back to before each test that uses the app
+FAKE_DEFAULTS = {'first_token_ms': 0.0, 'tokens_per_sec': 0.0, 'fail_rate': 0.0, 'fail_status': 503,
+                 'fail_first': 0, 'stream_error_after': None}
+
+
+def start_fake(**options):
+    """A fake Ollama on a free port; returns (url, server, fake)"""
+    server, fake = fake_ollama.start(**{**FAKE_DEFAULTS, **options})
+    return f"http://127.0.0.1:{server.server_address[1]}", server, fake
+
+
+def stop_fake(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_server():
+    """start(**options) -> (url, fake); every server started is stopped after the test"""
+    servers = []
+
+    def start(**options):
+        url, server, fake = start_fake(**options)
+        servers.append(server)
+        return url, fake
+
+    yield start
+    for server in servers:
+        stop_fake(server)
+
+
+@pytest.fixture
+def closed_port_url():
+    """A URL nothing listens on, so connecting is refused"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture(scope='session')
+def app_ollama():
+    url, server, fake = start_fake()
+    yield url, fake
+    stop_fake(server)
+
+
+@pytest.fixture(scope='session')
+def game(app_ollama, tmp_path_factory):
+    """The app module, imported once with its state under a temp dir and Ollama pointed at the shared fake"""
+    workdir = tmp_path_factory.mktemp('backend')
+    os.environ.update({
+        'OLLAMA_URL': app_ollama[0],
+        'OLLAMA_PROBE_INTERVAL': '0',
+        'OLLAMA_MAX_RETRIES': '0',
+        'DATA_DIR': str(workdir),
+        'SAVE_BACKEND': 'sqlite',
+        'LLM_CACHE_ENABLED': 'false',
+        'QUEST_POOL_ENABLED': 'false',
+        'QUEST_SPECULATION_ENABLED': 'false'
+    })
+    import app
+    return app
+
+
+@pytest.fixture
+def upstream(game, app_ollama):
+    """The fake behind the app, reset to healthy defaults with every circuit breaker closed"""
+    fake = app_ollama[1]
+    for name, value in FAKE_DEFAULTS.items():
+        setattr(fake, name, value)
+    fake.reset_stats()
+    for client in game.ollama_client.clients.values():
+        client.breaker.record_success()
+    return fake
+
+
+@pytest.fixture
+def client(game, request):
+    """A Flask test client whose requests come from a player unique to the test"""
+    test_client = game.app.test_client()
+    test_client.environ_base['HTTP_X_PLAYER_ID'] = request.node.name
+    return test_client
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+NPC = 'Commander Sarah Chen'
+
+
+@pytest.fixture
+def asgi_client(game, upstream, request):
+    import asgi
+    with TestClient(asgi.asgi_app, headers={'X-Player-Id': request.node.name}) as test_client:
+        yield test_client
+
+
+def test_dialogue_stream_route(asgi_client, upstream, monkeypatch):
+    text = "Welcome back to the outpost! The reactor's been humming along nicely."
+    monkeypatch.setattr(upstream, 'reply', lambda prompt, structured: text)
+    with asgi_client.stream('POST', '/api/dialogue/stream', json={'npc_name': NPC, 'player_message': 'Hello', 'npc_id': 'commander_sarah'}) as response:
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('application/x-ndjson')
+        events = [json.loads(line) for line in response.iter_lines() if line]
+    assert [event['type'] for event in events] == ['chunk', 'chunk', 'done']
+    assert events[0]['text'] == 'Welcome back to the outpost!'
+    assert events[-1]['message'] == text and events[-1]['fallback'] is False
+    assert all(event['npc_id'] == 'commander_sarah' for event in events)
+
+
+def test_dialogue_stream_route_falls_back(game, asgi_client, upstream):
+    upstream.stream_error_after = 1
+    with asgi_client.stream('POST', '/api/dialogue/stream', json={'npc_name': NPC, 'player_message': 'Hello'}) as response:
+        events = [json.loads(line) for line in response.iter_lines() if line]
+    fallback = game.get_fallback_dialogue_response(NPC)
+    assert events[0] == {'type': 'chunk', 'text': fallback, 'npc_id': None}
+    assert events[-1]['fallback'] is True
+
+
+def test_saves_ignores_a_malformed_limit(asgi_client):
+    response = asgi_client.get('/api/saves?limit=abc')
+    assert response.status_code == 200
+    assert response.json()['success'] is True
+
+
+def test_logs_route(game, asgi_client):
+    game.logger.warning('asgi log route check')
+    response = asgi_client.get('/api/logs?n=abc')
+    assert response.status_code == 200
+    body = response.json()
+    assert body['success'] is True and isinstance(body['logs'], list)
+    assert asgi_client.get('/api/logs?level=WARNING').json()['success'] is True
@@ -0,0 +1,72 @@
+import contextvars
+
+from dialogue_sessions import DialogueSessionStore
+from npc_memory import NPCMemoryStore
+
+NPC = 'Trader Eliza Thompson'
+
+
+def test_memory_block_can_leave_out_recent_exchanges():
+    store = NPCMemoryStore()
+    store.add_memory('p1', NPC, 'trade', 'Player sold iron ore', None, 5)
+    store.record_exchange('p1', NPC, 'Got any ore?', 'Plenty, for a price.')
+
+    full = store.build_context('p1', NPC, 'ore')
+    assert 'RECENT CONVERSATION CONTEXT' in full and 'Plenty, for a price.' in full
+
+    without_recent = store.build_context('p1', NPC, 'ore', include_recent=False)
+    assert 'RECENT CONVERSATION CONTEXT' not in without_recent
+    assert 'Player sold iron ore' in without_recent
+
+
+def test_session_history_is_reported_per_mode():
+    chat = DialogueSessionStore('chat')
+    payload, turn = chat.build(('p1', NPC), 'model', 'system', 'Hello', {})
+    assert not chat.has_history(('p1', NPC))
+    chat.record(turn, {}, 'Hi there.')
+    assert chat.has_history(('p1', NPC))
+
+    generate = DialogueSessionStore('generate')
+    payload, turn = generate.build(('p1', NPC), 'model', 'system', 'Hello', {})
+    generate.record(turn, {}, 'Hi there.')
+    assert not generate.has_history(('p1', NPC))
+
+
+def test_chat_turns_do_not_repeat_the_last_exchange(game, upstream, client, request):
+    assert game.DIALOGUE_API == 'chat'
+    player_id = request.node.name
+    body = client.post('/api/dialogue', json={'npc_name': NPC, 'player_message': 'Got any ore?'}).get_json()
+    assert body['success'] is True
+
+    def next_payload():
+        context = contextvars.copy_context()
+        context.run(game.current_player_id.set, player_id)
+        payload, turn = context.run(game.build_dialogue_payload, NPC, None, None, None, None, 'How much?', {}, '')
+        return payload
+
+    # The previous exchange is in the chat history, and only there
+    payload = next_payload()
+    history = payload['messages'][1:-1]
+    assert [message['role'] for message in history] == ['user', 'assistant']
+    assert history[1]['content'] == body['message']
+    assert body['message'] not in payload['messages'][-1]['content']
+
+    # Without a session the memory block is the only place the last exchange appears
+    game.dialogue_sessions.clear(player_id, NPC)
+    payload = next_payload()
+    assert len(payload['messages']) == 2
+    assert 'RECENT CONVERSATION CONTEXT' in payload['messages'][-1]['content']
+    assert body['message'] in payload['messages'][-1]['content']
+
+
+def test_dialogue_replies_are_capped_with_num_predict(game, upstream, monkeypatch):
+    # Ollama ignores an unknown `max_tokens` option; `num_predict` is the one it honours
+    payload, turn = game.build_dialogue_payload(NPC, None, None, None, None, 'Hello', {}, '')
+    assert payload['options']['num_predict'] == game.DIALOGUE_MAX_TOKENS
+    assert 'max_tokens' not in payload['options']
+
+    seen = []
+    tokens = upstream.tokens
+    monkeypatch.setattr(upstream, 'tokens', lambda text, limit=None: seen.append(limit) or tokens(text, limit))
+    game.ollama_client.generate(payload)
+    assert seen == [game.DIALOGUE_MAX_TOKENS]
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from response_cleaner import clean_dialogue_response
+
+NPC = 'Commander Sarah Chen'
+
+TWO_SENTENCES = "Welcome back to the outpost! The reactor's been humming along nicely since you fixed it."
+
+# Replies as models actually send them, echoed labels and memory lines included
+REPLIES = [
+    TWO_SENTENCES,
+    "Response: Stay out of the lower decks. They flooded last night.",
+    "Sure thing, friend.\nTRUST: 5\nCome back tomorrow and I'll have your parts.",
+    "Keep responses under three sentences. I've got work to do, so make it quick.",
+    "The scouts saw lights past the ridge... Nobody knows what they are. Be careful out there!",
+    "=== NPC MEMORY CONTEXT ===\nPlayer: asked about ore\n=== END MEMORY CONTEXT ===\nI remember you asked about ore. Check the mine.",
+]
+
+
+@pytest.fixture
+def reply(upstream, monkeypatch):
+    """Make the fake answer every prompt with the given text"""
+    def set_reply(text):
+        monkeypatch.setattr(upstream, 'reply', lambda prompt, structured: text)
+    return set_reply
+
+
+def stream_dialogue(client, message='Hello', **fields):
+    """POST /api/dialogue/stream without buffering; returns the response and an iterator over its events"""
+    response = client.post('/api/dialogue/stream', json={'npc_name': NPC, 'player_message': message, **fields}, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = (line for chunk in response.response for line in chunk.decode().splitlines() if line)
+    return response, (json.loads(line) for line in lines)
+
+
+def test_first_sentence_arrives_while_ollama_is_still_generating(client, upstream, reply):
+    reply(TWO_SENTENCES)
+    upstream.tokens_per_sec = 40
+    total_tokens = len(upstream.tokens(TWO_SENTENCES))
+
+    response, events = stream_dialogue(client)
+    first = next(events)
+    assert first == {'type': 'chunk', 'text': 'Welcome back to the outpost!', 'npc_id': None}
+    # The rest of the reply hasn't been generated yet
+    assert upstream.stats()['tokens'] < total_tokens
+
+    rest = list(events)
+    response.close()
+    assert [event['type'] for event in rest] == ['chunk', 'done']
+    done = rest[-1]
+    assert done['message'] == TWO_SENTENCES and done['fallback'] is False
+    assert done['first_chunk_ms'] is not None
+
+
+@pytest.mark.parametrize('text', REPLIES)
+def test_streamed_text_matches_blocking_cleanup(client, upstream, reply, text):
+    reply(text)
+    response, events = stream_dialogue(client)
+    events = list(events)
+    response.close()
+    chunks = [event['text'] for event in events if event['type'] == 'chunk']
+    assert events[-1]['type'] == 'done'
+    assert events[-1]['message'] == ' '.join(chunks) == clean_dialogue_response(text)
+
+    # The blocking endpoint cleans the same reply the same way
+    blocking = client.post('/api/dialogue', json={'npc_name': NPC, 'player_message': 'Hello again'}).get_json()
+    assert blocking['message'] == events[-1]['message']
+
+
+def test_upstream_error_midstream_keeps_what_was_sent(client, upstream, reply):
+    reply(TWO_SENTENCES)
+    # Break off partway through the second sentence
+    upstream.stream_error_after = len(upstream.tokens("Welcome back to the outpost! The reactor's"))
+
+    response, events = stream_dialogue(client)
+    events = list(events)
+    response.close()
+    assert upstream.stats()['stream_errors'] == 1
+    assert [event['type'] for event in events] == ['chunk', 'done']
+    assert events[0]['text'] == 'Welcome back to the outpost!'
+    assert events[1]['message'] == 'Welcome back to the outpost!'
+    assert events[1]['fallback'] is True
+
+
+def test_upstream_error_before_any_sentence_sends_fallback(game, client, upstream, reply):
+    reply(TWO_SENTENCES)
+    upstream.stream_error_after = 2
+
+    response, events = stream_dialogue(client)
+    events = list(events)
+    response.close()
+    fallback = game.get_fallback_dialogue_response(NPC)
+    assert events[0] == {'type': 'chunk', 'text': fallback, 'npc_id': None}
+    assert events[-1]['message'] == fallback and events[-1]['fallback'] is True
+
+
+def test_upstream_down_sends_fallback_as_one_chunk(game, client, upstream):
+    upstream.fail_rate, upstream.fail_status = 1.0, 503
+
+    response, events = stream_dialogue(client, npc_id='commander_sarah')
+    events = list(events)
+    response.close()
+    fallback = game.get_fallback_dialogue_response(NPC)
+    assert events == [
+        {'type': 'chunk', 'text': fallback, 'npc_id': 'commander_sarah'},
+        {**events[-1], 'type': 'done', 'message': fallback, 'fallback': True}
+    ]
@@ -0,0 +1,100 @@
+import json
+import types
+
+import pytest
+
+import generation_cache
+from generation_cache import GenerationCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces time.time in generation_cache with a clock the test moves by hand"""
+    clock = types.SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(generation_cache, 'time', types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def test_key_ignores_whitespace_and_case_but_not_model_or_options():
+    key = GenerationCache.make_key('Hello  there\n', 'llama2', {'temperature': 0.7})
+    assert GenerationCache.make_key('hello there', 'llama2', {'temperature': 0.7}) == key
+    assert GenerationCache.make_key('hello there', 'phi3', {'temperature': 0.7}) != key
+    assert GenerationCache.make_key('hello there', 'llama2', {'temperature': 0.9}) != key
+
+
+def test_misses_until_every_variant_is_collected():
+    cache = GenerationCache(variants_per_key=3)
+    for reply in ['one', 'two']:
+        cache.put('key', reply)
+        assert cache.get('key') is None
+    cache.put('key', 'three')
+    assert {cache.get('key') for _ in range(50)} == {'one', 'two', 'three'}
+
+    # A full key replaces its oldest variant instead of growing
+    cache.put('key', 'four')
+    assert {cache.get('key') for _ in range(50)} == {'two', 'three', 'four'}
+    stats = cache.stats()
+    assert stats['misses'] == 2 and stats['hits'] == 100 and stats['entries'] == 1
+    assert stats['bytes'] == sum(len(json.dumps(reply)) for reply in ['two', 'three', 'four'])
+
+
+def test_least_recently_used_key_is_evicted():
+    cache = GenerationCache(max_entries=2)
+    cache.put('a', 'reply a')
+    cache.put('b', 'reply b')
+    assert cache.get('a') == 'reply a'
+    cache.put('c', 'reply c')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'reply a' and cache.get('c') == 'reply c'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_byte_budget_evicts_and_oversized_values_are_skipped():
+    cache = GenerationCache(max_bytes=30)
+    cache.put('a', 'x' * 10)
+    cache.put('b', 'y' * 10)
+    cache.put('c', 'z' * 10)
+    assert cache.get('a') is None and cache.get('c') == 'z' * 10
+    assert cache.stats()['bytes'] <= 30
+
+    cache.put('huge', 'w' * 100)
+    assert cache.get('huge') is None
+    assert cache.get('c') == 'z' * 10
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = GenerationCache(ttl_seconds=60)
+    cache.put('key', 'reply')
+    clock.now += 60
+    assert cache.get('key') == 'reply'
+    clock.now += 1
+    assert cache.get('key') is None
+    stats = cache.stats()
+    assert stats['expirations'] == 1 and stats['entries'] == 0 and stats['bytes'] == 0
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / 'generations.db')
+    cache = GenerationCache(variants_per_key=2, disk_path=path)
+    cache.put('key', 'one')
+    cache.put('key', 'two')
+    cache.put('partial', 'only')
+
+    reopened = GenerationCache(variants_per_key=2, disk_path=path)
+    assert {reopened.get('key') for _ in range(30)} == {'one', 'two'}
+    assert reopened.get('partial') is None
+    stats = reopened.stats()
+    assert stats['disk_hits'] == 2 and stats['entries'] == 2 and stats['disk_tier'] is True
+
+    reopened.clear()
+    assert GenerationCache(variants_per_key=2, disk_path=path).get('key') is None
+
+
+def test_expired_disk_entries_are_deleted(tmp_path, clock):
+    path = str(tmp_path / 'generations.db')
+    GenerationCache(ttl_seconds=60, disk_path=path).put('key', 'reply')
+    clock.now += 61
+    reopened = GenerationCache(ttl_seconds=60, disk_path=path)
+    assert reopened.get('key') is None
+    assert reopened.stats()['expirations'] == 1
+    assert reopened._db.execute('SELECT COUNT(*) FROM generations').fetchone()[0] == 0
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+import log_reader
+import structured_logging
+from log_reader import CursorExpired
+
+
+def write_lines(path, messages, mode='a', ts='2025-01-01T00:00:00'):
+    with open(path, mode) as f:
+        for index, (level, msg) in enumerate(messages):
+            f.write(json.dumps({'ts': f"{ts}.{index:06d}", 'level': level, 'msg': msg}) + '\n')
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / 'game.log'
+    write_lines(path, [('INFO', f'line {index}') for index in range(10)], mode='w')
+    return str(path)
+
+
+def test_cursor_pages_into_the_past(log_file):
+    lines, cursor = log_reader.tail(log_file, n=4)
+    assert [json.loads(line)['msg'] for line in lines] == ['line 6', 'line 7', 'line 8', 'line 9']
+    lines, cursor = log_reader.tail(log_file, n=4, cursor=cursor)
+    assert [json.loads(line)['msg'] for line in lines] == ['line 2', 'line 3', 'line 4', 'line 5']
+
+
+def test_cursor_expires_when_the_file_is_cleared_in_place(log_file):
+    _, cursor = log_reader.tail(log_file, n=2)
+    # Same inode, like clear_log_files: truncate, then keep writing past the old offset
+    with open(log_file, 'r+') as f:
+        f.truncate(0)
+    write_lines(log_file, [('INFO', f'after clear {index}') for index in range(20)], ts='2025-01-02T00:00:00')
+    with pytest.raises(CursorExpired):
+        log_reader.tail(log_file, n=2, cursor=cursor)
+
+
+def test_cursor_past_the_end_expires(log_file):
+    _, cursor = log_reader.tail(log_file, n=2)
+    identity = cursor.split(':')[0]
+    with pytest.raises(CursorExpired):
+        log_reader.tail(log_file, cursor=f"{identity}:{10 ** 9}")
+
+
+def test_cursor_survives_appends(log_file):
+    _, cursor = log_reader.tail(log_file, n=2)
+    write_lines(log_file, [('INFO', 'appended')], ts='2025-01-01T00:00:01')
+    lines, _ = log_reader.tail(log_file, n=1, cursor=cursor)
+    assert json.loads(lines[0])['msg'] == 'line 7'
+
+
+def test_unknown_levels_count_as_info(log_file):
+    write_lines(log_file, [('TRACE', 'custom level'), (5, 'numeric level'), ('ERROR', 'an error')], ts='2025-01-01T00:00:01')
+    lines, _ = log_reader.tail(log_file, n=10, level='INFO')
+    assert [json.loads(line)['msg'] for line in lines][-3:] == ['custom level', 'numeric level', 'an error']
+    lines, _ = log_reader.tail(log_file, n=10, level='warning')
+    assert [json.loads(line)['msg'] for line in lines] == ['an error']
+
+
+def test_unknown_filter_level_is_rejected(log_file):
+    with pytest.raises(ValueError):
+        log_reader.tail(log_file, level='LOUD')
+
+
+def test_app_returns_410_for_a_cursor_from_before_a_clear(game, client):
+    handler = structured_logging._file_handler(game.log_listener)
+    log_file = handler.baseFilename
+    with handler.lock:
+        write_lines(log_file, [('INFO', f'before clear {index}') for index in range(5)])
+    cursor = client.get('/api/logs?n=2').get_json()['next_cursor']
+    assert cursor
+
+    assert client.post('/api/logs/clear').get_json()['success'] is True
+    with handler.lock:
+        write_lines(log_file, [('INFO', f'after clear {index}') for index in range(50)], ts='2025-01-02T00:00:00')
+    response = client.get(f'/api/logs?cursor={cursor}')
+    assert response.status_code == 410
+    assert client.get('/api/logs?level=WARNING').status_code == 200
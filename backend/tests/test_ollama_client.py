@@ -0,0 +1,288 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+import requests
+
+import fake_ollama
+import ollama_client
+from ollama_client import AsyncOllamaClient, CircuitBreaker, OllamaClient, OllamaError, OllamaUnavailable
+
+PAYLOAD = {'model': 'llama2-uncensored', 'prompt': 'Hello there', 'stream': False}
+
+
+def make_client(url, **options):
+    options = {'max_retries': 2, 'backoff_factor': 0.01, 'failure_threshold': 3, 'reset_timeout': 0.2, **options}
+    return OllamaClient(url, **options)
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """The retry attempts backoff delays were computed for, with the delays themselves kept tiny"""
+    attempts = []
+    original = ollama_client.backoff_delay
+
+    def delay(backoff_factor, attempt):
+        attempts.append(attempt)
+        return original(backoff_factor, attempt)
+
+    monkeypatch.setattr(ollama_client, 'backoff_delay', delay)
+    return attempts
+
+
+def test_generate_returns_body(fake_server):
+    url, fake = fake_server()
+    client = make_client(url)
+    body = client.generate(PAYLOAD)
+    assert body['response'] in fake_ollama.DIALOGUE_REPLIES
+    assert body['done'] is True
+    stats = client.stats()
+    assert stats['successes'] == 1 and stats['failures'] == 0 and stats['in_flight'] == 0
+
+
+def test_backoff_grows_exponentially_with_jitter():
+    for attempt in (1, 2, 3, 4):
+        ceiling = 0.5 * 2 ** (attempt - 1)
+        for _ in range(20):
+            assert ceiling / 2 <= ollama_client.backoff_delay(0.5, attempt) <= ceiling
+
+
+def test_retries_5xx_with_backoff_then_succeeds(fake_server, backoffs):
+    url, fake = fake_server(fail_first=2, fail_status=503)
+    client = make_client(url)
+    assert client.generate(PAYLOAD)['done'] is True
+    assert backoffs == [1, 2]
+    assert fake.stats()['requests'] == 3
+    stats = client.stats()
+    assert stats['retries'] == 2 and stats['successes'] == 1
+    assert client.breaker.snapshot()['consecutive_failures'] == 0
+
+
+def test_gives_up_after_max_retries(fake_server, backoffs):
+    url, fake = fake_server(fail_rate=1.0, fail_status=503)
+    client = make_client(url)
+    with pytest.raises(OllamaError) as error:
+        client.generate(PAYLOAD)
+    assert error.value.status_code == 503
+    assert backoffs == [1, 2]
+    assert fake.stats()['requests'] == 3
+    assert client.stats()['failures'] == 1
+
+
+def test_non_retryable_5xx_fails_at_once(fake_server, backoffs):
+    url, fake = fake_server(fail_rate=1.0, fail_status=500)
+    client = make_client(url)
+    with pytest.raises(OllamaError) as error:
+        client.generate(PAYLOAD)
+    assert error.value.status_code == 500
+    assert backoffs == []
+    assert client.breaker.snapshot()['consecutive_failures'] == 1
+
+
+def test_connection_errors_are_retried(closed_port_url, backoffs):
+    client = make_client(closed_port_url)
+    with pytest.raises(OllamaError, match='Could not connect'):
+        client.generate(PAYLOAD)
+    assert backoffs == [1, 2]
+    assert client.stats()['retries'] == 2
+    assert client.breaker.snapshot()['consecutive_failures'] == 1
+
+
+def test_read_timeout_is_not_retried(fake_server, backoffs):
+    url, fake = fake_server(first_token_ms=500)
+    client = make_client(url, read_timeout=0.1)
+    with pytest.raises(OllamaError, match='Timed out'):
+        client.generate(PAYLOAD)
+    assert backoffs == []
+    stats = client.stats()
+    assert stats['timeouts'] == 1 and stats['failures'] == 1
+
+
+def test_connect_timeout_is_retried(fake_server, backoffs, monkeypatch):
+    url, fake = fake_server()
+    client = make_client(url)
+    post = client.session.post
+    calls = []
+
+    def flaky_post(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise requests.exceptions.ConnectTimeout('connect timed out')
+        return post(*args, **kwargs)
+
+    monkeypatch.setattr(client.session, 'post', flaky_post)
+    assert client.generate(PAYLOAD)['done'] is True
+    assert backoffs == [1]
+    stats = client.stats()
+    assert stats['timeouts'] == 1 and stats['retries'] == 1 and stats['successes'] == 1
+
+
+def test_client_errors_do_not_trip_the_breaker(fake_server, backoffs):
+    # Ollama answers 400 to a `format` the model can't do; the server itself is fine
+    url, fake = fake_server(fail_rate=1.0, fail_status=400)
+    client = make_client(url, failure_threshold=2)
+    for _ in range(3):
+        with pytest.raises(OllamaError) as error:
+            client.generate(PAYLOAD)
+        assert error.value.status_code == 400
+    assert backoffs == []
+    assert client.breaker.snapshot() == {'state': CircuitBreaker.CLOSED, 'consecutive_failures': 0, 'times_opened': 0}
+    stats = client.stats()
+    assert stats['client_errors'] == 3 and stats['failures'] == 0
+
+
+def test_stream_client_error_does_not_trip_the_breaker(fake_server):
+    url, fake = fake_server(fail_rate=1.0, fail_status=400)
+    client = make_client(url, failure_threshold=1)
+    with pytest.raises(OllamaError):
+        list(client.generate_stream({**PAYLOAD, 'stream': True}))
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert client.stats()['client_errors'] == 1
+
+
+def test_breaker_opens_half_opens_and_closes(fake_server):
+    url, fake = fake_server(fail_rate=1.0, fail_status=500)
+    client = make_client(url, failure_threshold=2, reset_timeout=0.2)
+    for _ in range(2):
+        with pytest.raises(OllamaError):
+            client.generate(PAYLOAD)
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # Open: callers fail fast without reaching Ollama
+    with pytest.raises(OllamaUnavailable):
+        client.generate(PAYLOAD)
+    assert fake.stats()['requests'] == 2
+    assert client.stats()['short_circuited'] == 1
+    assert not client.breaker.available()
+
+    # After reset_timeout one probe goes through and closes the breaker
+    time.sleep(0.25)
+    fake.fail_rate = 0.0
+    assert client.breaker.available()
+    assert client.generate(PAYLOAD)['done'] is True
+    assert client.breaker.snapshot() == {'state': CircuitBreaker.CLOSED, 'consecutive_failures': 0, 'times_opened': 1}
+
+
+def test_half_open_lets_one_probe_through_and_reopens_on_failure():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow_request()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+
+
+def test_stream_yields_chunks_and_counts_success(fake_server):
+    url, fake = fake_server()
+    client = make_client(url)
+    chunks = list(client.generate_stream({**PAYLOAD, 'stream': True}))
+    assert chunks[-1]['done'] is True
+    assert ''.join(chunk['response'] for chunk in chunks) == client.generate(PAYLOAD)['response']
+    assert client.stats()['successes'] == 2
+
+
+def test_async_client_retries_connect_timeout_and_skips_breaker_on_4xx(fake_server):
+    url, fake = fake_server()
+
+    async def run():
+        client = AsyncOllamaClient(url, max_retries=1, backoff_factor=0.01, failure_threshold=1)
+        post = client.client.post
+        calls = []
+
+        async def flaky_post(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise httpx.ConnectTimeout('connect timed out')
+            return await post(*args, **kwargs)
+
+        client.client.post = flaky_post
+        try:
+            body = await client.generate(PAYLOAD)
+            fake.fail_rate, fake.fail_status = 1.0, 400
+            with pytest.raises(OllamaError):
+                await client.generate(PAYLOAD)
+            return body, client.stats()
+        finally:
+            await client.close()
+
+    body, stats = asyncio.run(run())
+    assert body['done'] is True
+    assert stats['retries'] == 1 and stats['timeouts'] == 1
+    assert stats['client_errors'] == 1 and stats['circuit_breaker']['state'] == CircuitBreaker.CLOSED
+
+
+def unreadable_response(url, content=b'<html>Bad gateway</html>'):
+    """A 200 whose body isn't a JSON object, like an error page from a proxy in front of Ollama"""
+    response = requests.Response()
+    response.status_code = 200
+    response._content = content
+    response.url = url
+    return response
+
+
+@pytest.mark.parametrize('content', [b'<html>Bad gateway</html>', b'{"response": "cut o', b'["not", "a", "body"]'])
+def test_unreadable_body_is_an_ollama_error(fake_server, monkeypatch, content):
+    url, fake = fake_server()
+    client = make_client(url, failure_threshold=1)
+    monkeypatch.setattr(client.session, 'post', lambda post_url, **kwargs: unreadable_response(post_url, content))
+    with pytest.raises(OllamaError) as error:
+        client.generate(PAYLOAD)
+    assert error.value.status_code is None
+    stats = client.stats()
+    assert stats['successes'] == 0 and stats['failures'] == 1
+    assert stats['circuit_breaker']['state'] == CircuitBreaker.OPEN
+
+
+def test_async_unreadable_body_is_an_ollama_error(fake_server):
+    url, fake = fake_server()
+
+    async def run():
+        client = AsyncOllamaClient(url, max_retries=0, failure_threshold=1)
+
+        async def garbled_post(post_url, **kwargs):
+            return httpx.Response(200, content=b'<html>Bad gateway</html>', request=httpx.Request('POST', post_url))
+
+        client.client.post = garbled_post
+        try:
+            with pytest.raises(OllamaError):
+                await client.chat({**PAYLOAD, 'messages': []})
+            return client.stats()
+        finally:
+            await client.close()
+
+    stats = asyncio.run(run())
+    assert stats['successes'] == 0 and stats['failures'] == 1
+    assert stats['circuit_breaker']['state'] == CircuitBreaker.OPEN
+
+
+def test_app_falls_back_while_ollama_fails(game, upstream, client):
+    upstream.fail_rate, upstream.fail_status = 1.0, 500
+    response = client.post('/api/dialogue', json={'npc_name': 'Commander Sarah Chen', 'player_message': 'Hello'})
+    body = response.get_json()
+    assert response.status_code == 200 and body['success'] is True
+    assert body['message'] == game.get_fallback_dialogue_response('Commander Sarah Chen')
+
+    # With the breaker open the fallback is served without calling Ollama
+    for breaker_client in game.ollama_client.clients.values():
+        for _ in range(breaker_client.breaker.failure_threshold):
+            breaker_client.breaker.record_failure()
+    requests_before = upstream.stats()['requests']
+    body = client.post('/api/dialogue', json={'npc_name': 'Commander Sarah Chen', 'player_message': 'Hello'}).get_json()
+    assert body['message'] == game.get_fallback_dialogue_response('Commander Sarah Chen')
+    assert upstream.stats()['requests'] == requests_before
+
+
+def test_app_falls_back_on_an_unreadable_body(game, upstream, client, monkeypatch):
+    for upstream_client in game.ollama_client.clients.values():
+        monkeypatch.setattr(upstream_client.session, 'post', lambda url, **kwargs: unreadable_response(url))
+    failures_before = sum(c.stats()['failures'] for c in game.ollama_client.clients.values())
+    response = client.post('/api/dialogue', json={'npc_name': 'Commander Sarah Chen', 'player_message': 'Hello'})
+    body = response.get_json()
+    assert response.status_code == 200 and body['success'] is True
+    assert body['message'] == game.get_fallback_dialogue_response('Commander Sarah Chen')
+    assert sum(c.stats()['failures'] for c in game.ollama_client.clients.values()) > failures_before
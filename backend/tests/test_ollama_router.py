@@ -0,0 +1,202 @@
+import asyncio
+import itertools
+from urllib.parse import urlparse
+
+import pytest
+
+from ollama_client import OllamaError, OllamaUnavailable
+from ollama_router import AsyncOllamaRouter, OllamaRouter, UpstreamPool, _rendezvous
+
+MODEL = 'llama2-uncensored'
+PAYLOAD = {'model': MODEL, 'prompt': 'Hello there', 'stream': False}
+
+
+def make_router(urls, router=OllamaRouter, affinity_slack=2, **options):
+    pool = UpstreamPool([(url, None) for url in urls], probe_interval=0, affinity_slack=affinity_slack)
+    options = {'max_retries': 0, 'failure_threshold': 3, 'reset_timeout': 60, **options}
+    return router(pool, affinity=lambda payload: payload.get('affinity'), **options)
+
+
+def served(fakes):
+    return [fake.stats()['requests'] for fake in fakes]
+
+
+def key_preferring(urls, url):
+    """An affinity key that rendezvous hashing sends to url"""
+    for index in itertools.count():
+        key = f"player{index}|npc"
+        if max(urls, key=lambda candidate: _rendezvous(key, candidate)) == url:
+            return key
+
+
+@pytest.fixture
+def fakes(fake_server):
+    """Three healthy fake upstreams: (urls, fakes)"""
+    started = [fake_server() for _ in range(3)]
+    return [url for url, _ in started], [fake for _, fake in started]
+
+
+def test_least_outstanding_upstream_is_picked(fakes):
+    urls, servers = fakes
+    router = make_router(urls)
+    busy = [router.pool.select(MODEL), router.pool.select(MODEL)]
+    assert {upstream.url for upstream in busy} == set(urls[:2])
+
+    # Two upstreams each have a request in flight, so the idle one gets the next
+    router.generate(PAYLOAD)
+    assert served(servers) == [0, 0, 1]
+
+    router.pool.release(busy[0])
+    router.generate(PAYLOAD)
+    assert served(servers) == [1, 0, 1]
+    assert [upstream.outstanding for upstream in router.pool.upstreams] == [0, 1, 0]
+
+
+def test_affinity_keeps_a_conversation_on_one_upstream(fakes):
+    urls, servers = fakes
+    router = make_router(urls)
+    key = key_preferring(urls, urls[1])
+    for _ in range(4):
+        router.generate({**PAYLOAD, 'affinity': key})
+    assert served(servers) == [0, 4, 0]
+    assert router.stats()['affinity_hits'] == 4
+
+    # Other conversations hash elsewhere
+    other = key_preferring(urls, urls[2])
+    router.generate({**PAYLOAD, 'affinity': other})
+    assert served(servers) == [0, 4, 1]
+
+
+def test_affinity_spills_once_its_upstream_is_past_the_slack(fakes):
+    urls, servers = fakes
+    router = make_router(urls, affinity_slack=2)
+    key = key_preferring(urls, urls[0])
+    preferred = router.pool.upstreams[0]
+
+    preferred.outstanding = 2
+    router.generate({**PAYLOAD, 'affinity': key})
+    assert served(servers) == [1, 0, 0]
+
+    preferred.outstanding = 3
+    router.generate({**PAYLOAD, 'affinity': key})
+    assert served(servers)[0] == 1 and sum(served(servers)) == 2
+    stats = router.stats()
+    assert stats['affinity_hits'] == 1 and stats['affinity_spills'] == 1
+
+
+@pytest.mark.parametrize('failure', [{'fail_rate': 1.0, 'fail_status': 503}, {'fail_rate': 1.0, 'fail_status': 500}])
+def test_fails_over_on_server_errors(fake_server, failure):
+    (bad_url, bad), (good_url, good) = fake_server(**failure), fake_server()
+    router = make_router([bad_url, good_url])
+    assert router.generate(PAYLOAD)['done'] is True
+    assert served([bad, good]) == [1, 1]
+    assert router.stats()['failovers'] == 1
+
+
+def test_fails_over_on_connection_errors(fake_server, closed_port_url):
+    good_url, good = fake_server()
+    router = make_router([closed_port_url, good_url])
+    assert router.generate(PAYLOAD)['done'] is True
+    assert good.stats()['requests'] == 1
+    assert router.stats()['failovers'] == 1
+
+
+def test_stream_fails_over_before_the_first_chunk(fake_server):
+    (bad_url, bad), (good_url, good) = fake_server(fail_rate=1.0, fail_status=503), fake_server()
+    router = make_router([bad_url, good_url])
+    chunks = list(router.generate_stream({**PAYLOAD, 'stream': True}))
+    assert chunks[-1]['done'] is True
+    assert good.stats()['streams'] == 1
+    assert router.stats()['failovers'] == 1
+    assert [upstream.outstanding for upstream in router.pool.upstreams] == [0, 0]
+
+
+def test_stream_does_not_fail_over_after_the_first_chunk(fake_server):
+    (flaky_url, flaky), (other_url, other) = fake_server(stream_error_after=1), fake_server()
+    router = make_router([flaky_url, other_url])
+    chunks = router.generate_stream({**PAYLOAD, 'stream': True})
+    assert next(chunks)['response']
+    with pytest.raises(OllamaError, match='stream failed'):
+        list(chunks)
+    assert other.stats()['requests'] == 0
+    assert router.stats()['failovers'] == 0
+
+
+def test_client_errors_are_not_failed_over(fake_server):
+    (bad_url, bad), (good_url, good) = fake_server(fail_rate=1.0, fail_status=400), fake_server()
+    router = make_router([bad_url, good_url])
+    key = key_preferring([bad_url, good_url], bad_url)
+    with pytest.raises(OllamaError) as error:
+        router.generate({**PAYLOAD, 'affinity': key})
+    assert error.value.status_code == 400
+    with pytest.raises(OllamaError):
+        list(router.generate_stream({**PAYLOAD, 'stream': True, 'affinity': key}))
+    assert bad.stats()['requests'] == 2
+    assert good.stats()['requests'] == 0
+    assert router.stats()['failovers'] == 0
+
+
+def test_last_upstream_error_is_raised_when_all_fail(fake_server):
+    urls = [fake_server(fail_rate=1.0, fail_status=503)[0] for _ in range(2)]
+    router = make_router(urls)
+    with pytest.raises(OllamaError) as error:
+        router.generate(PAYLOAD)
+    assert error.value.status_code == 503
+    assert router.stats()['failovers'] == 2
+
+
+def test_probes_track_health_and_discover_models(fake_server, closed_port_url):
+    (big_url, big), (small_url, small) = fake_server(), fake_server(models=('phi3:mini',))
+    router = make_router([big_url, small_url, closed_port_url])
+    pool = router.pool
+    pool.probe_all()
+
+    big_upstream, small_upstream, down = pool.upstreams
+    assert (big_upstream.healthy, small_upstream.healthy, down.healthy) == (True, True, False)
+    assert big_upstream.discovered_models == {MODEL}
+    assert small_upstream.discovered_models == {'phi3:mini'}
+    assert down.probe_failures == 1
+
+    # Each model goes only to the upstream that has it; the down one gets nothing
+    for _ in range(3):
+        router.generate({**PAYLOAD, 'model': 'phi3:mini'})
+        router.generate(PAYLOAD)
+    assert served([big, small]) == [3, 3]
+    assert router.stats()['failovers'] == 0
+
+    # Once the server comes up the next probe brings it back
+    port = urlparse(closed_port_url).port
+    revived_url, revived = fake_server(port=port)
+    assert pool.probe(down) is True
+    assert down.healthy is True and down.discovered_models == {MODEL}
+    router.generate(PAYLOAD)
+    router.generate(PAYLOAD)
+    assert revived.stats()['requests'] >= 1
+
+
+def test_no_upstream_serving_the_model(fake_server):
+    url, fake = fake_server(models=('phi3:mini',))
+    pool = UpstreamPool([(url, ['phi3:mini'])], probe_interval=0)
+    router = OllamaRouter(pool, max_retries=0)
+    with pytest.raises(OllamaUnavailable):
+        router.generate(PAYLOAD)
+    assert router.stats()['no_upstream'] == 1
+    assert fake.stats()['requests'] == 0
+
+
+def test_async_router_fails_over(fake_server):
+    (bad_url, bad), (good_url, good) = fake_server(fail_rate=1.0, fail_status=503), fake_server()
+
+    async def run():
+        router = make_router([bad_url, good_url], router=AsyncOllamaRouter)
+        try:
+            body = await router.generate(PAYLOAD)
+            chunks = [chunk async for chunk in router.generate_stream({**PAYLOAD, 'stream': True})]
+            return body, chunks, router.stats()
+        finally:
+            await router.close()
+
+    body, chunks, stats = asyncio.run(run())
+    assert body['done'] is True and chunks[-1]['done'] is True
+    assert stats['failovers'] == 2
+    assert good.stats()['requests'] == 2
@@ -0,0 +1,123 @@
+import copy
+import re
+
+import pytest
+
+from benchmarks import QUEST_SUGGESTIONS, sample_catalogue
+from quest_catalogue import COMMON_ITEM_MAPPINGS, catalogue_cache_stats, quest_catalogue, validate_quest_data
+
+
+# validate_quest_data as it was before quest_catalogue.py, without the logging.
+# Copied here, not imported, so it stays the reference.
+def legacy_validate_quest_data(quest, available_items, available_npcs, player_suggestion):
+    if player_suggestion:
+        crypto_matches = re.findall(r'(\d+)\s*crypto', player_suggestion.lower())
+        if crypto_matches:
+            quest['reward_crypto'] = min(int(crypto_matches[0]), 1000)
+    if quest.get('quest_type') == 'collect_item':
+        target_item = quest.get('target_item')
+        if target_item and target_item not in available_items:
+            if player_suggestion:
+                suggestion_lower = player_suggestion.lower()
+                for item in available_items:
+                    item_lower = item.lower()
+                    if (item_lower in suggestion_lower or
+                            any(word in suggestion_lower for word in item_lower.split('_'))):
+                        quest['target_item'] = item
+                        break
+                if quest['target_item'] not in available_items:
+                    for keyword, item_id in COMMON_ITEM_MAPPINGS.items():
+                        if keyword in suggestion_lower and item_id in available_items:
+                            quest['target_item'] = item_id
+                            break
+            if quest['target_item'] not in available_items:
+                quest['target_item'] = available_items[0] if available_items else 'crystal_red'
+        if player_suggestion:
+            quantity_matches = re.findall(r'(\d+)\s*(?:pieces?|items?|units?|of)', player_suggestion.lower())
+            if quantity_matches:
+                quest['quantity'] = min(int(quantity_matches[0]), 10)
+            elif any(word in player_suggestion.lower() for word in ['some', 'a few', 'several']):
+                quest['quantity'] = 3
+            elif 'a ' in player_suggestion.lower() or 'an ' in player_suggestion.lower():
+                quest['quantity'] = 1
+    elif quest.get('quest_type') == 'talk_to_npc':
+        target_npc = quest.get('target_npc')
+        if target_npc and target_npc not in available_npcs:
+            quest['target_npc'] = available_npcs[0] if available_npcs else 'Commander Sarah Chen'
+    return quest
+
+
+NPCS = ['Commander Sarah Chen', 'Dr. Marcus Webb', 'Scout Jake Williams']
+
+CATALOGUES = [
+    sample_catalogue(100),
+    sample_catalogue(1_000),
+    ['space_rock', 'Iron_Ore', 'glow_stalk'],
+    # Later items share parts with earlier ones, and an empty part matches everything
+    ['void_core', 'core', 'void', 'plasma__coil'],
+    ['crystal_red'],
+    [],
+]
+
+QUESTS = [
+    {'quest_type': 'collect_item', 'target_item': 'unobtainium', 'quantity': 1, 'reward_crypto': 15},
+    {'quest_type': 'collect_item', 'target_item': 'crystal_red', 'quantity': 1, 'reward_crypto': 15},
+    {'quest_type': 'collect_item', 'target_item': ['crystal_red'], 'quantity': 1, 'reward_crypto': 15},
+    {'quest_type': 'collect_item', 'target_item': '', 'quantity': 1, 'reward_crypto': 15},
+    {'quest_type': 'talk_to_npc', 'target_npc': 'Rick', 'reward_crypto': 15},
+    {'quest_type': 'talk_to_npc', 'target_npc': 'Dr. Marcus Webb', 'reward_crypto': 15},
+    {'quest_type': 'explore_area', 'reward_crypto': 15},
+]
+
+SUGGESTIONS = QUEST_SUGGESTIONS + [
+    None,
+    "bring me 12 units of CORE stuff",
+    "Need some Iron ore, 5 of them",
+    "a glow stalk and 20 crypto",
+    "several void things",
+    "an ancient relic please",
+    "plasma",
+]
+
+
+@pytest.mark.parametrize('items', CATALOGUES, ids=lambda items: f"{len(items)} items")
+def test_indexed_validation_matches_the_legacy_scan(items):
+    mismatches = []
+    for quest in QUESTS:
+        for suggestion in SUGGESTIONS:
+            expected = legacy_validate_quest_data(copy.deepcopy(quest), items, NPCS, suggestion)
+            actual = validate_quest_data(copy.deepcopy(quest), items, NPCS, suggestion)
+            if actual != expected:
+                mismatches.append((quest, suggestion, expected, actual))
+    assert mismatches == []
+
+
+def test_talk_quest_without_npcs_gets_the_default_npc():
+    quest = {'quest_type': 'talk_to_npc', 'target_npc': 'Rick'}
+    assert validate_quest_data(dict(quest), ['crystal_red'], [], 'hi') == \
+        legacy_validate_quest_data(dict(quest), ['crystal_red'], [], 'hi')
+
+
+def test_same_catalogue_reuses_its_index():
+    items = sample_catalogue(100) + ['cache_test_item']
+    before = catalogue_cache_stats()
+    catalogue = quest_catalogue(items, NPCS)
+    # An equal list is a different object from the frontend's next request
+    assert quest_catalogue(list(items), list(NPCS)) is catalogue
+    validate_quest_data({'quest_type': 'collect_item', 'target_item': 'x'}, list(items), list(NPCS), 'a cache test')
+    after = catalogue_cache_stats()
+    assert after['misses'] - before['misses'] == 1
+    assert after['hits'] - before['hits'] == 2
+
+
+def test_changed_catalogue_rebuilds_its_index():
+    items = ['changed_core', 'changed_lens']
+    catalogue = quest_catalogue(items, NPCS)
+    items.append('changed_coil')
+    rebuilt = quest_catalogue(items, NPCS)
+    assert rebuilt is not catalogue
+    assert rebuilt.has_item('changed_coil') and not catalogue.has_item('changed_coil')
+    assert quest_catalogue(items, NPCS[:1]) is not rebuilt
+
+    quest = validate_quest_data({'quest_type': 'collect_item', 'target_item': 'x'}, items, NPCS, 'a coil please')
+    assert quest['target_item'] == 'changed_coil'
@@ -0,0 +1,164 @@
+import random
+import re
+
+import pytest
+
+from benchmarks import dialogue_corpus
+from response_cleaner import DialogueStreamCleaner, clean_dialogue_response, keyword_pattern
+
+# The cleaner as it was before response_cleaner.py: 13 re.sub calls in order, then
+# a per-keyword scan of every line. Copied here, not imported, so it stays the reference.
+LEGACY_PATTERNS = [
+    r"If the player asks about.*?\.",
+    r"Respond as.*?\.",
+    r"Keep responses under.*?\.",
+    r"Be true to.*?\.",
+    r"If there are relevant memories.*?\.",
+    r"Response:",
+    r"Answer:",
+    r"Dialogue:",
+    r"=== NPC MEMORY CONTEXT ===",
+    r"=== END MEMORY CONTEXT ===",
+    r"RELATIONSHIP STATUS:.*?RECENT CONVERSATION CONTEXT:.*?=== END MEMORY CONTEXT ===",
+    r"IMPORTANT INSTRUCTIONS:.*?DO NOT include instruction text in your response",
+    r"PERSONALITY:.*?DIALOGUE STYLE:.*?PLAYER CONTEXT:.*?The player says:",
+]
+LEGACY_MEMORY_KEYWORDS = [
+    'relationship status:', 'trust:', 'friendship:', 'respect:', 'attraction:',
+    'personal_info:', 'relationship:', 'promises:', 'emotional:', 'gossip:', 'trade:', 'quests:',
+    'recent conversation context:', 'player:', 'npc:', 'emotion:',
+    '===', 'memory context', 'end memory context'
+]
+LEGACY_INSTRUCTION_KEYWORDS = [
+    'important instructions:', 'respond naturally', 'keep responses', 'be true to',
+    'use the memory context', 'do not include', 'personality:', 'background:', 'dialogue style:'
+]
+LEGACY_FALLBACKS = [
+    "I'm not sure how to respond to that.",
+    "That's an interesting question.",
+    "I need to think about that for a moment.",
+    "Let me consider what you're asking."
+]
+
+
+def legacy_clean(response_text):
+    if not response_text:
+        return "I'm not sure how to respond to that."
+    cleaned = response_text.strip()
+    for pattern in LEGACY_PATTERNS:
+        cleaned = re.sub(pattern, "", cleaned, flags=re.DOTALL | re.IGNORECASE)
+    filtered_lines = []
+    for line in cleaned.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if any(keyword in line.lower() for keyword in LEGACY_MEMORY_KEYWORDS):
+            continue
+        if any(keyword in line.lower() for keyword in LEGACY_INSTRUCTION_KEYWORDS):
+            continue
+        filtered_lines.append(line)
+    cleaned = ' '.join(filtered_lines).strip()
+    if cleaned and len(cleaned) > 5:
+        return cleaned
+    return random.choice(LEGACY_FALLBACKS)
+
+
+# The first few are the folding cases: IGNORECASE matches U+0130, U+0131 and U+017F
+# against 'i'/'s' although lower() doesn't turn them into those letters
+EDGE_CASES = [
+    "Reſponse: The reactor is fine.",
+    "RESPONSE: The reactor is fine.",
+    "İf the player asks about ore, say no. We're out of ore.",
+    "ıf the player asks about ore, say no. We're out of ore.",
+    "Be true to your role. I always am, friend.",
+    "Be true to your role! I always am, friend.",
+    "KEEP RESPONSES UNDER two sentences. Fine by me.",
+    "Reſpond as Rick. Ha! You again?",
+    "If there are relevant memories, use them. Long time no see.",
+    "PERSONALİTY: grumpy\nDIALOGUE STYLE: short\nPLAYER CONTEXT: none\nThe player ſays: hi\nHello yourself.",
+    "Trust is earned, not given.   Come back when you've proven yourself.",
+    "Hello there. Respond as Rick. Bye now.",
+    "Hello there Respond as Rick.\nSee you around.",
+    "  Sure thing.  \n\n  Come back tomorrow.  ",
+    "Mmm.",
+    "Mmm. Okay.",
+    "",
+    "   ",
+]
+
+CASES = dialogue_corpus() + EDGE_CASES
+
+
+def cleaned_alike(clean, text):
+    random.seed(text)
+    return clean(text)
+
+
+def stream(text, size):
+    cleaner = DialogueStreamCleaner()
+    sentences = []
+    for start in range(0, len(text), size):
+        sentences.extend(cleaner.feed(text[start:start + size]))
+    sentences.extend(cleaner.flush())
+    return sentences, cleaner
+
+
+def test_corpus_has_replies_every_cleanup_touches():
+    assert len(dialogue_corpus()) == 400
+    joined = '\n'.join(CASES)
+    for pattern in LEGACY_PATTERNS:
+        assert re.search(pattern, joined, re.DOTALL | re.IGNORECASE), pattern
+
+
+@pytest.mark.parametrize('text', EDGE_CASES)
+def test_edge_cases_match_the_legacy_cleaner(text):
+    assert cleaned_alike(clean_dialogue_response, text) == cleaned_alike(legacy_clean, text)
+
+
+def test_blocking_cleaner_matches_the_legacy_cleaner_on_the_corpus():
+    mismatches = [text for text in CASES
+                  if cleaned_alike(clean_dialogue_response, text) != cleaned_alike(legacy_clean, text)]
+    assert mismatches == []
+
+
+@pytest.mark.parametrize('size', [1, 4, 7])
+def test_stream_cleaner_matches_the_legacy_cleaner_on_the_corpus(size):
+    mismatches = []
+    for text in CASES:
+        expected = cleaned_alike(legacy_clean, text)
+        sentences, cleaner = stream(text, size)
+        if cleaned_alike(lambda _: cleaner.message(), text) != expected:
+            mismatches.append(('message', text))
+        # Nothing is streamed when the reply ends up as a fallback line
+        if (' '.join(sentences) if sentences else expected) != expected:
+            mismatches.append(('sentences', text))
+    assert mismatches == []
+
+
+def test_stream_holds_a_spanning_pattern_until_it_closes():
+    head = "Sure. IMPORTANT INSTRUCTIONS: Respond in character. Stay short. "
+    tail = "DO NOT include instruction text in your response. Anyway, hello there!"
+    cleaner = DialogueStreamCleaner()
+    assert cleaner.feed(head) == []
+    sentences = cleaner.feed(tail) + cleaner.flush()
+    assert sentences[0] == 'Sure.' and sentences[-1] == 'Anyway, hello there!'
+    assert ' '.join(sentences) == cleaner.message() == legacy_clean(head + tail)
+
+
+def test_stream_sends_sentences_before_the_line_ends():
+    cleaner = DialogueStreamCleaner()
+    assert cleaner.feed("Welcome back to the outpost! The reactor") == ['Welcome back to the outpost!']
+
+
+def test_message_drops_a_line_that_turns_out_to_hold_a_keyword():
+    # The first sentence has gone out before the keyword arrives; the message is still exact
+    text = "Good to see you again. Trust: 80/100\nNow get to work."
+    sentences, cleaner = stream(text, 4)
+    assert sentences == ['Good to see you again.', 'Now get to work.']
+    assert cleaner.message() == legacy_clean(text) == 'Now get to work.'
+
+
+def test_keyword_pattern_finds_any_keyword():
+    pattern = keyword_pattern(['trust:', 'trade:', 'tr'])
+    assert pattern.search('a trade: here') and pattern.search('xtr')
+    assert not keyword_pattern(['trust:', 'trade:']).search('a t r u s t')
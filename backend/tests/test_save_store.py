@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from save_store import PatchError, SQLiteSaveStore, apply_patch, make_patch
+
+
+def test_make_patch_round_trips():
+    old = {'player': {'x': 1, 'items': ['key', 'map']}, 'flags': {'met_sarah': True}}
+    new = {'player': {'x': 4, 'items': ['key']}, 'quests': [{'id': 'q1'}]}
+    assert apply_patch(old, make_patch(old, new)) == new
+
+
+@pytest.mark.parametrize('patch', [
+    {'op': 'add', 'path': '/x', 'value': 1},
+    'not a patch',
+    None,
+    ['not an operation'],
+    [{'path': '/x', 'value': 1}],
+    [{'op': 'frobnicate', 'path': '/x'}],
+    [{'op': 'add', 'value': 1}],
+    [{'op': 'add', 'path': '/x'}],
+    [{'op': 'replace', 'path': '/x'}],
+    [{'op': 'test', 'path': '/x'}],
+    [{'op': 'move', 'path': '/y'}],
+    [{'op': 'copy', 'path': '/y', 'from': 3}],
+    [{'op': 'remove', 'path': None}],
+])
+def test_malformed_patches_raise_patch_error(patch):
+    with pytest.raises(PatchError):
+        apply_patch({'x': 0}, patch)
+
+
+def test_malformed_patch_leaves_document_untouched():
+    document = {'x': 0}
+    with pytest.raises(PatchError):
+        apply_patch(document, [{'op': 'add', 'path': '/y', 'value': 1}, {'op': 'add', 'path': '/z'}])
+    assert document == {'x': 0}
+
+
+@pytest.mark.parametrize('patch', [
+    {'op': 'add', 'path': '/x', 'value': 1},
+    ['not an operation'],
+    [{'op': 'add', 'path': '/x'}],
+])
+def test_save_with_malformed_patch_is_a_bad_request(client, patch):
+    base = client.post('/api/save', json={'x': 0}).get_json()
+    response = client.post('/api/save', json={'base_save_id': base['save_id'], 'patch': patch})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_sqlite_stats_count_is_cached_between_recounts(tmp_path, monkeypatch):
+    store = SQLiteSaveStore(str(tmp_path / 'saves.db'), count_ttl=60)
+    try:
+        store.save('alice', {'x': 1})
+        counts = []
+        count = store.count
+        monkeypatch.setattr(store, 'count', lambda player_id=None: counts.append(player_id) or count(player_id))
+        assert store.stats()['saves'] == 1
+        store.save('bob', {'x': 2})
+        assert store.stats()['saves'] == 2
+        assert counts == [None]
+
+        # Saves written by another worker appear once the cached count expires
+        other = SQLiteSaveStore(store.path)
+        other.save('carol', {'x': 3})
+        other.close()
+        assert store.stats()['saves'] == 2
+        store.count_ttl = 0
+        assert store.stats()['saves'] == 3
+        assert len(counts) == 2
+    finally:
+        store.close()
+
+
+def test_default_paths_are_under_the_data_dir_not_the_working_directory(tmp_path):
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {key: value for key, value in os.environ.items() if key not in ('DATA_DIR', 'SAVE_PATH', 'LOG_DIR')}
+    env.update({'HOME': str(tmp_path / 'home'), 'XDG_DATA_HOME': '', 'PYTHONPATH': backend, 'OLLAMA_PROBE_INTERVAL': '0',
+                'QUEST_POOL_ENABLED': 'false', 'NPC_RELOAD_INTERVAL': '0'})
+    workdir = tmp_path / 'cwd'
+    workdir.mkdir()
+    output = subprocess.run([sys.executable, '-c', 'import app; print(app.SAVE_PATH); print(app.LOG_DIR)'],
+                            cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout.split('\n')
+    data_dir = tmp_path / 'home' / '.local' / 'share' / 'llm-scifi-game'
+    assert output[:2] == [str(data_dir / 'saves' / 'game_saves.db'), str(data_dir / 'logs')]
+    assert list(workdir.iterdir()) == []
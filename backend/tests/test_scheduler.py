@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from scheduler import (
+    PRIORITY_BACKGROUND, PRIORITY_DIALOGUE, PRIORITY_GENERATE_QUEST, PRIORITY_QUEST,
+    GenerationScheduler, QueueFull, QueueTimeout
+)
+
+
+def wait_for_depth(scheduler, depth):
+    deadline = time.monotonic() + 5
+    while scheduler.stats()['queue_depth'] != depth:
+        assert time.monotonic() < deadline, f"queue never reached {depth}"
+        time.sleep(0.005)
+
+
+def queue_behind(scheduler, requests):
+    """Queue (label, priority, player_id) requests one at a time behind a held slot.
+
+    Each request records its label once granted and releases straight away, so
+    the returned list is the order the scheduler served them in.
+    """
+    served = []
+
+    def run(label, priority, player_id):
+        with scheduler.slot(priority, player_id, timeout=5):
+            served.append(label)
+
+    threads = []
+    for depth, request in enumerate(requests, start=1):
+        thread = threading.Thread(target=run, args=request)
+        thread.start()
+        threads.append(thread)
+        wait_for_depth(scheduler, depth)
+    return served, threads
+
+
+def drain(scheduler, holder, threads):
+    scheduler.release(holder)
+    for thread in threads:
+        thread.join(5)
+    assert scheduler.stats()['active'] == 0
+
+
+def test_higher_priority_is_served_first():
+    scheduler = GenerationScheduler(max_concurrent=1)
+    holder = scheduler.acquire(PRIORITY_QUEST, 'holder')
+    served, threads = queue_behind(scheduler, [
+        ('background', PRIORITY_BACKGROUND, 'a'),
+        ('quest', PRIORITY_QUEST, 'b'),
+        ('dialogue', PRIORITY_DIALOGUE, 'c'),
+        ('generate_quest', PRIORITY_GENERATE_QUEST, 'd'),
+        ('dialogue 2', PRIORITY_DIALOGUE, 'e'),
+    ])
+    assert scheduler.stats()['queue_depth_by_priority'] == {
+        'dialogue': 2, 'generate_quest': 1, 'quest': 1, 'background': 1}
+    drain(scheduler, holder, threads)
+    assert served == ['dialogue', 'dialogue 2', 'generate_quest', 'quest', 'background']
+
+
+def test_players_take_turns_within_a_priority():
+    scheduler = GenerationScheduler(max_concurrent=1)
+    holder = scheduler.acquire(PRIORITY_DIALOGUE, 'holder')
+    served, threads = queue_behind(scheduler, [
+        ('a1', PRIORITY_DIALOGUE, 'a'),
+        ('a2', PRIORITY_DIALOGUE, 'a'),
+        ('a3', PRIORITY_DIALOGUE, 'a'),
+        ('b1', PRIORITY_DIALOGUE, 'b'),
+        ('b2', PRIORITY_DIALOGUE, 'b'),
+    ])
+    drain(scheduler, holder, threads)
+    assert served == ['a1', 'b1', 'a2', 'b2', 'a3']
+
+
+def test_player_with_a_running_generation_waits_behind_others():
+    scheduler = GenerationScheduler(max_concurrent=2)
+    running = scheduler.acquire(PRIORITY_DIALOGUE, 'a')
+    holder = scheduler.acquire(PRIORITY_DIALOGUE, 'holder')
+    served, threads = queue_behind(scheduler, [
+        ('a', PRIORITY_DIALOGUE, 'a'),
+        ('b', PRIORITY_DIALOGUE, 'b'),
+    ])
+    # 'a' queued first, but 'b' has nothing running yet
+    scheduler.release(holder)
+    for thread in threads:
+        thread.join(5)
+    assert served == ['b', 'a']
+    scheduler.release(running)
+    assert scheduler.stats()['active'] == 0
+
+
+def test_full_queue_rejects_new_requests():
+    scheduler = GenerationScheduler(max_concurrent=1, max_queue=1)
+    holder = scheduler.acquire(PRIORITY_QUEST)
+    served, threads = queue_behind(scheduler, [('queued', PRIORITY_QUEST, 'a')])
+    with pytest.raises(QueueFull):
+        scheduler.acquire(PRIORITY_DIALOGUE, 'b')
+    drain(scheduler, holder, threads)
+    assert served == ['queued']
+    stats = scheduler.stats()
+    assert stats['rejected_queue_full'] == 1 and stats['admitted'] == 2 and stats['peak_queue_depth'] == 1
+
+
+def test_requests_are_shed_past_their_queue_deadline():
+    scheduler = GenerationScheduler(max_concurrent=1, queue_timeouts={PRIORITY_QUEST: 0.05})
+    holder = scheduler.acquire(PRIORITY_DIALOGUE)
+    with pytest.raises(QueueTimeout):
+        scheduler.acquire(PRIORITY_QUEST)
+    with pytest.raises(QueueTimeout):
+        scheduler.acquire(PRIORITY_DIALOGUE, timeout=0.05)
+    stats = scheduler.stats()
+    assert stats['shed_deadline'] == 2 and stats['queue_depth'] == 0
+
+    # Shed requests don't hold on to a slot
+    scheduler.release(holder)
+    scheduler.release(scheduler.acquire(PRIORITY_QUEST))
+    assert scheduler.stats()['active'] == 0
+
+
+def test_try_acquire_yields_to_foreground_work():
+    scheduler = GenerationScheduler(max_concurrent=2)
+    background = scheduler.try_acquire(PRIORITY_BACKGROUND, 'pool')
+    assert background is not None
+    scheduler.release(background)
+
+    holder = scheduler.acquire(PRIORITY_DIALOGUE, 'a')
+    # A free slot isn't enough while anything is running
+    assert scheduler.try_acquire() is None
+
+    second = scheduler.acquire(PRIORITY_DIALOGUE, 'b')
+    served, threads = queue_behind(scheduler, [('queued', PRIORITY_QUEST, 'c')])
+    assert scheduler.try_acquire() is None
+    scheduler.release(second)
+    drain(scheduler, holder, threads)
+    assert served == ['queued']
+
+    assert scheduler.try_acquire() is not None
+
+
+def test_async_waiters_follow_priority_and_cancellation_frees_the_slot():
+    scheduler = GenerationScheduler(max_concurrent=1)
+    served = []
+
+    async def run(label, priority):
+        async with scheduler.slot_async(priority, label, timeout=5):
+            served.append(label)
+
+    async def main():
+        holder = await scheduler.acquire_async(PRIORITY_DIALOGUE, 'holder')
+        tasks = {}
+        for label, priority in [('quest', PRIORITY_QUEST), ('cancelled', PRIORITY_DIALOGUE),
+                                ('dialogue', PRIORITY_DIALOGUE)]:
+            tasks[label] = asyncio.create_task(run(label, priority))
+            await asyncio.sleep(0.01)
+        tasks['cancelled'].cancel()
+        await asyncio.sleep(0.01)
+        scheduler.release(holder)
+        await asyncio.gather(tasks['quest'], tasks['dialogue'])
+
+    asyncio.run(main())
+    assert served == ['dialogue', 'quest']
+    stats = scheduler.stats()
+    assert stats['active'] == 0 and stats['queue_depth'] == 0
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+
+import pytest
+
+from ollama_client import OllamaError
+from singleflight import SingleFlight
+
+
+def test_concurrent_threads_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 'reply'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('key', slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()['coalesced'] < 4:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['reply'] * 5 and calls == [1]
+    stats = flight.stats()
+    assert stats['upstream_calls'] == 1 and stats['coalesced'] == 4 and stats['in_flight'] == 0
+
+
+def test_threads_share_the_leaders_exception():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise OllamaError('upstream down')
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('key', failing)
+        except OllamaError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flight.stats()['coalesced'] < 1:
+        threading.Event().wait(0.01)
+    release.set()
+    leader.join()
+    follower.join()
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+    # The next call after it finished is a new upstream call
+    assert flight.do('key', lambda: 'fresh') == 'fresh'
+    assert flight.stats()['upstream_calls'] == 2
+
+
+def test_concurrent_tasks_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'reply'
+
+    async def run():
+        return await asyncio.gather(*(flight.do_async('key', slow) for _ in range(5)),
+                                    flight.do_async('other', slow))
+
+    assert asyncio.run(run()) == ['reply'] * 6
+    assert len(calls) == 2
+    stats = flight.stats()
+    assert stats['upstream_calls'] == 2 and stats['coalesced'] == 4 and stats['in_flight'] == 0
+
+
+def test_tasks_share_the_leaders_exception():
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise OllamaError('upstream down')
+
+    async def run():
+        return await asyncio.gather(*(flight.do_async('key', failing) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, OllamaError) for result in results)
+    assert flight.stats()['upstream_calls'] == 1
+
+
+@pytest.mark.parametrize('cancelled', ['leader', 'follower'])
+def test_cancelling_one_task_leaves_the_call_to_the_others(cancelled):
+    flight = SingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'reply'
+
+    async def run():
+        leader = asyncio.create_task(flight.do_async('key', slow))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flight.do_async('key', slow)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        victim = leader if cancelled == 'leader' else followers[0]
+        victim.cancel()
+        others = [task for task in [leader, *followers] if task is not victim]
+        results = await asyncio.gather(*others)
+        with pytest.raises(asyncio.CancelledError):
+            await victim
+        return results
+
+    assert asyncio.run(run()) == ['reply', 'reply']
+    assert calls == [1]
+    assert flight.stats()['in_flight'] == 0
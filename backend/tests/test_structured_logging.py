@@ -0,0 +1,98 @@
+import contextvars
+import json
+import logging
+import os
+import time
+
+import pytest
+
+from structured_logging import (
+    clear_log_files, log_files, request_id, rotate_log_files, setup_logging, stop_listener
+)
+
+player_id = contextvars.ContextVar('player_id', default=None)
+
+
+@pytest.fixture
+def logs(tmp_path, request):
+    """(listener, logger, log path) for a logger of its own, routed through a queue like the app's"""
+    name = f"test.structured.{request.node.name}"
+    listener = setup_logging(log_dir=str(tmp_path), filename='game.log', console=False,
+                             context_vars={'player_id': player_id}, logger_name=name)
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    yield listener, logger, str(tmp_path / 'game.log')
+    stop_listener(listener)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    for handler in listener.handlers:
+        handler.close()
+
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def wait_for_message(path, message):
+    """Wait until the listener thread has written a record with this message"""
+    deadline = time.monotonic() + 5
+    while not (os.path.exists(path) and any(entry['msg'] == message for entry in read_lines(path))):
+        assert time.monotonic() < deadline, f"{message!r} was never written"
+        time.sleep(0.005)
+
+
+def test_records_are_written_as_json_lines_by_the_listener(logs):
+    listener, logger, path = logs
+
+    def handle_request():
+        request_id.set('req-1')
+        player_id.set('alice')
+        logger.info('Generated %s', 'reply', extra={'npc': 'Rick', 'ms': 12.5})
+        try:
+            raise ValueError('bad model output')
+        except ValueError:
+            logger.exception('Parsing failed')
+
+    contextvars.copy_context().run(handle_request)
+    logger.debug('Below the level')
+    # An empty context, since earlier tests' requests may have set ids in this thread
+    contextvars.Context().run(logger.warning, 'Outside a request')
+    stop_listener(listener)
+    stop_listener(listener)
+
+    entries = read_lines(path)
+    assert [entry['msg'] for entry in entries] == ['Generated reply', 'Parsing failed', 'Outside a request']
+    first, failure, outside = entries
+    assert first['level'] == 'INFO' and first['logger'] == logger.name
+    assert (first['request_id'], first['player_id'], first['npc'], first['ms']) == ('req-1', 'alice', 'Rick', 12.5)
+    assert 'ValueError: bad model output' in failure['exc'] and failure['request_id'] == 'req-1'
+    assert (outside['request_id'], outside['player_id']) == ('-', None)
+
+
+def test_rotation_leaves_the_listener_writing_to_the_new_file(logs):
+    listener, logger, path = logs
+    logger.info('before rotation')
+    wait_for_message(path, 'before rotation')
+    rotate_log_files(listener)
+    logger.info('after rotation')
+    stop_listener(listener)
+
+    assert log_files(listener) == [path, f"{path}.1"]
+    assert [entry['msg'] for entry in read_lines(path)] == ['after rotation']
+    assert [entry['msg'] for entry in read_lines(f"{path}.1")] == ['before rotation']
+
+
+def test_clearing_leaves_the_listener_writing_to_the_emptied_file(logs):
+    listener, logger, path = logs
+    logger.info('first file')
+    wait_for_message(path, 'first file')
+    rotate_log_files(listener)
+    logger.info('second file, with a much longer message than the line written after clearing')
+    wait_for_message(path, 'second file, with a much longer message than the line written after clearing')
+    clear_log_files(listener)
+    assert log_files(listener) == [path] and os.path.getsize(path) == 0
+
+    logger.info('after clearing')
+    stop_listener(listener)
+    assert [entry['msg'] for entry in read_lines(path)] == ['after clearing']
@@ -1,74 +1,44 @@
-export const NPCData = [
-    {
-        id: 'commander_sarah',
-        name: 'Commander Sarah Chen',
-        spriteKey: 'scifiUnit_01',
-        x: 200,
-        y: 200,
-        personality: 'authoritative, strategic, concerned about colony security',
-        role: 'Outpost Commander',
-        background: 'Former military officer, now leads this frontier outpost',
-        dialogueStyle: 'formal but approachable, uses military terminology',
-        defaultGreeting: "At ease, soldier. I'm Commander Sarah Chen, in charge of this outpost. We're on the frontier here, so we need to stay vigilant. What brings you to my command center?"
-    },
-    {
-        id: 'engineer_marcus',
-        name: 'Engineer Marcus Rodriguez',
-        spriteKey: 'scifiUnit_02',
-        x: 600,
-        y: 300,
-        personality: 'brilliant but eccentric, obsessed with technology',
-        role: 'Chief Engineer',
-        background: 'Genius inventor who keeps the outpost running',
-        dialogueStyle: 'technical jargon mixed with enthusiasm, slightly scatterbrained',
-        defaultGreeting: "Oh! Hello there! I'm Marcus Rodriguez, Chief Engineer. *adjusts goggles excitedly* The quantum flux capacitors are behaving most unusually today! What can I help you with? The power grid needs constant attention, you know!"
-    },
-    {
-        id: 'trader_eliza',
-        name: 'Trader Eliza Thompson',
-        spriteKey: 'scifiUnit_03',
-        x: 400,
-        y: 500,
-        personality: 'charismatic, opportunistic, well-connected',
-        role: 'Merchant',
-        background: 'Travels between outposts, knows all the best deals',
-        dialogueStyle: 'smooth talker, always has a deal to offer',
-        defaultGreeting: "Well hello there, handsome! I'm Eliza Thompson, and I've got the best deals this side of the galaxy! Just got back from a trade run with some rare materials. What catches your eye today?"
-    },
-    {
-        id: 'scout_jake',
-        name: 'Scout Jake Williams',
-        spriteKey: 'scifiUnit_04',
-        x: 800,
-        y: 150,
-        personality: 'cautious, observant, has seen things in the wilderness',
-        role: 'Frontier Scout',
-        background: 'Explores the dangerous areas beyond the outpost',
-        dialogueStyle: 'whispers about threats, shares survival tips',
-        defaultGreeting: "*whispers* You should be careful out there. I'm Jake Williams, scout. I've seen things in the wilderness that would make your blood run cold. The outpost walls are all that keep us safe. What do you need to know?"
-    },
-    {
-        id: 'medic_dr_kim',
-        name: 'Dr. Kim Park',
-        spriteKey: 'scifiUnit_05',
-        x: 300,
-        y: 400,
-        personality: 'compassionate, professional, slightly overwhelmed',
-        role: 'Medical Officer',
-        background: 'Keeps everyone healthy in this harsh environment',
-        dialogueStyle: 'caring but busy, medical advice mixed with concern',
-        defaultGreeting: "Hello! I'm Dr. Kim Park, medical officer. I hope you're feeling well. The medical bay is fully stocked, but I'm always concerned about the health of our outpost residents. How are you holding up?"
-    },
-    {
-        id: 'unfiltered_rick',
-        name: 'Rick "The Unfiltered"',
-        spriteKey: 'scifiUnit_06',
-        x: 700,
-        y: 600,
-        personality: 'completely unfiltered, crude, says whatever comes to mind, no social boundaries',
-        role: 'Unfiltered Resident',
-        background: 'Lives on the edge of the outpost, known for saying exactly what he thinks',
-        dialogueStyle: 'crude, direct, no filter whatsoever, uses profanity freely, says anything without restraint',
-        defaultGreeting: "Well well well, look what the fuck crawled out of the void! I'm Rick, and I don't give a shit about your feelings or what anyone thinks. What the hell do you want? I'll tell you exactly what I think, no bullshit!"
+// NPCs come from the backend's registry (backend/data/npcs.json), the same file the
+// backend builds its prompts and fallbacks from. The bundled copy lets the game start
+// offline; refreshNPCData() picks up edits the backend has reloaded since the build.
+import registry from '../../backend/data/npcs.json';
+
+function toConfig(npc) {
+    return {
+        id: npc.id,
+        name: npc.name,
+        spriteKey: npc.sprite_key,
+        x: npc.x,
+        y: npc.y,
+        personality: npc.personality,
+        role: npc.role,
+        background: npc.background,
+        dialogueStyle: npc.dialogue_style,
+        defaultGreeting: npc.default_greeting
+    };
+}
+
+export const NPCData = registry.npcs.map(toConfig);
+
+// Update NPCData in place from /api/npcs; returns the configs that changed, or [] if
+// the backend is unreachable or its registry is the one we already have
+export async function refreshNPCData(apiService) {
+    const npcs = await apiService.getNPCRegistry();
+    if (!npcs) {
+        return [];
     }
-]; 
\ No newline at end of file
+
+    const changed = [];
+    npcs.map(toConfig).forEach(config => {
+        const current = NPCData.find(npc => npc.id === config.id);
+        if (!current) {
+            // New NPCs need a sprite loaded at preload time, so they appear on the next start
+            return;
+        }
+        if (JSON.stringify(current) !== JSON.stringify(config)) {
+            Object.assign(current, config);
+            changed.push(current);
+        }
+    });
+    return changed;
+}
@@ -1,5 +1,5 @@
 import { NPC } from './NPC.js';
-import { NPCData } from '../data/NPCData.js';
+import { NPCData, refreshNPCData } from '../data/NPCData.js';
 
 export class NPCManager {
     constructor(scene) {
@@ -60,6 +60,23 @@ export class NPCManager {
         });
     }
 
+    // Pick up NPC edits the backend's registry has that this build doesn't
+    async refreshFromRegistry(apiService) {
+        const changed = await refreshNPCData(apiService);
+        changed.forEach(config => {
+            const npc = this.npcs.find(npc => npc.id === config.id);
+            if (npc) {
+                npc.config = config;
+                npc.name = config.name;
+                npc.personality = config.personality;
+                npc.role = config.role;
+                npc.background = config.background;
+                npc.dialogueStyle = config.dialogueStyle;
+                npc.defaultGreeting = config.defaultGreeting;
+            }
+        });
+    }
+
     getNPCs() {
         return this.npcs;
     }
@@ -8,6 +8,7 @@ import { ProceduralMapGenerator } from '../systems/ProceduralMapGenerator.js';
 import { NPCData } from '../data/NPCData.js';
 import { ItemData } from '../data/ItemData.js';
 import { UIManager } from '../ui/UIManager.js';
+import { playerSession } from '../services/PlayerSession.js';
 
 export class GameScene extends Phaser.Scene {
     constructor() {
@@ -74,12 +75,15 @@ export class GameScene extends Phaser.Scene {
         
         // Create player in the center of the world
         this.player = new Player(this, 0, 0);
+        // The backend session starts from the player's full state, then follows it by events
+        playerSession.setStateProvider(() => this.player.getPlayerContext());
         
         // Create NPC manager
         this.npcManager = new NPCManager(this);
         
         // Create dialogue manager
         this.dialogueManager = new DialogueManager(this);
+        this.npcManager.refreshFromRegistry(this.dialogueManager.apiService);
         
         // Create quest manager
         this.questManager = new QuestManager(this);
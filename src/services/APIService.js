@@ -1,27 +1,116 @@
+import { playerSession } from './PlayerSession.js';
+
 export class APIService {
     constructor() {
         this.baseURL = 'http://localhost:5000';
         this.endpoints = {
             dialogue: '/api/dialogue',
+            dialogueStream: '/api/dialogue/stream',
             quest: '/api/quest',
             generateQuest: '/api/generate-quest',
             save: '/api/save',
-            load: '/api/load'
+            load: '/api/load',
+            memory: '/api/memory',
+            npcs: '/api/npcs',
+            session: '/api/session'
         };
+        this.npcRegistryETag = null;
+    }
+
+    // Start a backend session from the player's full state, unless one exists or is starting
+    startSession() {
+        if (playerSession.sessionId || playerSession.starting || !playerSession.stateProvider) {
+            return playerSession.starting;
+        }
+
+        playerSession.starting = fetch(`${this.baseURL}${this.endpoints.session}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ player_context: playerSession.snapshot() })
+        })
+            .then(response => response.ok ? response.json() : null)
+            .then(result => {
+                if (result && result.success) {
+                    playerSession.sessionId = result.session_id;
+                }
+            })
+            .catch(error => console.error('Starting player session failed:', error))
+            .finally(() => {
+                playerSession.starting = null;
+            });
+        return playerSession.starting;
+    }
+
+    // Add the session id and pending events to a request body, or the full player context
+    // while there's no session yet. Returns the events sent, to restore if the request fails.
+    attachSession(data, playerContext) {
+        if (!playerSession.sessionId) {
+            if (playerContext) {
+                data.player_context = playerContext;
+            }
+            this.startSession();
+            return [];
+        }
+
+        data.session_id = playerSession.sessionId;
+        const events = playerSession.takeEvents();
+        if (events.length) {
+            data.session_events = events;
+        }
+        return events;
+    }
+
+    // The backend no longer has our session (it expired or restarted); start a new one
+    checkSession(result) {
+        if (result && result.session_expired) {
+            playerSession.expire();
+            this.startSession();
+        }
     }
 
-    async sendDialogueRequest(npcName, message, playerContext, npcData = null, memoryContext = "") {
+    // The backend's NPC registry (snake_case entries), or null if it is unreachable or
+    // unchanged since the last call
+    async getNPCRegistry() {
+        try {
+            const headers = this.npcRegistryETag ? { 'If-None-Match': this.npcRegistryETag } : {};
+            const response = await fetch(`${this.baseURL}${this.endpoints.npcs}`, { headers });
+            if (response.status === 304) {
+                return null;
+            }
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+
+            const result = await response.json();
+            this.npcRegistryETag = response.headers.get('ETag');
+            return result.npcs;
+        } catch (error) {
+            console.error('NPC registry request failed:', error);
+            return null;
+        }
+    }
+
+    // onUndelivered(memoryUpdates) is called if the request fails, so the caller can queue them again
+    async sendDialogueRequest(npcName, message, playerContext, npcData = null, memoryContext = "", memoryUpdates = null, onUndelivered = null) {
+        let sessionEvents = [];
         try {
             const data = {
                 npc_name: npcName,
                 player_message: message,
-                player_context: playerContext,
                 memory_context: memoryContext
             };
+            sessionEvents = this.attachSession(data, playerContext);
+            
+            // New memories since the last request; the backend keeps them and picks the relevant ones
+            if (memoryUpdates) {
+                data.memory_updates = memoryUpdates;
+            }
             
             // Add full NPC data if provided
             if (npcData) {
-                data.npc_id = npcData.npc_name?.toLowerCase().replace(/\s+/g, '_');
+                data.npc_id = npcData.npc_id;
                 data.npc_personality = npcData.npc_personality;
                 data.npc_role = npcData.npc_role;
                 data.npc_background = npcData.npc_background;
@@ -41,9 +130,14 @@ export class APIService {
             }
 
             const result = await response.json();
+            this.checkSession(result);
             return result.message || result.response || "I'm not sure how to respond to that.";
         } catch (error) {
             console.error('API request failed:', error);
+            playerSession.restoreEvents(sessionEvents);
+            if (memoryUpdates && onUndelivered) {
+                onUndelivered(memoryUpdates);
+            }
             
             // Handle specific connection errors
             if (error.message.includes('Failed to fetch') || error.message.includes('ERR_CONNECTION_RESET')) {
@@ -56,7 +150,91 @@ export class APIService {
         }
     }
 
+    // Stream dialogue from the backend, calling onChunk with the text received so far.
+    // Falls back to the blocking endpoint if streaming isn't available.
+    async sendDialogueStreamRequest(npcName, message, playerContext, npcData = null, memoryContext = "", onChunk = null, memoryUpdates = null, onUndelivered = null) {
+        const data = {
+            npc_name: npcName,
+            player_message: message,
+            memory_context: memoryContext
+        };
+        const sessionEvents = this.attachSession(data, playerContext);
+
+        if (memoryUpdates) {
+            data.memory_updates = memoryUpdates;
+        }
+
+        if (npcData) {
+            data.npc_id = npcData.npc_id;
+            data.npc_personality = npcData.npc_personality;
+            data.npc_role = npcData.npc_role;
+            data.npc_background = npcData.npc_background;
+            data.npc_dialogue_style = npcData.npc_dialogue_style;
+        }
+
+        let received = '';
+        try {
+            const response = await fetch(`${this.baseURL}${this.endpoints.dialogueStream}`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify(data)
+            });
+
+            if (!response.ok || !response.body) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let finalMessage = null;
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const event = JSON.parse(line);
+                    if (event.type === 'chunk') {
+                        received = received ? `${received} ${event.text}` : event.text;
+                        if (onChunk) onChunk(received);
+                    } else if (event.type === 'done') {
+                        finalMessage = event.message;
+                        this.checkSession(event);
+                    }
+                }
+            }
+
+            return finalMessage || received || "I'm not sure how to respond to that.";
+        } catch (error) {
+            // Only retry on the blocking endpoint if nothing was shown yet
+            if (received) {
+                return received;
+            }
+            playerSession.restoreEvents(sessionEvents);
+            console.warn('Streaming dialogue failed, falling back to blocking request:', error);
+            return this.sendDialogueRequest(npcName, message, playerContext, npcData, memoryContext, memoryUpdates, onUndelivered);
+        }
+    }
+
+    // Forget everything the backend remembers about this player
+    async clearMemories() {
+        try {
+            await fetch(`${this.baseURL}${this.endpoints.memory}`, { method: 'DELETE' });
+        } catch (error) {
+            console.error('Clearing backend memories failed:', error);
+        }
+    }
+
     async generateQuestRequest(npcName, conversationContext, playerSuggestion, availableItems, availableNPCs) {
+        let sessionEvents = [];
         try {
             const data = {
                 npc_name: npcName,
@@ -65,6 +243,7 @@ export class APIService {
                 available_items: availableItems,
                 available_npcs: availableNPCs
             };
+            sessionEvents = this.attachSession(data, null);
 
             const response = await fetch(`${this.baseURL}${this.endpoints.generateQuest}`, {
                 method: 'POST',
@@ -78,9 +257,12 @@ export class APIService {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            return await response.json();
+            const result = await response.json();
+            this.checkSession(result);
+            return result;
         } catch (error) {
             console.error('Generate quest API request failed:', error);
+            playerSession.restoreEvents(sessionEvents);
             return {
                 success: false,
                 message: 'Failed to generate quest',
@@ -93,49 +275,107 @@ export class APIService {
     }
 
     async sendQuestRequest(data) {
+        const { player_context: playerContext, ...body } = data;
+        const sessionEvents = this.attachSession(body, playerContext);
         try {
             const response = await fetch(`${this.baseURL}${this.endpoints.quest}`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify(data)
+                body: JSON.stringify(body)
             });
 
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            return await response.json();
+            const result = await response.json();
+            this.checkSession(result);
+            return result;
         } catch (error) {
             console.error('Quest API request failed:', error);
+            playerSession.restoreEvents(sessionEvents);
             return this.getFallbackQuestResponse(data);
         }
     }
 
     async saveGameState(gameState) {
         try {
-            const response = await fetch(`${this.baseURL}${this.endpoints.save}`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(gameState)
-            });
+            // After the first save, send only what changed since the last one
+            const body = this.lastSave
+                ? { base_save_id: this.lastSave.saveId, patch: this.makePatch(this.lastSave.state, gameState) }
+                : gameState;
+
+            let response = await this.postSave(body);
+            if (response.status === 409 && this.lastSave) {
+                // The backend no longer has our base save; send everything
+                response = await this.postSave(gameState);
+            }
 
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            return await response.json();
+            const result = await response.json();
+            this.lastSave = { saveId: result.save_id, state: JSON.parse(JSON.stringify(gameState)) };
+            return result;
         } catch (error) {
             console.error('Save game failed:', error);
+            this.lastSave = null;
             // Fallback to localStorage
             this.saveToLocalStorage(gameState);
             return { success: true, message: 'Saved to local storage' };
         }
     }
 
+    postSave(body) {
+        return fetch(`${this.baseURL}${this.endpoints.save}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(body)
+        });
+    }
+
+    // JSON patch (RFC 6902) turning oldValue into newValue; objects are diffed by key, arrays by index
+    makePatch(oldValue, newValue, path = '') {
+        const isObject = (value) => value !== null && typeof value === 'object';
+        if (!isObject(oldValue) || !isObject(newValue) || Array.isArray(oldValue) !== Array.isArray(newValue)) {
+            return JSON.stringify(oldValue) === JSON.stringify(newValue) ? [] : [{ op: 'replace', path, value: newValue }];
+        }
+
+        const patch = [];
+        if (Array.isArray(oldValue)) {
+            const shared = Math.min(oldValue.length, newValue.length);
+            for (let i = 0; i < shared; i++) {
+                patch.push(...this.makePatch(oldValue[i], newValue[i], `${path}/${i}`));
+            }
+            for (let i = oldValue.length; i < newValue.length; i++) {
+                patch.push({ op: 'add', path: `${path}/${i}`, value: newValue[i] });
+            }
+            // Remove from the end so earlier indexes stay valid
+            for (let i = oldValue.length - 1; i >= newValue.length; i--) {
+                patch.push({ op: 'remove', path: `${path}/${i}` });
+            }
+            return patch;
+        }
+
+        const escape = (key) => key.replace(/~/g, '~0').replace(/\//g, '~1');
+        for (const key of Object.keys(oldValue)) {
+            if (!(key in newValue)) patch.push({ op: 'remove', path: `${path}/${escape(key)}` });
+        }
+        for (const [key, value] of Object.entries(newValue)) {
+            if (!(key in oldValue)) {
+                patch.push({ op: 'add', path: `${path}/${escape(key)}`, value });
+            } else {
+                patch.push(...this.makePatch(oldValue[key], value, `${path}/${escape(key)}`));
+            }
+        }
+        return patch;
+    }
+
     async loadGameState() {
         try {
             const response = await fetch(`${this.baseURL}${this.endpoints.load}`, {
@@ -0,0 +1,105 @@
+// Run with `npm test` (node --test): the dialogue stream client against a faked fetch
+import test from 'node:test';
+import assert from 'node:assert/strict';
+import { APIService } from './APIService.js';
+
+const NPC = 'Commander Sarah Chen';
+
+// A response body sending one event per read; with failAfter it breaks off after that many
+function ndjson(events, { failAfter = null } = {}) {
+    const encoder = new TextEncoder();
+    let index = 0;
+    return new ReadableStream({
+        pull(controller) {
+            if (failAfter !== null && index >= failAfter) {
+                controller.error(new TypeError('network error'));
+            } else if (index >= events.length) {
+                controller.close();
+            } else {
+                controller.enqueue(encoder.encode(`${JSON.stringify(events[index++])}\n`));
+            }
+        }
+    });
+}
+
+// Replace fetch with handlers keyed by path; returns the paths requested, in order
+function fakeFetch(t, handlers) {
+    const requested = [];
+    t.mock.method(globalThis, 'fetch', async (url) => {
+        const path = new URL(url).pathname;
+        requested.push(path);
+        return handlers[path]();
+    });
+    t.mock.method(console, 'warn', () => {});
+    t.mock.method(console, 'error', () => {});
+    return requested;
+}
+
+test('streamed sentences reach onChunk as they arrive', async (t) => {
+    const requested = fakeFetch(t, {
+        '/api/dialogue/stream': () => new Response(ndjson([
+            { type: 'chunk', text: 'Welcome back!' },
+            { type: 'chunk', text: 'The reactor is fine.' },
+            { type: 'done', message: 'Welcome back! The reactor is fine.' }
+        ]))
+    });
+    const seen = [];
+    const message = await new APIService().sendDialogueStreamRequest(NPC, 'Hello', {}, null, '', text => seen.push(text));
+    assert.equal(message, 'Welcome back! The reactor is fine.');
+    assert.deepEqual(seen, ['Welcome back!', 'Welcome back! The reactor is fine.']);
+    assert.deepEqual(requested, ['/api/dialogue/stream']);
+});
+
+test('falls back to /api/dialogue when the stream endpoint is missing', async (t) => {
+    const requested = fakeFetch(t, {
+        '/api/dialogue/stream': () => new Response('not found', { status: 404 }),
+        '/api/dialogue': () => Response.json({ success: true, message: 'Blocking reply.' })
+    });
+    const message = await new APIService().sendDialogueStreamRequest(NPC, 'Hello', {});
+    assert.equal(message, 'Blocking reply.');
+    assert.deepEqual(requested, ['/api/dialogue/stream', '/api/dialogue']);
+});
+
+test('falls back to /api/dialogue when the stream fails before any text', async (t) => {
+    const requested = fakeFetch(t, {
+        '/api/dialogue/stream': () => new Response(ndjson([{ type: 'chunk', text: 'Lost.' }], { failAfter: 0 })),
+        '/api/dialogue': () => Response.json({ success: true, message: 'Blocking reply.' })
+    });
+    const message = await new APIService().sendDialogueStreamRequest(NPC, 'Hello', {});
+    assert.equal(message, 'Blocking reply.');
+    assert.deepEqual(requested, ['/api/dialogue/stream', '/api/dialogue']);
+});
+
+test('keeps the text already shown when the stream breaks partway', async (t) => {
+    const requested = fakeFetch(t, {
+        '/api/dialogue/stream': () => new Response(ndjson([
+            { type: 'chunk', text: 'Welcome back!' },
+            { type: 'chunk', text: 'Never sent.' }
+        ], { failAfter: 1 }))
+    });
+    const message = await new APIService().sendDialogueStreamRequest(NPC, 'Hello', {});
+    assert.equal(message, 'Welcome back!');
+    assert.deepEqual(requested, ['/api/dialogue/stream']);
+});
+
+test('hands memory updates back when both the stream and the fallback fail', async (t) => {
+    fakeFetch(t, {
+        '/api/dialogue/stream': () => { throw new TypeError('Failed to fetch'); },
+        '/api/dialogue': () => { throw new TypeError('Failed to fetch'); }
+    });
+    const updates = { memories: [{ category: 'personal_info', content: 'Player is from Mars' }], relationship: null };
+    const undelivered = [];
+    await new APIService().sendDialogueStreamRequest(NPC, 'Hello', {}, null, '', null, updates, u => undelivered.push(u));
+    assert.deepEqual(undelivered, [updates]);
+});
+
+test('does not hand back memory updates the fallback delivered', async (t) => {
+    fakeFetch(t, {
+        '/api/dialogue/stream': () => new Response('not found', { status: 404 }),
+        '/api/dialogue': () => Response.json({ success: true, message: 'Blocking reply.' })
+    });
+    const undelivered = [];
+    const updates = { memories: [{ category: 'trade', content: 'Owes 20 crypto' }], relationship: null };
+    await new APIService().sendDialogueStreamRequest(NPC, 'Hello', {}, null, '', null, updates, u => undelivered.push(u));
+    assert.deepEqual(undelivered, []);
+});
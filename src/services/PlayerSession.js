@@ -0,0 +1,47 @@
+// The backend keeps each player's state (crypto, inventory, active quests) in a session,
+// so requests carry a session id and the few events since the last request instead of
+// the whole player context. One instance is shared by every APIService.
+class PlayerSession {
+    constructor() {
+        this.sessionId = null;
+        this.pendingEvents = [];
+        this.nextSeq = 1;
+        this.starting = null;
+        this.stateProvider = null;
+    }
+
+    // Full player context to start a session from, e.g. () => player.getPlayerContext()
+    setStateProvider(provider) {
+        this.stateProvider = provider;
+    }
+
+    // Small state changes: record('crypto', { amount }), record('item', { item_id, quantity }),
+    // record('quest_started', { quest_id }), record('quest_ended', { quest_id })
+    record(type, fields) {
+        this.pendingEvents.push({ seq: this.nextSeq++, type, ...fields });
+    }
+
+    takeEvents() {
+        const events = this.pendingEvents;
+        this.pendingEvents = [];
+        return events;
+    }
+
+    // Put back events whose request failed; the backend skips any it already applied
+    restoreEvents(events) {
+        this.pendingEvents = [...events, ...this.pendingEvents];
+    }
+
+    // The state changed wholesale (e.g. a save was loaded), so start over from a full context
+    expire() {
+        this.sessionId = null;
+    }
+
+    snapshot() {
+        // Events so far are part of the snapshot; only later ones get sent
+        this.pendingEvents = [];
+        return this.stateProvider ? this.stateProvider() : null;
+    }
+}
+
+export const playerSession = new PlayerSession();
@@ -1,3 +1,5 @@
+import { playerSession } from '../services/PlayerSession.js';
+
 export class InventoryManager {
     constructor() {
         this.slots = 16; // 4x4 grid
@@ -12,6 +14,7 @@ export class InventoryManager {
             const slot = this.items[i];
             if (slot && slot.itemId === item.itemId && slot.quantity < this.maxStack) {
                 slot.quantity++;
+                playerSession.record('item', { item_id: item.itemId, quantity: 1 });
                 this.updateUI();
                 return true;
             }
@@ -21,6 +24,7 @@ export class InventoryManager {
         const emptySlot = this.items.findIndex(slot => slot === null);
         if (emptySlot !== -1) {
             this.items[emptySlot] = { ...item, quantity: 1 };
+            playerSession.record('item', { item_id: item.itemId, quantity: 1 });
             this.updateUI();
             return true;
         }
@@ -31,6 +35,7 @@ export class InventoryManager {
 
     addCrypto(amount) {
         this.cryptoBalance += amount;
+        playerSession.record('crypto', { amount });
         this.updateUI();
         console.log(`Earned ${amount} crypto! Total: ${this.cryptoBalance}`);
     }
@@ -51,6 +56,9 @@ export class InventoryManager {
             }
         }
         
+        if (remainingToRemove < quantity) {
+            playerSession.record('item', { item_id: itemId, quantity: remainingToRemove - quantity });
+        }
         this.updateUI();
         return remainingToRemove === 0;
     }
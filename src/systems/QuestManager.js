@@ -1,4 +1,5 @@
 import { APIService } from '../services/APIService.js';
+import { playerSession } from '../services/PlayerSession.js';
 
 export class QuestManager {
     constructor(scene) {
@@ -146,6 +147,7 @@ export class QuestManager {
         if (index > -1) {
             this.activeQuests.splice(index, 1);
             this.completedQuests.push(quest);
+            playerSession.record('quest_ended', { quest_id: quest.id });
         }
 
         // Update UI
@@ -201,6 +203,7 @@ export class QuestManager {
 
         // Add to active quests
         this.activeQuests.push(quest);
+        playerSession.record('quest_started', { quest_id: quest.id });
         
         // Update UI
         if (window.uiManager) {
@@ -235,6 +238,7 @@ export class QuestManager {
         // Move from pending to active
         this.pendingQuests.splice(pendingIndex, 1);
         this.activeQuests.push(quest);
+        playerSession.record('quest_started', { quest_id: quest.id });
         
         // Update UI
         if (window.uiManager) {
@@ -348,6 +352,8 @@ export class QuestManager {
         if (state.pendingQuests) {
             this.pendingQuests = state.pendingQuests.map(q => ({ ...q, type: q.type }));
         }
+        // The backend session's quests are out of date; the next request starts a new one
+        playerSession.expire();
         
         // Refresh UI with loaded quests
         this.activeQuests.forEach(quest => {
@@ -13,6 +13,7 @@ export class DialogueManager {
         this.npcMemories = new Map(); // npcId -> MemoryEntry[]
         this.relationshipScores = new Map(); // npcId -> { trust: number, friendship: number, etc }
         this.conversationHistory = new Map(); // npcId -> ConversationEntry[]
+        this.pendingMemoryUpdates = new Map(); // npcId -> memories not yet sent to the backend
         
         // Memory categories for better organization
         this.memoryCategories = {
@@ -46,6 +47,17 @@ export class DialogueManager {
         
         memories.push(memoryEntry);
         
+        // Queue for the backend memory store, which is sent each memory once
+        if (!this.pendingMemoryUpdates.has(npcId)) {
+            this.pendingMemoryUpdates.set(npcId, []);
+        }
+        this.pendingMemoryUpdates.get(npcId).push({
+            category: category,
+            content: content,
+            emotional_context: emotionalContext,
+            importance: memoryEntry.importance
+        });
+        
         // Keep only the most important memories (max 10 per NPC)
         this.pruneMemories(npcId);
         
@@ -400,6 +412,23 @@ export class DialogueManager {
         return context;
     }
 
+    // Memories and relationship scores the backend hasn't seen yet for this NPC
+    takeMemoryUpdates(npcId) {
+        const memories = this.pendingMemoryUpdates.get(npcId) || [];
+        this.pendingMemoryUpdates.delete(npcId);
+        const relationship = this.relationshipScores.get(npcId);
+        
+        if (memories.length === 0 && !relationship) return null;
+        return { memories: memories, relationship: relationship || null };
+    }
+
+    // Queue memories again whose request never reached the backend, ahead of newer ones
+    restoreMemoryUpdates(npcId, updates) {
+        if (!updates || updates.memories.length === 0) return;
+        const pending = this.pendingMemoryUpdates.get(npcId) || [];
+        this.pendingMemoryUpdates.set(npcId, [...updates.memories, ...pending]);
+    }
+
     // Get memories by category
     getMemoriesByCategory(npcId, category) {
         const memories = this.npcMemories.get(npcId) || [];
@@ -468,6 +497,8 @@ export class DialogueManager {
         this.npcMemories.clear();
         this.relationshipScores.clear();
         this.conversationHistory.clear();
+        this.pendingMemoryUpdates.clear();
+        this.apiService.clearMemories();
         console.log("[Enhanced Memory System] All memories cleared");
     }
 
@@ -919,6 +950,7 @@ export class DialogueManager {
             
             // Get NPC data for better context
             const npcData = this.currentNPC ? {
+                npc_id: this.currentNPC.id,
                 npc_name: this.currentNPC.name,
                 npc_personality: this.currentNPC.personality,
                 npc_role: this.currentNPC.role,
@@ -926,16 +958,22 @@ export class DialogueManager {
                 npc_dialogue_style: this.currentNPC.dialogueStyle
             } : null;
             
-            // Get memory context for this NPC
-            const memoryContext = this.getMemoryContext();
+            // The backend keeps this NPC's memories and picks the ones relevant to the
+            // message, so only send what's new since the last request
+            const memoryUpdates = this.takeMemoryUpdates(this.currentNPC.id);
             
-            // Send request to backend with memory context
-            const response = await this.apiService.sendDialogueRequest(
-                this.currentNPC.name,
+            // Stream the response from the backend, showing text as it arrives
+            const npcName = this.currentNPC.name;
+            const npcId = this.currentNPC.id;
+            const response = await this.apiService.sendDialogueStreamRequest(
+                npcName,
                 message,
                 playerContext,
                 npcData,
-                memoryContext // Add memory context
+                "",
+                (partial) => this.showDialogueBox(partial, npcName),
+                memoryUpdates,
+                (undelivered) => this.restoreMemoryUpdates(npcId, undelivered)
             );
             
             this.isLoading = false;
@@ -0,0 +1,17 @@
+// Run with `npm test` (node --test)
+import test from 'node:test';
+import assert from 'node:assert/strict';
+import { DialogueManager } from './DialogueManager.js';
+
+test('undelivered memory updates are sent again, ahead of newer ones', (t) => {
+    t.mock.method(console, 'log', () => {});
+    const manager = new DialogueManager({});
+    manager.addMemoryEntry('trader_eliza', 'trade', 'Player sold iron ore');
+    const first = manager.takeMemoryUpdates('trader_eliza');
+    assert.equal(manager.takeMemoryUpdates('trader_eliza'), null);
+
+    manager.addMemoryEntry('trader_eliza', 'promises', 'Player promised to return');
+    manager.restoreMemoryUpdates('trader_eliza', first);
+    const resent = manager.takeMemoryUpdates('trader_eliza');
+    assert.deepEqual(resent.memories.map(memory => memory.content), ['Player sold iron ore', 'Player promised to return']);
+});
@@ -732,7 +732,7 @@ export class UIManager {
             if (data.success) {
                 const logContent = document.getElementById('log-content');
                 logContent.innerHTML = data.logs.map(line => 
-                    `<div style="margin-bottom: 2px;">${line}</div>`
+                    `<div style="margin-bottom: 2px;">${this.formatLogLine(line)}</div>`
                 ).join('');
                 logContent.scrollTop = logContent.scrollHeight; // Scroll to bottom
             } else {
@@ -743,6 +743,18 @@ export class UIManager {
         }
     }
 
+    // Backend logs are JSON lines; show them as "time LEVEL message"
+    formatLogLine(line) {
+        let text = line;
+        try {
+            const entry = JSON.parse(line);
+            text = `${entry.ts || ''} ${entry.level || ''} ${entry.msg || ''}`;
+        } catch (error) {
+            // Plain-text line from an older log file
+        }
+        return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+    }
+
     async clearLogs() {
         if (confirm('Are you sure you want to clear all logs?')) {
             try {